@@ -0,0 +1,125 @@
+import copy
+import logging
+import queue
+import random
+import re
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Optional, TextIO
+
+import orjson
+
+# values of keys such as "password", "admin_secret" or "x-hasura-admin-secret",
+# whether they appear in a JDBC URL, a JSON body or the repr of a model
+_SECRET_PATTERN = re.compile(
+    r"""([\w-]*(?:password|secret)["']?\s*[:=]\s*["']?)[^"'\s,;&})]+""",
+    re.IGNORECASE,
+)
+_REDACTED = "***"
+
+
+def redact(message: str) -> str:
+    """
+    Mask the secrets found in a message
+    """
+    return _SECRET_PATTERN.sub(r"\1" + _REDACTED, message)
+
+
+class LazyBody(object):
+    """
+    Wraps a request or response body passed as a logging argument, so that it is
+    only serialized if the record is actually emitted. Use it as
+    `logger.debug("Request: %s", LazyBody(body))`.
+    """
+
+    __slots__ = ("body",)
+
+    def __init__(self, body: Any):
+        self.body = body
+
+    def __str__(self) -> str:
+        if isinstance(self.body, bytes):
+            return self.body.decode(errors="replace")
+        try:
+            return orjson.dumps(self.body, default=str).decode()
+        except TypeError:
+            return str(self.body)
+
+
+class RedactingFormatter(logging.Formatter):
+    """
+    Formatter that caps the size of the bodies logged through LazyBody and redacts
+    the secrets of every formatted record.
+
+    Bodies longer than max_body_size characters are truncated (0 disables the cap),
+    and only a body_sample_rate fraction of the records get their bodies rendered
+    at all, the others show a placeholder.
+    """
+
+    def __init__(
+        self,
+        fmt: Optional[str] = None,
+        datefmt: Optional[str] = None,
+        max_body_size: int = 2048,
+        body_sample_rate: float = 1.0,
+    ):
+        super().__init__(fmt=fmt, datefmt=datefmt)
+        self._max_body_size = max_body_size
+        self._body_sample_rate = body_sample_rate
+
+    def format(self, record: logging.LogRecord) -> str:
+        args = record.args
+        if isinstance(args, tuple) and any(isinstance(arg, LazyBody) for arg in args):
+            # other handlers may format the same record, it is left untouched
+            record = copy.copy(record)
+            sampled = random.random() < self._body_sample_rate
+            record.args = tuple(
+                self._render_body(arg, sampled) if isinstance(arg, LazyBody) else arg
+                for arg in args
+            )
+        return redact(super().format(record))
+
+    def _render_body(self, body: LazyBody, sampled: bool) -> str:
+        if not sampled:
+            return "<body not sampled>"
+        rendered = str(body)
+        if 0 < self._max_body_size < len(rendered):
+            truncated = len(rendered) - self._max_body_size
+            return f"{rendered[:self._max_body_size]}... ({truncated} chars truncated)"
+        return rendered
+
+
+class BackgroundStreamHandler(QueueHandler):
+    """
+    Stream handler that writes from a background thread.
+
+    Records are put on an in-memory queue as they are, and a listener thread formats
+    them and writes them to the stream, so that neither the formatting nor the I/O
+    happen on the thread that logs. The handler can be used from a dictConfig
+    configuration like a StreamHandler, the formatter is applied by the listener.
+    """
+
+    def __init__(self, stream: Optional[TextIO] = None):
+        super().__init__(queue.SimpleQueue())
+        self._target = logging.StreamHandler(stream)
+        self._listener = QueueListener(self.queue, self._target)
+        self._listener.start()
+        self._stopped = False
+
+    def setFormatter(self, fmt: Optional[logging.Formatter]) -> None:
+        self._target.setFormatter(fmt)
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # the queue never leaves the process, so the record does not need to be
+        # formatted and stripped of its arguments before being enqueued
+        return record
+
+    def flush(self) -> None:
+        self._target.flush()
+
+    def close(self) -> None:
+        # called by logging.shutdown at exit, the queued records are written first
+        if not self._stopped:
+            self._stopped = True
+            self._listener.stop()
+        self._target.close()
+        super().close()
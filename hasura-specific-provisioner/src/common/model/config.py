@@ -1,15 +1,117 @@
+from enum import StrEnum, auto
+from typing import Dict
+
 from pydantic import BaseModel
 
 
+class HttpPoolConfig(BaseModel):
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 30.0
+    http2: bool = False
+
+
+class RetryConfig(BaseModel):
+    max_attempts: int = 3
+    initial_backoff: float = 0.1
+    max_backoff: float = 2.0
+    deadline: float = 10.0
+    # overrides max_attempts for single operations, 1 disables retries
+    operation_max_attempts: Dict[str, int] = {}
+
+
+class CircuitBreakerConfig(BaseModel):
+    # consecutive failures that open the circuit, 0 disables the circuit breaker
+    failure_threshold: int = 5
+    reset_timeout: float = 30.0
+    half_open_max_calls: int = 1
+
+
 class HasuraConfig(BaseModel):
     url: str
     admin_secret: str
     timeout: int
+    pool: HttpPoolConfig = HttpPoolConfig()
+    batch_window_ms: int = 0
+    batch_max_size: int = 50
+    metadata_cache_max_staleness: float = 0.0
+    conflict_max_retries: int = 3
+    retry: RetryConfig = RetryConfig()
+    circuit_breaker: CircuitBreakerConfig = CircuitBreakerConfig()
 
 
 class RoleMapperConfig(BaseModel):
     url: str
     timeout: int
+    pool: HttpPoolConfig = HttpPoolConfig()
+    retry: RetryConfig = RetryConfig()
+    circuit_breaker: CircuitBreakerConfig = CircuitBreakerConfig()
+
+
+class JobConfig(BaseModel):
+    # requests are served synchronously unless enabled
+    enabled: bool = False
+    max_workers: int = 8
+    max_pending: int = 1000
+    # seconds a finished job is kept after completion
+    ttl: float = 3600.0
+    # finished jobs kept at most, the oldest are evicted first
+    max_finished: int = 10000
+    # "memory" or "sqlite", only the latter survives restarts
+    store: str = "memory"
+    sqlite_path: str = "jobs.db"
+
+
+class ResultCacheConfig(BaseModel):
+    # seconds a result is returned from the cache, 0 disables the cache
+    ttl: float = 0.0
+    # results kept at most, the least recently used are evicted first
+    max_entries: int = 10000
+
+
+class GarbageCollectorConfig(BaseModel):
+    enabled: bool = False
+    # seconds between two collections
+    interval: float = 3600.0
+    # only report the orphaned resources, without removing them
+    dry_run: bool = False
+    # resources removed by a single metadata request
+    batch_size: int = 50
+    # metadata requests sent per second at most, 0 disables the limit
+    max_requests_per_second: float = 1.0
+
+
+class CheckpointConfig(BaseModel):
+    # "none", "memory" or "file", only the latter survives restarts
+    store: str = "none"
+    path: str = "checkpoints"
+    # seconds a checkpoint can be resumed from
+    ttl: float = 3600.0
+    # failed resumed runs after which the operations are planned again
+    max_resumes: int = 3
+
+
+class Lane(StrEnum):
+    VALIDATE = auto()
+    UPDATE_ACL = auto()
+    PROVISION = auto()
+    UNPROVISION = auto()
+
+
+class LaneConfig(BaseModel):
+    # requests of the lane running at the same time at most
+    concurrency: int
+    # lanes with a higher priority are granted a free slot first
+    priority: int
+
+
+class SchedulerConfig(BaseModel):
+    # requests of all the lanes running at the same time at most, 0 for no limit
+    max_concurrency: int = 32
+    validate_lane: LaneConfig = LaneConfig(concurrency=32, priority=3)
+    update_acl_lane: LaneConfig = LaneConfig(concurrency=16, priority=2)
+    provision_lane: LaneConfig = LaneConfig(concurrency=8, priority=1)
+    unprovision_lane: LaneConfig = LaneConfig(concurrency=8, priority=1)
 
 
 class SnowflakeConfig(BaseModel):
@@ -22,3 +124,8 @@ class SnowflakeConfig(BaseModel):
 
 class ProvisionerConfig(BaseModel):
     snowflake_config: SnowflakeConfig
+    bulk_metadata: bool = False
+    # output ports of a data product provisioned at the same time
+    data_product_max_concurrency: int = 4
+    # drop the source of a data product when unprovisioning the whole data product
+    drop_source_on_unprovision: bool = False
@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import Any, List, Literal, Optional
+from typing import Any, List, Literal, NamedTuple, Optional, Tuple
 
 from pydantic import BaseModel, Field, validator
 
@@ -87,3 +87,13 @@ class SnowflakeTable(BaseModel):
     database: str
     schema_: str = Field(..., alias="schema")
     table: str
+
+
+class HasuraDataProduct(NamedTuple):
+    """
+    A data product with all its Hasura output ports, each one with the output port
+    it reads from
+    """
+
+    data_product: DataProduct
+    output_ports: List[Tuple[HasuraOutputPort, OutputPort]]
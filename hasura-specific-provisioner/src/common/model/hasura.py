@@ -57,6 +57,13 @@ class AddSourceResult(StrEnum):
 
 
 class DropSourceResult(StrEnum):
+    SUCCESS = auto()
+    NOT_EXISTS = auto()
+    IN_USE = auto()
+    FAILURE = auto()
+
+
+class ClearSourceResult(StrEnum):
     SUCCESS = auto()
     NOT_EXISTS = auto()
     FAILURE = auto()
@@ -72,3 +79,19 @@ class Health(StrEnum):
     OK = auto()
     METADATA_ERROR = auto()
     ERROR = auto()
+
+
+class ResourceState(StrEnum):
+    MISSING = auto()
+    OUTDATED = auto()
+    UP_TO_DATE = auto()
+
+
+class GarbageCollectionReport(BaseModel):
+    dry_run: bool
+    orphaned_sources: int
+    # orphans removed by the collection, always 0 in dry-run mode
+    reclaimed: int
+    # size in bytes of the serialized metadata, estimated after in dry-run mode
+    metadata_size_before: int
+    metadata_size_after: int
@@ -0,0 +1,20 @@
+from enum import StrEnum, auto
+from typing import Dict
+
+from pydantic import BaseModel
+
+
+class CircuitState(StrEnum):
+    CLOSED = auto()
+    OPEN = auto()
+    HALF_OPEN = auto()
+
+
+class HealthStatus(StrEnum):
+    OK = auto()
+    DEGRADED = auto()
+
+
+class ServiceHealth(BaseModel):
+    status: HealthStatus
+    circuit_breakers: Dict[str, CircuitState]
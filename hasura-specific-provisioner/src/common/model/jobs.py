@@ -0,0 +1,45 @@
+import time
+from enum import StrEnum
+from typing import Generic, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class JobStatus(StrEnum):
+    RUNNING = "RUNNING"
+    COMPLETED = "COMPLETED"
+    FAILED = "FAILED"
+
+
+class Job(Generic[T]):
+    """
+    A background job: while running it has no result; once finished it has either
+    the result returned by the job or the error it raised.
+
+    `request` holds what is needed to run the job again if it is interrupted by a
+    restart, and `component_id` the component it acts on, if any.
+    """
+
+    token: str
+    status: JobStatus
+    result: Optional[T]
+    error: Optional[str]
+    component_id: Optional[str]
+    request: Optional[dict]
+    created_at: float
+    finished_at: Optional[float]
+
+    def __init__(
+        self,
+        token: str,
+        component_id: Optional[str] = None,
+        request: Optional[dict] = None,
+    ):
+        self.token = token
+        self.status = JobStatus.RUNNING
+        self.result = None
+        self.error = None
+        self.component_id = component_id
+        self.request = request
+        self.created_at = time.time()
+        self.finished_at = None
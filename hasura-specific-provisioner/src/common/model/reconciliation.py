@@ -0,0 +1,71 @@
+from enum import StrEnum, auto
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+from src.common.model.hasura import DataSourceConfig, TableConfig
+from src.common.model.rolemapping import Role
+
+
+class OperationType(StrEnum):
+    ADD_SOURCE = auto()
+    UPDATE_SOURCE = auto()
+    TRACK_TABLE = auto()
+    UPDATE_TABLE = auto()
+    CREATE_ROLE = auto()
+    DROP_SELECT_PERMISSION = auto()
+    CREATE_SELECT_PERMISSION = auto()
+    UNTRACK_TABLE = auto()
+    DROP_SOURCE = auto()
+
+
+class DesiredState(BaseModel):
+    data_source_config: DataSourceConfig
+    table_config: TableConfig
+    role: Role
+
+
+class Checkpoint(BaseModel):
+    """
+    Progress of a provisioning run: the planned operations and those that already
+    succeeded, so that a retry resumes from the first incomplete one
+    """
+
+    operations: List[OperationType]
+    completed: List[OperationType] = []
+    # runs that resumed from the checkpoint and failed again
+    resumes: int = 0
+    created_at: float
+
+
+class Service(StrEnum):
+    HASURA = auto()
+    ROLE_MAPPER = auto()
+
+
+class PlannedCall(BaseModel):
+    """
+    A call to Hasura or to the Role Mapper of an execution plan; a Hasura call may
+    bundle several metadata operations in a single bulk request
+    """
+
+    service: Service
+    # metadata operations, or the Role Mapper call
+    operations: List[str]
+    # the resource is already in the desired state, the call would not be made
+    skipped: bool = False
+    schema_reloads: int
+    # seconds, None if no call of the same kind was seen recently
+    estimated_latency: Optional[float] = None
+
+
+class ExecutionPlan(BaseModel):
+    """
+    The calls a provisioning, unprovisioning or ACL update would make, as of the
+    current Hasura metadata and Role Mapper state
+    """
+
+    calls: List[PlannedCall]
+    schema_reloads: int
+    # upper bound, as if the calls with an estimate ran one after the other
+    estimated_latency: float
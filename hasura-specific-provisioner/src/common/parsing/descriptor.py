@@ -1,15 +1,39 @@
-from typing import List, Tuple
+from typing import List, Tuple, Union
 
 import yaml
 
-from src.common.model.descriptor import DataProduct, HasuraOutputPort, OutputPort
+from src.common.model.descriptor import (
+    DataProduct,
+    HasuraDataProduct,
+    HasuraOutputPort,
+    OutputPort,
+)
 
 
 def parse_yaml_component_descriptor(
     descriptor_yaml: str,
 ) -> Tuple[DataProduct, HasuraOutputPort, OutputPort]:
+    return _parse_component_descriptor(yaml.safe_load(descriptor_yaml))
+
+
+def parse_yaml_dataproduct_descriptor(descriptor_yaml: str) -> HasuraDataProduct:
+    return _parse_dataproduct_descriptor(yaml.safe_load(descriptor_yaml))
+
+
+def parse_yaml_descriptor(
+    descriptor_yaml: str,
+) -> Union[HasuraDataProduct, Tuple[DataProduct, HasuraOutputPort, OutputPort]]:
     descriptor_dict = yaml.safe_load(descriptor_yaml)
 
+    # only a component descriptor names the component to provision
+    if "componentIdToProvision" in descriptor_dict:
+        return _parse_component_descriptor(descriptor_dict)
+    return _parse_dataproduct_descriptor(descriptor_dict)
+
+
+def _parse_component_descriptor(
+    descriptor_dict: dict,
+) -> Tuple[DataProduct, HasuraOutputPort, OutputPort]:
     dataproduct_dict = descriptor_dict["dataProduct"]
     hasura_op_component_id = descriptor_dict["componentIdToProvision"]
 
@@ -19,7 +43,31 @@ def parse_yaml_component_descriptor(
         data_product.components, hasura_op_component_id
     )
     hasura_op = HasuraOutputPort.parse_obj(hasura_op_dict)
+    source_op = _find_source_output_port(data_product, hasura_op)
+
+    return data_product, hasura_op, source_op
 
+
+def _parse_dataproduct_descriptor(descriptor_dict: dict) -> HasuraDataProduct:
+    # the data product is either at the top level or under dataProduct
+    dataproduct_dict = descriptor_dict.get("dataProduct", descriptor_dict)
+
+    data_product = DataProduct.parse_obj(dataproduct_dict)
+
+    output_ports = []
+    for component in data_product.components:
+        if not _is_hasura_output_port(component):
+            continue
+        hasura_op = HasuraOutputPort.parse_obj(component)
+        source_op = _find_source_output_port(data_product, hasura_op)
+        output_ports.append((hasura_op, source_op))
+
+    return HasuraDataProduct(data_product=data_product, output_ports=output_ports)
+
+
+def _find_source_output_port(
+    data_product: DataProduct, hasura_op: HasuraOutputPort
+) -> OutputPort:
     num_dependencies = len(hasura_op.dependsOn)
     if not num_dependencies == 1:
         raise ValueError(
@@ -31,9 +79,13 @@ def parse_yaml_component_descriptor(
     source_op_dict = _find_component_by_component_id(
         data_product.components, source_op_component_id
     )
-    source_op = OutputPort.parse_obj(source_op_dict)
+    return OutputPort.parse_obj(source_op_dict)
 
-    return data_product, hasura_op, source_op
+
+def _is_hasura_output_port(component: dict) -> bool:
+    return component.get("kind") == "outputport" and component.get("platform") == (
+        "Hasura"
+    )
 
 
 def _find_component_by_component_id(components: List[dict], id: str) -> dict:
@@ -1,46 +1,117 @@
+import asyncio
+import importlib.util
+import logging
 import os
-from typing import Annotated, Tuple, Union
+from typing import (
+    Annotated,
+    Any,
+    AsyncIterator,
+    Callable,
+    Optional,
+    Tuple,
+    TypeVar,
+    Union,
+)
 
-from fastapi import Depends
+from fastapi import Depends, Request
+from starlette.datastructures import State
 
 from src.common.model.config import (
+    CheckpointConfig,
+    CircuitBreakerConfig,
+    GarbageCollectorConfig,
     HasuraConfig,
+    HttpPoolConfig,
+    JobConfig,
+    Lane,
+    LaneConfig,
     ProvisionerConfig,
+    ResultCacheConfig,
+    RetryConfig,
     RoleMapperConfig,
+    SchedulerConfig,
     SnowflakeConfig,
 )
-from src.common.model.descriptor import DataProduct, HasuraOutputPort, OutputPort
-from src.common.parsing.descriptor import parse_yaml_component_descriptor
+from src.common.model.descriptor import (
+    DataProduct,
+    HasuraDataProduct,
+    HasuraOutputPort,
+    OutputPort,
+)
+from src.common.parsing.descriptor import (
+    parse_yaml_component_descriptor,
+    parse_yaml_dataproduct_descriptor,
+)
 from src.models import (
     DescriptorKind,
     ProvisioningRequest,
+    ProvisioningStatus,
+    Status1,
     UpdateAclRequest,
     ValidationError,
+    ValidationResult,
 )
+from src.services.checkpoints import (
+    CheckpointStore,
+    FileCheckpointStore,
+    InMemoryCheckpointStore,
+)
+from src.services.circuitbreaker import CircuitBreaker
+from src.services.hasura.auth import HasuraAdminTokenAuth
+from src.services.hasura.batcher import MetadataBatcher
 from src.services.hasura.client import HasuraAdminClient
+from src.services.hasura.gc import MetadataGarbageCollector
+from src.services.hasura.metadata import HasuraMetadataCache
 from src.services.hasura.provisioner import HasuraProvisioner
+from src.services.http import HttpConnectionPool
+from src.services.jobs import JobEngine, JobReplayer
+from src.services.jobstore import InMemoryJobStore, JobStore, SqliteJobStore
+from src.services.resultcache import ResultCache
 from src.services.rolemapper import RoleMapperClient
+from src.services.scheduler import LaneScheduler
+from src.services.singleflight import SingleFlight
+
+T = TypeVar("T")
+
+_logger = logging.getLogger(__name__)
+
+
+# a single component, or a whole data product with all its Hasura output ports
+ProvisioningTarget = Union[
+    Tuple[DataProduct, HasuraOutputPort, OutputPort], HasuraDataProduct
+]
+UnpackedProvisioningRequest = Union[ProvisioningTarget, ValidationError]
 
 
 async def unpack_provisioning_request(
     provisioning_request: ProvisioningRequest,
-) -> Union[Tuple[DataProduct, HasuraOutputPort, OutputPort], ValidationError]:
-    if not provisioning_request.descriptorKind == DescriptorKind.COMPONENT_DESCRIPTOR:
+) -> UnpackedProvisioningRequest:
+    descriptor_kind = provisioning_request.descriptorKind
+    if descriptor_kind not in (
+        DescriptorKind.COMPONENT_DESCRIPTOR,
+        DescriptorKind.DATAPRODUCT_DESCRIPTOR,
+    ):
         error = (
-            "Expecting a COMPONENT_DESCRIPTOR but got a "
-            f"{provisioning_request.descriptorKind} instead; please check with the "
-            f"platform team."
+            "Expecting a COMPONENT_DESCRIPTOR or a DATAPRODUCT_DESCRIPTOR but got a "
+            f"{descriptor_kind} instead; please check with the platform team."
         )
         return ValidationError(errors=[error])
 
+    # parsing large descriptors is CPU bound, it is kept off the event loop
     try:
-        return parse_yaml_component_descriptor(provisioning_request.descriptor)
+        if descriptor_kind == DescriptorKind.DATAPRODUCT_DESCRIPTOR:
+            return await asyncio.to_thread(
+                parse_yaml_dataproduct_descriptor, provisioning_request.descriptor
+            )
+        return await asyncio.to_thread(
+            parse_yaml_component_descriptor, provisioning_request.descriptor
+        )
     except Exception as ex:
         return ValidationError(errors=["Unable to parse the descriptor.", str(ex)])
 
 
 UnpackedProvisioningRequestDep = Annotated[
-    Union[Tuple[DataProduct, HasuraOutputPort, OutputPort], ValidationError],
+    UnpackedProvisioningRequest,
     Depends(unpack_provisioning_request),
 ]
 
@@ -55,7 +126,9 @@ async def unpack_update_acl_request(
             data_product,
             hasura_output_port,
             source_output_port,
-        ) = parse_yaml_component_descriptor(update_acl_request.provisionInfo.request)
+        ) = await asyncio.to_thread(
+            parse_yaml_component_descriptor, update_acl_request.provisionInfo.request
+        )
         return (
             data_product,
             hasura_output_port,
@@ -72,41 +145,543 @@ UnpackedUpdateAclRequestDep = Annotated[
 ]
 
 
+def get_scheduler_config_from_env() -> SchedulerConfig:
+    defaults = SchedulerConfig()
+    return SchedulerConfig(
+        max_concurrency=int(
+            get_env_or_default(
+                "SCHEDULER_MAX_CONCURRENCY", str(defaults.max_concurrency)
+            )
+        ),
+        validate_lane=get_lane_config_from_env(
+            "SCHEDULER_VALIDATE", defaults.validate_lane
+        ),
+        update_acl_lane=get_lane_config_from_env(
+            "SCHEDULER_UPDATE_ACL", defaults.update_acl_lane
+        ),
+        provision_lane=get_lane_config_from_env(
+            "SCHEDULER_PROVISION", defaults.provision_lane
+        ),
+        unprovision_lane=get_lane_config_from_env(
+            "SCHEDULER_UNPROVISION", defaults.unprovision_lane
+        ),
+    )
+
+
+def get_lane_config_from_env(prefix: str, defaults: LaneConfig) -> LaneConfig:
+    return LaneConfig(
+        concurrency=int(
+            get_env_or_default(f"{prefix}_CONCURRENCY", str(defaults.concurrency))
+        ),
+        priority=int(get_env_or_default(f"{prefix}_PRIORITY", str(defaults.priority))),
+    )
+
+
+def hold_lane(lane: Lane) -> Callable[[Request], AsyncIterator[None]]:
+    """
+    Returns a dependency holding a slot of the lane for the whole request, the
+    parsing of the descriptor included; requests are not scheduled if the app has
+    no scheduler, eg in tests
+    """
+
+    async def hold(request: Request) -> AsyncIterator[None]:
+        scheduler: Optional[LaneScheduler] = getattr(
+            request.app.state, "lane_scheduler", None
+        )
+        if scheduler is None:
+            yield
+            return
+        async with scheduler.hold(lane):
+            yield
+
+    return hold
+
+
+ValidateLaneDep = Annotated[None, Depends(hold_lane(Lane.VALIDATE))]
+UpdateAclLaneDep = Annotated[None, Depends(hold_lane(Lane.UPDATE_ACL))]
+ProvisionLaneDep = Annotated[None, Depends(hold_lane(Lane.PROVISION))]
+UnprovisionLaneDep = Annotated[None, Depends(hold_lane(Lane.UNPROVISION))]
+
+
 def get_hasura_config_from_env() -> HasuraConfig:
     return HasuraConfig(
         url=get_env("HASURA_URL"),
         admin_secret=get_env("HASURA_ADMIN_SECRET"),
         timeout=int(get_env("HASURA_TIMEOUT")),
+        pool=get_http_pool_config_from_env("HASURA"),
+        batch_window_ms=int(get_env_or_default("HASURA_BATCH_WINDOW_MS", "0")),
+        batch_max_size=int(get_env_or_default("HASURA_BATCH_MAX_SIZE", "50")),
+        metadata_cache_max_staleness=float(
+            get_env_or_default("HASURA_METADATA_CACHE_MAX_STALENESS", "0")
+        ),
+        conflict_max_retries=int(
+            get_env_or_default("HASURA_CONFLICT_MAX_RETRIES", "3")
+        ),
+        retry=get_retry_config_from_env("HASURA"),
+        circuit_breaker=get_circuit_breaker_config_from_env("HASURA"),
     )
 
 
-def get_hasura_admin_client(
-    hasura_config: Annotated[HasuraConfig, Depends(get_hasura_config_from_env)]
+def create_hasura_connection_pool(hasura_config: HasuraConfig) -> HttpConnectionPool:
+    return HttpConnectionPool(
+        name="hasura",
+        pool_config=hasura_config.pool,
+        timeout=hasura_config.timeout,
+        auth=HasuraAdminTokenAuth(hasura_config.admin_secret),
+    )
+
+
+def create_hasura_metadata_batcher(
+    hasura_config: HasuraConfig,
+    connection_pool: HttpConnectionPool,
+    circuit_breaker: Optional[CircuitBreaker] = None,
+) -> Optional[MetadataBatcher]:
+    if hasura_config.batch_window_ms <= 0:
+        return None
+    bulk_client = HasuraAdminClient(
+        hasura_url=hasura_config.url,
+        hasura_admin_secret=hasura_config.admin_secret,
+        hasura_timeout=hasura_config.timeout,
+        client=connection_pool.client,
+        conflict_max_retries=hasura_config.conflict_max_retries,
+        retry_config=hasura_config.retry,
+        circuit_breaker=circuit_breaker,
+    )
+    return MetadataBatcher(
+        send_bulk=bulk_client.bulk_keep_going,
+        window=hasura_config.batch_window_ms / 1000,
+        max_batch_size=hasura_config.batch_max_size,
+    )
+
+
+def create_hasura_metadata_cache(
+    hasura_config: HasuraConfig,
+    connection_pool: HttpConnectionPool,
+    circuit_breaker: Optional[CircuitBreaker] = None,
+) -> Optional[HasuraMetadataCache]:
+    if hasura_config.metadata_cache_max_staleness <= 0:
+        return None
+    export_client = HasuraAdminClient(
+        hasura_url=hasura_config.url,
+        hasura_admin_secret=hasura_config.admin_secret,
+        hasura_timeout=hasura_config.timeout,
+        client=connection_pool.client,
+        retry_config=hasura_config.retry,
+        circuit_breaker=circuit_breaker,
+    )
+    return HasuraMetadataCache(
+        export_metadata=export_client.export_metadata,
+        max_staleness=hasura_config.metadata_cache_max_staleness,
+    )
+
+
+def create_hasura_admin_client(
+    hasura_config: HasuraConfig, state: State
 ) -> HasuraAdminClient:
+    connection_pool: HttpConnectionPool = state.hasura_connection_pool
     return HasuraAdminClient(
         hasura_url=hasura_config.url,
         hasura_admin_secret=hasura_config.admin_secret,
         hasura_timeout=hasura_config.timeout,
+        client=connection_pool.client,
+        batcher=state.hasura_metadata_batcher,
+        metadata_cache=state.hasura_metadata_cache,
+        conflict_max_retries=hasura_config.conflict_max_retries,
+        retry_config=hasura_config.retry,
+        circuit_breaker=state.hasura_circuit_breaker,
+        source_registry=state.hasura_source_registry,
+    )
+
+
+def get_hasura_admin_client(
+    request: Request,
+    hasura_config: Annotated[HasuraConfig, Depends(get_hasura_config_from_env)],
+) -> HasuraAdminClient:
+    return create_hasura_admin_client(hasura_config, request.app.state)
+
+
+def get_garbage_collector_config_from_env() -> GarbageCollectorConfig:
+    defaults = GarbageCollectorConfig()
+    return GarbageCollectorConfig(
+        enabled=parse_bool(
+            get_env_or_default("HASURA_GC_ENABLED", str(defaults.enabled))
+        ),
+        interval=float(
+            get_env_or_default("HASURA_GC_INTERVAL", str(defaults.interval))
+        ),
+        dry_run=parse_bool(
+            get_env_or_default("HASURA_GC_DRY_RUN", str(defaults.dry_run))
+        ),
+        batch_size=int(
+            get_env_or_default("HASURA_GC_BATCH_SIZE", str(defaults.batch_size))
+        ),
+        max_requests_per_second=float(
+            get_env_or_default(
+                "HASURA_GC_MAX_REQUESTS_PER_SECOND",
+                str(defaults.max_requests_per_second),
+            )
+        ),
+    )
+
+
+def create_garbage_collector(
+    hasura_config: HasuraConfig, gc_config: GarbageCollectorConfig, state: State
+) -> Optional[MetadataGarbageCollector]:
+    if not gc_config.enabled:
+        return None
+    return MetadataGarbageCollector(
+        hasura_admin_client=create_hasura_admin_client(hasura_config, state),
+        config=gc_config,
+        snowflake_config=get_provisioner_config_from_env().snowflake_config,
     )
 
 
 def get_role_mapper_config_from_env() -> RoleMapperConfig:
     return RoleMapperConfig(
-        url=get_env("ROLE_MAPPER_URL"), timeout=int(get_env("ROLE_MAPPER_TIMEOUT"))
+        url=get_env("ROLE_MAPPER_URL"),
+        timeout=int(get_env("ROLE_MAPPER_TIMEOUT")),
+        pool=get_http_pool_config_from_env("ROLE_MAPPER"),
+        retry=get_retry_config_from_env("ROLE_MAPPER"),
+        circuit_breaker=get_circuit_breaker_config_from_env("ROLE_MAPPER"),
     )
 
 
-def get_role_mapper_client(
-    role_mapper_config: Annotated[
-        RoleMapperConfig, Depends(get_role_mapper_config_from_env)
-    ]
+def create_role_mapper_connection_pool(
+    role_mapper_config: RoleMapperConfig,
+) -> HttpConnectionPool:
+    return HttpConnectionPool(
+        name="rolemapper",
+        pool_config=role_mapper_config.pool,
+        timeout=role_mapper_config.timeout,
+    )
+
+
+def create_role_mapper_client(
+    role_mapper_config: RoleMapperConfig, state: State
 ) -> RoleMapperClient:
+    connection_pool: HttpConnectionPool = state.role_mapper_connection_pool
     return RoleMapperClient(
         role_mapper_url=role_mapper_config.url,
         role_mapper_timeout=role_mapper_config.timeout,
+        client=connection_pool.client,
+        retry_config=role_mapper_config.retry,
+        circuit_breaker=state.role_mapper_circuit_breaker,
+    )
+
+
+def get_role_mapper_client(
+    request: Request,
+    role_mapper_config: Annotated[
+        RoleMapperConfig, Depends(get_role_mapper_config_from_env)
+    ],
+) -> RoleMapperClient:
+    return create_role_mapper_client(role_mapper_config, request.app.state)
+
+
+def create_circuit_breaker(
+    name: str, circuit_breaker_config: CircuitBreakerConfig
+) -> Optional[CircuitBreaker]:
+    if circuit_breaker_config.failure_threshold <= 0:
+        return None
+    return CircuitBreaker(name=name, config=circuit_breaker_config)
+
+
+def get_http_pool_config_from_env(prefix: str) -> HttpPoolConfig:
+    defaults = HttpPoolConfig()
+    http2 = parse_bool(get_env_or_default(f"{prefix}_HTTP2", str(defaults.http2)))
+    if http2 and not _is_http2_available():
+        raise ValueError(
+            f"{prefix}_HTTP2 requires the h2 package; install httpx[http2] or "
+            "disable HTTP/2"
+        )
+    return HttpPoolConfig(
+        max_connections=int(
+            get_env_or_default(
+                f"{prefix}_POOL_MAX_CONNECTIONS", str(defaults.max_connections)
+            )
+        ),
+        max_keepalive_connections=int(
+            get_env_or_default(
+                f"{prefix}_POOL_MAX_KEEPALIVE_CONNECTIONS",
+                str(defaults.max_keepalive_connections),
+            )
+        ),
+        keepalive_expiry=float(
+            get_env_or_default(
+                f"{prefix}_POOL_KEEPALIVE_EXPIRY", str(defaults.keepalive_expiry)
+            )
+        ),
+        http2=http2,
+    )
+
+
+def _is_http2_available() -> bool:
+    # httpx only supports HTTP/2 with its optional h2 dependency
+    return importlib.util.find_spec("h2") is not None
+
+
+def get_retry_config_from_env(prefix: str) -> RetryConfig:
+    defaults = RetryConfig()
+    # eg "track_table=5,run_sql=1"
+    operation_max_attempts = {}
+    for item in get_env_or_default(f"{prefix}_RETRY_OPERATION_MAX_ATTEMPTS", "").split(
+        ","
+    ):
+        if item.strip():
+            operation, max_attempts = item.split("=", 1)
+            operation_max_attempts[operation.strip()] = int(max_attempts)
+    return RetryConfig(
+        max_attempts=int(
+            get_env_or_default(
+                f"{prefix}_RETRY_MAX_ATTEMPTS", str(defaults.max_attempts)
+            )
+        ),
+        initial_backoff=float(
+            get_env_or_default(
+                f"{prefix}_RETRY_INITIAL_BACKOFF", str(defaults.initial_backoff)
+            )
+        ),
+        max_backoff=float(
+            get_env_or_default(f"{prefix}_RETRY_MAX_BACKOFF", str(defaults.max_backoff))
+        ),
+        deadline=float(
+            get_env_or_default(f"{prefix}_RETRY_DEADLINE", str(defaults.deadline))
+        ),
+        operation_max_attempts=operation_max_attempts,
+    )
+
+
+def get_circuit_breaker_config_from_env(prefix: str) -> CircuitBreakerConfig:
+    defaults = CircuitBreakerConfig()
+    return CircuitBreakerConfig(
+        failure_threshold=int(
+            get_env_or_default(
+                f"{prefix}_CIRCUIT_FAILURE_THRESHOLD", str(defaults.failure_threshold)
+            )
+        ),
+        reset_timeout=float(
+            get_env_or_default(
+                f"{prefix}_CIRCUIT_RESET_TIMEOUT", str(defaults.reset_timeout)
+            )
+        ),
+        half_open_max_calls=int(
+            get_env_or_default(
+                f"{prefix}_CIRCUIT_HALF_OPEN_MAX_CALLS",
+                str(defaults.half_open_max_calls),
+            )
+        ),
     )
 
 
+def get_job_config_from_env(prefix: str) -> JobConfig:
+    defaults = JobConfig()
+    return JobConfig(
+        enabled=parse_bool(
+            get_env_or_default(f"{prefix}_ENABLED", str(defaults.enabled))
+        ),
+        max_workers=int(
+            get_env_or_default(f"{prefix}_MAX_WORKERS", str(defaults.max_workers))
+        ),
+        max_pending=int(
+            get_env_or_default(f"{prefix}_MAX_PENDING", str(defaults.max_pending))
+        ),
+        ttl=float(get_env_or_default(f"{prefix}_TTL", str(defaults.ttl))),
+        max_finished=int(
+            get_env_or_default(f"{prefix}_MAX_FINISHED", str(defaults.max_finished))
+        ),
+        store=get_env_or_default(f"{prefix}_STORE", defaults.store),
+        sqlite_path=get_env_or_default(f"{prefix}_SQLITE_PATH", defaults.sqlite_path),
+    )
+
+
+def create_job_store(
+    name: str,
+    job_config: JobConfig,
+    encode_result: Callable[[T], Any],
+    decode_result: Callable[[Any], T],
+) -> JobStore[T]:
+    if job_config.store == "memory":
+        return InMemoryJobStore(job_config)
+    if job_config.store == "sqlite":
+        return SqliteJobStore(
+            name=name,
+            path=job_config.sqlite_path,
+            config=job_config,
+            encode_result=encode_result,
+            decode_result=decode_result,
+        )
+    raise ValueError(f"Unknown job store {job_config.store}")
+
+
+ProvisioningJobEngine = JobEngine[Union[ProvisioningStatus, ValidationError]]
+
+
+def create_provisioning_job_engine(
+    job_config: JobConfig,
+    replay: Optional[JobReplayer[Union[ProvisioningStatus, ValidationError]]] = None,
+) -> Optional[ProvisioningJobEngine]:
+    if not job_config.enabled:
+        return None
+    return JobEngine(
+        name="provisioning",
+        config=job_config,
+        store=create_job_store(
+            "provisioning",
+            job_config,
+            _encode_provisioning_result,
+            _decode_provisioning_result,
+        ),
+        replay=replay,
+    )
+
+
+def _encode_provisioning_result(
+    result: Union[ProvisioningStatus, ValidationError]
+) -> dict:
+    if isinstance(result, ValidationError):
+        return {"validation_error": result.dict()}
+    return {"provisioning_status": result.dict()}
+
+
+def _decode_provisioning_result(
+    value: dict,
+) -> Union[ProvisioningStatus, ValidationError]:
+    if "validation_error" in value:
+        return ValidationError.parse_obj(value["validation_error"])
+    return ProvisioningStatus.parse_obj(value["provisioning_status"])
+
+
+def get_provisioning_job_engine(request: Request) -> Optional[ProvisioningJobEngine]:
+    return getattr(request.app.state, "provisioning_job_engine", None)
+
+
+ProvisioningJobEngineDep = Annotated[
+    Optional[ProvisioningJobEngine], Depends(get_provisioning_job_engine)
+]
+
+ValidationJobEngine = JobEngine[ValidationResult]
+
+
+def create_validation_job_engine(
+    job_config: JobConfig, replay: Optional[JobReplayer[ValidationResult]] = None
+) -> ValidationJobEngine:
+    # /v2/validate is asynchronous by definition, the engine is always created
+    return JobEngine(
+        name="validation",
+        config=job_config,
+        store=create_job_store(
+            "validation",
+            job_config,
+            lambda result: result.dict(),
+            ValidationResult.parse_obj,
+        ),
+        replay=replay,
+    )
+
+
+def get_validation_job_engine(request: Request) -> Optional[ValidationJobEngine]:
+    return getattr(request.app.state, "validation_job_engine", None)
+
+
+ValidationJobEngineDep = Annotated[
+    Optional[ValidationJobEngine], Depends(get_validation_job_engine)
+]
+
+
+def get_result_cache_config_from_env() -> ResultCacheConfig:
+    defaults = ResultCacheConfig()
+    return ResultCacheConfig(
+        ttl=float(get_env_or_default("RESULT_CACHE_TTL", str(defaults.ttl))),
+        max_entries=int(
+            get_env_or_default("RESULT_CACHE_MAX_ENTRIES", str(defaults.max_entries))
+        ),
+    )
+
+
+ProvisioningResultCache = ResultCache[Union[ProvisioningStatus, ValidationError]]
+
+
+def create_result_cache(
+    result_cache_config: ResultCacheConfig, hasura_config: HasuraConfig, state: State
+) -> Optional[ProvisioningResultCache]:
+    if result_cache_config.ttl <= 0:
+        return None
+    # without the metadata cache, checking the resource version of each cached
+    # result would cost a full metadata export, more than the call it saves
+    if hasura_config.metadata_cache_max_staleness <= 0:
+        _logger.warning(
+            "RESULT_CACHE_TTL requires HASURA_METADATA_CACHE_MAX_STALENESS, the "
+            "result cache is disabled"
+        )
+        return None
+    hasura_admin_client = create_hasura_admin_client(hasura_config, state)
+
+    async def get_resource_version() -> int:
+        snapshot = await hasura_admin_client.get_metadata_snapshot()
+        return snapshot.resource_version
+
+    return ResultCache(
+        config=result_cache_config,
+        get_resource_version=get_resource_version,
+        # failures and validation errors are always retried
+        is_cacheable=lambda result: isinstance(result, ProvisioningStatus)
+        and result.status == Status1.COMPLETED,
+    )
+
+
+def get_result_cache(request: Request) -> Optional[ProvisioningResultCache]:
+    return getattr(request.app.state, "result_cache", None)
+
+
+ResultCacheDep = Annotated[Optional[ProvisioningResultCache], Depends(get_result_cache)]
+
+
+ProvisioningSingleFlight = SingleFlight[Union[ProvisioningStatus, ValidationError]]
+
+
+def get_single_flight(request: Request) -> Optional[ProvisioningSingleFlight]:
+    return getattr(request.app.state, "single_flight", None)
+
+
+SingleFlightDep = Annotated[
+    Optional[ProvisioningSingleFlight], Depends(get_single_flight)
+]
+
+
+def get_checkpoint_config_from_env() -> CheckpointConfig:
+    defaults = CheckpointConfig()
+    return CheckpointConfig(
+        store=get_env_or_default("PROVISIONING_CHECKPOINTS_STORE", defaults.store),
+        path=get_env_or_default("PROVISIONING_CHECKPOINTS_PATH", defaults.path),
+        ttl=float(
+            get_env_or_default("PROVISIONING_CHECKPOINTS_TTL", str(defaults.ttl))
+        ),
+        max_resumes=int(
+            get_env_or_default(
+                "PROVISIONING_CHECKPOINTS_MAX_RESUMES", str(defaults.max_resumes)
+            )
+        ),
+    )
+
+
+def create_checkpoint_store(
+    checkpoint_config: CheckpointConfig,
+) -> Optional[CheckpointStore]:
+    if checkpoint_config.store == "none":
+        return None
+    if checkpoint_config.store == "memory":
+        return InMemoryCheckpointStore(
+            ttl=checkpoint_config.ttl, max_resumes=checkpoint_config.max_resumes
+        )
+    if checkpoint_config.store == "file":
+        return FileCheckpointStore(
+            path=checkpoint_config.path,
+            ttl=checkpoint_config.ttl,
+            max_resumes=checkpoint_config.max_resumes,
+        )
+    raise ValueError(f"Unknown checkpoint store {checkpoint_config.store}")
+
+
 def get_provisioner_config_from_env() -> ProvisionerConfig:
     return ProvisionerConfig(
         snowflake_config=SnowflakeConfig(
@@ -115,7 +690,14 @@ def get_provisioner_config_from_env() -> ProvisionerConfig:
             password=get_env("SNOWFLAKE_PASSWORD"),
             role=get_env("SNOWFLAKE_ROLE"),
             warehouse=get_env("SNOWFLAKE_WAREHOUSE"),
-        )
+        ),
+        bulk_metadata=parse_bool(get_env_or_default("HASURA_BULK_METADATA", "false")),
+        data_product_max_concurrency=int(
+            get_env_or_default("DATA_PRODUCT_MAX_CONCURRENCY", "4")
+        ),
+        drop_source_on_unprovision=parse_bool(
+            get_env_or_default("HASURA_UNPROVISION_DROP_SOURCE", "false")
+        ),
     )
 
 
@@ -127,7 +709,17 @@ def get_env(name: str) -> str:
         raise ValueError(f"Required environment variable {name} not found.")
 
 
+def get_env_or_default(name: str, default: str) -> str:
+    value = os.getenv(name)
+    return value if value is not None else default
+
+
+def parse_bool(value: str) -> bool:
+    return value.strip().lower() in ("true", "1", "yes")
+
+
 def get_provisioner(
+    request: Request,
     hasura_admin_client: Annotated[HasuraAdminClient, Depends(get_hasura_admin_client)],
     role_mapper_client: Annotated[RoleMapperClient, Depends(get_role_mapper_client)],
     provisioner_config: Annotated[
@@ -138,8 +730,25 @@ def get_provisioner(
         hasura_admin_client,
         role_mapper_client,
         provisioner_config,
+        lock_scheduler=getattr(request.app.state, "lock_scheduler", None),
+        checkpoint_store=getattr(request.app.state, "checkpoint_store", None),
+        latency_tracker=getattr(request.app.state, "latency_tracker", None),
     )
     return provisioner
 
 
 HasuraProvisionerDep = Annotated[HasuraProvisioner, Depends(get_provisioner)]
+
+
+def create_provisioner(state: State) -> HasuraProvisioner:
+    """
+    Create a provisioner outside of a request, eg to replay a job after a restart
+    """
+    return HasuraProvisioner(
+        create_hasura_admin_client(get_hasura_config_from_env(), state),
+        create_role_mapper_client(get_role_mapper_config_from_env(), state),
+        get_provisioner_config_from_env(),
+        lock_scheduler=state.lock_scheduler,
+        checkpoint_store=state.checkpoint_store,
+        latency_tracker=state.latency_tracker,
+    )
@@ -1,63 +1,217 @@
 from __future__ import annotations
 
+import asyncio
 import logging
-from typing import Union
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List, Optional, Tuple, Union
 
-from fastapi import FastAPI
+import orjson
+from fastapi import FastAPI, Request
 from starlette import status
 from starlette.responses import Response
 
 import src
+from src.common.model.descriptor import (
+    HasuraDataProduct,
+)
+from src.common.model.health import CircuitState, HealthStatus, ServiceHealth
+from src.common.model.jobs import Job, JobStatus
+from src.common.model.reconciliation import ExecutionPlan
+from src.common.parsing.descriptor import parse_yaml_descriptor
 from src.dependencies import (
     HasuraProvisionerDep,
+    ProvisioningJobEngineDep,
+    ProvisioningResultCache,
+    ProvisioningSingleFlight,
+    ProvisioningTarget,
+    ProvisionLaneDep,
+    ResultCacheDep,
+    SingleFlightDep,
     UnpackedProvisioningRequestDep,
     UnpackedUpdateAclRequestDep,
+    UnprovisionLaneDep,
+    UpdateAclLaneDep,
+    ValidateLaneDep,
+    ValidationJobEngineDep,
+    create_checkpoint_store,
+    create_circuit_breaker,
+    create_garbage_collector,
+    create_hasura_connection_pool,
+    create_hasura_metadata_batcher,
+    create_hasura_metadata_cache,
+    create_provisioner,
+    create_provisioning_job_engine,
+    create_result_cache,
+    create_role_mapper_connection_pool,
+    create_validation_job_engine,
+    get_checkpoint_config_from_env,
+    get_garbage_collector_config_from_env,
+    get_hasura_config_from_env,
+    get_job_config_from_env,
+    get_result_cache_config_from_env,
+    get_role_mapper_config_from_env,
+    get_scheduler_config_from_env,
 )
 from src.models import (
+    ProvisioningRequest,
     ProvisioningStatus,
+    Status,
+    Status1,
     SystemError,
+    UpdateAclRequest,
     ValidationError,
     ValidationRequest,
     ValidationResult,
     ValidationStatus,
 )
+from src.services.hasura.provisioner import HasuraProvisioner
+from src.services.hasura.registry import SourceRegistry
+from src.services.jobs import JobRunner
+from src.services.keyedlock import KeyedLockScheduler
+from src.services.latency import LatencyTracker
+from src.services.resultcache import make_result_key
+from src.services.scheduler import LaneScheduler
+from src.services.singleflight import SingleFlight
+
+_logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """
+    Create the request scheduler, the process-wide connection pools and circuit
+    breakers of the downstream services, the metadata batcher, the metadata cache,
+    the source registry, the keyed lock scheduler, the latency tracker of the
+    downstream calls, the provisioning checkpoint store, the single-flight and result
+    caches of the provisioning requests, the metadata garbage collector and the job
+    engines on startup, and close them on shutdown
+    """
+    hasura_config = get_hasura_config_from_env()
+    role_mapper_config = get_role_mapper_config_from_env()
+    app.state.lane_scheduler = LaneScheduler(get_scheduler_config_from_env())
+    app.state.hasura_circuit_breaker = create_circuit_breaker(
+        "hasura", hasura_config.circuit_breaker
+    )
+    app.state.role_mapper_circuit_breaker = create_circuit_breaker(
+        "rolemapper", role_mapper_config.circuit_breaker
+    )
+    app.state.hasura_connection_pool = create_hasura_connection_pool(hasura_config)
+    app.state.hasura_metadata_batcher = create_hasura_metadata_batcher(
+        hasura_config,
+        app.state.hasura_connection_pool,
+        app.state.hasura_circuit_breaker,
+    )
+    app.state.hasura_metadata_cache = create_hasura_metadata_cache(
+        hasura_config,
+        app.state.hasura_connection_pool,
+        app.state.hasura_circuit_breaker,
+    )
+    app.state.hasura_source_registry = SourceRegistry()
+    app.state.lock_scheduler = KeyedLockScheduler()
+    app.state.latency_tracker = LatencyTracker()
+    app.state.checkpoint_store = create_checkpoint_store(
+        get_checkpoint_config_from_env()
+    )
+    app.state.single_flight = SingleFlight("provisioning")
+    app.state.result_cache = create_result_cache(
+        get_result_cache_config_from_env(), hasura_config, app.state
+    )
+    app.state.hasura_garbage_collector = create_garbage_collector(
+        hasura_config, get_garbage_collector_config_from_env(), app.state
+    )
+    if app.state.hasura_garbage_collector is not None:
+        await app.state.hasura_garbage_collector.start()
+    app.state.role_mapper_connection_pool = create_role_mapper_connection_pool(
+        role_mapper_config
+    )
+    app.state.provisioning_job_engine = create_provisioning_job_engine(
+        get_job_config_from_env("PROVISIONING_JOBS"),
+        lambda request: _replay_provisioning(request, create_provisioner(app.state)),
+    )
+    if app.state.provisioning_job_engine is not None:
+        await app.state.provisioning_job_engine.start()
+    app.state.validation_job_engine = create_validation_job_engine(
+        get_job_config_from_env("VALIDATION_JOBS"),
+        lambda request: lambda: _validate_descriptor(
+            request["descriptor"], create_provisioner(app.state)
+        ),
+    )
+    await app.state.validation_job_engine.start()
+    try:
+        yield
+    finally:
+        if app.state.hasura_garbage_collector is not None:
+            await app.state.hasura_garbage_collector.aclose()
+        await app.state.validation_job_engine.aclose()
+        if app.state.provisioning_job_engine is not None:
+            await app.state.provisioning_job_engine.aclose()
+        if app.state.hasura_metadata_batcher is not None:
+            await app.state.hasura_metadata_batcher.aclose()
+        await app.state.hasura_connection_pool.aclose()
+        await app.state.role_mapper_connection_pool.aclose()
+
 
 app = FastAPI(
     title="Hasura Specific Provisioner Microservice",
     description="Microservice responsible to handle provisioning and access control requests for Hasura-based data product components.",  # noqa: E501
     version=src.__version__,
     servers=[{"url": "/"}],
+    lifespan=lifespan,
 )
 
-_logger = logging.getLogger(__name__)
-
 
 @app.post(
     "/v1/provision",
     responses={
-        "200": {"model": ProvisioningStatus},
+        "200": {"model": Union[ProvisioningStatus, ExecutionPlan]},
         "202": {"model": str},
         "400": {"model": ValidationError},
         "500": {"model": SystemError},
     },
     tags=["SpecificProvisioner"],
 )
-def provision(
+async def provision(
+    provisioning_request: ProvisioningRequest,
+    lane: ProvisionLaneDep,
     unpacked_request: UnpackedProvisioningRequestDep,
     response: Response,
     provisioner: HasuraProvisionerDep,
-) -> Union[ProvisioningStatus, str, ValidationError, SystemError]:
+    job_engine: ProvisioningJobEngineDep,
+    result_cache: ResultCacheDep,
+    single_flight: SingleFlightDep,
+    plan: bool = False,
+) -> Union[ProvisioningStatus, ExecutionPlan, str, ValidationError, SystemError]:
     """
-    Deploy a data product or a single component starting from a provisioning descriptor
+    Deploy a data product or a single component starting from a provisioning descriptor;
+    with `plan`, return the calls it would make instead
     """
     try:
         if isinstance(unpacked_request, ValidationError):
             response.status_code = status.HTTP_400_BAD_REQUEST
             return unpacked_request
-        data_product, hasura_output_port, source_output_port = unpacked_request
-        provisioning_result = provisioner.provision(
-            data_product, hasura_output_port, source_output_port
+        if plan:
+            return await _make_plan(
+                "provision", unpacked_request, provisioner, response
+            )
+        run, component_id = _make_provisioning_job(
+            "provision", unpacked_request, provisioner
+        )
+        run = _deduplicate(
+            run,
+            "provision",
+            component_id,
+            [provisioning_request.descriptor],
+            result_cache,
+            single_flight,
         )
+        if job_engine is not None:
+            response.status_code = status.HTTP_202_ACCEPTED
+            return job_engine.submit(
+                run,
+                component_id=component_id,
+                request=_make_provisioning_job_request("provision", unpacked_request),
+            )
+        provisioning_result = await run()
         if isinstance(provisioning_result, ValidationError):
             response.status_code = status.HTTP_400_BAD_REQUEST
             return provisioning_result
@@ -83,43 +237,215 @@ def provision(
     },
     tags=["SpecificProvisioner"],
 )
-def get_status(
+async def get_status(
     token: str,
     response: Response,
+    job_engine: ProvisioningJobEngineDep,
 ) -> Union[ProvisioningStatus, ValidationError, SystemError]:
     """
     Get the status for a provisioning request
     """
-    response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
-    return SystemError(error="Not implemented")
+    try:
+        job = await job_engine.get(token) if job_engine is not None else None
+        if job is None:
+            response.status_code = status.HTTP_400_BAD_REQUEST
+            return ValidationError(
+                errors=[f"Unknown or expired provisioning token {token}"]
+            )
+        response.status_code = status.HTTP_200_OK
+        return _to_provisioning_status(job)
+    except Exception as ex:
+        _logger.exception("Exception in /v1/provision/{token}/status")
+        response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
+        return SystemError(error=str(ex))
+
+
+def _make_provisioning_job(
+    operation: str,
+    unpacked_request: ProvisioningTarget,
+    provisioner: HasuraProvisioner,
+) -> Tuple[JobRunner[Union[ProvisioningStatus, ValidationError]], str]:
+    """
+    Returns the runner of a provisioning operation with the id of the component it
+    acts on, the data product id for a whole data product
+    """
+    if isinstance(unpacked_request, HasuraDataProduct):
+        hasura_data_product = unpacked_request
+        run_data_product = (
+            provisioner.provision_data_product
+            if operation == "provision"
+            else provisioner.unprovision_data_product
+        )
+        return (
+            lambda: run_data_product(hasura_data_product),
+            hasura_data_product.data_product.id,
+        )
+    data_product, hasura_output_port, source_output_port = unpacked_request
+    run_component = (
+        provisioner.provision if operation == "provision" else provisioner.unprovision
+    )
+    return (
+        lambda: run_component(data_product, hasura_output_port, source_output_port),
+        hasura_output_port.id,
+    )
+
+
+async def _make_plan(
+    operation: str,
+    unpacked_request: ProvisioningTarget,
+    provisioner: HasuraProvisioner,
+    response: Response,
+) -> Union[ExecutionPlan, ValidationError]:
+    """
+    Returns the execution plan of a provisioning operation, without running it
+    """
+    if isinstance(unpacked_request, HasuraDataProduct):
+        plan_data_product = (
+            provisioner.plan_provision_data_product
+            if operation == "provision"
+            else provisioner.plan_unprovision_data_product
+        )
+        return _to_plan_response(await plan_data_product(unpacked_request), response)
+    data_product, hasura_output_port, source_output_port = unpacked_request
+    plan_component = (
+        provisioner.plan_provision
+        if operation == "provision"
+        else provisioner.plan_unprovision
+    )
+    return _to_plan_response(
+        await plan_component(data_product, hasura_output_port, source_output_port),
+        response,
+    )
+
+
+def _to_plan_response(
+    execution_plan: Union[ExecutionPlan, ValidationError], response: Response
+) -> Union[ExecutionPlan, ValidationError]:
+    if isinstance(execution_plan, ValidationError):
+        response.status_code = status.HTTP_400_BAD_REQUEST
+    else:
+        response.status_code = status.HTTP_200_OK
+    return execution_plan
+
+
+def _deduplicate(
+    run: JobRunner[Union[ProvisioningStatus, ValidationError]],
+    operation: str,
+    component_id: str,
+    request_parts: List[str],
+    result_cache: Optional[ProvisioningResultCache],
+    single_flight: Optional[ProvisioningSingleFlight],
+) -> JobRunner[Union[ProvisioningStatus, ValidationError]]:
+    """
+    Answer a request identical to a completed one from the result cache, and attach
+    a request identical to one in flight to it
+    """
+    if result_cache is not None:
+        run = result_cache.wrap(
+            operation, make_result_key(operation, *request_parts), component_id, run
+        )
+    if single_flight is not None:
+        run = single_flight.wrap(
+            make_result_key(operation, component_id, *request_parts), run
+        )
+    return run
+
+
+def _make_provisioning_job_request(
+    operation: str,
+    unpacked_request: ProvisioningTarget,
+) -> dict:
+    # the data product holds all its components, the source output port included
+    if isinstance(unpacked_request, HasuraDataProduct):
+        return {
+            "operation": operation,
+            "descriptor": {"dataProduct": unpacked_request.data_product.dict()},
+        }
+    data_product, hasura_output_port, _ = unpacked_request
+    return {
+        "operation": operation,
+        "descriptor": {
+            "dataProduct": data_product.dict(),
+            "componentIdToProvision": hasura_output_port.id,
+        },
+    }
+
+
+def _replay_provisioning(
+    request: dict, provisioner: HasuraProvisioner
+) -> JobRunner[Union[ProvisioningStatus, ValidationError]]:
+    # JSON is valid YAML
+    descriptor = orjson.dumps(request["descriptor"]).decode()
+    unpacked_request: ProvisioningTarget = parse_yaml_descriptor(descriptor)
+    run, _ = _make_provisioning_job(request["operation"], unpacked_request, provisioner)
+    return run
+
+
+def _to_provisioning_status(
+    job: Job[Union[ProvisioningStatus, ValidationError]]
+) -> ProvisioningStatus:
+    if job.status == JobStatus.RUNNING:
+        return ProvisioningStatus(status=Status1.RUNNING, result="")
+    if job.status == JobStatus.FAILED:
+        return ProvisioningStatus(status=Status1.FAILED, result=job.error or "")
+    if isinstance(job.result, ProvisioningStatus):
+        return job.result
+    errors = job.result.errors if isinstance(job.result, ValidationError) else []
+    return ProvisioningStatus(status=Status1.FAILED, result="; ".join(errors))
 
 
 @app.post(
     "/v1/unprovision",
     responses={
-        "200": {"model": ProvisioningStatus},
+        "200": {"model": Union[ProvisioningStatus, ExecutionPlan]},
         "202": {"model": str},
         "400": {"model": ValidationError},
         "500": {"model": SystemError},
     },
     tags=["SpecificProvisioner"],
 )
-def unprovision(
+async def unprovision(
+    provisioning_request: ProvisioningRequest,
+    lane: UnprovisionLaneDep,
     unpacked_request: UnpackedProvisioningRequestDep,
     response: Response,
     provisioner: HasuraProvisionerDep,
-) -> Union[ProvisioningStatus, str, ValidationError, SystemError]:
+    job_engine: ProvisioningJobEngineDep,
+    result_cache: ResultCacheDep,
+    single_flight: SingleFlightDep,
+    plan: bool = False,
+) -> Union[ProvisioningStatus, ExecutionPlan, str, ValidationError, SystemError]:
     """
-    Undeploy a data product or a single component given the provisioning descriptor relative to the latest complete provisioning request
+    Undeploy a data product or a single component given the provisioning descriptor relative to the latest complete provisioning request;
+    with `plan`, return the calls it would make instead
     """  # noqa: E501
     try:
         if isinstance(unpacked_request, ValidationError):
             response.status_code = status.HTTP_400_BAD_REQUEST
             return unpacked_request
-        data_product, hasura_output_port, source_output_port = unpacked_request
-        provisioning_result = provisioner.unprovision(
-            data_product, hasura_output_port, source_output_port
+        if plan:
+            return await _make_plan(
+                "unprovision", unpacked_request, provisioner, response
+            )
+        run, component_id = _make_provisioning_job(
+            "unprovision", unpacked_request, provisioner
+        )
+        run = _deduplicate(
+            run,
+            "unprovision",
+            component_id,
+            [provisioning_request.descriptor],
+            result_cache,
+            single_flight,
         )
+        if job_engine is not None:
+            response.status_code = status.HTTP_202_ACCEPTED
+            return job_engine.submit(
+                run,
+                component_id=component_id,
+                request=_make_provisioning_job_request("unprovision", unpacked_request),
+            )
+        provisioning_result = await run()
         if isinstance(provisioning_result, ValidationError):
             response.status_code = status.HTTP_400_BAD_REQUEST
             return provisioning_result
@@ -139,29 +465,52 @@ def unprovision(
 @app.post(
     "/v1/updateacl",
     responses={
-        "200": {"model": ProvisioningStatus},
+        "200": {"model": Union[ProvisioningStatus, ExecutionPlan]},
         "202": {"model": str},
         "400": {"model": ValidationError},
         "500": {"model": SystemError},
     },
     tags=["SpecificProvisioner"],
 )
-def updateacl(
+async def updateacl(
+    update_acl_request: UpdateAclRequest,
+    lane: UpdateAclLaneDep,
     unpacked_request: UnpackedUpdateAclRequestDep,
     response: Response,
     provisioner: HasuraProvisionerDep,
-) -> Union[ProvisioningStatus, str, ValidationError, SystemError]:
+    single_flight: SingleFlightDep,
+    plan: bool = False,
+) -> Union[ProvisioningStatus, ExecutionPlan, str, ValidationError, SystemError]:
     """
-    Request the access to a specific provisioner component
+    Request the access to a specific provisioner component; with `plan`, return the
+    calls it would make instead
     """
     try:
         if isinstance(unpacked_request, ValidationError):
             response.status_code = status.HTTP_400_BAD_REQUEST
             return unpacked_request
         data_product, hasura_output_port, source_output_port, refs = unpacked_request
-        provisioning_result = provisioner.update_acl(
-            data_product, hasura_output_port, source_output_port, refs
+        if plan:
+            return _to_plan_response(
+                await provisioner.plan_update_acl(
+                    data_product, hasura_output_port, source_output_port
+                ),
+                response,
+            )
+        run = _deduplicate(
+            lambda: provisioner.update_acl(
+                data_product, hasura_output_port, source_output_port, refs
+            ),
+            "updateacl",
+            hasura_output_port.id,
+            # the order of the identities does not change the mappings
+            [update_acl_request.provisionInfo.request, "\n".join(sorted(refs))],
+            # the mappings live in the Role Mapper, the Hasura resource version
+            # the result cache relies on does not change with them
+            None,
+            single_flight,
         )
+        provisioning_result = await run()
         if isinstance(provisioning_result, ValidationError):
             response.status_code = status.HTTP_400_BAD_REQUEST
             return provisioning_result
@@ -183,7 +532,8 @@ def updateacl(
     responses={"200": {"model": ValidationResult}, "500": {"model": SystemError}},
     tags=["SpecificProvisioner"],
 )
-def validate(
+async def validate(
+    lane: ValidateLaneDep,
     unpacked_request: UnpackedProvisioningRequestDep,
     response: Response,
     provisioner: HasuraProvisionerDep,
@@ -195,10 +545,13 @@ def validate(
         if isinstance(unpacked_request, ValidationError):
             response.status_code = status.HTTP_200_OK
             return ValidationResult(valid=False, error=unpacked_request)
-        data_product, hasura_output_port, source_output_port = unpacked_request
-        validation_result = provisioner.validate(
-            data_product, hasura_output_port, source_output_port
-        )
+        if isinstance(unpacked_request, HasuraDataProduct):
+            validation_result = provisioner.validate_data_product(unpacked_request)
+        else:
+            data_product, hasura_output_port, source_output_port = unpacked_request
+            validation_result = provisioner.validate(
+                data_product, hasura_output_port, source_output_port
+            )
         response.status_code = status.HTTP_200_OK
         return validation_result
     except Exception as ex:
@@ -216,15 +569,54 @@ def validate(
     },
     tags=["SpecificProvisioner"],
 )
-def async_validate(
+async def async_validate(
     body: ValidationRequest,
     response: Response,
+    provisioner: HasuraProvisionerDep,
+    job_engine: ValidationJobEngineDep,
 ) -> Union[None, str, ValidationError, SystemError]:
     """
     Validate a deployment request
     """
-    response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
-    return SystemError(error="Not implemented")
+    try:
+        if job_engine is None:
+            raise Exception("The validation job engine is not running")
+        response.status_code = status.HTTP_202_ACCEPTED
+        return job_engine.submit(
+            lambda: _validate_descriptor(body.descriptor, provisioner),
+            request={"descriptor": body.descriptor},
+        )
+    except Exception as ex:
+        _logger.exception("Exception in /v2/validate")
+        response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
+        return SystemError(error=str(ex))
+
+
+async def _validate_descriptor(
+    descriptor: str, provisioner: HasuraProvisioner
+) -> ValidationResult:
+    # parsing large descriptors is CPU bound, it is kept off the event loop
+    try:
+        unpacked_request = await asyncio.to_thread(parse_yaml_descriptor, descriptor)
+    except Exception as ex:
+        return ValidationResult(
+            valid=False,
+            error=ValidationError(errors=["Unable to parse the descriptor.", str(ex)]),
+        )
+    if isinstance(unpacked_request, HasuraDataProduct):
+        validation_result = provisioner.validate_data_product(unpacked_request)
+        if not validation_result.valid:
+            return validation_result
+        return await provisioner.check_preflight_data_product(unpacked_request)
+    data_product, hasura_output_port, source_output_port = unpacked_request
+    validation_result = provisioner.validate(
+        data_product, hasura_output_port, source_output_port
+    )
+    if not validation_result.valid:
+        return validation_result
+    return await provisioner.check_preflight(
+        data_product, hasura_output_port, source_output_port
+    )
 
 
 @app.get(
@@ -236,12 +628,61 @@ def async_validate(
     },
     tags=["SpecificProvisioner"],
 )
-def get_validation_status(
+async def get_validation_status(
     token: str,
     response: Response,
+    job_engine: ValidationJobEngineDep,
 ) -> Union[ValidationStatus, ValidationError, SystemError]:
     """
     Get the status for a provisioning request
     """
-    response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
-    return SystemError(error="Not implemented")
+    try:
+        job = await job_engine.get(token) if job_engine is not None else None
+        if job is None:
+            response.status_code = status.HTTP_400_BAD_REQUEST
+            return ValidationError(
+                errors=[f"Unknown or expired validation token {token}"]
+            )
+        response.status_code = status.HTTP_200_OK
+        return _to_validation_status(job)
+    except Exception as ex:
+        _logger.exception("Exception in /v2/validate/{token}/status")
+        response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
+        return SystemError(error=str(ex))
+
+
+def _to_validation_status(job: Job[ValidationResult]) -> ValidationStatus:
+    if job.status == JobStatus.RUNNING:
+        return ValidationStatus(status=Status.RUNNING)
+    if job.status == JobStatus.FAILED:
+        return ValidationStatus(
+            status=Status.FAILED,
+            result=ValidationResult(
+                valid=False, error=ValidationError(errors=[job.error or ""])
+            ),
+        )
+    return ValidationStatus(status=Status.COMPLETED, result=job.result)
+
+
+@app.get(
+    "/v1/health",
+    responses={"200": {"model": ServiceHealth}},
+    tags=["SpecificProvisioner"],
+)
+async def health(request: Request) -> ServiceHealth:
+    """
+    Report the state of the circuit breakers of the downstream services
+    """
+    circuit_breakers = {
+        circuit_breaker.name: circuit_breaker.state
+        for circuit_breaker in (
+            getattr(request.app.state, "hasura_circuit_breaker", None),
+            getattr(request.app.state, "role_mapper_circuit_breaker", None),
+        )
+        if circuit_breaker is not None
+    }
+    degraded = any(state == CircuitState.OPEN for state in circuit_breakers.values())
+    return ServiceHealth(
+        status=HealthStatus.DEGRADED if degraded else HealthStatus.OK,
+        circuit_breakers=circuit_breakers,
+    )
@@ -0,0 +1,156 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, Optional
+
+import orjson
+
+from src.common.model.reconciliation import Checkpoint, DesiredState
+
+
+def make_checkpoint_key(
+    operation: str, component_id: str, desired_state: DesiredState
+) -> str:
+    """
+    Key of the checkpoint of a provisioning run: the operation and component id
+    with a hash of the desired state, which is derived from the descriptor, so that
+    a changed descriptor never resumes the run of a previous one
+    """
+    digest = hashlib.sha256(operation.encode())
+    digest.update(b"\0")
+    digest.update(component_id.encode())
+    digest.update(b"\0")
+    digest.update(orjson.dumps(desired_state.dict(), option=orjson.OPT_SORT_KEYS))
+    return digest.hexdigest()
+
+
+class CheckpointStore(ABC):
+    """
+    Storage of the checkpoints of the provisioning runs.
+
+    Checkpoints older than `ttl` seconds, or already resumed by `max_resumes` runs
+    that failed again, are ignored: the steps they record as completed may have
+    been undone in the meantime, so the operations are planned again.
+    """
+
+    def __init__(self, ttl: float, max_resumes: int):
+        self._ttl = ttl
+        self._max_resumes = max_resumes
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[Checkpoint]:
+        """
+        Returns the checkpoint with the provided key, or None if it is unknown or
+        expired
+        """
+
+    @abstractmethod
+    async def save(self, key: str, checkpoint: Checkpoint) -> None:
+        """
+        Insert or update a checkpoint
+        """
+
+    @abstractmethod
+    async def delete(self, key: str) -> None:
+        """
+        Delete a checkpoint, once its run completed
+        """
+
+    def _is_expired(self, checkpoint: Checkpoint) -> bool:
+        return (
+            checkpoint.created_at <= time.time() - self._ttl
+            or checkpoint.resumes >= self._max_resumes
+        )
+
+
+class InMemoryCheckpointStore(CheckpointStore):
+    """
+    Checkpoint store kept in memory only, the checkpoints are lost on restart
+    """
+
+    _checkpoints: Dict[str, Checkpoint]
+
+    def __init__(self, ttl: float, max_resumes: int):
+        super().__init__(ttl, max_resumes)
+        self._checkpoints = {}
+
+    async def get(self, key: str) -> Optional[Checkpoint]:
+        checkpoint = self._checkpoints.get(key)
+        if checkpoint is not None and self._is_expired(checkpoint):
+            del self._checkpoints[key]
+            return None
+        return checkpoint
+
+    async def save(self, key: str, checkpoint: Checkpoint) -> None:
+        self._checkpoints[key] = checkpoint
+        # expired checkpoints of runs that were never retried are dropped here
+        for expired_key in [
+            other_key
+            for other_key, other in self._checkpoints.items()
+            if self._is_expired(other)
+        ]:
+            del self._checkpoints[expired_key]
+
+    async def delete(self, key: str) -> None:
+        self._checkpoints.pop(key, None)
+
+
+class FileCheckpointStore(CheckpointStore):
+    """
+    Checkpoint store persisted as one JSON file per checkpoint in a directory, so
+    that the checkpoints survive a restart and can be shared by the replicas
+    mounting the same volume. Files are replaced atomically and accessed off the
+    event loop.
+    """
+
+    def __init__(self, path: str, ttl: float, max_resumes: int):
+        super().__init__(ttl, max_resumes)
+        self._path = path
+        self._write_lock = asyncio.Lock()
+        self._logger = logging.getLogger(__name__)
+
+    async def get(self, key: str) -> Optional[Checkpoint]:
+        checkpoint = await asyncio.to_thread(self._read, key)
+        if checkpoint is not None and self._is_expired(checkpoint):
+            await self.delete(key)
+            return None
+        return checkpoint
+
+    async def save(self, key: str, checkpoint: Checkpoint) -> None:
+        content = orjson.dumps(checkpoint.dict())
+        # concurrent steps of a run save in the order they completed
+        async with self._write_lock:
+            await asyncio.to_thread(self._write, key, content)
+
+    async def delete(self, key: str) -> None:
+        await asyncio.to_thread(self._remove, key)
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self._path, f"{key}.json")
+
+    def _read(self, key: str) -> Optional[Checkpoint]:
+        try:
+            with open(self._file(key), "rb") as file:
+                return Checkpoint.parse_obj(orjson.loads(file.read()))
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # a corrupted checkpoint only costs a full run
+            self._logger.warning("Ignoring unreadable checkpoint %s", key)
+            return None
+
+    def _write(self, key: str, content: bytes) -> None:
+        os.makedirs(self._path, exist_ok=True)
+        temporary_file = f"{self._file(key)}.{os.getpid()}.tmp"
+        with open(temporary_file, "wb") as file:
+            file.write(content)
+        os.replace(temporary_file, self._file(key))
+
+    def _remove(self, key: str) -> None:
+        try:
+            os.remove(self._file(key))
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,124 @@
+import logging
+import time
+import weakref
+
+from opentelemetry import metrics
+from opentelemetry.metrics import CallbackOptions, Observation
+
+from src.common.model.config import CircuitBreakerConfig
+from src.common.model.health import CircuitState
+
+_meter = metrics.get_meter(__name__)
+_rejected_calls = _meter.create_counter(
+    "circuit_breaker.rejected_calls",
+    description="Requests failed fast because the circuit breaker was open",
+)
+
+# numeric encoding of the state for the circuit_breaker.state gauge
+_STATE_VALUES = {
+    CircuitState.CLOSED: 0,
+    CircuitState.HALF_OPEN: 1,
+    CircuitState.OPEN: 2,
+}
+
+# circuit breakers observed by the circuit_breaker.state gauge, which is created
+# once and reports each breaker under its own service attribute
+_breakers: "weakref.WeakSet[CircuitBreaker]" = weakref.WeakSet()
+
+
+def _observe_state(options: CallbackOptions) -> list[Observation]:
+    return [
+        Observation(_STATE_VALUES[breaker.state], {"service": breaker.name})
+        for breaker in list(_breakers)
+    ]
+
+
+_meter.create_observable_gauge(
+    "circuit_breaker.state",
+    callbacks=[_observe_state],
+    description="Circuit breaker state: 0 closed, 1 half-open, 2 open",
+)
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker(object):
+    """
+    Circuit breaker for a single downstream service, shared by all requests.
+
+    After `failure_threshold` consecutive failures the circuit opens and requests
+    fail immediately instead of waiting for the downstream timeout. Once
+    `reset_timeout` seconds have passed the circuit is half-open: up to
+    `half_open_max_calls` trial requests are let through, and the circuit closes
+    again on the first success or opens again on the first failure.
+    """
+
+    _name: str
+    _config: CircuitBreakerConfig
+    _state: CircuitState
+
+    def __init__(self, name: str, config: CircuitBreakerConfig):
+        self._name = name
+        self._config = config
+        self._state = CircuitState.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+        self._logger = logging.getLogger(__name__)
+        _breakers.add(self)
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def state(self) -> CircuitState:
+        if (
+            self._state == CircuitState.OPEN
+            and time.monotonic() - self._opened_at >= self._config.reset_timeout
+        ):
+            self._transition(CircuitState.HALF_OPEN)
+        return self._state
+
+    def before_call(self) -> None:
+        """
+        Raise CircuitOpenError if the request must not be sent
+        """
+        state = self.state
+        if state == CircuitState.HALF_OPEN:
+            if self._half_open_calls < self._config.half_open_max_calls:
+                self._half_open_calls += 1
+                return
+        elif state == CircuitState.CLOSED:
+            return
+        _rejected_calls.add(1, {"service": self._name})
+        raise CircuitOpenError(
+            f"The {self._name} service is unavailable (circuit breaker open); "
+            "please retry later."
+        )
+
+    def record_success(self) -> None:
+        self._failures = 0
+        if self._state != CircuitState.CLOSED:
+            self._transition(CircuitState.CLOSED)
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        if self._state == CircuitState.HALF_OPEN or (
+            self._state == CircuitState.CLOSED
+            and self._failures >= self._config.failure_threshold
+        ):
+            self._opened_at = time.monotonic()
+            self._transition(CircuitState.OPEN)
+
+    def _transition(self, state: CircuitState) -> None:
+        self._logger.warning(
+            "Circuit breaker for %s moving from %s to %s",
+            self._name,
+            self._state,
+            state,
+        )
+        self._state = state
+        self._half_open_calls = 0
@@ -0,0 +1,95 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+# status code and, for 400 responses, the error payload of a metadata request
+MetadataResponse = Tuple[int, Optional[dict]]
+
+BulkSender = Callable[[List[dict]], Awaitable[List[MetadataResponse]]]
+
+
+class MetadataBatcher(object):
+    """
+    Group-commit batcher for Hasura metadata write requests.
+
+    Requests submitted by concurrent callers are collected for up to `window`
+    seconds, or until `max_batch_size` requests are pending, and are then sent to
+    Hasura as a single bulk request; each caller receives the result of its own
+    request. Batches are sent one at a time and in submission order, so requests
+    that depend on each other (eg, add source then track table) keep their order.
+    """
+
+    _send_bulk: BulkSender
+    _window: float
+    _max_batch_size: int
+    _pending: List[Tuple[dict, "asyncio.Future[MetadataResponse]"]]
+
+    def __init__(self, send_bulk: BulkSender, window: float, max_batch_size: int):
+        if window <= 0:
+            raise ValueError("The batching window must be greater than zero")
+        if max_batch_size < 1:
+            raise ValueError("The maximum batch size must be at least 1")
+        self._send_bulk = send_bulk
+        self._window = window
+        self._max_batch_size = max_batch_size
+        self._pending = []
+        self._flush_timer: Optional[asyncio.TimerHandle] = None
+        self._send_lock = asyncio.Lock()
+        self._flushes: set[asyncio.Task] = set()
+        self._logger = logging.getLogger(__name__)
+
+    async def submit(self, request: dict) -> MetadataResponse:
+        """
+        Enqueue a metadata request and wait for the result of the batch it ends up in
+        """
+        future: asyncio.Future[
+            MetadataResponse
+        ] = asyncio.get_running_loop().create_future()
+        self._pending.append((request, future))
+        if len(self._pending) >= self._max_batch_size:
+            self._flush()
+        elif self._flush_timer is None:
+            self._flush_timer = asyncio.get_running_loop().call_later(
+                self._window, self._flush
+            )
+        return await future
+
+    async def aclose(self) -> None:
+        """
+        Send any pending request and wait for all in-flight batches to complete
+        """
+        self._flush()
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+
+    def _flush(self) -> None:
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        task = asyncio.get_running_loop().create_task(self._send(batch))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _send(
+        self, batch: List[Tuple[dict, "asyncio.Future[MetadataResponse]"]]
+    ) -> None:
+        async with self._send_lock:
+            self._logger.debug("Sending a batch of %d metadata requests", len(batch))
+            try:
+                results = await self._send_bulk([request for request, _ in batch])
+                if len(results) != len(batch):
+                    raise ValueError(
+                        f"Expected {len(batch)} results from the bulk request but "
+                        f"got {len(results)}"
+                    )
+            except Exception as ex:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(ex)
+                return
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
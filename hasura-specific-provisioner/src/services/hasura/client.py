@@ -1,12 +1,17 @@
+import asyncio
 import codecs
 import logging
-from typing import List, Optional, Union
+from typing import Any, Dict, List, Optional, Tuple, Union
 
-from httpx import Client, Response
-from pydantic import parse_obj_as
+import orjson
+from httpx import AsyncClient, Response
+from opentelemetry import metrics
 
+from src.common.log import LazyBody
+from src.common.model.config import RetryConfig
 from src.common.model.hasura import (
     AddSourceResult,
+    ClearSourceResult,
     CreateSelectPermissionResult,
     DataSourceConfig,
     DataSourceType,
@@ -14,166 +19,517 @@ from src.common.model.hasura import (
     DropSourceResult,
     Health,
     QualifiedTable,
+    ResourceState,
     TableConfig,
     TrackTableResult,
     UntrackTableResult,
 )
+from src.common.model.reconciliation import OperationType
+from src.services.circuitbreaker import CircuitBreaker
 from src.services.hasura.auth import HasuraAdminTokenAuth
+from src.services.hasura.batcher import MetadataBatcher, MetadataResponse
+from src.services.hasura.metadata import (
+    HasuraMetadataCache,
+    MetadataSnapshot,
+    TableSpec,
+)
+from src.services.hasura.registry import SourceRegistry
+from src.services.retry import Retrier
+
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
+_meter = metrics.get_meter(__name__)
+_metadata_writes = _meter.create_counter(
+    "hasura.metadata.writes",
+    description="Metadata write requests sent to Hasura, including retries",
+)
+_metadata_conflicts = _meter.create_counter(
+    "hasura.metadata.conflicts",
+    description="Metadata write requests rejected due to a resource version conflict",
+)
+_metadata_conflict_retries = _meter.create_counter(
+    "hasura.metadata.conflict_retries",
+    description="Metadata write requests retried after a resource version conflict",
+)
+
+# operations that leave Hasura in the same state however many times they are run,
+# given that "already exists" and "does not exist" errors are treated as success
+IDEMPOTENT_OPERATIONS = frozenset(
+    {
+        "add_source",
+        "update_source",
+        "drop_source",
+        "track_table",
+        "set_table_customization",
+        "untrack_table",
+        "create_select_permission",
+        "drop_select_permission",
+        "bulk_keep_going",
+        "export_metadata",
+        "get_source_tables",
+    }
+)
 
 
 class HasuraAdminClient(object):
     _metadata_endpoint: str
     _query_endpoint: str
     _health_endpoint: str
-    _client: Client
+    _client: AsyncClient
 
     def __init__(
-        self, hasura_url: str, hasura_admin_secret: str, hasura_timeout: int = 30
+        self,
+        hasura_url: str,
+        hasura_admin_secret: str,
+        hasura_timeout: int = 30,
+        client: Optional[AsyncClient] = None,
+        batcher: Optional[MetadataBatcher] = None,
+        metadata_cache: Optional[HasuraMetadataCache] = None,
+        conflict_max_retries: int = 3,
+        retry_config: Optional[RetryConfig] = None,
+        circuit_breaker: Optional[CircuitBreaker] = None,
+        source_registry: Optional[SourceRegistry] = None,
     ):
         self._metadata_endpoint = self._ensure_slash(hasura_url) + "v1/metadata"
         self._query_endpoint = self._ensure_slash(hasura_url) + "v2/query"
         self._health_endpoint = self._ensure_slash(hasura_url) + "healthz"
-        auth = HasuraAdminTokenAuth(hasura_admin_secret)
-        self._client = Client(auth=auth, timeout=hasura_timeout)
+        if client is None:
+            auth = HasuraAdminTokenAuth(hasura_admin_secret)
+            self._client = AsyncClient(auth=auth, timeout=hasura_timeout)
+        else:
+            self._client = client
+        self._batcher = batcher
+        self._metadata_cache = metadata_cache
+        self._source_registry = source_registry
+        self._conflict_max_retries = conflict_max_retries
+        self._retrier = Retrier(
+            service="hasura",
+            config=RetryConfig(max_attempts=1)
+            if retry_config is None
+            else retry_config,
+            idempotent_operations=IDEMPOTENT_OPERATIONS,
+            circuit_breaker=circuit_breaker,
+        )
+        # resource version of the metadata the next write is based on, if known
+        self._resource_version: Optional[int] = None
         self._logger = logging.getLogger(__name__)
 
-    def add_source(self, data_source_config: DataSourceConfig) -> AddSourceResult:
+    async def add_source(self, data_source_config: DataSourceConfig) -> AddSourceResult:
         """
         Add a data source according to the provided config
         """
 
-        self._logger.info(f"Attempting to add source with config: {data_source_config}")
-        response = self._add_source(data_source_config)
-        self._logger.info(f"Got response: {response}")
+        self._logger.info(
+            "Attempting to add source with config: %s", data_source_config
+        )
+        if await self._is_source_up_to_date(data_source_config):
+            self._logger.info("Source already up to date, skipping")
+            return AddSourceResult.ALREADY_EXISTS
+        status_code, error = await self._add_source(data_source_config)
+        self._logger.info("Got response: %s", status_code)
 
-        if response.status_code == 200:
-            return AddSourceResult.SUCCESS
-        else:
-            if response.status_code == 400:
-                code = response.json()["code"]
-                if code is not None and code == "already-exists":
-                    return AddSourceResult.ALREADY_EXISTS
-                else:
-                    return AddSourceResult.FAILURE
-            else:
-                return AddSourceResult.FAILURE
+        return self._to_add_source_result(status_code, error)
 
-    def drop_source(self, data_source_config: DataSourceConfig) -> DropSourceResult:
+    async def drop_source(
+        self, data_source_config: DataSourceConfig
+    ) -> DropSourceResult:
         """
         Drop a data source according to the provided config
         """
 
         self._logger.info(
-            f"Attempting to drop source with config: {data_source_config}"
+            "Attempting to drop source with config: %s", data_source_config
         )
-        response = self._drop_source(data_source_config)
-        self._logger.info(f"Got response: {response}")
+        status_code, error = await self._drop_source(data_source_config)
+        self._logger.info("Got response: %s", status_code)
 
-        if response.status_code == 200:
-            return DropSourceResult.SUCCESS
-        else:
-            if response.status_code == 400:
-                code = response.json()["code"]
-                if code is not None and code == "not-exists":
-                    return DropSourceResult.NOT_EXISTS
-                else:
-                    return DropSourceResult.FAILURE
-            else:
-                return DropSourceResult.FAILURE
+        return self._to_drop_source_result(status_code, error)
 
-    def track_table(self, table_config: TableConfig) -> TrackTableResult:
+    async def track_table(self, table_config: TableConfig) -> TrackTableResult:
         """
         Track a table according to the provided config
         """
 
-        self._logger.info(f"Attempting to track table with config: {table_config}")
-        response = self._track_table(table_config)
-        self._logger.info(f"Got response: {response}")
+        self._logger.info("Attempting to track table with config: %s", table_config)
+        if await self._is_table_up_to_date(table_config):
+            self._logger.info("Table already tracked and up to date, skipping")
+            return TrackTableResult.ALREADY_TRACKED
+        status_code, error = await self._track_table(table_config)
+        self._logger.info("Got response: %s", status_code)
 
-        if response.status_code == 200:
-            return TrackTableResult.SUCCESS
-        else:
-            if response.status_code == 400:
-                code = response.json()["code"]
-                if code is not None and code == "already-tracked":
-                    return TrackTableResult.ALREADY_TRACKED
-                else:
-                    return TrackTableResult.FAILURE
-            else:
-                return TrackTableResult.FAILURE
+        return self._to_track_table_result(status_code, error)
 
-    def untrack_table(self, table_config: TableConfig) -> UntrackTableResult:
+    async def untrack_table(self, table_config: TableConfig) -> UntrackTableResult:
         """
         Untrack a table according to the provided config
         """
 
-        self._logger.info(f"Attempting to untrack table with config: {table_config}")
-        response = self._untrack_table(table_config)
-        self._logger.info(f"Got response: {response}")
+        self._logger.info("Attempting to untrack table with config: %s", table_config)
+        status_code, error = await self._untrack_table(table_config)
+        self._logger.info("Got response: %s", status_code)
 
-        if response.status_code == 200:
-            return UntrackTableResult.SUCCESS
-        else:
-            if response.status_code == 400:
-                code = response.json()["code"]
-                if code is not None and code == "already-untracked":
-                    return UntrackTableResult.NOT_TRACKED
-                else:
-                    return UntrackTableResult.FAILURE
-            else:
-                return UntrackTableResult.FAILURE
+        return self._to_untrack_table_result(status_code, error)
 
-    def create_select_permission(
+    async def create_select_permission(
         self, table_config: TableConfig, role_id: str
     ) -> CreateSelectPermissionResult:
         self._logger.info(
-            "Attempting to create select permission on table with "
-            + f"config: {table_config} for role: {role_id}"
+            "Attempting to create select permission on table with config: %s "
+            "for role: %s",
+            table_config,
+            role_id,
         )
-        response = self._create_select_permission(table_config, role_id)
-        self._logger.info(f"Got response: {response}")
+        if await self._is_select_permission_up_to_date(table_config, role_id):
+            self._logger.info("Select permission already up to date, skipping")
+            return CreateSelectPermissionResult.ALREADY_EXISTS
+        status_code, error = await self._create_select_permission(table_config, role_id)
+        self._logger.info("Got response: %s", status_code)
 
-        if response.status_code == 200:
-            return CreateSelectPermissionResult.SUCCESS
-        else:
-            if response.status_code == 400:
-                code = response.json()["code"]
-                if code is not None and code == "already-exists":
-                    return CreateSelectPermissionResult.ALREADY_EXISTS
-                else:
-                    return CreateSelectPermissionResult.FAILURE
-            else:
-                return CreateSelectPermissionResult.FAILURE
+        return self._to_create_select_permission_result(status_code, error)
 
-    def drop_select_permission(
+    async def drop_select_permission(
         self, table_config: TableConfig, role_id: str
     ) -> DropSelectPermissionResult:
         self._logger.info(
-            "Attempting to drop select permission on table with "
-            + f"config: {table_config} for role: {role_id}"
+            "Attempting to drop select permission on table with config: %s "
+            "for role: %s",
+            table_config,
+            role_id,
         )
-        response = self._drop_select_permission(table_config, role_id)
-        self._logger.info(f"Got response: {response}")
+        status_code, error = await self._drop_select_permission(table_config, role_id)
+        self._logger.info("Got response: %s", status_code)
 
-        if response.status_code == 200:
-            return DropSelectPermissionResult.SUCCESS
+        return self._to_drop_select_permission_result(status_code, error)
+
+    async def clear_source(
+        self, data_source_config: DataSourceConfig, drop_source: bool = False
+    ) -> Tuple[ClearSourceResult, int]:
+        """
+        Drop the select permissions of all the tables tracked in a data source and
+        untrack them, then drop the source itself if `drop_source`, with a single
+        atomic bulk metadata request so that Hasura rebuilds its schema cache once.
+        Returns the result with the number of untracked tables
+        """
+
+        self._logger.info(
+            "Attempting to clear source %s (drop source: %s)",
+            data_source_config.data_source_name,
+            drop_source,
+        )
+        # the atomic request fails as a whole if it does not match the metadata, so
+        # it is planned on a fresh export rather than on the cached snapshot, and
+        # planned again on a conflict instead of being resent as is
+        retries = 0
+        while True:
+            snapshot = MetadataSnapshot(*await self.export_metadata())
+            self._resource_version = snapshot.resource_version
+            if self._source_registry is not None:
+                self._source_registry.sync(snapshot)
+            if snapshot.get_source(data_source_config.data_source_name) is None:
+                self._logger.info("Source does not exist, skipping")
+                return ClearSourceResult.NOT_EXISTS, 0
+
+            tables = snapshot.get_tables(data_source_config.data_source_name)
+            requests = self._make_clear_source_requests(
+                data_source_config, tables, drop_source
+            )
+            if not requests:
+                self._logger.info("Source has no tracked tables, skipping")
+                return ClearSourceResult.SUCCESS, 0
+
+            try:
+                # never batched, the batcher does not preserve atomicity
+                status_code, payload = await self._send_metadata(
+                    {"type": "bulk", "args": requests}, retry_conflicts=False
+                )
+            finally:
+                if self._metadata_cache is not None:
+                    self._metadata_cache.invalidate()
+            self._logger.info("Got response: %s", status_code)
+            if (
+                not _is_conflict(status_code, payload)
+                or retries >= self._conflict_max_retries
+            ):
+                break
+            retries += 1
+            _metadata_conflict_retries.add(1, {"type": "bulk"})
+            self._logger.info(
+                "Metadata changed while clearing source %s, planning again "
+                "(attempt %d)",
+                data_source_config.data_source_name,
+                retries,
+            )
+
+        if status_code != 200:
+            return ClearSourceResult.FAILURE, 0
+        if self._source_registry is not None:
+            for table in tables:
+                self._source_registry.untrack(
+                    data_source_config.data_source_name, table["table"]
+                )
+            if drop_source:
+                self._source_registry.drop_source(data_source_config.data_source_name)
+        return ClearSourceResult.SUCCESS, len(tables)
+
+    async def run_metadata_operations(
+        self,
+        operations: List[OperationType],
+        data_source_config: DataSourceConfig,
+        table_config: TableConfig,
+        role_id: str,
+    ) -> List[bool]:
+        """
+        Run the metadata operations, in order and with a single bulk request when
+        there is more than one, and return whether each of them succeeded. Operations
+        that find the resource already in the requested state are successful
+        """
+
+        self._logger.info("Attempting to run metadata operations: %s", operations)
+        requests = [
+            self._make_operation_request(
+                operation, data_source_config, table_config, role_id
+            )
+            for operation in operations
+        ]
+        if len(requests) == 1:
+            responses = [await self._post_metadata(requests[0])]
         else:
-            if response.status_code == 400:
-                code = response.json()["code"]
-                error = response.json()["error"]
-                if (
-                    code is not None
-                    and code == "permission-denied"  # ???
-                    and error is not None
-                    and "does not exist" in error
-                ):
-                    return DropSelectPermissionResult.NOT_EXISTS
-                else:
-                    return DropSelectPermissionResult.FAILURE
-            else:
-                return DropSelectPermissionResult.FAILURE
+            responses = await self._post_metadata_many(requests) if requests else []
+        self._logger.info("Got responses: %s", [code for code, _ in responses])
+
+        results = [
+            self._is_operation_successful(operation, status_code, error)
+            for operation, (status_code, error) in zip(operations, responses)
+        ]
+        for operation, successful in zip(operations, results):
+            if successful:
+                self._register_operation(
+                    operation, data_source_config, table_config, role_id
+                )
+        return results
+
+    def get_source_reference_count(self, source_name: str) -> Optional[int]:
+        """
+        Returns the number of tables tracked in the source according to the source
+        registry, or None if there is no registry or it is not loaded yet
+        """
+        registry = self._source_registry
+        if registry is None or not registry.is_loaded():
+            return None
+        return registry.count(source_name)
+
+    async def drop_source_if_unused(
+        self, data_source_config: DataSourceConfig
+    ) -> DropSourceResult:
+        """
+        Drop a data source if no table is tracked in it anymore according to the
+        source registry. The drop is based on the metadata the registry reflects: if
+        another writer changed the metadata in the meantime, Hasura rejects it with a
+        conflict and the source is kept. Batched writes are sent by the batcher on
+        its own and leave the resource version of this client behind, so with a
+        batcher the registry is synced with a fresh export first
+        """
+        registry = self._source_registry
+        source_name = data_source_config.data_source_name
+        if registry is not None and self._batcher is not None:
+            snapshot = MetadataSnapshot(*await self.export_metadata())
+            self._resource_version = snapshot.resource_version
+            registry.sync(snapshot)
+        if (
+            registry is None
+            or not registry.is_loaded()
+            or registry.count(source_name) > 0
+        ):
+            self._logger.info("Source %s may still be in use, keeping it", source_name)
+            return DropSourceResult.IN_USE
+        if not registry.has_source(source_name):
+            return DropSourceResult.NOT_EXISTS
+
+        self._logger.info("Attempting to drop unused source %s", source_name)
+        try:
+            status_code, payload = await self._send_metadata(
+                self._make_drop_source_request(data_source_config),
+                retry_conflicts=False,
+            )
+        finally:
+            if self._metadata_cache is not None:
+                self._metadata_cache.invalidate()
+        self._logger.info("Got response: %s", status_code)
+
+        if _is_conflict(status_code, payload):
+            self._logger.info(
+                "Metadata changed since source %s was found unused, keeping it",
+                source_name,
+            )
+            return DropSourceResult.IN_USE
+        drop_source_res = self._to_drop_source_result(
+            status_code, _error_payload(status_code, payload)
+        )
+        if drop_source_res != DropSourceResult.FAILURE:
+            registry.drop_source(source_name)
+        return drop_source_res
+
+    async def drop_unused_sources(
+        self, resource_version: Optional[int], source_names: List[str]
+    ) -> List[bool]:
+        """
+        Drop the provided Snowflake sources with a single bulk_keep_going request.
+        The request is based on the metadata at `resource_version` the sources were
+        found unused in, or on the one left by the last write of the client if None:
+        if another writer changed the metadata in the meantime, Hasura rejects it
+        with a conflict and nothing is dropped. Returns, for each source, whether it
+        was dropped
+        """
+        requests = [
+            self._make_drop_source_request(_make_snowflake_source_config(source_name))
+            for source_name in source_names
+        ]
+        if not requests:
+            return []
+
+        self._logger.info("Attempting to drop %d unused sources", len(source_names))
+        if resource_version is not None:
+            self._resource_version = resource_version
+        try:
+            status_code, payload = await self._send_metadata(
+                {"type": "bulk_keep_going", "args": requests}, retry_conflicts=False
+            )
+        finally:
+            if self._metadata_cache is not None:
+                self._metadata_cache.invalidate()
+        self._logger.info("Got response: %s", status_code)
+
+        dropped = [
+            result_status_code == 200
+            for result_status_code, _ in _bulk_keep_going_results(
+                status_code, payload, len(requests)
+            )
+        ]
+        if self._source_registry is not None:
+            for source_name, is_dropped in zip(source_names, dropped):
+                if is_dropped:
+                    self._source_registry.drop_source(source_name)
+        return dropped
+
+    @property
+    def has_metadata_cache(self) -> bool:
+        return self._metadata_cache is not None
+
+    @property
+    def has_batcher(self) -> bool:
+        return self._batcher is not None
+
+    async def get_metadata_snapshot(self) -> MetadataSnapshot:
+        """
+        Returns the current Hasura metadata, from the metadata cache if one is
+        configured
+        """
+        if self._metadata_cache is not None:
+            snapshot = await self._metadata_cache.get()
+        else:
+            snapshot = MetadataSnapshot(*await self.export_metadata())
+        self._resource_version = snapshot.resource_version
+        if self._source_registry is not None:
+            self._source_registry.sync(snapshot)
+        return snapshot
+
+    def get_source_state(
+        self, snapshot: MetadataSnapshot, data_source_config: DataSourceConfig
+    ) -> ResourceState:
+        """
+        Compare the data source in the metadata snapshot with the provided config
+        """
+        if snapshot.get_source(data_source_config.data_source_name) is None:
+            return ResourceState.MISSING
+        if snapshot.has_source(
+            data_source_config.data_source_type.value,
+            data_source_config.data_source_name,
+            self._make_add_source_request(data_source_config)["args"]["configuration"],
+        ):
+            return ResourceState.UP_TO_DATE
+        return ResourceState.OUTDATED
+
+    def get_table_state(
+        self, snapshot: MetadataSnapshot, table_config: TableConfig
+    ) -> ResourceState:
+        """
+        Compare the tracked table in the metadata snapshot with the provided config,
+        including its custom name and custom root fields
+        """
+        table_spec = self._make_table_spec(table_config)
+        if snapshot.get_table(table_config.data_source_name, table_spec) is None:
+            return ResourceState.MISSING
+        if snapshot.has_table(
+            table_config.data_source_name,
+            table_spec,
+            self._make_track_table_request(table_config)["args"]["configuration"],
+        ):
+            return ResourceState.UP_TO_DATE
+        return ResourceState.OUTDATED
+
+    def get_graphql_name_conflicts(
+        self, snapshot: MetadataSnapshot, table_config: TableConfig
+    ) -> Dict[str, Tuple[str, TableSpec]]:
+        """
+        Returns the custom table name and custom root fields of the provided config
+        that are already used by another tracked table, with the source name and
+        table spec of that table
+        """
+        return snapshot.find_graphql_name_conflicts(
+            table_config.data_source_name,
+            self._make_table_spec(table_config),
+            [
+                table_config.custom_table_name,
+                table_config.select_root_field_name,
+                table_config.select_by_pk_root_field_name,
+                table_config.select_aggregate_root_field_name,
+                table_config.select_stream_root_field_name,
+            ],
+        )
+
+    def get_select_permission_state(
+        self, snapshot: MetadataSnapshot, table_config: TableConfig, role_id: str
+    ) -> ResourceState:
+        """
+        Compare the select permission of the role in the metadata snapshot with the
+        one that would be created for it
+        """
+        table_spec = self._make_table_spec(table_config)
+        if (
+            snapshot.get_select_permission(
+                table_config.data_source_name, table_spec, role_id
+            )
+            is None
+        ):
+            return ResourceState.MISSING
+        if snapshot.has_select_permission(
+            table_config.data_source_name,
+            table_spec,
+            role_id,
+            self._make_create_select_permission_request(table_config, role_id)["args"][
+                "permission"
+            ],
+        ):
+            return ResourceState.UP_TO_DATE
+        return ResourceState.OUTDATED
+
+    async def export_metadata(self) -> Tuple[int, dict]:
+        """
+        Returns the current Hasura metadata together with its resource version
+        """
+        content = orjson.dumps({"type": "export_metadata", "version": 2, "args": {}})
+
+        self._logger.debug("Calling %s to export metadata", self._metadata_endpoint)
+        response = await self._retrier.call(
+            "export_metadata",
+            lambda: self._post_content(self._metadata_endpoint, content),
+        )
+        response.raise_for_status()
+        payload = _decode(response)
 
-    def get_source_tables(
+        return payload["resource_version"], payload["metadata"]
+
+    async def get_source_tables(
         self, data_source_config: Optional[DataSourceConfig] = None
     ) -> list[QualifiedTable]:
         """
@@ -197,33 +553,25 @@ class HasuraAdminClient(object):
         }
 
         self._logger.debug(
-            f"Calling {self._metadata_endpoint} to get source tables: {request_body}"
+            "Calling %s to get source tables: %s",
+            self._metadata_endpoint,
+            LazyBody(request_body),
         )
-        response = self._client.post(self._metadata_endpoint, json=request_body)
-        self._logger.debug(f"Got response: {response.json()}")
-
-        # rename "schema" field into "schema_name" and "table" field into "table_name"
-        # to have an easier time with Pydantic
-        def rename_fields(table_objects: List[dict]) -> List[dict]:
-            key_mapping = {
-                "schema": "schema_name",
-                "name": "table_name",
-            }
-            new_table_objects = map(
-                lambda table_object: {
-                    key_mapping.get(k, k): v for k, v in table_object.items()
-                },
-                table_objects,
-            )
-            return list(new_table_objects)
-
-        json = rename_fields(response.json())
-
-        tables = parse_obj_as(list[QualifiedTable], json)
+        content = orjson.dumps(request_body)
+        response = await self._retrier.call(
+            "get_source_tables",
+            lambda: self._post_content(self._metadata_endpoint, content),
+        )
+        payload = _decode(response)
+        self._logger.debug("Got response: %s", response.status_code)
 
-        return tables
+        # Hasura names the fields "schema" and "name"
+        return [
+            QualifiedTable(schema_name=table["schema"], table_name=table["name"])
+            for table in payload
+        ]
 
-    def run_sql(
+    async def run_sql(
         self,
         statements: List[str],
         data_source_config: Optional[DataSourceConfig] = None,
@@ -261,18 +609,23 @@ class HasuraAdminClient(object):
         request_body = {"type": "bulk", "args": queries}
 
         self._logger.debug(
-            f"Calling {self._query_endpoint} to run SQL queries: {request_body}"
+            "Calling %s to run SQL queries: %s",
+            self._query_endpoint,
+            LazyBody(request_body),
+        )
+        content = orjson.dumps(request_body)
+        response = await self._retrier.call(
+            "run_sql", lambda: self._post_content(self._query_endpoint, content)
         )
-        response = self._client.post(self._query_endpoint, json=request_body)
-        self._logger.debug(f"Got response: {response.json()}")
+        self._logger.debug("Got response: %s", response.status_code)
 
         return response
 
-    def health_check(self) -> Health:
+    async def health_check(self) -> Health:
         """
         Performs a health check on Hasura.
         """
-        response = self._client.get(
+        response = await self._client.get(
             url=self._health_endpoint, params=[("strict", False)]
         )
 
@@ -284,7 +637,7 @@ class HasuraAdminClient(object):
         else:
             return Health.ERROR
 
-    def clear_metadata(self, magic_word: str) -> Response:
+    async def clear_metadata(self, magic_word: str) -> Response:
         # Samuel L. Jackson would not be entertained
         magic_word_check = codecs.encode(
             "V xabj guvf jvyy pyrne Unfhen zrgnqngn veerpbirenoyl", "rot13"
@@ -294,57 +647,361 @@ class HasuraAdminClient(object):
 
         request_body = {"type": "clear_metadata", "args": {}}
 
-        self._logger.debug(f"Calling {self._metadata_endpoint} to clear metadata")
-        response = self._client.post(url=self._metadata_endpoint, json=request_body)
-        self._logger.debug(f"Got response: {response.json()}")
+        self._logger.debug("Calling %s to clear metadata", self._metadata_endpoint)
+        response = await self._post_content(
+            self._metadata_endpoint, orjson.dumps(request_body)
+        )
+        self._logger.debug("Got response: %s", response.status_code)
 
         return response
 
-    def _add_source(self, data_source_config: DataSourceConfig) -> Response:
+    async def _add_source(
+        self, data_source_config: DataSourceConfig
+    ) -> MetadataResponse:
         """
         Perform the REST request to create a data source according to the provided
         config
         """
-        request_body = {
-            "type": data_source_config.data_source_type.value + "_add_source",
-            "args": {
-                "name": data_source_config.data_source_name,
-                "configuration": data_source_config.config,
-            },
-        }
+        request_body = self._make_add_source_request(data_source_config)
 
         self._logger.debug(
-            f"Calling {self._metadata_endpoint} to add source: {request_body}"
+            "Calling %s to add source: %s",
+            self._metadata_endpoint,
+            LazyBody(request_body),
         )
-        response = self._client.post(url=self._metadata_endpoint, json=request_body)
-        self._logger.debug(f"Got response: {response.json()}")
-
-        return response
+        return await self._post_metadata(request_body)
 
-    def _drop_source(
+    async def _drop_source(
         self, data_source_config: DataSourceConfig, cascade: bool = False
-    ) -> Response:
+    ) -> MetadataResponse:
         """
         Perform the REST request to drop a data source according to the provided config
         """
-        request_body = {
-            "type": data_source_config.data_source_type.value + "_drop_source",
-            "args": {"name": data_source_config.data_source_name, "cascade": cascade},
-        }
+        request_body = self._make_drop_source_request(data_source_config, cascade)
 
         self._logger.debug(
-            f"Calling {self._metadata_endpoint} to drop source: {request_body}"
+            "Calling %s to drop source: %s",
+            self._metadata_endpoint,
+            LazyBody(request_body),
         )
-        response = self._client.post(url=self._metadata_endpoint, json=request_body)
-        self._logger.debug(f"Got response: {response.json()}")
-
-        return response
+        return await self._post_metadata(request_body)
 
-    def _track_table(self, table_config: TableConfig) -> Response:
+    async def _track_table(self, table_config: TableConfig) -> MetadataResponse:
         """
         Perform the REST request to track a table according to the provided config
         """
-        request_body = {
+        request_body = self._make_track_table_request(table_config)
+
+        self._logger.debug(
+            "Calling %s to track table: %s",
+            self._metadata_endpoint,
+            LazyBody(request_body),
+        )
+        return await self._post_metadata(request_body)
+
+    async def _untrack_table(
+        self, table_config: TableConfig, cascade: bool = False
+    ) -> MetadataResponse:
+        """
+        Perform the REST request to untrack a table according to the provided config
+        """
+        request_body = self._make_untrack_table_request(table_config, cascade)
+
+        self._logger.debug(
+            "Calling %s to untrack table: %s",
+            self._metadata_endpoint,
+            LazyBody(request_body),
+        )
+        return await self._post_metadata(request_body)
+
+    async def _create_select_permission(
+        self, table_config: TableConfig, role_id: str
+    ) -> MetadataResponse:
+        """
+        Perform the REST request to add read permissions on a tracked table to the
+        provided role
+        """
+        request_body = self._make_create_select_permission_request(
+            table_config, role_id
+        )
+
+        self._logger.debug(
+            "Calling %s to create read permissions on table: %s to role %s",
+            self._metadata_endpoint,
+            LazyBody(request_body),
+            role_id,
+        )
+        return await self._post_metadata(request_body)
+
+    async def _drop_select_permission(
+        self, table_config: TableConfig, role_id: str
+    ) -> MetadataResponse:
+        """
+        Perform the REST request to remove read permissions on a tracked table from
+        the provided role
+        """
+        request_body = self._make_drop_select_permission_request(table_config, role_id)
+
+        self._logger.debug(
+            "Calling %s to drop read permissions on table: %s to role %s",
+            self._metadata_endpoint,
+            LazyBody(request_body),
+            role_id,
+        )
+        return await self._post_metadata(request_body)
+
+    async def bulk(self, requests: List[dict]) -> MetadataResponse:
+        """
+        Run the metadata requests in a single bulk request, in one transaction: either
+        all of them are applied or none is. Returns the status code and error payload
+        of the bulk request
+        """
+        request_body = {"type": "bulk", "args": requests}
+
+        self._logger.debug(
+            "Calling %s to run atomic bulk requests: %s",
+            self._metadata_endpoint,
+            LazyBody(request_body),
+        )
+        try:
+            # never batched, the batcher does not preserve atomicity
+            status_code, payload = await self._send_metadata(request_body)
+        finally:
+            if self._metadata_cache is not None:
+                self._metadata_cache.invalidate()
+        self._logger.debug("Got response: %s", LazyBody(payload))
+
+        return status_code, _error_payload(status_code, payload)
+
+    async def bulk_keep_going(self, requests: List[dict]) -> List[MetadataResponse]:
+        """
+        Run the metadata requests in a single bulk_keep_going request, so that Hasura
+        rebuilds its schema cache only once. Returns, for each request, the status
+        code and error payload it would have had if it had been sent on its own
+        """
+        request_body = {"type": "bulk_keep_going", "args": requests}
+
+        self._logger.debug(
+            "Calling %s to run bulk requests: %s",
+            self._metadata_endpoint,
+            LazyBody(request_body),
+        )
+        status_code, payload = await self._send_metadata(request_body)
+        self._logger.debug("Got response: %s", LazyBody(payload))
+
+        return _bulk_keep_going_results(status_code, payload, len(requests))
+
+    async def _send_metadata(
+        self, request_body: dict, retry_conflicts: bool = True
+    ) -> Tuple[int, Any]:
+        """
+        Send a metadata write request carrying the resource version it is based on,
+        if known. When another writer changed the metadata in the meantime, Hasura
+        rejects the request with a conflict: unless `retry_conflicts` is False, the
+        resource version is read again and the request is retried, up to
+        `conflict_max_retries` times. Returns the status code and the decoded
+        response body
+        """
+        retries = 0
+        while True:
+            if self._resource_version is None:
+                content = orjson.dumps(request_body)
+            else:
+                content = orjson.dumps(
+                    {**request_body, "resource_version": self._resource_version}
+                )
+            _metadata_writes.add(1, {"type": request_body["type"]})
+            response = await self._retrier.call(
+                _operation_name(request_body["type"]),
+                lambda: self._post_content(self._metadata_endpoint, content),
+            )
+            payload = _decode(response)
+            if not _is_conflict(response.status_code, payload):
+                break
+            _metadata_conflicts.add(1, {"type": request_body["type"]})
+            if not retry_conflicts:
+                break
+            if retries >= self._conflict_max_retries:
+                self._logger.warning(
+                    "Metadata write still conflicting after %d retries, giving up",
+                    retries,
+                )
+                break
+            retries += 1
+            _metadata_conflict_retries.add(1, {"type": request_body["type"]})
+            self._logger.info(
+                "Metadata changed since resource version %s, retrying (attempt %d)",
+                self._resource_version,
+                retries,
+            )
+            self._resource_version, _ = await self.export_metadata()
+
+        self._resource_version = _next_resource_version(
+            self._resource_version, response.status_code, payload
+        )
+        return response.status_code, payload
+
+    async def _post_content(self, url: str, content: bytes) -> Response:
+        return await self._client.post(url=url, content=content, headers=_JSON_HEADERS)
+
+    async def _post_metadata(self, request_body: dict) -> MetadataResponse:
+        """
+        Send a metadata write request, through the batcher if one is configured
+        """
+        try:
+            if self._batcher is not None:
+                return await self._batcher.submit(request_body)
+
+            status_code, payload = await self._send_metadata(request_body)
+            self._logger.debug("Got response: %s", LazyBody(payload))
+
+            return status_code, _error_payload(status_code, payload)
+        finally:
+            if self._metadata_cache is not None:
+                self._metadata_cache.invalidate()
+
+    async def _post_metadata_many(
+        self, request_bodies: List[dict]
+    ) -> List[MetadataResponse]:
+        """
+        Send several metadata write requests at once, through the batcher if one is
+        configured or as a single bulk request otherwise
+        """
+        try:
+            if self._batcher is not None:
+                return list(
+                    await asyncio.gather(
+                        *[self._batcher.submit(body) for body in request_bodies]
+                    )
+                )
+
+            return await self.bulk_keep_going(request_bodies)
+        finally:
+            if self._metadata_cache is not None:
+                self._metadata_cache.invalidate()
+
+    async def _is_source_up_to_date(self, data_source_config: DataSourceConfig) -> bool:
+        if self._metadata_cache is None:
+            return False
+        snapshot = await self.get_metadata_snapshot()
+        source_state = self.get_source_state(snapshot, data_source_config)
+        return source_state == ResourceState.UP_TO_DATE
+
+    async def _is_table_up_to_date(self, table_config: TableConfig) -> bool:
+        if self._metadata_cache is None:
+            return False
+        snapshot = await self.get_metadata_snapshot()
+        return self.get_table_state(snapshot, table_config) == ResourceState.UP_TO_DATE
+
+    async def _is_select_permission_up_to_date(
+        self, table_config: TableConfig, role_id: str
+    ) -> bool:
+        if self._metadata_cache is None:
+            return False
+        snapshot = await self.get_metadata_snapshot()
+        permission_state = self.get_select_permission_state(
+            snapshot, table_config, role_id
+        )
+        return permission_state == ResourceState.UP_TO_DATE
+
+    def _register_operation(
+        self,
+        operation: OperationType,
+        data_source_config: DataSourceConfig,
+        table_config: TableConfig,
+        role_id: str,
+    ) -> None:
+        registry = self._source_registry
+        if registry is None:
+            return
+        source_name = data_source_config.data_source_name
+        table_spec = self._make_table_spec(table_config)
+        if operation == OperationType.ADD_SOURCE:
+            registry.add_source(source_name)
+        elif operation == OperationType.TRACK_TABLE:
+            registry.track(source_name, table_spec)
+        elif operation == OperationType.UNTRACK_TABLE:
+            registry.untrack(source_name, table_spec)
+        elif operation == OperationType.CREATE_SELECT_PERMISSION:
+            registry.grant(source_name, table_spec, role_id)
+        elif operation == OperationType.DROP_SELECT_PERMISSION:
+            registry.revoke(source_name, table_spec, role_id)
+
+    def _make_operation_request(
+        self,
+        operation: OperationType,
+        data_source_config: DataSourceConfig,
+        table_config: TableConfig,
+        role_id: str,
+    ) -> dict:
+        if operation == OperationType.ADD_SOURCE:
+            return self._make_add_source_request(data_source_config)
+        if operation == OperationType.UPDATE_SOURCE:
+            return self._make_update_source_request(data_source_config)
+        if operation == OperationType.TRACK_TABLE:
+            return self._make_track_table_request(table_config)
+        if operation == OperationType.UPDATE_TABLE:
+            return self._make_set_table_customization_request(table_config)
+        if operation == OperationType.DROP_SELECT_PERMISSION:
+            return self._make_drop_select_permission_request(table_config, role_id)
+        if operation == OperationType.CREATE_SELECT_PERMISSION:
+            return self._make_create_select_permission_request(table_config, role_id)
+        if operation == OperationType.UNTRACK_TABLE:
+            return self._make_untrack_table_request(table_config)
+        else:
+            raise ValueError(f"Unsupported metadata operation {operation}")
+
+    def _make_clear_source_requests(
+        self,
+        data_source_config: DataSourceConfig,
+        tables: List[dict],
+        drop_source: bool,
+    ) -> List[dict]:
+        requests = []
+        for table in tables:
+            for permission in table.get("select_permissions", []):
+                requests.append(
+                    self._make_drop_table_select_permission_request(
+                        data_source_config, table["table"], permission["role"]
+                    )
+                )
+            requests.append(
+                self._make_untrack_table_spec_request(
+                    data_source_config, table["table"]
+                )
+            )
+        if drop_source:
+            requests.append(self._make_drop_source_request(data_source_config))
+        return requests
+
+    def _make_add_source_request(self, data_source_config: DataSourceConfig) -> dict:
+        return {
+            "type": data_source_config.data_source_type.value + "_add_source",
+            "args": {
+                "name": data_source_config.data_source_name,
+                "configuration": data_source_config.config,
+            },
+        }
+
+    def _make_update_source_request(self, data_source_config: DataSourceConfig) -> dict:
+        return {
+            "type": data_source_config.data_source_type.value + "_update_source",
+            "args": {
+                "name": data_source_config.data_source_name,
+                "configuration": data_source_config.config,
+            },
+        }
+
+    def _make_drop_source_request(
+        self, data_source_config: DataSourceConfig, cascade: bool = False
+    ) -> dict:
+        return {
+            "type": data_source_config.data_source_type.value + "_drop_source",
+            "args": {"name": data_source_config.data_source_name, "cascade": cascade},
+        }
+
+    def _make_track_table_request(self, table_config: TableConfig) -> dict:
+        return {
             "type": table_config.data_source_type.value + "_track_table",
             "args": {
                 "source": table_config.data_source_name,
@@ -362,21 +1019,21 @@ class HasuraAdminClient(object):
             },
         }
 
-        self._logger.debug(
-            f"Calling {self._metadata_endpoint} to track table: {request_body}"
-        )
-        response = self._client.post(url=self._metadata_endpoint, json=request_body)
-        self._logger.debug(f"Got response: {response.json()}")
-
-        return response
+    def _make_set_table_customization_request(self, table_config: TableConfig) -> dict:
+        track_table_args = self._make_track_table_request(table_config)["args"]
+        return {
+            "type": table_config.data_source_type.value + "_set_table_customization",
+            "args": {
+                "source": track_table_args["source"],
+                "table": track_table_args["table"],
+                "configuration": track_table_args["configuration"],
+            },
+        }
 
-    def _untrack_table(
+    def _make_untrack_table_request(
         self, table_config: TableConfig, cascade: bool = False
-    ) -> Response:
-        """
-        Perform the REST request to untrack a table according to the provided config
-        """
-        request_body = {
+    ) -> dict:
+        return {
             "type": table_config.data_source_type.value + "_untrack_table",
             "args": {
                 "table": self._make_table_spec(table_config),
@@ -385,22 +1042,22 @@ class HasuraAdminClient(object):
             },
         }
 
-        self._logger.debug(
-            f"Calling {self._metadata_endpoint} to untrack table: {request_body}"
-        )
-        response = self._client.post(url=self._metadata_endpoint, json=request_body)
-        self._logger.debug(f"Got response: {response.json()}")
-
-        return response
+    def _make_untrack_table_spec_request(
+        self, data_source_config: DataSourceConfig, table_spec: TableSpec
+    ) -> dict:
+        return {
+            "type": data_source_config.data_source_type.value + "_untrack_table",
+            "args": {
+                "table": table_spec,
+                "source": data_source_config.data_source_name,
+                "cascade": False,
+            },
+        }
 
-    def _create_select_permission(
+    def _make_create_select_permission_request(
         self, table_config: TableConfig, role_id: str
-    ) -> Response:
-        """
-        Perform the REST request to add read permissions on a tracked table to the
-        provided role
-        """
-        request_body = {
+    ) -> dict:
+        return {
             "type": table_config.data_source_type.value + "_create_select_permission",
             "args": {
                 "table": self._make_table_spec(table_config),
@@ -415,24 +1072,10 @@ class HasuraAdminClient(object):
             },
         }
 
-        self._logger.debug(
-            f"Calling {self._metadata_endpoint} to create read permissions on table:"
-            + f" {request_body} to role {role_id}"
-        )
-        response = self._client.post(url=self._metadata_endpoint, json=request_body)
-        self._logger.debug(f"Got response: {response.json()}")
-
-        return response
-
-    def _drop_select_permission(
+    def _make_drop_select_permission_request(
         self, table_config: TableConfig, role_id: str
-    ) -> Response:
-        """
-        Perform the REST request to remove read permissions on a tracked table from
-        the provided role
-        """
-
-        request_body = {
+    ) -> dict:
+        return {
             "type": table_config.data_source_type.value + "_drop_select_permission",
             "args": {
                 "table": self._make_table_spec(table_config),
@@ -441,14 +1084,18 @@ class HasuraAdminClient(object):
             },
         }
 
-        self._logger.debug(
-            f"Calling {self._metadata_endpoint} to drop read permissions on table: "
-            + f"{request_body} to role {role_id}"
-        )
-        response = self._client.post(url=self._metadata_endpoint, json=request_body)
-        self._logger.debug(f"Got response: {response.json()}")
-
-        return response
+    def _make_drop_table_select_permission_request(
+        self, data_source_config: DataSourceConfig, table_spec: TableSpec, role_id: str
+    ) -> dict:
+        return {
+            "type": data_source_config.data_source_type.value
+            + "_drop_select_permission",
+            "args": {
+                "table": table_spec,
+                "role": role_id,
+                "source": data_source_config.data_source_name,
+            },
+        }
 
     def _make_table_spec(self, table_config: TableConfig) -> Union[list[str], dict]:
         ds_type = table_config.data_source_type
@@ -462,8 +1109,177 @@ class HasuraAdminClient(object):
         else:
             raise ValueError(f"Unsupported data source type {ds_type}")
 
+    @staticmethod
+    def _to_add_source_result(
+        status_code: int, error: Optional[dict]
+    ) -> AddSourceResult:
+        if status_code == 200:
+            return AddSourceResult.SUCCESS
+        if status_code == 400 and _error_code(error) == "already-exists":
+            return AddSourceResult.ALREADY_EXISTS
+        return AddSourceResult.FAILURE
+
+    @staticmethod
+    def _to_drop_source_result(
+        status_code: int, error: Optional[dict]
+    ) -> DropSourceResult:
+        if status_code == 200:
+            return DropSourceResult.SUCCESS
+        if status_code == 400 and _error_code(error) == "not-exists":
+            return DropSourceResult.NOT_EXISTS
+        return DropSourceResult.FAILURE
+
+    @staticmethod
+    def _to_track_table_result(
+        status_code: int, error: Optional[dict]
+    ) -> TrackTableResult:
+        if status_code == 200:
+            return TrackTableResult.SUCCESS
+        if status_code == 400 and _error_code(error) == "already-tracked":
+            return TrackTableResult.ALREADY_TRACKED
+        return TrackTableResult.FAILURE
+
+    @staticmethod
+    def _to_untrack_table_result(
+        status_code: int, error: Optional[dict]
+    ) -> UntrackTableResult:
+        if status_code == 200:
+            return UntrackTableResult.SUCCESS
+        if status_code == 400 and _error_code(error) == "already-untracked":
+            return UntrackTableResult.NOT_TRACKED
+        return UntrackTableResult.FAILURE
+
+    @staticmethod
+    def _to_create_select_permission_result(
+        status_code: int, error: Optional[dict]
+    ) -> CreateSelectPermissionResult:
+        if status_code == 200:
+            return CreateSelectPermissionResult.SUCCESS
+        if status_code == 400 and _error_code(error) == "already-exists":
+            return CreateSelectPermissionResult.ALREADY_EXISTS
+        return CreateSelectPermissionResult.FAILURE
+
+    @staticmethod
+    def _to_drop_select_permission_result(
+        status_code: int, error: Optional[dict]
+    ) -> DropSelectPermissionResult:
+        if status_code == 200:
+            return DropSelectPermissionResult.SUCCESS
+        if (
+            status_code == 400
+            and _error_code(error) == "permission-denied"  # ???
+            and error is not None
+            and error.get("error") is not None
+            and "does not exist" in error["error"]
+        ):
+            return DropSelectPermissionResult.NOT_EXISTS
+        return DropSelectPermissionResult.FAILURE
+
+    @classmethod
+    def _is_operation_successful(
+        cls, operation: OperationType, status_code: int, error: Optional[dict]
+    ) -> bool:
+        if operation == OperationType.ADD_SOURCE:
+            return cls._to_add_source_result(status_code, error) in (
+                AddSourceResult.SUCCESS,
+                AddSourceResult.ALREADY_EXISTS,
+            )
+        if operation == OperationType.TRACK_TABLE:
+            return cls._to_track_table_result(status_code, error) in (
+                TrackTableResult.SUCCESS,
+                TrackTableResult.ALREADY_TRACKED,
+            )
+        if operation == OperationType.DROP_SELECT_PERMISSION:
+            return cls._to_drop_select_permission_result(status_code, error) in (
+                DropSelectPermissionResult.SUCCESS,
+                DropSelectPermissionResult.NOT_EXISTS,
+            )
+        if operation == OperationType.CREATE_SELECT_PERMISSION:
+            return cls._to_create_select_permission_result(status_code, error) in (
+                CreateSelectPermissionResult.SUCCESS,
+                CreateSelectPermissionResult.ALREADY_EXISTS,
+            )
+        if operation == OperationType.UNTRACK_TABLE:
+            return cls._to_untrack_table_result(status_code, error) in (
+                UntrackTableResult.SUCCESS,
+                UntrackTableResult.NOT_TRACKED,
+            )
+        # update source and update table have no idempotent error to tolerate
+        return status_code == 200
+
     @staticmethod
     def _ensure_slash(url: str) -> str:
         if not url.endswith("/"):
             return url + "/"
         return url
+
+
+def _decode(response: Response) -> Any:
+    # decode the body once; empty or non-JSON bodies (eg from a proxy) are None
+    try:
+        return orjson.loads(response.content) if response.content else None
+    except orjson.JSONDecodeError:
+        return None
+
+
+def _error_payload(status_code: int, payload: Any) -> Optional[dict]:
+    return payload if status_code == 400 and isinstance(payload, dict) else None
+
+
+def _bulk_keep_going_results(
+    status_code: int, payload: Any, count: int
+) -> List[MetadataResponse]:
+    if status_code != 200:
+        # the whole bulk request was rejected, every request shares its fate
+        return [(status_code, _error_payload(status_code, payload))] * count
+
+    results: List[MetadataResponse] = []
+    for result in payload:
+        if isinstance(result, dict) and "code" in result:
+            results.append((400, result))
+        else:
+            results.append((200, None))
+    return results
+
+
+def _make_snowflake_source_config(source_name: str) -> DataSourceConfig:
+    return DataSourceConfig(
+        data_source_type=DataSourceType.SNOWFLAKE,
+        data_source_name=source_name,
+        config={},
+    )
+
+
+def _error_code(error: Optional[dict]) -> Optional[str]:
+    return None if error is None else error.get("code")
+
+
+def _operation_name(request_type: str) -> str:
+    # strip the backend prefix, eg snowflake_track_table -> track_table
+    for data_source_type in DataSourceType:
+        prefix = data_source_type.value + "_"
+        if request_type.startswith(prefix):
+            return request_type[len(prefix) :]
+    return request_type
+
+
+def _is_conflict(status_code: int, payload: Any) -> bool:
+    return (
+        status_code == 409
+        and isinstance(payload, dict)
+        and _error_code(payload) == "conflict"
+    )
+
+
+def _next_resource_version(
+    resource_version: Optional[int], status_code: int, payload: Any
+) -> Optional[int]:
+    # a successful write bumps the resource version by one; when some of the
+    # requests may have failed the new version is unknown
+    if resource_version is None or status_code != 200:
+        return None
+    if isinstance(payload, list) and any(
+        isinstance(result, dict) and "code" in result for result in payload
+    ):
+        return None
+    return resource_version + 1
@@ -0,0 +1,203 @@
+import asyncio
+import copy
+import logging
+from typing import List, Optional, Set
+
+import orjson
+from opentelemetry import metrics
+from opentelemetry.metrics import CallbackOptions, Observation
+
+from src.common.model.config import GarbageCollectorConfig, SnowflakeConfig
+from src.common.model.hasura import GarbageCollectionReport
+from src.services.hasura.client import HasuraAdminClient
+from src.services.hasura.metadata import MetadataSnapshot
+from src.services.hasura.provisioner import make_snowflake_jdbc_url_prefix
+
+_meter = metrics.get_meter(__name__)
+_reclaimed = _meter.create_counter(
+    "hasura.gc.reclaimed",
+    description="Orphaned Hasura resources removed by the garbage collector, by kind",
+)
+
+# the only kind of source added by the provisioner
+_SOURCE_KIND = "snowflake"
+
+
+class MetadataGarbageCollector(object):
+    """
+    Removes the Hasura sources left behind by the provisioner, typically after a
+    major version bump changed the names it builds: the sources added by the
+    provisioner that no longer have any tracked table. A source is known to be added
+    by the provisioner when it connects to Snowflake with the connection settings of
+    the provisioner, whatever its name, so that sources added by hand are never
+    removed; tables, permissions and roles are left to unprovisioning.
+
+    A source is removed only if it was already found orphaned by the previous
+    collection, so that a source added by a provisioning still in progress is not
+    mistaken for an orphan. The removals are sent in bulk_keep_going requests of up
+    to `batch_size` sources, at most `max_requests_per_second` of them. The first
+    one is based on the metadata the orphans were found in and each following one on
+    the metadata left by the previous one, so that the collection stops as soon as
+    another writer changes the metadata. In dry-run mode, the orphans are only
+    reported.
+    """
+
+    _config: GarbageCollectorConfig
+    # orphans found by the previous collection
+    _candidates: Set[str]
+
+    def __init__(
+        self,
+        hasura_admin_client: HasuraAdminClient,
+        config: GarbageCollectorConfig,
+        snowflake_config: SnowflakeConfig,
+    ):
+        self._hasura_admin_client = hasura_admin_client
+        self._config = config
+        self._jdbc_url_prefix = make_snowflake_jdbc_url_prefix(snowflake_config)
+        self._candidates = set()
+        self._metadata_size: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._logger = logging.getLogger(__name__)
+        self._register_metrics()
+
+    async def start(self) -> None:
+        """
+        Start collecting every `interval` seconds on the running event loop
+        """
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def aclose(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def collect(self) -> GarbageCollectionReport:
+        """
+        Find the orphaned sources and, unless in dry-run mode, remove the ones
+        already found orphaned by the previous collection
+        """
+        resource_version, metadata = await self._hasura_admin_client.export_metadata()
+        snapshot = MetadataSnapshot(resource_version, metadata)
+        source_names = [
+            source_name
+            for source_name in snapshot.get_source_names()
+            if self._is_provisioned_source(snapshot, source_name)
+            and not snapshot.get_tables(source_name)
+        ]
+        size_before = len(orjson.dumps(metadata))
+
+        previous_candidates, self._candidates = self._candidates, set(source_names)
+
+        if self._config.dry_run:
+            size_after = len(orjson.dumps(_prune(metadata, source_names)))
+            reclaimed = 0
+        else:
+            reclaimed = await self._remove(
+                resource_version,
+                [
+                    source_name
+                    for source_name in source_names
+                    if source_name in previous_candidates
+                ],
+            )
+            if reclaimed > 0:
+                _, metadata = await self._hasura_admin_client.export_metadata()
+            size_after = len(orjson.dumps(metadata))
+        self._metadata_size = size_after
+
+        report = GarbageCollectionReport(
+            dry_run=self._config.dry_run,
+            orphaned_sources=len(source_names),
+            reclaimed=reclaimed,
+            metadata_size_before=size_before,
+            metadata_size_after=size_after,
+        )
+        self._logger.info(
+            "Garbage collection found %d orphaned sources, reclaimed %d (dry run: "
+            "%s), metadata size %d -> %d bytes",
+            report.orphaned_sources,
+            report.reclaimed,
+            report.dry_run,
+            report.metadata_size_before,
+            report.metadata_size_after,
+        )
+        return report
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self._config.interval)
+            try:
+                await self.collect()
+            except Exception:
+                self._logger.exception("Garbage collection failed")
+
+    async def _remove(self, resource_version: int, source_names: List[str]) -> int:
+        """
+        Remove the sources in batches, returns how many were removed
+        """
+        batch_size = max(1, self._config.batch_size)
+        min_interval = (
+            1 / self._config.max_requests_per_second
+            if self._config.max_requests_per_second > 0
+            else 0
+        )
+        reclaimed = 0
+        # later batches are based on the metadata left by the previous one
+        batch_resource_version: Optional[int] = resource_version
+        for start in range(0, len(source_names), batch_size):
+            if start > 0:
+                await asyncio.sleep(min_interval)
+            batch = source_names[start : start + batch_size]
+            dropped = await self._hasura_admin_client.drop_unused_sources(
+                batch_resource_version, batch
+            )
+            batch_resource_version = None
+            _reclaimed.add(sum(dropped), {"kind": "source"})
+            reclaimed += sum(dropped)
+            if not all(dropped):
+                # the metadata changed, or its new version is unknown
+                self._logger.info(
+                    "Some orphans could not be removed, stopping until the next "
+                    "collection"
+                )
+                break
+        return reclaimed
+
+    def _is_provisioned_source(
+        self, snapshot: MetadataSnapshot, source_name: str
+    ) -> bool:
+        source = snapshot.get_source(source_name)
+        if source is None or source.get("kind") != _SOURCE_KIND:
+            return False
+        jdbc_url = source.get("configuration", {}).get("jdbc_url")
+        return isinstance(jdbc_url, str) and jdbc_url.startswith(self._jdbc_url_prefix)
+
+    def _register_metrics(self) -> None:
+        def observe_metadata_size(options: CallbackOptions) -> list[Observation]:
+            if self._metadata_size is None:
+                return []
+            return [Observation(self._metadata_size)]
+
+        _meter.create_observable_gauge(
+            "hasura.metadata.size",
+            callbacks=[observe_metadata_size],
+            unit="By",
+            description="Size of the Hasura metadata seen by the last garbage "
+            "collection",
+        )
+
+
+def _prune(metadata: dict, source_names: List[str]) -> dict:
+    """
+    Returns a copy of the metadata without the provided sources
+    """
+    dropped_sources = set(source_names)
+    pruned = copy.deepcopy(metadata)
+    pruned["sources"] = [
+        source
+        for source in pruned.get("sources", [])
+        if source["name"] not in dropped_sources
+    ]
+    return pruned
@@ -0,0 +1,228 @@
+import asyncio
+import logging
+import time
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+
+import orjson
+
+TableSpec = Union[list[str], dict]
+
+MetadataExporter = Callable[[], Awaitable[Tuple[int, dict]]]
+
+# Hasura exports the "pg" backend as "postgres"
+_SOURCE_KINDS = {"pg": "postgres"}
+
+_MAX_REFRESH_ATTEMPTS = 3
+
+
+class MetadataSnapshot(object):
+    """
+    Indexed, read-only view of the Hasura metadata as returned by export_metadata
+    """
+
+    resource_version: int
+
+    def __init__(self, resource_version: int, metadata: dict):
+        self.resource_version = resource_version
+        self._sources: Dict[str, dict] = {}
+        self._tables: Dict[Tuple[str, bytes], dict] = {}
+        for source in metadata.get("sources", []):
+            self._sources[source["name"]] = source
+            for table in source.get("tables", []):
+                self._tables[(source["name"], table_key(table["table"]))] = table
+        # built on first use, only validation needs it
+        self._graphql_names: Optional[Dict[str, Tuple[str, TableSpec]]] = None
+
+    def get_source(self, source_name: str) -> Optional[dict]:
+        return self._sources.get(source_name)
+
+    def get_source_names(self) -> List[str]:
+        return list(self._sources)
+
+    def get_tables(self, source_name: str) -> List[dict]:
+        source = self.get_source(source_name)
+        return [] if source is None else source.get("tables", [])
+
+    def get_table(self, source_name: str, table_spec: TableSpec) -> Optional[dict]:
+        return self._tables.get((source_name, table_key(table_spec)))
+
+    def get_select_permission(
+        self, source_name: str, table_spec: TableSpec, role: str
+    ) -> Optional[dict]:
+        table = self.get_table(source_name, table_spec)
+        if table is None:
+            return None
+        return next(
+            (
+                permission
+                for permission in table.get("select_permissions", [])
+                if permission["role"] == role
+            ),
+            None,
+        )
+
+    def has_source(
+        self, source_type: str, source_name: str, configuration: dict
+    ) -> bool:
+        source = self.get_source(source_name)
+        return (
+            source is not None
+            and source.get("kind") == _SOURCE_KINDS.get(source_type, source_type)
+            and source.get("configuration") == configuration
+        )
+
+    def has_table(
+        self, source_name: str, table_spec: TableSpec, configuration: dict
+    ) -> bool:
+        table = self.get_table(source_name, table_spec)
+        return table is not None and _normalize_table_configuration(
+            table.get("configuration", {})
+        ) == _normalize_table_configuration(configuration)
+
+    def has_select_permission(
+        self, source_name: str, table_spec: TableSpec, role: str, permission: dict
+    ) -> bool:
+        existing = self.get_select_permission(source_name, table_spec, role)
+        return existing is not None and _drop_empty(
+            existing.get("permission", {})
+        ) == _drop_empty(permission)
+
+    def find_graphql_name_conflicts(
+        self, source_name: str, table_spec: TableSpec, names: Iterable[str]
+    ) -> Dict[str, Tuple[str, TableSpec]]:
+        """
+        Returns the names among the provided ones that are already used as custom
+        name or custom root field by a tracked table other than the provided one,
+        with the source name and table spec of the table using them
+        """
+        if self._graphql_names is None:
+            self._graphql_names = self._index_graphql_names()
+        key = table_key(table_spec)
+        conflicts = {}
+        for name in names:
+            owner = self._graphql_names.get(name)
+            if owner is not None and (
+                owner[0] != source_name or table_key(owner[1]) != key
+            ):
+                conflicts[name] = owner
+        return conflicts
+
+    def _index_graphql_names(self) -> Dict[str, Tuple[str, TableSpec]]:
+        graphql_names: Dict[str, Tuple[str, TableSpec]] = {}
+        for source_name, source in self._sources.items():
+            for table in source.get("tables", []):
+                configuration = _normalize_table_configuration(
+                    table.get("configuration", {})
+                )
+                for name in [
+                    configuration.get("custom_name"),
+                    *configuration.get("custom_root_fields", {}).values(),
+                ]:
+                    if name:
+                        graphql_names.setdefault(name, (source_name, table["table"]))
+        return graphql_names
+
+
+class HasuraMetadataCache(object):
+    """
+    Local snapshot of the Hasura metadata, shared by all requests.
+
+    The snapshot is reloaded when it is older than `max_staleness` seconds or after
+    it has been invalidated by a metadata write. When a reload finds the same
+    resource_version as the current snapshot, the already indexed snapshot is kept.
+    """
+
+    _export_metadata: MetadataExporter
+    _max_staleness: float
+    _snapshot: Optional[MetadataSnapshot]
+
+    def __init__(self, export_metadata: MetadataExporter, max_staleness: float):
+        self._export_metadata = export_metadata
+        self._max_staleness = max_staleness
+        self._snapshot = None
+        self._fetched_at = 0.0
+        self._generation = 0
+        self._valid_generation = -1
+        self._lock = asyncio.Lock()
+        self._logger = logging.getLogger(__name__)
+
+    async def get(self) -> MetadataSnapshot:
+        """
+        Return the current snapshot, reloading it if it is stale or invalidated
+        """
+        snapshot = self._fresh_snapshot()
+        if snapshot is not None:
+            return snapshot
+
+        async with self._lock:
+            snapshot = self._fresh_snapshot()
+            if snapshot is not None:
+                return snapshot
+            return await self._refresh()
+
+    def invalidate(self) -> None:
+        """
+        Mark the snapshot as outdated, eg after a metadata write
+        """
+        self._generation += 1
+
+    def _fresh_snapshot(self) -> Optional[MetadataSnapshot]:
+        if (
+            self._snapshot is not None
+            and self._valid_generation == self._generation
+            and time.monotonic() - self._fetched_at <= self._max_staleness
+        ):
+            return self._snapshot
+        return None
+
+    async def _refresh(self) -> MetadataSnapshot:
+        attempts = 0
+        while True:
+            attempts += 1
+            generation = self._generation
+            fetched_at = time.monotonic()
+            resource_version, metadata = await self._export_metadata()
+            snapshot = self._snapshot
+            if snapshot is None or snapshot.resource_version != resource_version:
+                self._logger.debug(
+                    "Loaded metadata snapshot at resource version %s", resource_version
+                )
+                snapshot = MetadataSnapshot(resource_version, metadata)
+                self._snapshot = snapshot
+            self._fetched_at = fetched_at
+            # if a write completed while exporting, the export may predate it: retry,
+            # and after a few attempts return the export without caching it as fresh
+            if generation == self._generation:
+                self._valid_generation = generation
+                return snapshot
+            if attempts >= _MAX_REFRESH_ATTEMPTS:
+                return snapshot
+
+
+def table_key(table_spec: Any) -> bytes:
+    # table specs are lists or dicts, serialized to be used as keys
+    return orjson.dumps(table_spec, option=orjson.OPT_SORT_KEYS)
+
+
+def _normalize_table_configuration(configuration: dict) -> dict:
+    # custom root fields can be exported either as plain names or as objects
+    custom_root_fields = {
+        field: value["name"] if isinstance(value, dict) else value
+        for field, value in configuration.get("custom_root_fields", {}).items()
+    }
+    return _drop_empty({**configuration, "custom_root_fields": custom_root_fields})
+
+
+def _drop_empty(value: dict) -> dict:
+    # Hasura omits empty and default values when exporting the metadata
+    return {k: v for k, v in value.items() if v not in (None, False, [], {})}
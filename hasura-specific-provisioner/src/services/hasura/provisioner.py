@@ -1,28 +1,63 @@
-from typing import List, Union
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, List, Optional, Tuple, Union
 from urllib.parse import quote
 
-from src.common.model.config import ProvisionerConfig
-from src.common.model.descriptor import DataProduct, HasuraOutputPort, OutputPort
+from src.common.model.config import ProvisionerConfig, SnowflakeConfig
+from src.common.model.descriptor import (
+    DataProduct,
+    HasuraDataProduct,
+    HasuraOutputPort,
+    OutputPort,
+)
 from src.common.model.hasura import (
-    AddSourceResult,
-    CreateSelectPermissionResult,
+    ClearSourceResult,
     DataSourceConfig,
     DataSourceType,
     QualifiedTable,
     TableConfig,
-    TrackTableResult,
-    UntrackTableResult,
+)
+from src.common.model.reconciliation import (
+    Checkpoint,
+    DesiredState,
+    ExecutionPlan,
+    OperationType,
+    PlannedCall,
+    Service,
 )
 from src.common.model.rolemapping import GroupRoleMappings, Role, UserRoleMappings
 from src.models import (
+    Info,
     ProvisioningStatus,
     Status1,
     ValidationError,
     ValidationResult,
 )
+from src.services.checkpoints import CheckpointStore, make_checkpoint_key
 from src.services.hasura.client import HasuraAdminClient
+from src.services.hasura.metadata import MetadataSnapshot
+from src.services.hasura.reconciler import (
+    HasuraReconciler,
+    make_execution_plan,
+    make_planned_call,
+)
+from src.services.keyedlock import KeyedLockScheduler, role_key, source_key
+from src.services.latency import LatencyTracker
 from src.services.rolemapper import RoleMapperClient
 
+_FAILURE_MESSAGES = {
+    OperationType.ADD_SOURCE: "Unable to add data source",
+    OperationType.UPDATE_SOURCE: "Unable to update data source",
+    OperationType.TRACK_TABLE: "Unable to track table",
+    OperationType.UPDATE_TABLE: "Unable to update table customization",
+    OperationType.CREATE_ROLE: "Unable to create role",
+    OperationType.DROP_SELECT_PERMISSION: "Unable to update permissions for table",
+    OperationType.CREATE_SELECT_PERMISSION: "Unable to create permissions for table",
+    OperationType.UNTRACK_TABLE: "Unable to untrack table",
+    OperationType.DROP_SOURCE: "Unable to drop data source",
+}
+
 
 # TODO logging
 class HasuraProvisioner(object):
@@ -31,10 +66,33 @@ class HasuraProvisioner(object):
         hasura_admin_client: HasuraAdminClient,
         role_mapper_client: RoleMapperClient,
         provisioner_config: ProvisionerConfig,
+        lock_scheduler: Optional[KeyedLockScheduler] = None,
+        checkpoint_store: Optional[CheckpointStore] = None,
+        latency_tracker: Optional[LatencyTracker] = None,
     ):
         self._hasura_admin_client = hasura_admin_client
         self._role_mapper_client = role_mapper_client
         self._config = provisioner_config
+        self._checkpoint_store = checkpoint_store
+        # shared by all the provisioners, to serialize writes to the same source
+        self._lock_scheduler = (
+            KeyedLockScheduler() if lock_scheduler is None else lock_scheduler
+        )
+        # shared as well, the estimates of the execution plans are based on the
+        # durations of the calls made by all the provisioners
+        self._latency_tracker = (
+            LatencyTracker() if latency_tracker is None else latency_tracker
+        )
+        self._reconciler = HasuraReconciler(
+            hasura_admin_client,
+            role_mapper_client,
+            bulk_metadata=provisioner_config.bulk_metadata,
+            drop_unused_sources=provisioner_config.drop_source_on_unprovision,
+            lock_scheduler=self._lock_scheduler,
+            latency_tracker=self._latency_tracker,
+            inspect_state=hasura_admin_client.has_metadata_cache,
+        )
+        self._logger = logging.getLogger(__name__)
 
     def validate(
         self,
@@ -100,7 +158,111 @@ class HasuraProvisioner(object):
         else:
             return ValidationResult(valid=False, error=ValidationError(errors=errors))
 
-    def provision(
+    def validate_data_product(
+        self, hasura_data_product: HasuraDataProduct
+    ) -> ValidationResult:
+        """
+        Validate all the Hasura output ports of a data product, each error being
+        prefixed with the id of its output port. The output ports share the source of
+        the data product, and their tables are resolved in its database and schema,
+        so they must all read from the same database and schema
+        """
+        data_product, output_ports = hasura_data_product
+        errors: list[str] = []
+        for hasura_output_port, source_output_port in output_ports:
+            validation_result = self.validate(
+                data_product, hasura_output_port, source_output_port
+            )
+            if validation_result.error is not None:
+                errors.extend(
+                    f"{hasura_output_port.id}: {error}"
+                    for error in validation_result.error.errors
+                )
+
+        locations = sorted(
+            {
+                (
+                    str(source_output_port.specific.get("database")),
+                    str(source_output_port.specific.get("schema")),
+                )
+                for _, source_output_port in output_ports
+            }
+        )
+        if len(locations) > 1:
+            errors.append(
+                "All the Hasura output ports of the data product must read from the "
+                "same database and schema, found: "
+                + ", ".join(f"{database}.{schema}" for database, schema in locations)
+            )
+
+        if len(errors) == 0:
+            return ValidationResult(valid=True)
+        else:
+            return ValidationResult(valid=False, error=ValidationError(errors=errors))
+
+    async def check_preflight(
+        self,
+        data_product: DataProduct,
+        hasura_output_port: HasuraOutputPort,
+        source_output_port: OutputPort,
+    ) -> ValidationResult:
+        """
+        Check the request against the current Hasura metadata: the custom table name
+        and root fields must not be used already by another tracked table, or Hasura
+        would reject the table when provisioning
+        """
+        snapshot = await self._hasura_admin_client.get_metadata_snapshot()
+        errors = self._find_name_conflicts(
+            snapshot, data_product, hasura_output_port, source_output_port
+        )
+        if len(errors) == 0:
+            return ValidationResult(valid=True)
+        else:
+            return ValidationResult(valid=False, error=ValidationError(errors=errors))
+
+    async def check_preflight_data_product(
+        self, hasura_data_product: HasuraDataProduct
+    ) -> ValidationResult:
+        """
+        Check all the Hasura output ports of a data product against the current
+        Hasura metadata, each error being prefixed with the id of its output port
+        """
+        data_product, output_ports = hasura_data_product
+        snapshot = await self._hasura_admin_client.get_metadata_snapshot()
+        errors: list[str] = []
+        for hasura_output_port, source_output_port in output_ports:
+            errors.extend(
+                f"{hasura_output_port.id}: {error}"
+                for error in self._find_name_conflicts(
+                    snapshot, data_product, hasura_output_port, source_output_port
+                )
+            )
+
+        if len(errors) == 0:
+            return ValidationResult(valid=True)
+        else:
+            return ValidationResult(valid=False, error=ValidationError(errors=errors))
+
+    def _find_name_conflicts(
+        self,
+        snapshot: MetadataSnapshot,
+        data_product: DataProduct,
+        hasura_output_port: HasuraOutputPort,
+        source_output_port: OutputPort,
+    ) -> list[str]:
+        _, table_config = self._make_data_source_and_table_configs(
+            data_product, hasura_output_port, source_output_port
+        )
+        conflicts = self._hasura_admin_client.get_graphql_name_conflicts(
+            snapshot, table_config
+        )
+        return [
+            f"The name {name} is already used by table {table_spec} "
+            f"of source {source_name}; please choose another one."
+            for name, (source_name, table_spec) in conflicts.items()
+        ]
+
+    async def provision(
         self,
         data_product: DataProduct,
         hasura_output_port: HasuraOutputPort,
@@ -113,91 +275,194 @@ class HasuraProvisioner(object):
         if not validation_result.valid:
             return validation_result.error  # type: ignore[return-value]
 
-        data_source_config, table_config = self._make_data_source_and_table_configs(
+        desired_state = self._make_desired_state(
             data_product, hasura_output_port, source_output_port
         )
 
-        add_source_res = self._hasura_admin_client.add_source(data_source_config)
+        return await self._provision_desired_state(desired_state)
 
-        if (
-            add_source_res == AddSourceResult.SUCCESS
-            or add_source_res == AddSourceResult.ALREADY_EXISTS
-        ):
-            pass
-        else:
-            return ProvisioningStatus(
-                status=Status1.FAILED,
-                result="Unable to add data source; please check with the platform team.",  # noqa E501
+    async def provision_data_product(
+        self, hasura_data_product: HasuraDataProduct
+    ) -> Union[ProvisioningStatus, ValidationError]:
+        """
+        Provision all the Hasura output ports of a data product.
+
+        The source is shared by all the output ports of the data product, so it is
+        set up once beforehand; the output ports are then provisioned concurrently,
+        at most `data_product_max_concurrency` at a time. The outcome of each output
+        port is reported in the private info of the returned status.
+        """
+        validation_result = self.validate_data_product(hasura_data_product)
+
+        if not validation_result.valid:
+            return validation_result.error  # type: ignore[return-value]
+
+        data_product, output_ports = hasura_data_product
+        desired_states = [
+            self._make_desired_state(
+                data_product, hasura_output_port, source_output_port
             )
+            for hasura_output_port, source_output_port in output_ports
+        ]
+
+        for desired_state in _distinct_sources(desired_states):
+            operations = await self._reconciler.plan_source(desired_state)
+            failed_operation = await self._reconciler.apply(desired_state, operations)
+            if failed_operation is not None:
+                return _make_failure_status(failed_operation)
+
+        statuses = await self._run_concurrently(
+            desired_states,
+            lambda desired_state: self._provision_desired_state(
+                desired_state, include_source=False
+            ),
+        )
+        return _make_data_product_status("Provisioning", output_ports, statuses)
 
-        track_table_res = self._hasura_admin_client.track_table(table_config)
+    async def unprovision(
+        self,
+        data_product: DataProduct,
+        hasura_output_port: HasuraOutputPort,
+        source_output_port: OutputPort,
+    ) -> Union[ProvisioningStatus, ValidationError]:
+        validation_result = self.validate(
+            data_product, hasura_output_port, source_output_port
+        )
+
+        if not validation_result.valid:
+            return validation_result.error  # type: ignore[return-value]
 
-        if (
-            track_table_res == TrackTableResult.SUCCESS
-            or track_table_res == TrackTableResult.ALREADY_TRACKED
+        desired_state = self._make_desired_state(
+            data_product, hasura_output_port, source_output_port
+        )
+
+        return await self._unprovision_desired_state(desired_state)
+
+    async def unprovision_data_product(
+        self, hasura_data_product: HasuraDataProduct
+    ) -> Union[ProvisioningStatus, ValidationError]:
+        """
+        Unprovision a whole data product: the select permissions of all the tables of
+        its source are dropped and the tables untracked with a single atomic bulk
+        metadata request, tables of output ports no longer in the descriptor
+        included. The source is dropped as well if `drop_source_on_unprovision`.
+        """
+        validation_result = self.validate_data_product(hasura_data_product)
+
+        if not validation_result.valid:
+            return validation_result.error  # type: ignore[return-value]
+
+        data_product, output_ports = hasura_data_product
+        # the type and name are enough to identify the source
+        data_source_config = DataSourceConfig(
+            data_source_type=DataSourceType.SNOWFLAKE,
+            data_source_name=_make_source_name(data_product),
+            config={},
+        )
+        async with self._lock_scheduler.hold(
+            source_key(data_source_config.data_source_name)
         ):
-            pass
-        else:
-            return ProvisioningStatus(
+            (
+                clear_source_res,
+                untracked_tables,
+            ) = await self._latency_tracker.measure(
+                "clear_source",
+                self._hasura_admin_client.clear_source(
+                    data_source_config,
+                    drop_source=self._config.drop_source_on_unprovision,
+                ),
+            )
+
+        if clear_source_res == ClearSourceResult.FAILURE:
+            status = ProvisioningStatus(
                 status=Status1.FAILED,
-                result="Unable to track table; please check with the platform team.",
+                result=(
+                    "Unable to untrack the tables of the data product; "
+                    "please check with the platform team."
+                ),
+            )
+        else:
+            status = ProvisioningStatus(
+                status=Status1.COMPLETED,
+                result=f"Unprovisioning completed, {untracked_tables} tables untracked",
             )
+        # the outcome is the same for all the output ports
+        status.info = _make_components_info(output_ports, [status] * len(output_ports))
+        return status
 
-        role_id = _make_role_id(data_product, hasura_output_port)
-        role = Role(
-            role_id=role_id,
-            component_id=hasura_output_port.id,
-            graphql_root_field_names=[
-                table_config.select_root_field_name,
-                table_config.select_by_pk_root_field_name,
-                table_config.select_aggregate_root_field_name,
-                table_config.select_stream_root_field_name,
-            ],
+    async def update_acl(
+        self,
+        data_product: DataProduct,
+        hasura_output_port: HasuraOutputPort,
+        source_output_port: OutputPort,
+        refs: List[str],
+    ) -> Union[ProvisioningStatus, ValidationError]:
+        validation_result = self.validate(
+            data_product, hasura_output_port, source_output_port
         )
 
-        create_role_res = self._role_mapper_client.create_role(role)
+        if not validation_result.valid:
+            return validation_result.error  # type: ignore[return-value]
+
+        role_id = _make_role_id(data_product, hasura_output_port)
+        users = [user for user in refs if user.startswith("user:")]
+        groups = [group for group in refs if group.startswith("group:")]
+        user_role_mappings = UserRoleMappings(role_id=role_id, users=users)
+        group_role_mappings = GroupRoleMappings(role_id=role_id, groups=groups)
 
-        if type(create_role_res) == Role:
+        # the user and group mappings are independent, they are updated concurrently
+        async with self._lock_scheduler.hold(role_key(role_id)):
+            user_role_mapping_res, group_role_mapping_res = await asyncio.gather(
+                self._latency_tracker.measure(
+                    "update_user_role_mappings",
+                    self._role_mapper_client.update_user_role_mappings(
+                        user_role_mappings
+                    ),
+                ),
+                self._latency_tracker.measure(
+                    "update_group_role_mappings",
+                    self._role_mapper_client.update_group_role_mappings(
+                        group_role_mappings
+                    ),
+                ),
+            )
+
+        if type(user_role_mapping_res) == UserRoleMappings:
             pass
         else:
             return ProvisioningStatus(
                 status=Status1.FAILED,
-                result="Unable to create role; please check with the platform team.",
+                result=(
+                    "Unable to update user role mappings; "
+                    "please check with the platform team."
+                ),
             )
 
-        create_select_permission_res = (
-            self._hasura_admin_client.create_select_permission(table_config, role_id)
-        )
-
-        if (
-            create_select_permission_res == CreateSelectPermissionResult.SUCCESS
-            or create_select_permission_res
-            == CreateSelectPermissionResult.ALREADY_EXISTS
-        ):
+        if type(group_role_mapping_res) == GroupRoleMappings:
             pass
         else:
             return ProvisioningStatus(
                 status=Status1.FAILED,
                 result=(
-                    "Unable to create permissions for table; "
+                    "Unable to update group role mappings; "
                     "please check with the platform team."
                 ),
             )
 
-        # TODO deploy info
-        # info = Info(publicInfo={"info": "link to hasura, example query"})
-        info = None
-
         return ProvisioningStatus(
-            status=Status1.COMPLETED, result="Provisioning completed", info=info
+            status=Status1.COMPLETED, result="Update ACL completed"
         )
 
-    def unprovision(
+    async def plan_provision(
         self,
         data_product: DataProduct,
         hasura_output_port: HasuraOutputPort,
         source_output_port: OutputPort,
-    ) -> Union[ProvisioningStatus, ValidationError]:
+    ) -> Union[ExecutionPlan, ValidationError]:
+        """
+        Returns the calls the provisioning of an output port would make, as of the
+        current Hasura metadata and Role Mapper state, without making them
+        """
         validation_result = self.validate(
             data_product, hasura_output_port, source_output_port
         )
@@ -205,42 +470,108 @@ class HasuraProvisioner(object):
         if not validation_result.valid:
             return validation_result.error  # type: ignore[return-value]
 
-        data_source_config, table_config = self._make_data_source_and_table_configs(
+        desired_state = self._make_desired_state(
             data_product, hasura_output_port, source_output_port
         )
+        return make_execution_plan(
+            await self._reconciler.explain_provision(desired_state)
+        )
 
-        untrack_table_res = self._hasura_admin_client.untrack_table(table_config)
+    async def plan_provision_data_product(
+        self, hasura_data_product: HasuraDataProduct
+    ) -> Union[ExecutionPlan, ValidationError]:
+        """
+        Returns the calls the provisioning of a whole data product would make: the
+        ones setting up its sources, then the ones of each output port
+        """
+        validation_result = self.validate_data_product(hasura_data_product)
 
-        if (
-            untrack_table_res == UntrackTableResult.SUCCESS
-            or untrack_table_res == UntrackTableResult.NOT_TRACKED
-        ):
-            pass
-        else:
-            return ProvisioningStatus(
-                status=Status1.FAILED,
-                result="Unable to untrack table; please check with the platform team.",
+        if not validation_result.valid:
+            return validation_result.error  # type: ignore[return-value]
+
+        data_product, output_ports = hasura_data_product
+        desired_states = [
+            self._make_desired_state(
+                data_product, hasura_output_port, source_output_port
+            )
+            for hasura_output_port, source_output_port in output_ports
+        ]
+        calls: List[PlannedCall] = []
+        for desired_state in _distinct_sources(desired_states):
+            calls.extend(await self._reconciler.explain_source(desired_state))
+        for desired_state in desired_states:
+            calls.extend(
+                await self._reconciler.explain_provision(
+                    desired_state, include_source=False
+                )
             )
+        return make_execution_plan(calls)
 
-        # TODO smart drop source
-        # for now, do not drop source as it may be used by to other OPs
-        # we need to check, for now leave it
+    async def plan_unprovision(
+        self,
+        data_product: DataProduct,
+        hasura_output_port: HasuraOutputPort,
+        source_output_port: OutputPort,
+    ) -> Union[ExecutionPlan, ValidationError]:
+        """
+        Returns the calls the unprovisioning of an output port would make, without
+        making them
+        """
+        validation_result = self.validate(
+            data_product, hasura_output_port, source_output_port
+        )
 
-        # TODO remove role and mappings
-        #  (delete role + put empty role mappings for groups and users?)
-        # for now we can leave them, they create no issues
+        if not validation_result.valid:
+            return validation_result.error  # type: ignore[return-value]
 
-        return ProvisioningStatus(
-            status=Status1.COMPLETED, result="Unprovisioning completed"
+        desired_state = self._make_desired_state(
+            data_product, hasura_output_port, source_output_port
         )
+        return make_execution_plan(
+            await self._reconciler.explain_unprovision(desired_state)
+        )
+
+    async def plan_unprovision_data_product(
+        self, hasura_data_product: HasuraDataProduct
+    ) -> Union[ExecutionPlan, ValidationError]:
+        """
+        Returns the single bulk request the unprovisioning of a whole data product
+        would send, skipped if there is nothing to remove from its source
+        """
+        validation_result = self.validate_data_product(hasura_data_product)
+
+        if not validation_result.valid:
+            return validation_result.error  # type: ignore[return-value]
+
+        data_product, _ = hasura_data_product
+        source_name = _make_source_name(data_product)
+        snapshot = await self._hasura_admin_client.get_metadata_snapshot()
+        if snapshot.get_source(source_name) is None or (
+            not snapshot.get_tables(source_name)
+            and not self._config.drop_source_on_unprovision
+        ):
+            call = PlannedCall(
+                service=Service.HASURA,
+                operations=["clear_source"],
+                skipped=True,
+                schema_reloads=0,
+            )
+        else:
+            call = make_planned_call(
+                self._latency_tracker, Service.HASURA, ["clear_source"], 1
+            )
+        return make_execution_plan([call])
 
-    def update_acl(
+    async def plan_update_acl(
         self,
         data_product: DataProduct,
         hasura_output_port: HasuraOutputPort,
         source_output_port: OutputPort,
-        refs: List[str],
-    ) -> Union[ProvisioningStatus, ValidationError]:
+    ) -> Union[ExecutionPlan, ValidationError]:
+        """
+        Returns the Role Mapper calls an ACL update would make; the mappings are
+        always replaced as a whole, so they are never skipped
+        """
         validation_result = self.validate(
             data_product, hasura_output_port, source_output_port
         )
@@ -248,44 +579,158 @@ class HasuraProvisioner(object):
         if not validation_result.valid:
             return validation_result.error  # type: ignore[return-value]
 
-        role_id = _make_role_id(data_product, hasura_output_port)
-        users = [user for user in refs if user.startswith("user:")]
-        groups = [group for group in refs if group.startswith("group:")]
-        user_role_mappings = UserRoleMappings(role_id=role_id, users=users)
-        group_role_mappings = GroupRoleMappings(role_id=role_id, groups=groups)
-
-        user_role_mapping_res = self._role_mapper_client.update_user_role_mappings(
-            user_role_mappings
+        return make_execution_plan(
+            [
+                make_planned_call(
+                    self._latency_tracker, Service.ROLE_MAPPER, [operation], 0
+                )
+                for operation in (
+                    "update_user_role_mappings",
+                    "update_group_role_mappings",
+                )
+            ]
         )
 
-        if type(user_role_mapping_res) == UserRoleMappings:
-            pass
+    async def _provision_desired_state(
+        self, desired_state: DesiredState, include_source: bool = True
+    ) -> ProvisioningStatus:
+        if self._checkpoint_store is None:
+            operations = await self._reconciler.plan_provision(
+                desired_state, include_source=include_source
+            )
+            failed_operation = await self._reconciler.apply(desired_state, operations)
         else:
-            return ProvisioningStatus(
-                status=Status1.FAILED,
-                result=(
-                    "Unable to update user role mappings; "
-                    "please check with the platform team."
-                ),
+            failed_operation = await self._provision_from_checkpoint(
+                self._checkpoint_store, desired_state, include_source
             )
 
-        group_role_mapping_res = self._role_mapper_client.update_group_role_mappings(
-            group_role_mappings
+        if failed_operation is not None:
+            return _make_failure_status(failed_operation)
+
+        # TODO deploy info
+        # info = Info(publicInfo={"info": "link to hasura, example query"})
+        info = None
+
+        return ProvisioningStatus(
+            status=Status1.COMPLETED, result="Provisioning completed", info=info
         )
 
-        if type(group_role_mapping_res) == GroupRoleMappings:
-            pass
+    async def _provision_from_checkpoint(
+        self,
+        checkpoint_store: CheckpointStore,
+        desired_state: DesiredState,
+        include_source: bool,
+    ) -> Optional[OperationType]:
+        """
+        Resume the run of a previous attempt from its checkpoint, without planning
+        again, or plan and run the operations recording each one that succeeds.
+        The checkpoint is deleted once all the operations succeeded
+        """
+        key = make_checkpoint_key(
+            "provision" if include_source else "provision_output_port",
+            desired_state.role.component_id,
+            desired_state,
+        )
+        checkpoint = await checkpoint_store.get(key)
+        resumed = checkpoint is not None
+        if checkpoint is not None:
+            operations = [
+                operation
+                for operation in checkpoint.operations
+                if operation not in checkpoint.completed
+            ]
+            self._logger.info(
+                "Resuming the provisioning of %s from its checkpoint: %s",
+                desired_state.role.component_id,
+                operations,
+            )
         else:
-            return ProvisioningStatus(
-                status=Status1.FAILED,
-                result=(
-                    "Unable to update group role mappings; "
-                    "please check with the platform team."
-                ),
+            operations = await self._reconciler.plan_provision(
+                desired_state, include_source=include_source
             )
+            if not operations:
+                return None
+            checkpoint = Checkpoint(operations=operations, created_at=time.time())
+            await checkpoint_store.save(key, checkpoint)
+        current_checkpoint = checkpoint
+
+        async def record(completed: List[OperationType]) -> None:
+            current_checkpoint.completed.extend(completed)
+            await checkpoint_store.save(key, current_checkpoint)
+
+        failed_operation = await self._reconciler.apply(
+            desired_state, operations, on_completed=record
+        )
+        if failed_operation is None:
+            await checkpoint_store.delete(key)
+        elif resumed:
+            current_checkpoint.resumes += 1
+            await checkpoint_store.save(key, current_checkpoint)
+        return failed_operation
+
+    async def _unprovision_desired_state(
+        self, desired_state: DesiredState
+    ) -> ProvisioningStatus:
+        operations = await self._reconciler.plan_unprovision(desired_state)
+        failed_operation = await self._reconciler.apply(desired_state, operations)
+
+        if failed_operation is not None:
+            return _make_failure_status(failed_operation)
+
+        # TODO remove role and mappings
+        #  (delete role + put empty role mappings for groups and users?)
+        # for now we can leave them, they create no issues
 
         return ProvisioningStatus(
-            status=Status1.COMPLETED, result="Update ACL completed"
+            status=Status1.COMPLETED, result="Unprovisioning completed"
+        )
+
+    async def _run_concurrently(
+        self,
+        desired_states: List[DesiredState],
+        run: Callable[[DesiredState], Awaitable[ProvisioningStatus]],
+    ) -> List[ProvisioningStatus]:
+        # a failing output port does not stop the others
+        semaphore = asyncio.Semaphore(self._config.data_product_max_concurrency)
+
+        async def run_bounded(desired_state: DesiredState) -> ProvisioningStatus:
+            async with semaphore:
+                try:
+                    return await run(desired_state)
+                except Exception as ex:
+                    self._logger.exception(
+                        "Unable to reconcile output port %s",
+                        desired_state.role.component_id,
+                    )
+                    return ProvisioningStatus(status=Status1.FAILED, result=str(ex))
+
+        return await asyncio.gather(
+            *(run_bounded(desired_state) for desired_state in desired_states)
+        )
+
+    def _make_desired_state(
+        self,
+        data_product: DataProduct,
+        hasura_output_port: HasuraOutputPort,
+        source_output_port: OutputPort,
+    ) -> DesiredState:
+        data_source_config, table_config = self._make_data_source_and_table_configs(
+            data_product, hasura_output_port, source_output_port
+        )
+        role = Role(
+            role_id=_make_role_id(data_product, hasura_output_port),
+            component_id=hasura_output_port.id,
+            graphql_root_field_names=[
+                table_config.select_root_field_name,
+                table_config.select_by_pk_root_field_name,
+                table_config.select_aggregate_root_field_name,
+                table_config.select_stream_root_field_name,
+            ],
+        )
+        return DesiredState(
+            data_source_config=data_source_config,
+            table_config=table_config,
+            role=role,
         )
 
     def _make_data_source_and_table_configs(
@@ -320,20 +765,29 @@ class HasuraProvisioner(object):
         return data_source_config, table_config
 
     def _make_snowflake_jdbc_url(self, snowflake_output_port: OutputPort) -> str:
-        sc = self._config.snowflake_config
         db = snowflake_output_port.specific["database"]
         schema = snowflake_output_port.specific["schema"]
 
         jdbc_url = (
-            f"jdbc:snowflake://{sc.host}/?"
-            f"user={sc.user}&password={quote(sc.password)}&"
-            f"role={sc.role}&warehouse={sc.warehouse}&"
-            f"db={db}&schema={schema}"
+            make_snowflake_jdbc_url_prefix(self._config.snowflake_config)
+            + f"db={db}&schema={schema}"
         )
 
         return jdbc_url
 
 
+def make_snowflake_jdbc_url_prefix(sc: SnowflakeConfig) -> str:
+    """
+    Returns the start of the JDBC URL of the sources added by the provisioner: the
+    connection settings of the provisioner, before the database and schema
+    """
+    return (
+        f"jdbc:snowflake://{sc.host}/?"
+        f"user={sc.user}&password={quote(sc.password)}&"
+        f"role={sc.role}&warehouse={sc.warehouse}&"
+    )
+
+
 def _normalize(value: str) -> str:
     return value.replace(" ", "").replace("-", "").lower()
 
@@ -369,3 +823,64 @@ def _make_source_name(dp: DataProduct) -> str:
 def _make_role_id(dp: DataProduct, op: HasuraOutputPort) -> str:
     prefix = _make_prefix(dp, op)
     return f"{prefix}role"
+
+
+def _distinct_sources(desired_states: List[DesiredState]) -> List[DesiredState]:
+    # each distinct source config is applied once, in order; the output ports of a
+    # validated data product all share the same one
+    source_desired_states: List[DesiredState] = []
+    for desired_state in desired_states:
+        if all(
+            desired_state.data_source_config != other.data_source_config
+            for other in source_desired_states
+        ):
+            source_desired_states.append(desired_state)
+    return source_desired_states
+
+
+def _make_failure_status(failed_operation: OperationType) -> ProvisioningStatus:
+    return ProvisioningStatus(
+        status=Status1.FAILED,
+        result=(
+            f"{_FAILURE_MESSAGES[failed_operation]}; "
+            "please check with the platform team."
+        ),
+    )
+
+
+def _make_data_product_status(
+    operation_name: str,
+    output_ports: List[Tuple[HasuraOutputPort, OutputPort]],
+    statuses: List[ProvisioningStatus],
+) -> ProvisioningStatus:
+    info = _make_components_info(output_ports, statuses)
+    failures = [
+        f"{hasura_output_port.id}: {status.result}"
+        for (hasura_output_port, _), status in zip(output_ports, statuses)
+        if status.status != Status1.COMPLETED
+    ]
+    if failures:
+        return ProvisioningStatus(
+            status=Status1.FAILED,
+            result=(
+                f"{operation_name} failed for {len(failures)} of {len(statuses)} "
+                f"output ports: " + "; ".join(failures)
+            ),
+            info=info,
+        )
+    return ProvisioningStatus(
+        status=Status1.COMPLETED,
+        result=f"{operation_name} completed for {len(statuses)} output ports",
+        info=info,
+    )
+
+
+def _make_components_info(
+    output_ports: List[Tuple[HasuraOutputPort, OutputPort]],
+    statuses: List[ProvisioningStatus],
+) -> Info:
+    components = {
+        hasura_output_port.id: {"status": status.status.value, "result": status.result}
+        for (hasura_output_port, _), status in zip(output_ports, statuses)
+    }
+    return Info(publicInfo={}, privateInfo={"components": components})
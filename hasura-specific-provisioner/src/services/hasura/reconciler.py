@@ -0,0 +1,521 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+from src.common.model.hasura import DropSourceResult, ResourceState
+from src.common.model.reconciliation import (
+    DesiredState,
+    ExecutionPlan,
+    OperationType,
+    PlannedCall,
+    Service,
+)
+from src.common.model.rolemapping import Role
+from src.services.hasura.client import HasuraAdminClient
+from src.services.hasura.metadata import MetadataSnapshot
+from src.services.keyedlock import KeyedLockScheduler, role_key, source_key
+from src.services.latency import LatencyTracker
+from src.services.rolemapper import RoleMapperClient
+
+# operations that must succeed before an operation can run, when they are planned;
+# the select permission is never granted to a role unknown to the role mapper
+_DEPENDENCIES: Dict[OperationType, Set[OperationType]] = {
+    OperationType.ADD_SOURCE: set(),
+    OperationType.UPDATE_SOURCE: set(),
+    OperationType.TRACK_TABLE: {OperationType.ADD_SOURCE, OperationType.UPDATE_SOURCE},
+    OperationType.UPDATE_TABLE: {
+        OperationType.ADD_SOURCE,
+        OperationType.UPDATE_SOURCE,
+    },
+    OperationType.CREATE_ROLE: set(),
+    OperationType.DROP_SELECT_PERMISSION: {
+        OperationType.TRACK_TABLE,
+        OperationType.UPDATE_TABLE,
+    },
+    OperationType.CREATE_SELECT_PERMISSION: {
+        OperationType.TRACK_TABLE,
+        OperationType.UPDATE_TABLE,
+        OperationType.DROP_SELECT_PERMISSION,
+        OperationType.CREATE_ROLE,
+    },
+    OperationType.UNTRACK_TABLE: set(),
+    OperationType.DROP_SOURCE: {OperationType.UNTRACK_TABLE},
+}
+
+# notified of the operations that succeeded
+OperationsCallback = Callable[[List[OperationType]], Awaitable[None]]
+
+# operations that are not metadata requests, or must not join a bulk request
+_STANDALONE_OPERATIONS = {OperationType.CREATE_ROLE, OperationType.DROP_SOURCE}
+
+# operations planned instead of another one when its resource exists but is outdated
+_ALTERNATIVES: Dict[OperationType, Set[OperationType]] = {
+    OperationType.ADD_SOURCE: {OperationType.UPDATE_SOURCE},
+    OperationType.TRACK_TABLE: {OperationType.UPDATE_TABLE},
+}
+
+
+class HasuraReconciler(object):
+    """
+    Brings Hasura and the Role Mapper to the desired state of an output port.
+
+    The desired state is compared with the actual Hasura metadata and Role Mapper
+    state, and only the operations needed to close the gap are planned, in dependency
+    order: source, table, role, then select permission. An output port that is already
+    in the desired state needs no write at all, and a run that failed halfway is
+    completed by the next one without repeating the steps that already succeeded.
+    Without a metadata cache, reading the state would cost a full metadata export
+    and a Role Mapper call on every provisioning, more than the writes it saves:
+    unless `inspect_state`, all the operations are planned without reading the
+    state, and those finding their resource already there, or already gone, succeed.
+    Operations that do not depend on each other are applied concurrently; each
+    step holds the lock of the source, or of the role, it writes to, so that steps
+    of concurrent reconciliations on the same source or role never run at the same
+    time. Metadata writes sent through a batcher are serialized by the batcher
+    instead, so that concurrent writes to the same source can share a batch.
+    """
+
+    def __init__(
+        self,
+        hasura_admin_client: HasuraAdminClient,
+        role_mapper_client: RoleMapperClient,
+        bulk_metadata: bool = False,
+        drop_unused_sources: bool = False,
+        lock_scheduler: Optional[KeyedLockScheduler] = None,
+        latency_tracker: Optional[LatencyTracker] = None,
+        inspect_state: bool = True,
+    ):
+        self._hasura_admin_client = hasura_admin_client
+        self._inspect_state = inspect_state
+        self._role_mapper_client = role_mapper_client
+        self._bulk_metadata = bulk_metadata
+        self._drop_unused_sources = drop_unused_sources
+        self._lock_scheduler = (
+            KeyedLockScheduler() if lock_scheduler is None else lock_scheduler
+        )
+        self._latency_tracker = (
+            LatencyTracker() if latency_tracker is None else latency_tracker
+        )
+        self._logger = logging.getLogger(__name__)
+
+    async def plan_source(self, desired_state: DesiredState) -> List[OperationType]:
+        """
+        Plan the operations needed to provision the source of the desired state only
+        """
+        if not self._inspect_state:
+            operations = [OperationType.ADD_SOURCE]
+        else:
+            snapshot = await self._hasura_admin_client.get_metadata_snapshot()
+            operations = self._plan_source(snapshot, desired_state)
+        self._logger.info("Planned source operations: %s", operations)
+        return operations
+
+    async def plan_provision(
+        self, desired_state: DesiredState, include_source: bool = True
+    ) -> List[OperationType]:
+        """
+        Plan the operations needed to provision the desired state; the source is left
+        out if `include_source` is False, eg when it is set up once beforehand for
+        several output ports
+        """
+        if not self._inspect_state:
+            operations = [
+                OperationType.TRACK_TABLE,
+                OperationType.CREATE_ROLE,
+                OperationType.CREATE_SELECT_PERMISSION,
+            ]
+            if include_source:
+                operations.insert(0, OperationType.ADD_SOURCE)
+            self._logger.info("Planned provisioning operations: %s", operations)
+            return operations
+        return await self._plan_provision_from_state(desired_state, include_source)
+
+    async def _plan_provision_from_state(
+        self, desired_state: DesiredState, include_source: bool
+    ) -> List[OperationType]:
+        client = self._hasura_admin_client
+        snapshot = await client.get_metadata_snapshot()
+        table_config = desired_state.table_config
+        role = desired_state.role
+
+        operations: List[OperationType] = []
+
+        if include_source:
+            operations.extend(self._plan_source(snapshot, desired_state))
+
+        table_state = client.get_table_state(snapshot, table_config)
+        if table_state == ResourceState.MISSING:
+            operations.append(OperationType.TRACK_TABLE)
+        elif table_state == ResourceState.OUTDATED:
+            operations.append(OperationType.UPDATE_TABLE)
+
+        actual_role = await self._latency_tracker.measure(
+            "get_role", self._role_mapper_client.get_role(role.role_id)
+        )
+        if not _is_role_up_to_date(actual_role, role):
+            operations.append(OperationType.CREATE_ROLE)
+
+        # Hasura cannot replace a permission in place, an outdated one is recreated
+        permission_state = client.get_select_permission_state(
+            snapshot, table_config, role.role_id
+        )
+        if permission_state == ResourceState.OUTDATED:
+            operations.append(OperationType.DROP_SELECT_PERMISSION)
+        if permission_state != ResourceState.UP_TO_DATE:
+            operations.append(OperationType.CREATE_SELECT_PERMISSION)
+
+        self._logger.info("Planned provisioning operations: %s", operations)
+        return operations
+
+    async def plan_unprovision(
+        self, desired_state: DesiredState
+    ) -> List[OperationType]:
+        """
+        Plan the operations needed to unprovision the desired state
+        """
+        client = self._hasura_admin_client
+        data_source_config = desired_state.data_source_config
+
+        operations: List[OperationType] = []
+
+        # the role creates no issues, so only the table is removed, and the source
+        # as well if no other table uses it, according to the source registry
+        if not self._inspect_state:
+            # untracking a table that is not tracked succeeds, and a missing source
+            # is found by the registry before dropping it
+            operations.append(OperationType.UNTRACK_TABLE)
+            source_exists = True
+        else:
+            snapshot = await client.get_metadata_snapshot()
+            table_state = client.get_table_state(snapshot, desired_state.table_config)
+            if table_state != ResourceState.MISSING:
+                operations.append(OperationType.UNTRACK_TABLE)
+            source_exists = (
+                client.get_source_state(snapshot, data_source_config)
+                != ResourceState.MISSING
+            )
+
+        references = client.get_source_reference_count(
+            data_source_config.data_source_name
+        )
+        if (
+            self._drop_unused_sources
+            and references is not None
+            and references - operations.count(OperationType.UNTRACK_TABLE) == 0
+            and source_exists
+        ):
+            operations.append(OperationType.DROP_SOURCE)
+
+        self._logger.info("Planned unprovisioning operations: %s", operations)
+        return operations
+
+    async def explain_source(self, desired_state: DesiredState) -> List[PlannedCall]:
+        """
+        Returns the calls provisioning the source of the desired state only would
+        make, without making them
+        """
+        snapshot = await self._hasura_admin_client.get_metadata_snapshot()
+        operations = self._plan_source(snapshot, desired_state)
+        return self._make_planned_calls(operations, [OperationType.ADD_SOURCE])
+
+    async def explain_provision(
+        self, desired_state: DesiredState, include_source: bool = True
+    ) -> List[PlannedCall]:
+        """
+        Returns the calls provisioning the desired state would make, without making
+        them; the resources already in the desired state are reported as skipped
+        """
+        operations = await self._plan_provision_from_state(
+            desired_state, include_source
+        )
+        candidates = [
+            OperationType.TRACK_TABLE,
+            OperationType.CREATE_ROLE,
+            OperationType.CREATE_SELECT_PERMISSION,
+        ]
+        if include_source:
+            candidates.insert(0, OperationType.ADD_SOURCE)
+        # the role is always read to plan the provisioning
+        return [
+            make_planned_call(
+                self._latency_tracker, Service.ROLE_MAPPER, ["get_role"], 0
+            ),
+            *self._make_planned_calls(operations, candidates),
+        ]
+
+    async def explain_unprovision(
+        self, desired_state: DesiredState
+    ) -> List[PlannedCall]:
+        """
+        Returns the calls unprovisioning the desired state would make, without
+        making them
+        """
+        operations = await self.plan_unprovision(desired_state)
+        candidates = [OperationType.UNTRACK_TABLE]
+        if self._drop_unused_sources:
+            candidates.append(OperationType.DROP_SOURCE)
+        return self._make_planned_calls(operations, candidates)
+
+    def _make_planned_calls(
+        self, operations: List[OperationType], candidates: List[OperationType]
+    ) -> List[PlannedCall]:
+        """
+        Returns a call for each step of the planned operations, and a skipped one
+        for each candidate operation that is not needed
+        """
+        calls = [
+            make_planned_call(
+                self._latency_tracker,
+                _service(step),
+                step,
+                # every metadata request reloads the GraphQL schema once
+                0 if _service(step) == Service.ROLE_MAPPER else 1,
+            )
+            for step, _ in self._make_steps(operations)
+        ]
+        planned = set(operations)
+        for operation in candidates:
+            if not ({operation} | _ALTERNATIVES.get(operation, set())) & planned:
+                calls.append(
+                    PlannedCall(
+                        service=_service([operation]),
+                        operations=[operation],
+                        skipped=True,
+                        schema_reloads=0,
+                    )
+                )
+        return calls
+
+    def _plan_source(
+        self, snapshot: MetadataSnapshot, desired_state: DesiredState
+    ) -> List[OperationType]:
+        source_state = self._hasura_admin_client.get_source_state(
+            snapshot, desired_state.data_source_config
+        )
+        if source_state == ResourceState.MISSING:
+            return [OperationType.ADD_SOURCE]
+        if source_state == ResourceState.OUTDATED:
+            return [OperationType.UPDATE_SOURCE]
+        return []
+
+    async def apply(
+        self,
+        desired_state: DesiredState,
+        operations: List[OperationType],
+        on_completed: Optional[OperationsCallback] = None,
+    ) -> Optional[OperationType]:
+        """
+        Run the planned operations, each one as soon as the operations it depends on
+        have succeeded, so that independent operations run concurrently (eg, the
+        role is created while the source and the table are set up). Operations
+        depending on a failed one are skipped. `on_completed` is awaited with the
+        operations of each step that succeeded, as soon as the step is done.
+        Returns the first operation that failed, in plan order, or None if all of
+        them succeeded
+        """
+        steps = self._make_steps(operations)
+        tasks: List["asyncio.Task[List[bool]]"] = []
+        for step, dependencies in steps:
+            tasks.append(
+                asyncio.create_task(
+                    self._run_step(
+                        desired_state,
+                        step,
+                        [tasks[index] for index in dependencies],
+                        on_completed,
+                    )
+                )
+            )
+        results = await asyncio.gather(*tasks)
+
+        outcomes = {
+            operation: ok
+            for (step, _), step_results in zip(steps, results)
+            for operation, ok in zip(step, step_results)
+        }
+        failed = [
+            operation
+            for operation in operations
+            if outcomes[operation] is False
+            and not _is_skipped(operation, operations, outcomes)
+        ]
+        return failed[0] if failed else None
+
+    async def _run_step(
+        self,
+        desired_state: DesiredState,
+        step: List[OperationType],
+        dependencies: List["asyncio.Task[List[bool]]"],
+        on_completed: Optional[OperationsCallback] = None,
+    ) -> List[bool]:
+        for dependency_results in await asyncio.gather(*dependencies):
+            if not all(dependency_results):
+                return [False] * len(step)
+
+        results = await self._run_operations(desired_state, step)
+        completed = [operation for operation, ok in zip(step, results) if ok]
+        if on_completed is not None and completed:
+            await on_completed(completed)
+        return results
+
+    async def _run_operations(
+        self, desired_state: DesiredState, step: List[OperationType]
+    ) -> List[bool]:
+        if step == [OperationType.CREATE_ROLE]:
+            async with self._lock_scheduler.hold(role_key(desired_state.role.role_id)):
+                create_role_res = await self._latency_tracker.measure(
+                    call_name(step),
+                    self._role_mapper_client.create_role(desired_state.role),
+                )
+            return [type(create_role_res) == Role]
+
+        # the batcher sends the writes one batch at a time, in submission order: the
+        # writes to the same source are serialized by it, and holding the source
+        # lock while waiting for the batching window would keep them out of the
+        # batches of each other
+        keys = (
+            []
+            if step != [OperationType.DROP_SOURCE]
+            and self._hasura_admin_client.has_batcher
+            else [source_key(desired_state.data_source_config.data_source_name)]
+        )
+        async with self._lock_scheduler.hold(*keys):
+            if step == [OperationType.DROP_SOURCE]:
+                # the source is only dropped if it is still unused when the step runs
+                drop_source_res = await self._latency_tracker.measure(
+                    call_name(step),
+                    self._hasura_admin_client.drop_source_if_unused(
+                        desired_state.data_source_config
+                    ),
+                )
+                return [drop_source_res != DropSourceResult.FAILURE]
+
+            return await self._latency_tracker.measure(
+                call_name(step),
+                self._hasura_admin_client.run_metadata_operations(
+                    step,
+                    desired_state.data_source_config,
+                    desired_state.table_config,
+                    desired_state.role.role_id,
+                ),
+            )
+
+    def _make_steps(
+        self, operations: List[OperationType]
+    ) -> List[Tuple[List[OperationType], List[int]]]:
+        """
+        Group the operations in steps, each one run with a single request, and
+        return them in order with the indexes of the steps they depend on
+        """
+        if not self._bulk_metadata:
+            groups = [[operation] for operation in operations]
+        else:
+            # standalone operations (the role, the source drop) cannot join a bulk
+            # request: those the metadata operations depend on are run first, so
+            # that all the metadata operations are sent as a single bulk request,
+            # reloading the schema once, and the others afterwards
+            metadata_operations = [
+                operation
+                for operation in operations
+                if operation not in _STANDALONE_OPERATIONS
+            ]
+            required = {
+                dependency
+                for operation in metadata_operations
+                for dependency in _all_dependencies(operation)
+            }
+            groups = [
+                *[
+                    [operation]
+                    for operation in operations
+                    if operation in _STANDALONE_OPERATIONS and operation in required
+                ],
+                metadata_operations,
+                *[
+                    [operation]
+                    for operation in operations
+                    if operation in _STANDALONE_OPERATIONS and operation not in required
+                ],
+            ]
+            groups = [group for group in groups if group]
+
+        steps: List[Tuple[List[OperationType], List[int]]] = []
+        for group in groups:
+            dependencies = {
+                index
+                for operation in group
+                for dependency in _DEPENDENCIES[operation]
+                for index, (step, _) in enumerate(steps)
+                if dependency in step
+            }
+            steps.append((group, sorted(dependencies)))
+        return steps
+
+
+def call_name(operations: Sequence[str]) -> str:
+    """
+    Name of a call in the latency tracker, a bulk request is named after all its
+    operations
+    """
+    return "+".join(operations)
+
+
+def make_planned_call(
+    latency_tracker: LatencyTracker,
+    service: Service,
+    operations: Sequence[str],
+    schema_reloads: int,
+) -> PlannedCall:
+    return PlannedCall(
+        service=service,
+        operations=list(operations),
+        schema_reloads=schema_reloads,
+        estimated_latency=latency_tracker.estimate(call_name(operations)),
+    )
+
+
+def make_execution_plan(calls: List[PlannedCall]) -> ExecutionPlan:
+    return ExecutionPlan(
+        calls=calls,
+        schema_reloads=sum(call.schema_reloads for call in calls),
+        estimated_latency=sum(
+            call.estimated_latency
+            for call in calls
+            if not call.skipped and call.estimated_latency is not None
+        ),
+    )
+
+
+def _service(step: List[OperationType]) -> Service:
+    return (
+        Service.ROLE_MAPPER if step == [OperationType.CREATE_ROLE] else Service.HASURA
+    )
+
+
+def _is_role_up_to_date(actual_role: object, role: Role) -> bool:
+    # errors reading the role are not fatal, the role is simply upserted again
+    return (
+        isinstance(actual_role, Role)
+        and actual_role.component_id == role.component_id
+        and sorted(actual_role.graphql_root_field_names)
+        == sorted(role.graphql_root_field_names)
+    )
+
+
+def _all_dependencies(operation: OperationType) -> Set[OperationType]:
+    dependencies = set(_DEPENDENCIES[operation])
+    for dependency in _DEPENDENCIES[operation]:
+        dependencies |= _all_dependencies(dependency)
+    return dependencies
+
+
+def _is_skipped(
+    operation: OperationType,
+    operations: List[OperationType],
+    outcomes: Dict[OperationType, bool],
+) -> bool:
+    # an operation that was not attempted because a planned dependency failed
+    return any(
+        dependency in operations and not outcomes[dependency]
+        for dependency in _DEPENDENCIES[operation]
+    )
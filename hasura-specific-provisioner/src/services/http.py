@@ -0,0 +1,129 @@
+import logging
+import weakref
+from typing import Any, Callable, Optional
+
+from httpx import AsyncClient, Auth, Limits, Request
+from opentelemetry import metrics
+from opentelemetry.metrics import CallbackOptions, Observation
+from pydantic import BaseModel
+
+from src.common.model.config import HttpPoolConfig
+
+_meter = metrics.get_meter(__name__)
+
+# connection pools observed by the instruments below, the instruments of a meter
+# are created once and each pool is reported under its own service attribute
+_pools: "weakref.WeakSet[HttpConnectionPool]" = weakref.WeakSet()
+
+
+def _observe(field: str) -> Callable[[CallbackOptions], list[Observation]]:
+    def callback(options: CallbackOptions) -> list[Observation]:
+        return [
+            Observation(getattr(pool.stats, field), {"service": pool.name})
+            for pool in list(_pools)
+        ]
+
+    return callback
+
+
+_meter.create_observable_counter(
+    "http.client.requests",
+    callbacks=[_observe("requests")],
+    description="Requests sent through the connection pool",
+)
+_meter.create_observable_counter(
+    "http.client.connections.opened",
+    callbacks=[_observe("connections_opened")],
+    description="New TCP connections opened by the connection pool",
+)
+_meter.create_observable_counter(
+    "http.client.connections.reused",
+    callbacks=[_observe("connections_reused")],
+    description="Requests served over an already open connection",
+)
+_meter.create_observable_counter(
+    "http.client.tls_handshakes",
+    callbacks=[_observe("tls_handshakes")],
+    description="TLS handshakes performed by the connection pool",
+)
+
+
+class ConnectionStats(BaseModel):
+    requests: int = 0
+    connections_opened: int = 0
+    tls_handshakes: int = 0
+
+    @property
+    def connections_reused(self) -> int:
+        return max(self.requests - self.connections_opened, 0)
+
+
+class HttpConnectionPool(object):
+    """
+    Long-lived HTTP client for a single downstream service, shared by all requests.
+
+    Connections are kept alive and reused across requests; the number of
+    connections actually opened is tracked via the httpcore trace extension so
+    that the handshakes saved by the pool can be observed.
+    """
+
+    _name: str
+    _client: AsyncClient
+    _stats: ConnectionStats
+
+    def __init__(
+        self,
+        name: str,
+        pool_config: HttpPoolConfig,
+        timeout: int = 30,
+        auth: Optional[Auth] = None,
+    ):
+        self._name = name
+        self._stats = ConnectionStats()
+        self._client = AsyncClient(
+            auth=auth,
+            timeout=timeout,
+            http2=pool_config.http2,
+            limits=Limits(
+                max_connections=pool_config.max_connections,
+                max_keepalive_connections=pool_config.max_keepalive_connections,
+                keepalive_expiry=pool_config.keepalive_expiry,
+            ),
+            event_hooks={"request": [self._on_request]},
+        )
+        self._logger = logging.getLogger(__name__)
+        _pools.add(self)
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def client(self) -> AsyncClient:
+        return self._client
+
+    @property
+    def stats(self) -> ConnectionStats:
+        return self._stats.copy()
+
+    async def aclose(self) -> None:
+        stats = self.stats
+        self._logger.info(
+            "Closing %s connection pool: %d requests, %d connections opened, "
+            "%d connections reused",
+            self._name,
+            stats.requests,
+            stats.connections_opened,
+            stats.connections_reused,
+        )
+        await self._client.aclose()
+
+    async def _on_request(self, request: Request) -> None:
+        self._stats.requests += 1
+        request.extensions["trace"] = self._trace
+
+    async def _trace(self, event_name: str, info: dict[str, Any]) -> None:
+        if event_name == "connection.connect_tcp.complete":
+            self._stats.connections_opened += 1
+        elif event_name == "connection.start_tls.complete":
+            self._stats.tls_handshakes += 1
@@ -0,0 +1,202 @@
+import asyncio
+import logging
+import time
+import uuid
+import weakref
+from typing import Any, Awaitable, Callable, Generic, List, Optional, Tuple, TypeVar
+
+from opentelemetry import metrics
+from opentelemetry.metrics import CallbackOptions, Observation
+
+from src.common.model.config import JobConfig
+from src.common.model.jobs import Job, JobStatus
+from src.services.jobstore import InMemoryJobStore, JobStore
+
+_meter = metrics.get_meter(__name__)
+_finished_jobs = _meter.create_counter(
+    "jobs.finished",
+    description="Background jobs that finished, by outcome",
+)
+
+# job engines observed by the gauges below, which are created once and report each
+# engine under its own engine attribute
+_engines: "weakref.WeakSet[JobEngine[Any]]" = weakref.WeakSet()
+
+
+def _observe_pending(options: CallbackOptions) -> list[Observation]:
+    return [
+        Observation(engine.pending, {"engine": engine.name})
+        for engine in list(_engines)
+    ]
+
+
+def _observe_stored(options: CallbackOptions) -> list[Observation]:
+    return [
+        Observation(engine.stored, {"engine": engine.name}) for engine in list(_engines)
+    ]
+
+
+_meter.create_observable_gauge(
+    "jobs.pending",
+    callbacks=[_observe_pending],
+    description="Jobs waiting for a worker",
+)
+_meter.create_observable_gauge(
+    "jobs.stored",
+    callbacks=[_observe_stored],
+    description="Jobs kept in memory",
+)
+
+T = TypeVar("T")
+
+JobRunner = Callable[[], Awaitable[T]]
+
+# rebuilds the runner of a job interrupted by a restart from its request
+JobReplayer = Callable[[dict], JobRunner[T]]
+
+
+class JobQueueFullError(Exception):
+    pass
+
+
+class JobEngine(Generic[T]):
+    """
+    Runs jobs in the background on a bounded pool of workers, so that a request can
+    be answered with a token right away and its outcome polled later.
+
+    At most `max_workers` jobs run at the same time and at most `max_pending` wait
+    for a worker, further submissions are rejected. The jobs are kept in a JobStore,
+    in memory by default. When the store is durable, the jobs still running when the
+    service stopped are run again on startup through `replay`, or marked as failed
+    if they cannot be replayed.
+    """
+
+    _name: str
+    _config: JobConfig
+    _store: JobStore[T]
+
+    def __init__(
+        self,
+        name: str,
+        config: JobConfig,
+        store: Optional[JobStore[T]] = None,
+        replay: Optional[JobReplayer[T]] = None,
+    ):
+        self._name = name
+        self._config = config
+        self._store = InMemoryJobStore(config) if store is None else store
+        self._replay = replay
+        self._queue: asyncio.Queue[Tuple[Job[T], JobRunner[T]]] = asyncio.Queue(
+            maxsize=config.max_pending
+        )
+        self._workers: List[asyncio.Task] = []
+        self._logger = logging.getLogger(__name__)
+        _engines.add(self)
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def pending(self) -> int:
+        """
+        Number of jobs waiting for a worker
+        """
+        return self._queue.qsize()
+
+    @property
+    def stored(self) -> int:
+        """
+        Number of jobs kept in memory by the store
+        """
+        return self._store.count()
+
+    async def start(self) -> None:
+        """
+        Open the store, replay the interrupted jobs and start the workers on the
+        running event loop
+        """
+        await self._store.start()
+        for job in await self._store.find_running():
+            self._resume(job)
+        loop = asyncio.get_running_loop()
+        self._workers = [
+            loop.create_task(self._work()) for _ in range(self._config.max_workers)
+        ]
+
+    async def aclose(self) -> None:
+        """
+        Stop the workers and close the store; jobs still running are cancelled and
+        stay running in a durable store, to be replayed on the next start
+        """
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        await self._store.aclose()
+
+    def submit(
+        self,
+        run: JobRunner[T],
+        component_id: Optional[str] = None,
+        request: Optional[dict] = None,
+    ) -> str:
+        """
+        Enqueue a job and return its token; raise JobQueueFullError if too many jobs
+        are already waiting for a worker. The request is stored with the job to
+        replay it after a restart
+        """
+        job: Job[T] = Job(uuid.uuid4().hex, component_id=component_id, request=request)
+        try:
+            self._queue.put_nowait((job, run))
+        except asyncio.QueueFull:
+            raise JobQueueFullError(
+                f"Too many pending {self._name} jobs; please retry later."
+            )
+        self._store.save(job)
+        return job.token
+
+    async def get(self, token: str) -> Optional[Job[T]]:
+        """
+        Returns the job with the provided token, or None if it is unknown or expired
+        """
+        return await self._store.get(token)
+
+    async def find_by_component(self, component_id: str) -> List[Job[T]]:
+        """
+        Returns the known jobs acting on the provided component
+        """
+        return await self._store.find_by_component(component_id)
+
+    def _resume(self, job: Job[T]) -> None:
+        try:
+            if self._replay is None or job.request is None:
+                raise ValueError("the job cannot be replayed")
+            self._queue.put_nowait((job, self._replay(job.request)))
+            self._logger.info("Replaying %s job %s", self._name, job.token)
+        except Exception as ex:
+            self._logger.warning(
+                "Unable to replay %s job %s: %s", self._name, job.token, ex
+            )
+            self._finish(job, error="Interrupted by a restart of the provisioner")
+
+    async def _work(self) -> None:
+        while True:
+            job, run = await self._queue.get()
+            try:
+                self._finish(job, result=await run())
+            except Exception as ex:
+                self._logger.exception("Job %s of %s failed", job.token, self._name)
+                self._finish(job, error=str(ex))
+            finally:
+                self._queue.task_done()
+
+    def _finish(
+        self, job: Job[T], result: Optional[T] = None, error: Optional[str] = None
+    ) -> None:
+        job.result = result
+        job.error = error
+        job.status = JobStatus.FAILED if error is not None else JobStatus.COMPLETED
+        job.finished_at = time.time()
+        self._store.save(job)
+        _finished_jobs.add(1, {"engine": self._name, "status": str(job.status)})
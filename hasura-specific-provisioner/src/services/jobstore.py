@@ -0,0 +1,388 @@
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Generic, List, Optional, Set, TypeVar
+
+import orjson
+
+from src.common.model.config import JobConfig
+from src.common.model.jobs import Job, JobStatus
+
+T = TypeVar("T")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    token TEXT PRIMARY KEY,
+    engine TEXT NOT NULL,
+    component_id TEXT,
+    status TEXT NOT NULL,
+    request BLOB,
+    result BLOB,
+    error TEXT,
+    created_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_component_id ON jobs (engine, component_id);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (engine, status, finished_at);
+"""
+
+_COLUMNS = (
+    "token, component_id, status, request, result, error, created_at, finished_at"
+)
+
+
+class JobStore(ABC, Generic[T]):
+    """
+    Storage of the jobs of a JobEngine.
+
+    The store owns the retention of the jobs: finished jobs are kept for `ttl`
+    seconds, and at most `max_finished` of them, the oldest being evicted first;
+    running jobs are never evicted.
+    """
+
+    async def start(self) -> None:
+        """
+        Prepare the store, called once before any other method
+        """
+
+    async def aclose(self) -> None:
+        """
+        Persist any pending change and release the store resources
+        """
+
+    @abstractmethod
+    def save(self, job: Job[T]) -> None:
+        """
+        Insert or update a job
+        """
+
+    @abstractmethod
+    async def get(self, token: str) -> Optional[Job[T]]:
+        """
+        Returns the job with the provided token, or None if it is unknown or expired
+        """
+
+    @abstractmethod
+    async def find_by_component(self, component_id: str) -> List[Job[T]]:
+        """
+        Returns the stored jobs acting on the provided component
+        """
+
+    @abstractmethod
+    async def find_running(self) -> List[Job[T]]:
+        """
+        Returns the jobs that are not finished
+        """
+
+    @abstractmethod
+    def count(self) -> int:
+        """
+        Returns the number of jobs kept in memory
+        """
+
+
+class InMemoryJobStore(JobStore[T]):
+    """
+    Job store kept in memory only, the jobs are lost on restart
+    """
+
+    _config: JobConfig
+    _jobs: Dict[str, Job[T]]
+    # finished jobs in order of completion, with their completion time
+    _finished: "OrderedDict[str, float]"
+    _by_component: Dict[str, Set[str]]
+
+    def __init__(self, config: JobConfig):
+        self._config = config
+        self._jobs = {}
+        self._finished = OrderedDict()
+        self._by_component = {}
+
+    def save(self, job: Job[T]) -> None:
+        self._jobs[job.token] = job
+        if job.component_id is not None:
+            self._by_component.setdefault(job.component_id, set()).add(job.token)
+        if job.finished_at is not None:
+            self._finished[job.token] = job.finished_at
+            while len(self._finished) > self._config.max_finished:
+                token, _ = self._finished.popitem(last=False)
+                self._remove(token)
+        self._evict_expired()
+
+    async def get(self, token: str) -> Optional[Job[T]]:
+        self._evict_expired()
+        return self._jobs.get(token)
+
+    async def find_by_component(self, component_id: str) -> List[Job[T]]:
+        self._evict_expired()
+        return [self._jobs[token] for token in self._by_component.get(component_id, ())]
+
+    async def find_running(self) -> List[Job[T]]:
+        return [job for job in self._jobs.values() if job.status == JobStatus.RUNNING]
+
+    def count(self) -> int:
+        return len(self._jobs)
+
+    def _evict_expired(self) -> None:
+        expiry = time.time() - self._config.ttl
+        while self._finished:
+            token, finished_at = next(iter(self._finished.items()))
+            if finished_at > expiry:
+                break
+            del self._finished[token]
+            self._remove(token)
+
+    def _remove(self, token: str) -> None:
+        job = self._jobs.pop(token, None)
+        if job is not None and job.component_id is not None:
+            tokens = self._by_component.get(job.component_id, set())
+            tokens.discard(token)
+            if not tokens:
+                self._by_component.pop(job.component_id, None)
+
+
+class SqliteJobStore(JobStore[T]):
+    """
+    Job store persisted in an embedded SQLite database, so that the jobs survive a
+    restart.
+
+    The database runs in WAL mode, so that status reads never wait for a write.
+    Saved jobs are collected for up to `flush_interval` seconds, or until
+    `max_batch_size` of them are pending, and are then written in a single
+    transaction off the event loop. Reads go through an in-memory LRU cache of up
+    to `max_cached` jobs, which also holds the jobs not written yet, so that a job
+    is visible as soon as it is saved; the reads missing it run off the event loop
+    as well. Several stores, one per engine, can share the same database file.
+    """
+
+    _name: str
+    _path: str
+    _config: JobConfig
+    _cache: "OrderedDict[str, Job[T]]"
+    _pending: Dict[str, Job[T]]
+
+    def __init__(
+        self,
+        name: str,
+        path: str,
+        config: JobConfig,
+        encode_result: Callable[[T], Any],
+        decode_result: Callable[[Any], T],
+        flush_interval: float = 0.05,
+        max_batch_size: int = 500,
+        max_cached: int = 10000,
+    ):
+        self._name = name
+        self._path = path
+        self._config = config
+        self._encode_result = encode_result
+        self._decode_result = decode_result
+        self._flush_interval = flush_interval
+        self._max_batch_size = max_batch_size
+        self._max_cached = max_cached
+        self._cache = OrderedDict()
+        self._pending = {}
+        self._flush_timer: Optional[asyncio.TimerHandle] = None
+        self._write_lock = asyncio.Lock()
+        self._flushes: set[asyncio.Task] = set()
+        self._reader: Optional[sqlite3.Connection] = None
+        # the reader is shared by the threads of the reads
+        self._read_lock = threading.Lock()
+        self._writer: Optional[sqlite3.Connection] = None
+        self._logger = logging.getLogger(__name__)
+
+    async def start(self) -> None:
+        await asyncio.to_thread(self._connect)
+
+    async def aclose(self) -> None:
+        self._flush()
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+        await asyncio.to_thread(self._disconnect)
+
+    def save(self, job: Job[T]) -> None:
+        self._cache_job(job)
+        self._pending[job.token] = job
+        if len(self._pending) >= self._max_batch_size:
+            self._flush()
+        elif self._flush_timer is None:
+            self._flush_timer = asyncio.get_running_loop().call_later(
+                self._flush_interval, self._flush
+            )
+
+    async def get(self, token: str) -> Optional[Job[T]]:
+        job = self._cache.get(token)
+        if job is not None:
+            self._cache.move_to_end(token)
+        else:
+            job = self._pending.get(token)
+        if job is None:
+            rows = await asyncio.to_thread(self._select, "token = ?", (token,))
+            if not rows:
+                return None
+            # a newer version may have been saved during the read
+            job = self._cache.get(token) or self._pending.get(token) or rows[0]
+            self._cache_job(job)
+        if self._is_expired(job):
+            return None
+        return job
+
+    async def find_by_component(self, component_id: str) -> List[Job[T]]:
+        # rows not written yet, or already updated in memory, take precedence
+        jobs = {
+            job.token: job
+            for job in await asyncio.to_thread(
+                self._select, "component_id = ?", (component_id,)
+            )
+            if not self._is_expired(job)
+        }
+        for job in (*self._cache.values(), *self._pending.values()):
+            if job.component_id == component_id and not self._is_expired(job):
+                jobs[job.token] = job
+        return list(jobs.values())
+
+    async def find_running(self) -> List[Job[T]]:
+        jobs = {
+            job.token: job
+            for job in await asyncio.to_thread(
+                self._select, "status = ?", (str(JobStatus.RUNNING),)
+            )
+        }
+        for job in (*self._cache.values(), *self._pending.values()):
+            if job.status == JobStatus.RUNNING:
+                jobs[job.token] = job
+            else:
+                jobs.pop(job.token, None)
+        return list(jobs.values())
+
+    def count(self) -> int:
+        return len(self._cache)
+
+    def _is_expired(self, job: Job[T]) -> bool:
+        return (
+            job.finished_at is not None
+            and job.finished_at <= time.time() - self._config.ttl
+        )
+
+    def _cache_job(self, job: Job[T]) -> None:
+        self._cache[job.token] = job
+        self._cache.move_to_end(job.token)
+        while len(self._cache) > self._max_cached:
+            self._cache.popitem(last=False)
+
+    def _connect(self) -> None:
+        # the writer is only used by one thread at a time, under the write lock
+        self._writer = sqlite3.connect(self._path, timeout=5, check_same_thread=False)
+        self._writer.execute("PRAGMA journal_mode=WAL")
+        self._writer.execute("PRAGMA synchronous=NORMAL")
+        self._writer.executescript(_SCHEMA)
+        self._reader = sqlite3.connect(self._path, timeout=5, check_same_thread=False)
+
+    def _disconnect(self) -> None:
+        with self._read_lock:
+            for connection in (self._reader, self._writer):
+                if connection is not None:
+                    connection.close()
+            self._reader = self._writer = None
+
+    def _select(self, condition: str, parameters: tuple) -> List[Job[T]]:
+        with self._read_lock:
+            if self._reader is None:
+                raise RuntimeError("The job store is not started")
+            rows = self._reader.execute(
+                f"SELECT {_COLUMNS} FROM jobs WHERE engine = ? AND {condition}",
+                (self._name, *parameters),
+            ).fetchall()
+        return [self._to_job(row) for row in rows]
+
+    def _flush(self) -> None:
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        rows = [self._to_row(job) for job in batch.values()]
+        task = asyncio.get_running_loop().create_task(self._write(rows, batch))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _write(self, rows: List[tuple], batch: Dict[str, Job[T]]) -> None:
+        async with self._write_lock:
+            try:
+                await asyncio.to_thread(self._write_rows, rows, time.time())
+            except Exception:
+                self._logger.exception(
+                    "Unable to write %d %s jobs, retrying later", len(rows), self._name
+                )
+                # newer versions saved in the meantime win
+                for token, job in batch.items():
+                    self._pending.setdefault(token, job)
+                if self._flush_timer is None:
+                    self._flush_timer = asyncio.get_running_loop().call_later(
+                        self._flush_interval, self._flush
+                    )
+
+    def _write_rows(self, rows: List[tuple], now: float) -> None:
+        if self._writer is None:
+            raise RuntimeError("The job store is not started")
+        with self._writer:
+            self._writer.executemany(
+                f"INSERT OR REPLACE INTO jobs (engine, {_COLUMNS}) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._writer.execute(
+                "DELETE FROM jobs WHERE engine = ? AND finished_at <= ?",
+                (self._name, now - self._config.ttl),
+            )
+            self._writer.execute(
+                "DELETE FROM jobs WHERE token IN (SELECT token FROM jobs "
+                "WHERE engine = ? AND finished_at IS NOT NULL "
+                "ORDER BY finished_at DESC LIMIT -1 OFFSET ?)",
+                (self._name, self._config.max_finished),
+            )
+
+    def _to_row(self, job: Job[T]) -> tuple:
+        return (
+            self._name,
+            job.token,
+            job.component_id,
+            str(job.status),
+            None if job.request is None else orjson.dumps(job.request),
+            None
+            if job.result is None
+            else orjson.dumps(self._encode_result(job.result)),
+            job.error,
+            job.created_at,
+            job.finished_at,
+        )
+
+    def _to_job(self, row: tuple) -> Job[T]:
+        (
+            token,
+            component_id,
+            status,
+            request,
+            result,
+            error,
+            created_at,
+            finished_at,
+        ) = row
+        job: Job[T] = Job(
+            token,
+            component_id=component_id,
+            request=None if request is None else orjson.loads(request),
+        )
+        job.status = JobStatus(status)
+        job.result = (
+            None if result is None else self._decode_result(orjson.loads(result))
+        )
+        job.error = error
+        job.created_at = created_at
+        job.finished_at = finished_at
+        return job
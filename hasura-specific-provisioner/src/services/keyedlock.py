@@ -0,0 +1,85 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List
+
+from opentelemetry import metrics
+
+_meter = metrics.get_meter(__name__)
+_lock_wait = _meter.create_histogram(
+    "lock.wait",
+    unit="s",
+    description="Time spent waiting for the keyed locks of an operation",
+)
+
+
+def source_key(source_name: str) -> str:
+    return f"source:{source_name}"
+
+
+def role_key(role_id: str) -> str:
+    return f"role:{role_id}"
+
+
+class _KeyedLock(object):
+    lock: asyncio.Lock
+    # holders and waiters, the lock is forgotten when there are none left
+    users: int
+
+    def __init__(self) -> None:
+        self.lock = asyncio.Lock()
+        self.users = 0
+
+
+class KeyedLockScheduler(object):
+    """
+    Serializes the operations sharing a key, eg the writes to the same Hasura source
+    or to the same role, while operations on different keys run fully in parallel.
+
+    The operations waiting for a key are granted it in arrival order, and the keys
+    are held for a single step of a reconciliation rather than for a whole request:
+    the steps of a large data product queue up among those of the other requests on
+    the same keys instead of holding them until the data product is done. An
+    operation needing several keys acquires them in a fixed order, so that two
+    operations can never wait for each other.
+    """
+
+    _locks: Dict[str, _KeyedLock]
+
+    def __init__(self, name: str = "metadata"):
+        self._name = name
+        self._locks = {}
+
+    @asynccontextmanager
+    async def hold(self, *keys: str) -> AsyncIterator[None]:
+        """
+        Hold the locks of all the provided keys, waiting for them if needed
+        """
+        ordered_keys = sorted(set(keys))
+        keyed_locks = [self._reference(key) for key in ordered_keys]
+        acquired: List[_KeyedLock] = []
+        started_at = time.monotonic()
+        try:
+            for keyed_lock in keyed_locks:
+                await keyed_lock.lock.acquire()
+                acquired.append(keyed_lock)
+            _lock_wait.record(time.monotonic() - started_at, {"scheduler": self._name})
+            yield
+        finally:
+            for keyed_lock in acquired:
+                keyed_lock.lock.release()
+            for key in ordered_keys:
+                self._dereference(key)
+
+    def _reference(self, key: str) -> _KeyedLock:
+        keyed_lock = self._locks.get(key)
+        if keyed_lock is None:
+            keyed_lock = self._locks[key] = _KeyedLock()
+        keyed_lock.users += 1
+        return keyed_lock
+
+    def _dereference(self, key: str) -> None:
+        keyed_lock = self._locks[key]
+        keyed_lock.users -= 1
+        if keyed_lock.users == 0:
+            del self._locks[key]
@@ -0,0 +1,59 @@
+import statistics
+import time
+from collections import deque
+from typing import Awaitable, Deque, Dict, Optional, TypeVar
+
+from opentelemetry import metrics
+
+_meter = metrics.get_meter(__name__)
+_call_duration = _meter.create_histogram(
+    "downstream.call.duration",
+    unit="s",
+    description="Duration of the calls to Hasura and the Role Mapper, by operation",
+)
+
+T = TypeVar("T")
+
+
+class LatencyTracker(object):
+    """
+    Keeps the durations of the most recent downstream calls of each operation, e.g.
+    a metadata request or a Role Mapper call, to estimate the duration of the calls
+    of an execution plan. The durations are exported as a histogram as well.
+
+    The estimate of an operation is the median of its last `window` calls, so that
+    a single slow call does not skew it.
+    """
+
+    _durations: Dict[str, Deque[float]]
+
+    def __init__(self, window: int = 100):
+        self._window = window
+        self._durations = {}
+
+    async def measure(self, operation: str, call: Awaitable[T]) -> T:
+        """
+        Await the call and record its duration, failed calls included
+        """
+        started_at = time.monotonic()
+        try:
+            return await call
+        finally:
+            self.record(operation, time.monotonic() - started_at)
+
+    def record(self, operation: str, duration: float) -> None:
+        durations = self._durations.get(operation)
+        if durations is None:
+            durations = self._durations[operation] = deque(maxlen=self._window)
+        durations.append(duration)
+        _call_duration.record(duration, {"operation": operation})
+
+    def estimate(self, operation: str) -> Optional[float]:
+        """
+        Returns the estimated duration of a call, or None if no call of the
+        operation was seen yet
+        """
+        durations = self._durations.get(operation)
+        if not durations:
+            return None
+        return statistics.median(durations)
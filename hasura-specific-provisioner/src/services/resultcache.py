@@ -0,0 +1,166 @@
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from typing import (
+    Awaitable,
+    Callable,
+    Dict,
+    Generic,
+    NamedTuple,
+    Optional,
+    Set,
+    TypeVar,
+)
+
+from opentelemetry import metrics
+from opentelemetry.metrics import CallbackOptions, Observation
+
+from src.common.model.config import ResultCacheConfig
+
+_meter = metrics.get_meter(__name__)
+_lookups = _meter.create_counter(
+    "result_cache.lookups",
+    description="Lookups of cached operation results, by operation and outcome",
+)
+_evictions = _meter.create_counter(
+    "result_cache.evictions",
+    description="Cached operation results evicted, by reason",
+)
+
+T = TypeVar("T")
+
+Runner = Callable[[], Awaitable[T]]
+
+# returns the current resource version of the Hasura metadata
+ResourceVersionGetter = Callable[[], Awaitable[int]]
+
+
+class _Entry(NamedTuple):
+    result: object
+    component_id: str
+    resource_version: int
+    expires_at: float
+
+
+def make_result_key(operation: str, *request_parts: str) -> str:
+    """
+    Hash an operation together with the parts of its request, usually the descriptor
+    """
+    digest = hashlib.sha256(operation.encode())
+    for part in request_parts:
+        digest.update(b"\0")
+        digest.update(part.encode())
+    return digest.hexdigest()
+
+
+class ResultCache(Generic[T]):
+    """
+    Results of the provisioning operations, keyed by a hash of the operation and of
+    its request, so that an identical request is answered without calling Hasura or
+    the Role Mapper again.
+
+    A result is returned from the cache for up to `ttl` seconds, and only if the
+    resource version of the Hasura metadata is still the one seen right after the
+    operation, i.e. nobody changed the metadata in between. Running any operation on
+    a component evicts the results cached for the component, so that an older
+    request sent again is applied again. At most `max_entries` results are kept, the
+    least recently used are evicted first.
+    """
+
+    _config: ResultCacheConfig
+    _entries: "OrderedDict[str, _Entry]"
+    _by_component: Dict[str, Set[str]]
+
+    def __init__(
+        self,
+        config: ResultCacheConfig,
+        get_resource_version: ResourceVersionGetter,
+        is_cacheable: Callable[[T], bool],
+    ):
+        self._config = config
+        self._get_resource_version = get_resource_version
+        self._is_cacheable = is_cacheable
+        self._entries = OrderedDict()
+        self._by_component = {}
+        self._logger = logging.getLogger(__name__)
+        self._register_metrics()
+
+    def wrap(
+        self, operation: str, key: str, component_id: str, run: Runner[T]
+    ) -> Runner[T]:
+        """
+        Returns a runner answering from the cache when possible, and running the
+        operation and caching its result otherwise
+        """
+
+        async def run_cached() -> T:
+            entry = self._get(key)
+            if entry is not None:
+                if await self._get_resource_version() == entry.resource_version:
+                    _lookups.add(1, {"operation": operation, "outcome": "hit"})
+                    self._logger.info(
+                        "Returning the cached result of %s for %s",
+                        operation,
+                        component_id,
+                    )
+                    return entry.result  # type: ignore[return-value]
+                self._evict(key, "stale")
+            _lookups.add(1, {"operation": operation, "outcome": "miss"})
+            try:
+                result = await run()
+            finally:
+                self._evict_component(component_id)
+            if self._is_cacheable(result):
+                self._put(key, component_id, result, await self._get_resource_version())
+            return result
+
+        return run_cached
+
+    def _get(self, key: str) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at <= time.monotonic():
+            self._evict(key, "expired")
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _put(
+        self, key: str, component_id: str, result: T, resource_version: int
+    ) -> None:
+        self._entries[key] = _Entry(
+            result=result,
+            component_id=component_id,
+            resource_version=resource_version,
+            expires_at=time.monotonic() + self._config.ttl,
+        )
+        self._entries.move_to_end(key)
+        self._by_component.setdefault(component_id, set()).add(key)
+        while len(self._entries) > self._config.max_entries:
+            self._evict(next(iter(self._entries)), "capacity")
+
+    def _evict_component(self, component_id: str) -> None:
+        for key in list(self._by_component.get(component_id, ())):
+            self._evict(key, "invalidated")
+
+    def _evict(self, key: str, reason: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        keys = self._by_component.get(entry.component_id, set())
+        keys.discard(key)
+        if not keys:
+            self._by_component.pop(entry.component_id, None)
+        _evictions.add(1, {"reason": reason})
+
+    def _register_metrics(self) -> None:
+        def observe_entries(options: CallbackOptions) -> list[Observation]:
+            return [Observation(len(self._entries))]
+
+        _meter.create_observable_gauge(
+            "result_cache.entries",
+            callbacks=[observe_entries],
+            description="Operation results kept in the cache",
+        )
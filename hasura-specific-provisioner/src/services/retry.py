@@ -0,0 +1,122 @@
+import asyncio
+import logging
+import random
+import time
+from typing import AbstractSet, Awaitable, Callable, Optional
+
+from httpx import Response, TransportError
+from opentelemetry import metrics
+
+from src.common.model.config import RetryConfig
+from src.services.circuitbreaker import CircuitBreaker
+
+_meter = metrics.get_meter(__name__)
+_retries = _meter.create_counter(
+    "http.client.retries",
+    description="Requests retried after a transient failure",
+)
+
+
+class Retrier(object):
+    """
+    Retries requests to a downstream service that failed with a transient error,
+    ie a connection error, a timeout or a 5xx response.
+
+    Only idempotent operations are retried by default; the number of attempts of each
+    operation can be overridden in the configuration. Retries are spaced with
+    exponential backoff and full jitter, and are never started past the deadline.
+    Non-retryable responses are returned immediately.
+
+    When a circuit breaker is provided, every request goes through it once, whatever
+    its number of attempts: it fails fast with CircuitOpenError while the circuit is
+    open, and only its final outcome is recorded, as a single success or failure.
+    Any exception, cancellation included, is recorded as a failure, so that a trial
+    request of a half-open circuit always reports back.
+    """
+
+    _service: str
+    _config: RetryConfig
+    _idempotent_operations: AbstractSet[str]
+
+    def __init__(
+        self,
+        service: str,
+        config: RetryConfig,
+        idempotent_operations: AbstractSet[str],
+        circuit_breaker: Optional[CircuitBreaker] = None,
+    ):
+        self._service = service
+        self._config = config
+        self._idempotent_operations = idempotent_operations
+        self._circuit_breaker = circuit_breaker
+        self._logger = logging.getLogger(__name__)
+
+    def max_attempts(self, operation: str) -> int:
+        default = (
+            self._config.max_attempts if operation in self._idempotent_operations else 1
+        )
+        return max(self._config.operation_max_attempts.get(operation, default), 1)
+
+    async def call(
+        self, operation: str, send: Callable[[], Awaitable[Response]]
+    ) -> Response:
+        """
+        Send the request, retrying it according to the policy of the operation
+        """
+        if self._circuit_breaker is None:
+            return await self._call_with_retries(operation, send)
+
+        self._circuit_breaker.before_call()
+        try:
+            response = await self._call_with_retries(operation, send)
+        except BaseException:
+            self._circuit_breaker.record_failure()
+            raise
+        if _is_transient(response):
+            self._circuit_breaker.record_failure()
+        else:
+            self._circuit_breaker.record_success()
+        return response
+
+    async def _call_with_retries(
+        self, operation: str, send: Callable[[], Awaitable[Response]]
+    ) -> Response:
+        max_attempts = self.max_attempts(operation)
+        deadline = time.monotonic() + self._config.deadline
+        attempt = 1
+        while True:
+            error: Optional[TransportError] = None
+            response: Optional[Response] = None
+            try:
+                response = await send()
+            except TransportError as ex:
+                error = ex
+
+            if response is not None and not _is_transient(response):
+                return response
+
+            backoff = self._backoff(attempt)
+            if attempt >= max_attempts or time.monotonic() + backoff > deadline:
+                if response is not None:
+                    return response
+                raise error  # type: ignore[misc]
+
+            self._logger.info(
+                "Attempt %d of %s on %s failed with %s, retrying in %.3fs",
+                attempt,
+                operation,
+                self._service,
+                response.status_code if response is not None else repr(error),
+                backoff,
+            )
+            _retries.add(1, {"service": self._service, "operation": operation})
+            await asyncio.sleep(backoff)
+            attempt += 1
+
+    def _backoff(self, attempt: int) -> float:
+        exponential = self._config.initial_backoff * 2 ** (attempt - 1)
+        return random.uniform(0, min(self._config.max_backoff, exponential))
+
+
+def _is_transient(response: Response) -> bool:
+    return response.status_code >= 500
@@ -1,8 +1,10 @@
 import logging
 from typing import Optional, Union
 
-from httpx import Client
+from httpx import AsyncClient
 
+from src.common.log import LazyBody
+from src.common.model.config import RetryConfig
 from src.common.model.rolemapping import (
     GroupRoleMappings,
     Role,
@@ -10,19 +12,33 @@ from src.common.model.rolemapping import (
     UserRoleMappings,
     ValidationError,
 )
+from src.services.circuitbreaker import CircuitBreaker
+from src.services.retry import Retrier
+
+# all the Role Mapper operations are upserts or reads
+IDEMPOTENT_OPERATIONS = frozenset(
+    {
+        "create_role",
+        "get_role",
+        "update_user_role_mappings",
+        "update_group_role_mappings",
+    }
+)
 
 
 class RoleMapperClient(object):
     _roles_endpoint: str
     _user_roles_endpoint: str
     _group_roles_endpoint: str
-    _client: Client
+    _client: AsyncClient
 
     def __init__(
         self,
         role_mapper_url: str,
         role_mapper_timeout: int = 30,
-        client: Optional[Client] = None,
+        client: Optional[AsyncClient] = None,
+        retry_config: Optional[RetryConfig] = None,
+        circuit_breaker: Optional[CircuitBreaker] = None,
     ):
         self._roles_endpoint = self._ensure_slash(role_mapper_url) + "v1/roles"
         self._user_roles_endpoint = (
@@ -32,13 +48,30 @@ class RoleMapperClient(object):
             self._ensure_slash(role_mapper_url) + "v1/group_roles"
         )
         self._health_endpoint = self._ensure_slash(role_mapper_url) + "v1/health"
-        self._client = Client(timeout=role_mapper_timeout) if client is None else client
+        self._client = (
+            AsyncClient(timeout=role_mapper_timeout) if client is None else client
+        )
+        self._retrier = Retrier(
+            service="rolemapper",
+            config=RetryConfig(max_attempts=1)
+            if retry_config is None
+            else retry_config,
+            idempotent_operations=IDEMPOTENT_OPERATIONS,
+            circuit_breaker=circuit_breaker,
+        )
         self._logger = logging.getLogger(__name__)
 
-    def create_role(self, role: Role) -> Union[Role, ValidationError, SystemError]:
-        self._logger.debug(f"Calling {self._roles_endpoint} to create role: {role}")
-        response = self._client.put(self._roles_endpoint, json=role.dict())
-        self._logger.debug(f"Got response: {response.json()}")
+    async def create_role(
+        self, role: Role
+    ) -> Union[Role, ValidationError, SystemError]:
+        self._logger.debug("Calling %s to create role: %s", self._roles_endpoint, role)
+        response = await self._retrier.call(
+            "create_role",
+            lambda: self._client.put(self._roles_endpoint, json=role.dict()),
+        )
+        self._logger.debug(
+            "Got response: %s %s", response.status_code, LazyBody(response.content)
+        )
 
         status_code = response.status_code
         if status_code == 200:
@@ -50,17 +83,48 @@ class RoleMapperClient(object):
         else:
             raise ValueError(f"Unknown response: {response}")
 
-    def update_user_role_mappings(
+    async def get_role(
+        self, role_id: str
+    ) -> Union[Role, None, ValidationError, SystemError]:
+        """
+        Returns the role with the provided id, or None if it does not exist
+        """
+        role_endpoint = f"{self._roles_endpoint}/{role_id}"
+        self._logger.debug("Calling %s to get role", role_endpoint)
+        response = await self._retrier.call(
+            "get_role", lambda: self._client.get(role_endpoint)
+        )
+        self._logger.debug("Got response: %s", response.status_code)
+
+        status_code = response.status_code
+        if status_code == 200:
+            return Role.parse_obj(response.json())
+        if status_code == 404:
+            return None
+        if status_code == 400:
+            return ValidationError.parse_obj(response.json())
+        if status_code == 500:
+            return SystemError.parse_obj(response.json())
+        else:
+            raise ValueError(f"Unknown response: {response}")
+
+    async def update_user_role_mappings(
         self, user_role_mappings: UserRoleMappings
     ) -> Union[UserRoleMappings, ValidationError, SystemError]:
         self._logger.debug(
-            f"Calling {self._user_roles_endpoint} to update user role "
-            f"mappings: {user_role_mappings}"
+            "Calling %s to update user role mappings: %s",
+            self._user_roles_endpoint,
+            user_role_mappings,
+        )
+        response = await self._retrier.call(
+            "update_user_role_mappings",
+            lambda: self._client.put(
+                self._user_roles_endpoint, json=user_role_mappings.dict()
+            ),
         )
-        response = self._client.put(
-            self._user_roles_endpoint, json=user_role_mappings.dict()
+        self._logger.debug(
+            "Got response: %s %s", response.status_code, LazyBody(response.content)
         )
-        self._logger.debug(f"Got response: {response.json()}")
 
         status_code = response.status_code
         if status_code == 200:
@@ -72,17 +136,23 @@ class RoleMapperClient(object):
         else:
             raise ValueError(f"Unknown response: {response}")
 
-    def update_group_role_mappings(
+    async def update_group_role_mappings(
         self, group_role_mappings: GroupRoleMappings
     ) -> Union[GroupRoleMappings, ValidationError, SystemError]:
         self._logger.debug(
-            f"Calling {self._group_roles_endpoint} to update group role "
-            f"mappings: {group_role_mappings}"
+            "Calling %s to update group role mappings: %s",
+            self._group_roles_endpoint,
+            group_role_mappings,
         )
-        response = self._client.put(
-            self._group_roles_endpoint, json=group_role_mappings.dict()
+        response = await self._retrier.call(
+            "update_group_role_mappings",
+            lambda: self._client.put(
+                self._group_roles_endpoint, json=group_role_mappings.dict()
+            ),
+        )
+        self._logger.debug(
+            "Got response: %s %s", response.status_code, LazyBody(response.content)
         )
-        self._logger.debug(f"Got response: {response.json()}")
 
         status_code = response.status_code
         if status_code == 200:
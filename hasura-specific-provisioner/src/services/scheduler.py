@@ -0,0 +1,134 @@
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Dict, Tuple
+
+from opentelemetry import metrics
+from opentelemetry.metrics import CallbackOptions, Observation
+
+from src.common.model.config import Lane, LaneConfig, SchedulerConfig
+
+_meter = metrics.get_meter(__name__)
+_queue_time = _meter.create_histogram(
+    "scheduler.queue.time",
+    unit="s",
+    description="Time spent by the requests waiting for a slot, by lane",
+)
+
+
+class _LaneState(object):
+    config: LaneConfig
+    running: int
+    # arrival time and future of the waiting requests, in arrival order
+    waiters: Deque[Tuple[float, "asyncio.Future[None]"]]
+
+    def __init__(self, config: LaneConfig):
+        self.config = config
+        self.running = 0
+        self.waiters = deque()
+
+
+class LaneScheduler(object):
+    """
+    Admits the requests in separate lanes by class of operation, so that the cheap
+    ones, eg validations and ACL updates from the Witboost UI, are not stuck behind
+    a burst of provisionings triggering several schema reloads each.
+
+    Each lane runs at most `concurrency` requests at a time, and all the lanes
+    together at most `max_concurrency`. When a slot frees up, it is granted to the
+    waiting request of the lane with the highest priority that is below its own
+    limit, the one that waited longest on a tie; the requests of a lane are granted
+    in arrival order.
+    """
+
+    _lanes: Dict[Lane, _LaneState]
+
+    def __init__(self, config: SchedulerConfig):
+        self._max_concurrency = config.max_concurrency
+        self._lanes = {
+            lane: _LaneState(getattr(config, f"{lane}_lane")) for lane in Lane
+        }
+        self._running = 0
+        self._register_metrics()
+
+    @asynccontextmanager
+    async def hold(self, lane: Lane) -> AsyncIterator[None]:
+        """
+        Hold a slot of the lane, waiting for it if needed
+        """
+        lane_state = self._lanes[lane]
+        enqueued_at = time.monotonic()
+        future: "asyncio.Future[None]" = asyncio.get_running_loop().create_future()
+        lane_state.waiters.append((enqueued_at, future))
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.cancelled():
+                if (enqueued_at, future) in lane_state.waiters:
+                    lane_state.waiters.remove((enqueued_at, future))
+            else:
+                # the slot was granted right before the cancellation
+                self._release(lane_state)
+            raise
+        _queue_time.record(time.monotonic() - enqueued_at, {"lane": lane})
+        try:
+            yield
+        finally:
+            self._release(lane_state)
+
+    def _dispatch(self) -> None:
+        while self._max_concurrency <= 0 or self._running < self._max_concurrency:
+            # requests cancelled while waiting are dropped before they are granted
+            for lane_state in self._lanes.values():
+                while lane_state.waiters and lane_state.waiters[0][1].done():
+                    lane_state.waiters.popleft()
+            ready = [
+                lane_state
+                for lane_state in self._lanes.values()
+                if lane_state.waiters
+                and lane_state.running < lane_state.config.concurrency
+            ]
+            if not ready:
+                return
+            lane_state = min(
+                ready,
+                key=lambda ready_lane: (
+                    -ready_lane.config.priority,
+                    ready_lane.waiters[0][0],
+                ),
+            )
+            _, future = lane_state.waiters.popleft()
+            lane_state.running += 1
+            self._running += 1
+            future.set_result(None)
+
+    def _release(self, lane_state: _LaneState) -> None:
+        lane_state.running -= 1
+        self._running -= 1
+        self._dispatch()
+
+    def _register_metrics(self) -> None:
+        def observe_queued(options: CallbackOptions) -> list[Observation]:
+            return [
+                Observation(len(lane_state.waiters), {"lane": lane})
+                for lane, lane_state in self._lanes.items()
+            ]
+
+        def observe_running(options: CallbackOptions) -> list[Observation]:
+            return [
+                Observation(lane_state.running, {"lane": lane})
+                for lane, lane_state in self._lanes.items()
+            ]
+
+        _meter.create_observable_gauge(
+            "scheduler.queue.length",
+            callbacks=[observe_queued],
+            description="Requests waiting for a slot, by lane",
+        )
+        _meter.create_observable_gauge(
+            "scheduler.running",
+            callbacks=[observe_running],
+            description="Requests holding a slot, by lane",
+        )
@@ -0,0 +1,55 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Generic, TypeVar
+
+from opentelemetry import metrics
+
+_meter = metrics.get_meter(__name__)
+_calls = _meter.create_counter(
+    "single_flight.calls",
+    description="Operations run, or attached to an identical one in flight",
+)
+
+T = TypeVar("T")
+
+Runner = Callable[[], Awaitable[T]]
+
+
+class SingleFlight(Generic[T]):
+    """
+    Deduplicates identical operations running at the same time: the first call with
+    a key runs the operation, the calls with the same key made while it is in flight
+    wait for it and get the same result, or the same exception.
+
+    The operation runs in its own task, so that it completes, and its result reaches
+    the attached callers, even if the caller that started it is cancelled.
+    """
+
+    _in_flight: Dict[str, "asyncio.Future[T]"]
+
+    def __init__(self, name: str):
+        self._name = name
+        self._in_flight = {}
+        self._logger = logging.getLogger(__name__)
+
+    def wrap(self, key: str, run: Runner[T]) -> Runner[T]:
+        """
+        Returns a runner attaching to the operation in flight with the same key, if
+        any, and running the operation otherwise
+        """
+
+        async def run_once() -> T:
+            future = self._in_flight.get(key)
+            if future is None:
+                _calls.add(1, {"name": self._name, "outcome": "run"})
+                future = asyncio.ensure_future(run())
+                self._in_flight[key] = future
+                future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+            else:
+                _calls.add(1, {"name": self._name, "outcome": "attached"})
+                self._logger.info(
+                    "Attaching to the identical %s operation in flight", self._name
+                )
+            return await asyncio.shield(future)
+
+        return run_once
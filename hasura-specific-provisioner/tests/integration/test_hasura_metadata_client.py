@@ -110,7 +110,7 @@ def _get_hasura_url(compose: DockerCompose) -> str:
 
 
 @pytest.fixture
-def schema_name(request: FixtureRequest, hasura_docker: HasuraInDocker):
+async def schema_name(request: FixtureRequest, hasura_docker: HasuraInDocker):
     schema_name = "schema_" + request.node.name
     yield schema_name
     client = HasuraAdminClient(
@@ -118,20 +118,22 @@ def schema_name(request: FixtureRequest, hasura_docker: HasuraInDocker):
         hasura_admin_secret=hasura_docker.hasura_admin_secret,
     )
     statements = ["DROP SCHEMA IF EXISTS " + schema_name + " CASCADE"]
-    client.run_sql(statements=statements, cascade=True)
-    client.clear_metadata("I know this will clear Hasura metadata irrecoverably")
+    await client.run_sql(statements=statements, cascade=True)
+    await client.clear_metadata("I know this will clear Hasura metadata irrecoverably")
 
 
-def test_create_client(hasura_docker: HasuraInDocker):
+@pytest.mark.anyio
+async def test_create_client(hasura_docker: HasuraInDocker):
     client = HasuraAdminClient(
         hasura_url=hasura_docker.hasura_url,
         hasura_admin_secret=hasura_docker.hasura_admin_secret,
     )
-    health = client.health_check()
+    health = await client.health_check()
     assert health == Health.OK
 
 
-def test_run_sql(hasura_docker: HasuraInDocker, schema_name: str) -> None:
+@pytest.mark.anyio
+async def test_run_sql(hasura_docker: HasuraInDocker, schema_name: str) -> None:
     client = HasuraAdminClient(
         hasura_url=hasura_docker.hasura_url,
         hasura_admin_secret=hasura_docker.hasura_admin_secret,
@@ -142,12 +144,15 @@ def test_run_sql(hasura_docker: HasuraInDocker, schema_name: str) -> None:
         "SET SEARCH_PATH = " + schema_name,
         "CREATE TABLE test_table(col1 VARCHAR PRIMARY KEY, col2 VARCHAR)",
     ]
-    response = client.run_sql(statements)
+    response = await client.run_sql(statements)
 
     assert response.status_code == 200
 
 
-def test_get_source_tables(schema_name: str, hasura_docker: HasuraInDocker) -> None:
+@pytest.mark.anyio
+async def test_get_source_tables(
+    schema_name: str, hasura_docker: HasuraInDocker
+) -> None:
     client = HasuraAdminClient(
         hasura_url=hasura_docker.hasura_url,
         hasura_admin_secret=hasura_docker.hasura_admin_secret,
@@ -158,11 +163,11 @@ def test_get_source_tables(schema_name: str, hasura_docker: HasuraInDocker) -> N
         "SET SEARCH_PATH = " + schema_name,
         "CREATE TABLE test_table_2(col1 VARCHAR PRIMARY KEY, col2 VARCHAR)",
     ]
-    run_sql_response = client.run_sql(statements)
+    run_sql_response = await client.run_sql(statements)
 
     assert run_sql_response.status_code == 200
 
-    tables = client.get_source_tables()
+    tables = await client.get_source_tables()
 
     assert any(
         table.table_name == "test_table_2" and table.schema_name == schema_name
@@ -170,7 +175,8 @@ def test_get_source_tables(schema_name: str, hasura_docker: HasuraInDocker) -> N
     )
 
 
-def test_track_table(schema_name: str, hasura_docker: HasuraInDocker) -> None:
+@pytest.mark.anyio
+async def test_track_table(schema_name: str, hasura_docker: HasuraInDocker) -> None:
     client = HasuraAdminClient(
         hasura_url=hasura_docker.hasura_url,
         hasura_admin_secret=hasura_docker.hasura_admin_secret,
@@ -182,7 +188,7 @@ def test_track_table(schema_name: str, hasura_docker: HasuraInDocker) -> None:
         "SET SEARCH_PATH = " + schema_name,
         "CREATE TABLE " + table_name + "(col1 VARCHAR PRIMARY KEY, col2 VARCHAR)",
     ]
-    run_sql_response = client.run_sql(statements)
+    run_sql_response = await client.run_sql(statements)
     assert run_sql_response.status_code == 200
 
     table_config: TableConfig = TableConfig(
@@ -198,11 +204,11 @@ def test_track_table(schema_name: str, hasura_docker: HasuraInDocker) -> None:
     )
 
     # should succeed
-    res1 = client.track_table(table_config)
+    res1 = await client.track_table(table_config)
     assert res1 == TrackTableResult.SUCCESS
 
     # should fail (already tracked)
-    res2 = client.track_table(table_config)
+    res2 = await client.track_table(table_config)
     assert res2 == TrackTableResult.ALREADY_TRACKED
 
     # should fail (already tracked, even though the fields have changed)
@@ -220,11 +226,12 @@ def test_track_table(schema_name: str, hasura_docker: HasuraInDocker) -> None:
         + " table in schema "
         + schema_name,
     )
-    res3 = client.track_table(table_config2)
+    res3 = await client.track_table(table_config2)
     assert res3 == TrackTableResult.ALREADY_TRACKED
 
 
-def test_untrack_table(schema_name: str, hasura_docker: HasuraInDocker) -> None:
+@pytest.mark.anyio
+async def test_untrack_table(schema_name: str, hasura_docker: HasuraInDocker) -> None:
     client = HasuraAdminClient(
         hasura_url=hasura_docker.hasura_url,
         hasura_admin_secret=hasura_docker.hasura_admin_secret,
@@ -236,7 +243,7 @@ def test_untrack_table(schema_name: str, hasura_docker: HasuraInDocker) -> None:
         "SET SEARCH_PATH = " + schema_name,
         "CREATE TABLE " + table_name + "(col1 VARCHAR PRIMARY KEY, col2 VARCHAR)",
     ]
-    run_sql_response = client.run_sql(statements)
+    run_sql_response = await client.run_sql(statements)
     assert run_sql_response.status_code == 200
 
     table_config: TableConfig = TableConfig(
@@ -252,15 +259,15 @@ def test_untrack_table(schema_name: str, hasura_docker: HasuraInDocker) -> None:
     )
 
     # should succeed
-    res1 = client.track_table(table_config)
+    res1 = await client.track_table(table_config)
     assert res1 == TrackTableResult.SUCCESS
 
     # should succeed
-    res2 = client.untrack_table(table_config)
+    res2 = await client.untrack_table(table_config)
     assert res2 == UntrackTableResult.SUCCESS
 
     # should fail (already untracked)
-    res3 = client.untrack_table(table_config)
+    res3 = await client.untrack_table(table_config)
     assert res3 == UntrackTableResult.NOT_TRACKED
 
     # should fail (never tracked it, and it does not exist)
@@ -280,11 +287,12 @@ def test_untrack_table(schema_name: str, hasura_docker: HasuraInDocker) -> None:
         + " table in schema "
         + schema_name,
     )
-    res3 = client.untrack_table(table_config2)
+    res3 = await client.untrack_table(table_config2)
     assert res3 == UntrackTableResult.NOT_TRACKED
 
 
-def test_create_select_permission(
+@pytest.mark.anyio
+async def test_create_select_permission(
     schema_name: str, hasura_docker: HasuraInDocker
 ) -> None:
     client = HasuraAdminClient(
@@ -300,7 +308,7 @@ def test_create_select_permission(
         "SET SEARCH_PATH = " + schema_name,
         "CREATE TABLE " + table_name + "(col1 VARCHAR PRIMARY KEY, col2 VARCHAR)",
     ]
-    run_sql_response = client.run_sql(statements)
+    run_sql_response = await client.run_sql(statements)
     assert run_sql_response.status_code == 200
 
     table_config: TableConfig = TableConfig(
@@ -316,19 +324,20 @@ def test_create_select_permission(
     )
 
     # should succeed
-    res1 = client.track_table(table_config)
+    res1 = await client.track_table(table_config)
     assert res1 == TrackTableResult.SUCCESS
 
     # should succeed
-    res2 = client.create_select_permission(table_config, role_id)
+    res2 = await client.create_select_permission(table_config, role_id)
     assert res2 == CreateSelectPermissionResult.SUCCESS
 
     # should fail (already exists)
-    res3 = client.create_select_permission(table_config, role_id)
+    res3 = await client.create_select_permission(table_config, role_id)
     assert res3 == CreateSelectPermissionResult.ALREADY_EXISTS
 
 
-def test_drop_select_permission(
+@pytest.mark.anyio
+async def test_drop_select_permission(
     schema_name: str, hasura_docker: HasuraInDocker
 ) -> None:
     client = HasuraAdminClient(
@@ -344,7 +353,7 @@ def test_drop_select_permission(
         "SET SEARCH_PATH = " + schema_name,
         "CREATE TABLE " + table_name + "(col1 VARCHAR PRIMARY KEY, col2 VARCHAR)",
     ]
-    run_sql_response = client.run_sql(statements)
+    run_sql_response = await client.run_sql(statements)
     assert run_sql_response.status_code == 200
 
     table_config: TableConfig = TableConfig(
@@ -360,43 +369,45 @@ def test_drop_select_permission(
     )
 
     # should succeed
-    res1 = client.track_table(table_config)
+    res1 = await client.track_table(table_config)
     assert res1 == TrackTableResult.SUCCESS
 
     # should fail (not exists)
-    res2 = client.drop_select_permission(table_config, role_id)
+    res2 = await client.drop_select_permission(table_config, role_id)
     assert res2 == DropSelectPermissionResult.NOT_EXISTS
 
     # should succeed
-    res3 = client.create_select_permission(table_config, role_id)
+    res3 = await client.create_select_permission(table_config, role_id)
     assert res3 == CreateSelectPermissionResult.SUCCESS
 
     # should succeed
-    res4 = client.drop_select_permission(table_config, role_id)
+    res4 = await client.drop_select_permission(table_config, role_id)
     assert res4 == DropSelectPermissionResult.SUCCESS
 
     # should fail (not exists)
-    res5 = client.drop_select_permission(table_config, role_id)
+    res5 = await client.drop_select_permission(table_config, role_id)
     assert res5 == DropSelectPermissionResult.NOT_EXISTS
 
 
-def test_clear_metadata(hasura_docker) -> None:
+@pytest.mark.anyio
+async def test_clear_metadata(hasura_docker) -> None:
     client = HasuraAdminClient(
         hasura_url=hasura_docker.hasura_url,
         hasura_admin_secret=hasura_docker.hasura_admin_secret,
     )
 
     with pytest.raises(ValueError):
-        client.clear_metadata("Wrong")
+        await client.clear_metadata("Wrong")
 
-    response = client.clear_metadata(
+    response = await client.clear_metadata(
         "I know this will clear Hasura metadata irrecoverably"
     )
 
     assert response.status_code == 200
 
 
-def test_add_drop_source(hasura_docker: HasuraInDocker) -> None:
+@pytest.mark.anyio
+async def test_add_drop_source(hasura_docker: HasuraInDocker) -> None:
     client = HasuraAdminClient(
         hasura_url=hasura_docker.hasura_url,
         hasura_admin_secret=hasura_docker.hasura_admin_secret,
@@ -423,21 +434,21 @@ def test_add_drop_source(hasura_docker: HasuraInDocker) -> None:
     )
 
     # should fail (not exists)
-    res1 = client.drop_source(data_source_config)
+    res1 = await client.drop_source(data_source_config)
     assert res1 == DropSourceResult.NOT_EXISTS
 
     # should succeed
-    res2 = client.add_source(data_source_config)
+    res2 = await client.add_source(data_source_config)
     assert res2 == AddSourceResult.SUCCESS
 
     # should fail (already exists)
-    res3 = client.add_source(data_source_config)
+    res3 = await client.add_source(data_source_config)
     assert res3 == AddSourceResult.ALREADY_EXISTS
 
     # should succeed
-    res4 = client.drop_source(data_source_config)
+    res4 = await client.drop_source(data_source_config)
     assert res4 == DropSourceResult.SUCCESS
 
     # should fail (not exists)
-    res5 = client.drop_source(data_source_config)
+    res5 = await client.drop_source(data_source_config)
     assert res5 == DropSourceResult.NOT_EXISTS
@@ -5,7 +5,7 @@ from typing import Generator
 
 import pytest
 import requests
-from httpx import Client
+from httpx import AsyncClient
 from requests.exceptions import ConnectionError
 from testcontainers.core.container import DockerContainer  # type: ignore
 
@@ -82,19 +82,21 @@ def _get_rolemapper_url(container: DockerContainer) -> str:
     return rolemapper_url
 
 
-def test_create_role_success(rolemapper_docker: RoleMapperInDocker):
+@pytest.mark.anyio
+async def test_create_role_success(rolemapper_docker: RoleMapperInDocker):
     client = RoleMapperClient(role_mapper_url=rolemapper_docker.rolemapper_url)
     to_be_created_role = Role(
         role_id="", component_id="", graphql_root_field_names=[""]
     )
 
-    created_role = client.create_role(to_be_created_role)
+    created_role = await client.create_role(to_be_created_role)
 
     assert isinstance(created_role, Role)
 
 
-def test_create_role_validation_error(rolemapper_docker: RoleMapperInDocker):
-    http_client = Client(headers={"Prefer": "code=400"})
+@pytest.mark.anyio
+async def test_create_role_validation_error(rolemapper_docker: RoleMapperInDocker):
+    http_client = AsyncClient(headers={"Prefer": "code=400"})
     client = RoleMapperClient(
         role_mapper_url=rolemapper_docker.rolemapper_url, client=http_client
     )
@@ -102,13 +104,14 @@ def test_create_role_validation_error(rolemapper_docker: RoleMapperInDocker):
         role_id="", component_id="", graphql_root_field_names=[""]
     )
 
-    error = client.create_role(to_be_created_role)
+    error = await client.create_role(to_be_created_role)
 
     assert isinstance(error, ValidationError)
 
 
-def test_create_role_system_error(rolemapper_docker: RoleMapperInDocker):
-    http_client = Client(headers={"Prefer": "code=500"})
+@pytest.mark.anyio
+async def test_create_role_system_error(rolemapper_docker: RoleMapperInDocker):
+    http_client = AsyncClient(headers={"Prefer": "code=500"})
     client = RoleMapperClient(
         role_mapper_url=rolemapper_docker.rolemapper_url, client=http_client
     )
@@ -116,78 +119,88 @@ def test_create_role_system_error(rolemapper_docker: RoleMapperInDocker):
         role_id="", component_id="", graphql_root_field_names=[""]
     )
 
-    error = client.create_role(to_be_created_role)
+    error = await client.create_role(to_be_created_role)
 
     assert isinstance(error, SystemError)
 
 
-def test_update_user_role_mappings_success(rolemapper_docker: RoleMapperInDocker):
+@pytest.mark.anyio
+async def test_update_user_role_mappings_success(rolemapper_docker: RoleMapperInDocker):
     client = RoleMapperClient(role_mapper_url=rolemapper_docker.rolemapper_url)
     user_role_mapping_to_update = UserRoleMappings(role_id="", users=[""])
 
-    user_role_mapping_updated = client.update_user_role_mappings(
+    user_role_mapping_updated = await client.update_user_role_mappings(
         user_role_mapping_to_update
     )
 
     assert isinstance(user_role_mapping_updated, UserRoleMappings)
 
 
-def test_update_user_role_validation_error(rolemapper_docker: RoleMapperInDocker):
-    http_client = Client(headers={"Prefer": "code=400"})
+@pytest.mark.anyio
+async def test_update_user_role_validation_error(rolemapper_docker: RoleMapperInDocker):
+    http_client = AsyncClient(headers={"Prefer": "code=400"})
     client = RoleMapperClient(
         role_mapper_url=rolemapper_docker.rolemapper_url, client=http_client
     )
     user_role_mapping_to_update = UserRoleMappings(role_id="", users=[""])
 
-    error = client.update_user_role_mappings(user_role_mapping_to_update)
+    error = await client.update_user_role_mappings(user_role_mapping_to_update)
 
     assert isinstance(error, ValidationError)
 
 
-def test_update_user_role_system_error(rolemapper_docker: RoleMapperInDocker):
-    http_client = Client(headers={"Prefer": "code=500"})
+@pytest.mark.anyio
+async def test_update_user_role_system_error(rolemapper_docker: RoleMapperInDocker):
+    http_client = AsyncClient(headers={"Prefer": "code=500"})
     client = RoleMapperClient(
         role_mapper_url=rolemapper_docker.rolemapper_url, client=http_client
     )
     user_role_mapping_to_update = UserRoleMappings(role_id="", users=[""])
 
-    error = client.update_user_role_mappings(user_role_mapping_to_update)
+    error = await client.update_user_role_mappings(user_role_mapping_to_update)
 
     assert isinstance(error, SystemError)
 
 
-def test_update_group_role_mappings_success(rolemapper_docker: RoleMapperInDocker):
+@pytest.mark.anyio
+async def test_update_group_role_mappings_success(
+    rolemapper_docker: RoleMapperInDocker,
+):
     client = RoleMapperClient(role_mapper_url=rolemapper_docker.rolemapper_url)
     group_role_mapping_to_update = GroupRoleMappings(role_id="", groups=[""])
 
-    group_role_mapping_updated = client.update_group_role_mappings(
+    group_role_mapping_updated = await client.update_group_role_mappings(
         group_role_mapping_to_update
     )
 
     assert isinstance(group_role_mapping_updated, GroupRoleMappings)
 
 
-def test_update_group_role_mappings_validation_error(
+@pytest.mark.anyio
+async def test_update_group_role_mappings_validation_error(
     rolemapper_docker: RoleMapperInDocker,
 ):
-    http_client = Client(headers={"Prefer": "code=400"})
+    http_client = AsyncClient(headers={"Prefer": "code=400"})
     client = RoleMapperClient(
         role_mapper_url=rolemapper_docker.rolemapper_url, client=http_client
     )
     group_role_mapping_to_update = GroupRoleMappings(role_id="", groups=[""])
 
-    error = client.update_group_role_mappings(group_role_mapping_to_update)
+    error = await client.update_group_role_mappings(group_role_mapping_to_update)
 
     assert isinstance(error, ValidationError)
 
 
-def test_update_group_role_mappings_system_error(rolemapper_docker: RoleMapperInDocker):
-    http_client = Client(headers={"Prefer": "code=500"})
+@pytest.mark.anyio
+async def test_update_group_role_mappings_system_error(
+    rolemapper_docker: RoleMapperInDocker,
+):
+    http_client = AsyncClient(headers={"Prefer": "code=500"})
     client = RoleMapperClient(
         role_mapper_url=rolemapper_docker.rolemapper_url, client=http_client
     )
     group_role_mapping_to_update = GroupRoleMappings(role_id="", groups=[""])
 
-    error = client.update_group_role_mappings(group_role_mapping_to_update)
+    error = await client.update_group_role_mappings(group_role_mapping_to_update)
 
     assert isinstance(error, SystemError)
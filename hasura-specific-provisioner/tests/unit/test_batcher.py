@@ -0,0 +1,129 @@
+import asyncio
+import json
+from typing import List
+
+import pytest
+from httpx import AsyncClient, MockTransport, Request, Response
+
+from src.common.model.hasura import AddSourceResult, TrackTableResult
+from src.services.hasura.batcher import MetadataBatcher, MetadataResponse
+from src.services.hasura.client import HasuraAdminClient
+from tests.unit.test_hasura_client import data_source_config, table_config
+
+
+class RecordingSender:
+    def __init__(self) -> None:
+        self.batches: List[List[dict]] = []
+
+    async def __call__(self, requests: List[dict]) -> List[MetadataResponse]:
+        self.batches.append(requests)
+        return [(200, None) if r["ok"] else (400, {"code": "x"}) for r in requests]
+
+
+@pytest.mark.anyio
+async def test_batcher_groups_concurrent_requests() -> None:
+    sender = RecordingSender()
+    batcher = MetadataBatcher(send_bulk=sender, window=0.05, max_batch_size=10)
+
+    results = await asyncio.gather(
+        batcher.submit({"id": 1, "ok": True}),
+        batcher.submit({"id": 2, "ok": False}),
+        batcher.submit({"id": 3, "ok": True}),
+    )
+
+    assert results == [(200, None), (400, {"code": "x"}), (200, None)]
+    assert len(sender.batches) == 1
+    assert [r["id"] for r in sender.batches[0]] == [1, 2, 3]
+
+
+@pytest.mark.anyio
+async def test_batcher_flushes_when_max_batch_size_reached() -> None:
+    sender = RecordingSender()
+    batcher = MetadataBatcher(send_bulk=sender, window=60, max_batch_size=2)
+
+    results = await asyncio.wait_for(
+        asyncio.gather(
+            batcher.submit({"id": 1, "ok": True}),
+            batcher.submit({"id": 2, "ok": True}),
+        ),
+        timeout=1,
+    )
+
+    assert results == [(200, None), (200, None)]
+    assert len(sender.batches) == 1
+
+
+@pytest.mark.anyio
+async def test_batcher_keeps_submission_order_across_batches() -> None:
+    sender = RecordingSender()
+    batcher = MetadataBatcher(send_bulk=sender, window=0.01, max_batch_size=2)
+
+    await asyncio.gather(
+        *[batcher.submit({"id": i, "ok": True}) for i in range(5)],
+    )
+
+    assert [[r["id"] for r in batch] for batch in sender.batches] == [
+        [0, 1],
+        [2, 3],
+        [4],
+    ]
+
+
+@pytest.mark.anyio
+async def test_batcher_propagates_errors_to_all_callers() -> None:
+    async def failing_sender(requests: List[dict]) -> List[MetadataResponse]:
+        raise ConnectionError("Hasura is down")
+
+    batcher = MetadataBatcher(send_bulk=failing_sender, window=0.01, max_batch_size=10)
+
+    results = await asyncio.gather(
+        batcher.submit({"id": 1}), batcher.submit({"id": 2}), return_exceptions=True
+    )
+
+    assert all(isinstance(result, ConnectionError) for result in results)
+
+
+@pytest.mark.anyio
+async def test_batcher_aclose_flushes_pending_requests() -> None:
+    sender = RecordingSender()
+    batcher = MetadataBatcher(send_bulk=sender, window=60, max_batch_size=10)
+
+    pending = asyncio.ensure_future(batcher.submit({"id": 1, "ok": True}))
+    await asyncio.sleep(0)
+    await batcher.aclose()
+
+    assert await pending == (200, None)
+
+
+@pytest.mark.anyio
+async def test_client_with_batcher_sends_one_bulk_request() -> None:
+    requests: List[dict] = []
+
+    def handler(request: Request) -> Response:
+        body = json.loads(request.content)
+        requests.append(body)
+        return Response(200, json=[{"message": "success"}] * len(body["args"]))
+
+    http_client = AsyncClient(transport=MockTransport(handler))
+    bulk_client = HasuraAdminClient(
+        hasura_url="http://hasura", hasura_admin_secret="", client=http_client
+    )
+    batcher = MetadataBatcher(
+        send_bulk=bulk_client.bulk_keep_going, window=0.05, max_batch_size=10
+    )
+    client = HasuraAdminClient(
+        hasura_url="http://hasura",
+        hasura_admin_secret="",
+        client=http_client,
+        batcher=batcher,
+    )
+
+    add_source_res, track_table_res = await asyncio.gather(
+        client.add_source(data_source_config), client.track_table(table_config)
+    )
+
+    assert add_source_res == AddSourceResult.SUCCESS
+    assert track_table_res == TrackTableResult.SUCCESS
+    assert len(requests) == 1
+    assert requests[0]["type"] == "bulk_keep_going"
+    assert len(requests[0]["args"]) == 2
@@ -0,0 +1,173 @@
+import time
+
+import pytest
+
+from src.common.model.reconciliation import Checkpoint, OperationType
+from src.common.parsing.descriptor import parse_yaml_component_descriptor
+from src.models import ProvisioningStatus, Status1
+from src.services.checkpoints import (
+    CheckpointStore,
+    FileCheckpointStore,
+    InMemoryCheckpointStore,
+    make_checkpoint_key,
+)
+from src.services.hasura.provisioner import HasuraProvisioner
+from tests.unit.test_descriptors import descriptor_yaml_ok
+from tests.unit.test_provisioner import (
+    make_hasura_admin_client,
+    make_role_mapper_client,
+    provisioner_config,
+)
+
+operations = [
+    OperationType.ADD_SOURCE,
+    OperationType.TRACK_TABLE,
+    OperationType.CREATE_SELECT_PERMISSION,
+]
+
+
+def make_stores(tmp_path, ttl: float = 60, max_resumes: int = 3):
+    return [
+        InMemoryCheckpointStore(ttl=ttl, max_resumes=max_resumes),
+        FileCheckpointStore(path=str(tmp_path), ttl=ttl, max_resumes=max_resumes),
+    ]
+
+
+@pytest.mark.anyio
+async def test_checkpoint_store_save_get_delete(tmp_path) -> None:
+    for store in make_stores(tmp_path):
+        checkpoint = Checkpoint(
+            operations=operations,
+            completed=[OperationType.ADD_SOURCE],
+            created_at=time.time(),
+        )
+
+        await store.save("key", checkpoint)
+        assert await store.get("key") == checkpoint
+
+        await store.delete("key")
+        assert await store.get("key") is None
+
+
+@pytest.mark.anyio
+async def test_checkpoint_store_ignores_expired_checkpoints(tmp_path) -> None:
+    for store in make_stores(tmp_path, ttl=60):
+        await store.save(
+            "key",
+            Checkpoint(operations=operations, created_at=time.time() - 120),
+        )
+
+        assert await store.get("key") is None
+
+
+@pytest.mark.anyio
+async def test_checkpoint_store_ignores_checkpoints_resumed_too_often(
+    tmp_path,
+) -> None:
+    for store in make_stores(tmp_path, max_resumes=2):
+        await store.save(
+            "key",
+            Checkpoint(operations=operations, resumes=2, created_at=time.time()),
+        )
+
+        assert await store.get("key") is None
+
+
+@pytest.mark.anyio
+async def test_file_checkpoint_store_ignores_unreadable_checkpoints(tmp_path) -> None:
+    store = FileCheckpointStore(path=str(tmp_path), ttl=60, max_resumes=3)
+    (tmp_path / "key.json").write_text("{not json")
+
+    assert await store.get("key") is None
+
+
+def test_checkpoint_key_depends_on_the_desired_state() -> None:
+    provisioner = HasuraProvisioner(
+        hasura_admin_client=make_hasura_admin_client(),
+        provisioner_config=provisioner_config,
+        role_mapper_client=make_role_mapper_client(),
+    )
+    data_product, hasura_op, snowflake_op = parse_yaml_component_descriptor(
+        descriptor_yaml_ok
+    )
+    desired_state = provisioner._make_desired_state(
+        data_product, hasura_op, snowflake_op
+    )
+    changed_state = desired_state.copy(
+        update={
+            "role": desired_state.role.copy(
+                update={"graphql_root_field_names": ["other"]}
+            )
+        }
+    )
+
+    key = make_checkpoint_key("provision", "component", desired_state)
+
+    assert key == make_checkpoint_key("provision", "component", desired_state)
+    assert key != make_checkpoint_key("provision", "component", changed_state)
+    assert key != make_checkpoint_key("provision", "other", desired_state)
+    assert key != make_checkpoint_key("unprovision", "component", desired_state)
+
+
+@pytest.mark.anyio
+async def test_provisioner_resumes_from_the_failed_operation(tmp_path) -> None:
+    store: CheckpointStore = FileCheckpointStore(
+        path=str(tmp_path), ttl=60, max_resumes=3
+    )
+    data_product, hasura_op, snowflake_op = parse_yaml_component_descriptor(
+        descriptor_yaml_ok
+    )
+    failing_client = make_hasura_admin_client(
+        failing_operations=[OperationType.CREATE_SELECT_PERMISSION]
+    )
+    await HasuraProvisioner(
+        hasura_admin_client=failing_client,
+        provisioner_config=provisioner_config,
+        role_mapper_client=make_role_mapper_client(),
+        checkpoint_store=store,
+    ).provision(data_product, hasura_op, snowflake_op)
+
+    hasura_admin_client = make_hasura_admin_client()
+    role_mapper_client = make_role_mapper_client()
+    provisioning_status = await HasuraProvisioner(
+        hasura_admin_client=hasura_admin_client,
+        provisioner_config=provisioner_config,
+        role_mapper_client=role_mapper_client,
+        checkpoint_store=store,
+    ).provision(data_product, hasura_op, snowflake_op)
+
+    assert isinstance(provisioning_status, ProvisioningStatus)
+    assert provisioning_status.status == Status1.COMPLETED
+    assert [
+        call.args[0] for call in hasura_admin_client.run_metadata_operations.mock_calls
+    ] == [[OperationType.CREATE_SELECT_PERMISSION]]
+    hasura_admin_client.get_metadata_snapshot.assert_not_called()
+    role_mapper_client.get_role.assert_not_called()
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.mark.anyio
+async def test_provisioner_plans_again_after_too_many_resumes() -> None:
+    store = InMemoryCheckpointStore(ttl=60, max_resumes=1)
+    data_product, hasura_op, snowflake_op = parse_yaml_component_descriptor(
+        descriptor_yaml_ok
+    )
+    for _ in range(2):
+        await HasuraProvisioner(
+            hasura_admin_client=make_hasura_admin_client(
+                failing_operations=[OperationType.CREATE_SELECT_PERMISSION]
+            ),
+            provisioner_config=provisioner_config,
+            role_mapper_client=make_role_mapper_client(),
+            checkpoint_store=store,
+        ).provision(data_product, hasura_op, snowflake_op)
+
+    hasura_admin_client = make_hasura_admin_client()
+    await HasuraProvisioner(
+        hasura_admin_client=hasura_admin_client,
+        provisioner_config=provisioner_config,
+        role_mapper_client=make_role_mapper_client(),
+        checkpoint_store=store,
+    ).provision(data_product, hasura_op, snowflake_op)
+
+    hasura_admin_client.get_metadata_snapshot.assert_called()
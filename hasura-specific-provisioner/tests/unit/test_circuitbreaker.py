@@ -0,0 +1,166 @@
+import asyncio
+import time
+
+import pytest
+from httpx import AsyncClient, ConnectError, MockTransport, Request, Response
+from opentelemetry.metrics import CallbackOptions
+
+from src.common.model.config import CircuitBreakerConfig, RetryConfig
+from src.common.model.health import CircuitState
+from src.services.circuitbreaker import (
+    CircuitBreaker,
+    CircuitOpenError,
+    _observe_state,
+)
+from src.services.retry import Retrier
+from src.services.rolemapper import RoleMapperClient
+
+
+def test_circuit_breaker_opens_after_consecutive_failures() -> None:
+    circuit_breaker = CircuitBreaker(
+        "hasura", CircuitBreakerConfig(failure_threshold=3, reset_timeout=60)
+    )
+
+    circuit_breaker.record_failure()
+    circuit_breaker.record_failure()
+    circuit_breaker.record_success()
+    circuit_breaker.record_failure()
+    circuit_breaker.record_failure()
+    assert circuit_breaker.state == CircuitState.CLOSED
+
+    circuit_breaker.record_failure()
+    assert circuit_breaker.state == CircuitState.OPEN
+    with pytest.raises(CircuitOpenError):
+        circuit_breaker.before_call()
+
+
+def test_every_circuit_breaker_state_is_observed() -> None:
+    # names unique to the test, breakers of other tests may still be alive
+    open_breaker = CircuitBreaker(
+        "observed_open", CircuitBreakerConfig(failure_threshold=1, reset_timeout=60)
+    )
+    closed_breaker = CircuitBreaker("observed_closed", CircuitBreakerConfig())
+
+    open_breaker.record_failure()
+    observations = _observe_state(CallbackOptions())
+
+    states = {
+        observation.attributes["service"]: observation.value
+        for observation in observations
+        if observation.attributes is not None
+    }
+    assert states["observed_open"] == 2
+    assert states["observed_closed"] == 0
+    assert closed_breaker.state == CircuitState.CLOSED
+
+
+def test_circuit_breaker_half_open_lets_trial_calls_through() -> None:
+    circuit_breaker = CircuitBreaker(
+        "hasura",
+        CircuitBreakerConfig(
+            failure_threshold=1, reset_timeout=0.01, half_open_max_calls=1
+        ),
+    )
+    circuit_breaker.record_failure()
+    time.sleep(0.02)
+
+    assert circuit_breaker.state == CircuitState.HALF_OPEN
+    circuit_breaker.before_call()
+    with pytest.raises(CircuitOpenError):
+        circuit_breaker.before_call()
+
+    circuit_breaker.record_success()
+    assert circuit_breaker.state == CircuitState.CLOSED
+
+
+def test_circuit_breaker_reopens_on_failed_trial_call() -> None:
+    circuit_breaker = CircuitBreaker(
+        "hasura", CircuitBreakerConfig(failure_threshold=1, reset_timeout=0.01)
+    )
+    circuit_breaker.record_failure()
+    time.sleep(0.02)
+    circuit_breaker.before_call()
+
+    circuit_breaker.record_failure()
+
+    assert circuit_breaker.state == CircuitState.OPEN
+
+
+@pytest.mark.anyio
+async def test_client_fails_fast_while_circuit_is_open() -> None:
+    calls = 0
+
+    def handler(request: Request) -> Response:
+        nonlocal calls
+        calls += 1
+        raise ConnectError("connection refused")
+
+    circuit_breaker = CircuitBreaker(
+        "rolemapper", CircuitBreakerConfig(failure_threshold=2, reset_timeout=60)
+    )
+    client = RoleMapperClient(
+        role_mapper_url="http://rolemapper",
+        client=AsyncClient(transport=MockTransport(handler)),
+        circuit_breaker=circuit_breaker,
+    )
+
+    for _ in range(2):
+        with pytest.raises(ConnectError):
+            await client.get_role("role")
+    with pytest.raises(CircuitOpenError):
+        await client.get_role("role")
+
+    assert calls == 2
+
+
+@pytest.mark.anyio
+async def test_retried_request_counts_as_a_single_failure() -> None:
+    circuit_breaker = CircuitBreaker(
+        "hasura", CircuitBreakerConfig(failure_threshold=2, reset_timeout=60)
+    )
+    retrier = Retrier(
+        "hasura",
+        RetryConfig(max_attempts=3, initial_backoff=0.001, max_backoff=0.001),
+        {"track_table"},
+        circuit_breaker=circuit_breaker,
+    )
+
+    async def send() -> Response:
+        return Response(503)
+
+    response = await retrier.call("track_table", send)
+
+    assert response.status_code == 503
+    assert circuit_breaker.state == CircuitState.CLOSED
+
+
+@pytest.mark.anyio
+async def test_failed_trial_request_reopens_the_circuit_whatever_the_error() -> None:
+    circuit_breaker = CircuitBreaker(
+        "hasura", CircuitBreakerConfig(failure_threshold=1, reset_timeout=0)
+    )
+    retrier = Retrier(
+        "hasura", RetryConfig(), {"track_table"}, circuit_breaker=circuit_breaker
+    )
+    circuit_breaker.record_failure()
+
+    async def fail() -> Response:
+        raise ValueError("unexpected")
+
+    async def hang() -> Response:
+        await asyncio.sleep(60)
+        return Response(200)
+
+    with pytest.raises(ValueError):
+        await retrier.call("track_table", fail)
+    assert circuit_breaker._state == CircuitState.OPEN
+
+    trial = asyncio.create_task(retrier.call("track_table", hang))
+    await asyncio.sleep(0)
+    trial.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await trial
+    assert circuit_breaker._state == CircuitState.OPEN
+    # the next trial request is let through
+    assert circuit_breaker.state == CircuitState.HALF_OPEN
+    circuit_breaker.before_call()
@@ -1,5 +1,8 @@
 from datetime import datetime, timezone
 from textwrap import dedent
+from typing import List
+
+import yaml
 
 from src.common.model.descriptor import (
     DataProduct,
@@ -751,3 +754,33 @@ dataProduct:
 componentIdToProvision: urn:dmb:cmp:healthcare:vaccinations:0:hasura-output-port
 """
 )
+
+
+def make_dataproduct_descriptor_yaml(output_port_names: List[str]) -> str:
+    """
+    The data product of descriptor_yaml_ok as a DATAPRODUCT_DESCRIPTOR, with a Hasura
+    output port for each of the provided names instead of the original one
+    """
+    data_product = yaml.safe_load(descriptor_yaml_ok)["dataProduct"]
+    components = data_product["components"]
+    hasura_op = next(
+        component for component in components if component["platform"] == "Hasura"
+    )
+    components.remove(hasura_op)
+    for name in output_port_names:
+        prefix = f"healthcare_vaccinations_0_{name}_"
+        components.append(
+            {
+                **hasura_op,
+                "id": f"urn:dmb:cmp:healthcare:vaccinations:0:{name}",
+                "name": name,
+                "specific": {
+                    "customTableName": f"{prefix}table",
+                    "select": f"{prefix}select",
+                    "selectByPk": f"{prefix}by_pk",
+                    "selectAggregate": f"{prefix}agg",
+                    "selectStream": f"{prefix}stream",
+                },
+            }
+        )
+    return yaml.safe_dump(data_product)
@@ -0,0 +1,131 @@
+import copy
+import json
+from typing import List
+
+import pytest
+from httpx import Request, Response
+
+from src.common.model.config import GarbageCollectorConfig, SnowflakeConfig
+from src.services.hasura.gc import MetadataGarbageCollector
+from src.services.hasura.provisioner import make_snowflake_jdbc_url_prefix
+from tests.unit.test_hasura_client import make_client
+from tests.unit.test_reconciler import FakeHasura
+
+snowflake_config = SnowflakeConfig(
+    host="account.snowflakecomputing.com",
+    user="provisioner",
+    password="secret",
+    role="HASURA",
+    warehouse="WH",
+)
+
+
+def make_source(name: str, jdbc_url: str, tables: List[dict]) -> dict:
+    return {
+        "name": name,
+        "kind": "snowflake",
+        "configuration": {"fully_qualify_all_names": False, "jdbc_url": jdbc_url},
+        "tables": tables,
+    }
+
+
+provisioner_jdbc_url = (
+    make_snowflake_jdbc_url_prefix(snowflake_config) + "db=DB&schema=SCHEMA"
+)
+
+# domain_dp_0 was left behind by a major version bump to domain_dp_1
+metadata: dict = {
+    "version": 3,
+    "sources": [
+        make_source("domain_dp_0", provisioner_jdbc_url, []),
+        make_source(
+            "domain_dp_1",
+            provisioner_jdbc_url,
+            [
+                {
+                    "table": ["TABLE"],
+                    "select_permissions": [
+                        {"role": "domain_dp_1_op_role", "permission": {}},
+                        {"role": "reporting_role", "permission": {}},
+                    ],
+                }
+            ],
+        ),
+        # added by hand, with other connection settings
+        make_source(
+            "sales_staging_0",
+            "jdbc:snowflake://account.snowflakecomputing.com/?user=analyst&"
+            "password=other&role=ANALYST&warehouse=WH&db=DB&schema=SCHEMA",
+            [],
+        ),
+        {"name": "analytics", "kind": "postgres", "tables": []},
+    ],
+}
+
+
+def make_collector(hasura, **kwargs) -> MetadataGarbageCollector:
+    return MetadataGarbageCollector(
+        make_client(hasura),
+        GarbageCollectorConfig(enabled=True, max_requests_per_second=0, **kwargs),
+        snowflake_config,
+    )
+
+
+@pytest.mark.anyio
+async def test_dry_run_only_reports_orphans() -> None:
+    hasura = FakeHasura(metadata)
+    collector = make_collector(hasura, dry_run=True)
+
+    await collector.collect()
+    report = await collector.collect()
+
+    # only the source added by the provisioner, without its permissions
+    assert report.orphaned_sources == 1
+    assert report.reclaimed == 0
+    assert report.metadata_size_after < report.metadata_size_before
+    assert hasura.writes == []
+
+
+@pytest.mark.anyio
+async def test_orphans_are_removed_on_the_second_collection() -> None:
+    hasura = FakeHasura(metadata)
+    collector = make_collector(hasura)
+
+    first_report = await collector.collect()
+    assert first_report.reclaimed == 0
+    assert hasura.writes == []
+
+    report = await collector.collect()
+
+    assert report.reclaimed == 1
+    assert hasura.writes == ["snowflake_drop_source"]
+
+
+@pytest.mark.anyio
+async def test_removal_stops_when_the_metadata_changes() -> None:
+    two_orphans = copy.deepcopy(metadata)
+    two_orphans["sources"].append(make_source("domain_old_0", provisioner_jdbc_url, []))
+    hasura = FakeHasura(two_orphans)
+    writes: List[dict] = []
+
+    def handler(request: Request) -> Response:
+        body = json.loads(request.content)
+        if body["type"] != "bulk_keep_going":
+            return hasura(request)
+        writes.append(body)
+        if len(writes) > 1:
+            return Response(409, json={"code": "conflict", "error": "conflict"})
+        return Response(200, json=[{"message": "success"}])
+
+    collector = make_collector(handler, batch_size=1)
+
+    await collector.collect()
+    report = await collector.collect()
+
+    assert report.reclaimed == 1
+    # the second batch is based on the metadata left by the first one
+    assert [write["resource_version"] for write in writes] == [1, 2]
+    assert [write["args"][0]["args"]["name"] for write in writes] == [
+        "domain_dp_0",
+        "domain_old_0",
+    ]
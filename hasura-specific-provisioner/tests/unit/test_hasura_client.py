@@ -0,0 +1,318 @@
+import json
+from typing import Callable, List
+
+import pytest
+from httpx import AsyncClient, MockTransport, Request, Response
+
+from src.common.model.hasura import (
+    ClearSourceResult,
+    DataSourceConfig,
+    DataSourceType,
+    DropSourceResult,
+    QualifiedTable,
+    TableConfig,
+    TrackTableResult,
+)
+from src.common.model.reconciliation import OperationType
+from src.services.hasura.batcher import MetadataBatcher
+from src.services.hasura.client import HasuraAdminClient
+from src.services.hasura.registry import SourceRegistry
+
+data_source_config = DataSourceConfig(
+    data_source_type=DataSourceType.SNOWFLAKE,
+    data_source_name="domain_dp_0",
+    config={"fully_qualify_all_names": False, "jdbc_url": "jdbc:snowflake://host"},
+)
+
+table_config = TableConfig(
+    data_source_type=DataSourceType.SNOWFLAKE,
+    data_source_name="domain_dp_0",
+    source_table=QualifiedTable(schema_name="SCHEMA", table_name="TABLE"),
+    custom_table_name="domain_dp_0_op_table",
+    select_root_field_name="domain_dp_0_op_select",
+    select_by_pk_root_field_name="domain_dp_0_op_select_by_pk",
+    select_aggregate_root_field_name="domain_dp_0_op_aggregate",
+    select_stream_root_field_name="domain_dp_0_op_stream",
+    comment="Access to the TABLE table in schema SCHEMA",
+)
+
+
+def make_client(handler: Callable[[Request], Response]) -> HasuraAdminClient:
+    return HasuraAdminClient(
+        hasura_url="http://hasura",
+        hasura_admin_secret="secret",
+        client=AsyncClient(transport=MockTransport(handler)),
+    )
+
+
+class VersionedHasura:
+    def __init__(self, resource_version: int, conflicts: int = 0):
+        self.resource_version = resource_version
+        self.conflicts = conflicts
+        self.writes: List[dict] = []
+
+    def __call__(self, request: Request) -> Response:
+        body = json.loads(request.content)
+        if body["type"] == "export_metadata":
+            return Response(
+                200,
+                json={
+                    "resource_version": self.resource_version,
+                    "metadata": {"version": 3, "sources": []},
+                },
+            )
+        self.writes.append(body)
+        if self.conflicts > 0:
+            self.conflicts -= 1
+            # another replica wrote in the meantime
+            self.resource_version += 1
+            return Response(409, json={"code": "conflict", "error": "conflict"})
+        self.resource_version += 1
+        return Response(200, json={"message": "success"})
+
+
+@pytest.mark.anyio
+async def test_writes_carry_resource_version() -> None:
+    hasura = VersionedHasura(resource_version=7)
+    client = make_client(hasura)
+
+    await client.get_metadata_snapshot()
+    await client.add_source(data_source_config)
+    await client.track_table(table_config)
+
+    assert [write["resource_version"] for write in hasura.writes] == [7, 8]
+
+
+@pytest.mark.anyio
+async def test_conflicting_write_is_retried_with_new_resource_version() -> None:
+    hasura = VersionedHasura(resource_version=7, conflicts=1)
+    client = make_client(hasura)
+
+    await client.get_metadata_snapshot()
+    track_table_res = await client.track_table(table_config)
+
+    assert track_table_res == TrackTableResult.SUCCESS
+    assert [write["resource_version"] for write in hasura.writes] == [7, 8]
+
+
+@pytest.mark.anyio
+async def test_conflicting_write_fails_after_max_retries() -> None:
+    hasura = VersionedHasura(resource_version=7, conflicts=10)
+    client = HasuraAdminClient(
+        hasura_url="http://hasura",
+        hasura_admin_secret="secret",
+        client=AsyncClient(transport=MockTransport(hasura)),
+        conflict_max_retries=2,
+    )
+
+    await client.get_metadata_snapshot()
+    track_table_res = await client.track_table(table_config)
+
+    assert track_table_res == TrackTableResult.FAILURE
+    assert len(hasura.writes) == 3
+
+
+@pytest.mark.anyio
+async def test_writes_without_known_resource_version_are_not_versioned() -> None:
+    hasura = VersionedHasura(resource_version=7)
+    client = make_client(hasura)
+
+    await client.add_source(data_source_config)
+
+    assert "resource_version" not in hasura.writes[0]
+
+
+@pytest.mark.anyio
+async def test_get_source_tables() -> None:
+    def handler(request: Request) -> Response:
+        assert request.headers["Content-Type"] == "application/json"
+        assert json.loads(request.content) == {
+            "type": "snowflake_get_source_tables",
+            "args": {"source": "domain_dp_0"},
+        }
+        return Response(
+            200,
+            json=[
+                {"schema": "SCHEMA", "name": "TABLE_1"},
+                {"schema": "SCHEMA", "name": "TABLE_2"},
+            ],
+        )
+
+    client = make_client(handler)
+
+    tables = await client.get_source_tables(data_source_config)
+
+    assert tables == [
+        QualifiedTable(schema_name="SCHEMA", table_name="TABLE_1"),
+        QualifiedTable(schema_name="SCHEMA", table_name="TABLE_2"),
+    ]
+
+
+@pytest.mark.anyio
+async def test_non_json_error_response_is_a_failure() -> None:
+    def handler(request: Request) -> Response:
+        return Response(502, content=b"<html>Bad Gateway</html>")
+
+    client = make_client(handler)
+
+    assert await client.track_table(table_config) == TrackTableResult.FAILURE
+
+
+def make_source_hasura(
+    tables: List[dict], writes: List[dict], bulk_status: int = 200
+) -> Callable[[Request], Response]:
+    def handler(request: Request) -> Response:
+        body = json.loads(request.content)
+        if body["type"] == "export_metadata":
+            source = {"name": "domain_dp_0", "kind": "snowflake", "tables": tables}
+            return Response(
+                200,
+                json={"resource_version": 4, "metadata": {"sources": [source]}},
+            )
+        writes.append(body)
+        if bulk_status != 200:
+            return Response(bulk_status, json={"code": "not-exists", "error": "boom"})
+        return Response(200, json=[{"message": "success"}] * len(body["args"]))
+
+    return handler
+
+
+@pytest.mark.anyio
+async def test_clear_source_single_atomic_request() -> None:
+    writes: List[dict] = []
+    tables: List[dict] = [
+        {
+            "table": ["TABLE_1"],
+            "select_permissions": [{"role": "role_1"}, {"role": "role_2"}],
+        },
+        {"table": ["TABLE_2"]},
+    ]
+    client = make_client(make_source_hasura(tables, writes))
+
+    result = await client.clear_source(data_source_config, drop_source=True)
+
+    assert result == (ClearSourceResult.SUCCESS, 2)
+    assert len(writes) == 1
+    assert writes[0]["type"] == "bulk"
+    assert writes[0]["resource_version"] == 4
+    assert [(arg["type"], arg["args"].get("role")) for arg in writes[0]["args"]] == [
+        ("snowflake_drop_select_permission", "role_1"),
+        ("snowflake_drop_select_permission", "role_2"),
+        ("snowflake_untrack_table", None),
+        ("snowflake_untrack_table", None),
+        ("snowflake_drop_source", None),
+    ]
+    assert writes[0]["args"][3]["args"]["table"] == ["TABLE_2"]
+
+
+@pytest.mark.anyio
+async def test_clear_source_plans_again_on_conflict() -> None:
+    writes: List[dict] = []
+    tables: List[dict] = [{"table": ["TABLE_1"]}]
+    resource_version = 4
+
+    def handler(request: Request) -> Response:
+        nonlocal resource_version
+        body = json.loads(request.content)
+        if body["type"] == "export_metadata":
+            source = {"name": "domain_dp_0", "kind": "snowflake", "tables": tables}
+            return Response(
+                200,
+                json={
+                    "resource_version": resource_version,
+                    "metadata": {"sources": [source]},
+                },
+            )
+        writes.append(body)
+        if len(writes) == 1:
+            # another writer tracked a table in the meantime
+            tables.append({"table": ["TABLE_2"]})
+            resource_version += 1
+            return Response(409, json={"code": "conflict", "error": "conflict"})
+        return Response(200, json=[{"message": "success"}] * len(body["args"]))
+
+    client = make_client(handler)
+
+    result = await client.clear_source(data_source_config)
+
+    assert result == (ClearSourceResult.SUCCESS, 2)
+    assert [write["resource_version"] for write in writes] == [4, 5]
+    # the stale plan is not resent
+    assert [[arg["args"]["table"] for arg in write["args"]] for write in writes] == [
+        [["TABLE_1"]],
+        [["TABLE_1"], ["TABLE_2"]],
+    ]
+
+
+@pytest.mark.anyio
+async def test_clear_source_failure() -> None:
+    writes: List[dict] = []
+    client = make_client(make_source_hasura([{"table": ["TABLE"]}], writes, 400))
+
+    result = await client.clear_source(data_source_config)
+
+    assert result == (ClearSourceResult.FAILURE, 0)
+    # the source is kept
+    assert [arg["type"] for arg in writes[0]["args"]] == ["snowflake_untrack_table"]
+
+
+@pytest.mark.anyio
+async def test_clear_missing_source_makes_no_writes() -> None:
+    def handler(request: Request) -> Response:
+        assert json.loads(request.content)["type"] == "export_metadata"
+        return Response(200, json={"resource_version": 1, "metadata": {}})
+
+    client = make_client(handler)
+
+    result = await client.clear_source(data_source_config, drop_source=True)
+
+    assert result == (ClearSourceResult.NOT_EXISTS, 0)
+
+
+@pytest.mark.anyio
+async def test_drop_unused_source_after_batched_writes() -> None:
+    resource_version = 4
+    tables: List[dict] = [{"table": ["TABLE"]}]
+    drops: List[dict] = []
+
+    def handler(request: Request) -> Response:
+        nonlocal resource_version
+        body = json.loads(request.content)
+        if body["type"] == "export_metadata":
+            source = {"name": "domain_dp_0", "kind": "snowflake", "tables": tables}
+            return Response(
+                200,
+                json={
+                    "resource_version": resource_version,
+                    "metadata": {"sources": [source]},
+                },
+            )
+        if body.get("resource_version", resource_version) != resource_version:
+            return Response(409, json={"code": "conflict", "error": "conflict"})
+        resource_version += 1
+        if body["type"] == "bulk_keep_going":
+            tables.clear()
+            return Response(200, json=[{"message": "success"}] * len(body["args"]))
+        drops.append(body)
+        return Response(200, json={"message": "success"})
+
+    # the batcher sends the writes with a client of its own, as in production
+    batcher = MetadataBatcher(
+        send_bulk=make_client(handler).bulk_keep_going, window=0.01, max_batch_size=10
+    )
+    client = HasuraAdminClient(
+        hasura_url="http://hasura",
+        hasura_admin_secret="secret",
+        client=AsyncClient(transport=MockTransport(handler)),
+        batcher=batcher,
+        source_registry=SourceRegistry(),
+    )
+
+    await client.get_metadata_snapshot()
+    assert await client.run_metadata_operations(
+        [OperationType.UNTRACK_TABLE], data_source_config, table_config, "role"
+    ) == [True]
+    result = await client.drop_source_if_unused(data_source_config)
+
+    assert result == DropSourceResult.SUCCESS
+    assert [drop["resource_version"] for drop in drops] == [5]
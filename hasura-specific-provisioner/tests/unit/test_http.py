@@ -0,0 +1,120 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Generator
+
+import pytest
+from opentelemetry.metrics import CallbackOptions
+
+from src.common.model.config import HttpPoolConfig
+from src.dependencies import get_http_pool_config_from_env
+from src.services.http import HttpConnectionPool, _observe
+
+
+class _OkHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self) -> None:
+        body = b"{}"
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+@pytest.fixture
+def local_server_url() -> Generator[str, None, None]:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _OkHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.anyio
+async def test_connection_pool_reuses_connections(local_server_url: str) -> None:
+    pool = HttpConnectionPool(name="test", pool_config=HttpPoolConfig())
+
+    for _ in range(3):
+        assert (await pool.client.get(local_server_url)).status_code == 200
+    await pool.aclose()
+
+    stats = pool.stats
+    assert stats.requests == 3
+    assert stats.connections_opened == 1
+    assert stats.connections_reused == 2
+    assert stats.tls_handshakes == 0
+
+
+@pytest.mark.anyio
+async def test_connection_pool_without_keepalive_opens_new_connections(
+    local_server_url: str,
+) -> None:
+    pool = HttpConnectionPool(
+        name="test", pool_config=HttpPoolConfig(max_keepalive_connections=0)
+    )
+
+    for _ in range(3):
+        assert (await pool.client.get(local_server_url)).status_code == 200
+    await pool.aclose()
+
+    stats = pool.stats
+    assert stats.requests == 3
+    assert stats.connections_opened == 3
+    assert stats.connections_reused == 0
+
+
+@pytest.mark.anyio
+async def test_every_connection_pool_is_observed(local_server_url: str) -> None:
+    # names unique to the test, pools of other tests may still be alive
+    hasura_pool = HttpConnectionPool(
+        name="observed_hasura", pool_config=HttpPoolConfig()
+    )
+    role_mapper_pool = HttpConnectionPool(
+        name="observed_role_mapper", pool_config=HttpPoolConfig()
+    )
+
+    await hasura_pool.client.get(local_server_url)
+    observations = _observe("requests")(CallbackOptions())
+
+    requests = {
+        observation.attributes["service"]: observation.value
+        for observation in observations
+        if observation.attributes is not None
+    }
+    assert requests["observed_hasura"] == 1
+    assert requests["observed_role_mapper"] == 0
+    await hasura_pool.aclose()
+    await role_mapper_pool.aclose()
+
+
+def test_http_pool_config_from_env(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr("src.dependencies._is_http2_available", lambda: True)
+    monkeypatch.setenv("HASURA_POOL_MAX_CONNECTIONS", "10")
+    monkeypatch.setenv("HASURA_POOL_MAX_KEEPALIVE_CONNECTIONS", "5")
+    monkeypatch.setenv("HASURA_POOL_KEEPALIVE_EXPIRY", "60")
+    monkeypatch.setenv("HASURA_HTTP2", "true")
+
+    pool_config = get_http_pool_config_from_env("HASURA")
+
+    assert pool_config == HttpPoolConfig(
+        max_connections=10,
+        max_keepalive_connections=5,
+        keepalive_expiry=60.0,
+        http2=True,
+    )
+    assert get_http_pool_config_from_env("ROLE_MAPPER") == HttpPoolConfig()
+
+
+def test_http_pool_config_rejects_http2_without_h2(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr("src.dependencies._is_http2_available", lambda: False)
+    monkeypatch.setenv("HASURA_HTTP2", "true")
+
+    with pytest.raises(ValueError, match="HASURA_HTTP2 requires the h2 package"):
+        get_http_pool_config_from_env("HASURA")
@@ -0,0 +1,196 @@
+import asyncio
+
+import pytest
+from opentelemetry.metrics import CallbackOptions
+
+from src.common.model.config import JobConfig
+from src.common.model.jobs import JobStatus
+from src.dependencies import get_job_config_from_env
+from src.services.jobs import (
+    JobEngine,
+    JobQueueFullError,
+    _observe_pending,
+    _observe_stored,
+)
+
+
+async def wait_until_finished(engine: JobEngine, token: str) -> None:
+    for _ in range(100):
+        job = await engine.get(token)
+        if job is None or job.status != JobStatus.RUNNING:
+            return
+        await asyncio.sleep(0.01)
+
+
+@pytest.mark.anyio
+async def test_engine_runs_jobs_in_the_background() -> None:
+    engine: JobEngine[str] = JobEngine("test", JobConfig(max_workers=2))
+    await engine.start()
+    release = asyncio.Event()
+
+    async def run() -> str:
+        await release.wait()
+        return "done"
+
+    token = engine.submit(run)
+    running = await engine.get(token)
+    assert running is not None
+    assert running.status == JobStatus.RUNNING
+
+    release.set()
+    await wait_until_finished(engine, token)
+    job = await engine.get(token)
+
+    assert job is not None
+    assert job.status == JobStatus.COMPLETED
+    assert job.result == "done"
+    await engine.aclose()
+
+
+@pytest.mark.anyio
+async def test_engine_records_failures() -> None:
+    engine: JobEngine[str] = JobEngine("test", JobConfig(max_workers=1))
+    await engine.start()
+
+    async def run() -> str:
+        raise ValueError("boom")
+
+    token = engine.submit(run)
+    await wait_until_finished(engine, token)
+    job = await engine.get(token)
+
+    assert job is not None
+    assert job.status == JobStatus.FAILED
+    assert job.error == "boom"
+    await engine.aclose()
+
+
+@pytest.mark.anyio
+async def test_engine_bounds_running_and_pending_jobs() -> None:
+    engine: JobEngine[str] = JobEngine("test", JobConfig(max_workers=1, max_pending=1))
+    await engine.start()
+    release = asyncio.Event()
+    running = 0
+    max_running = 0
+
+    async def run() -> str:
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        await release.wait()
+        running -= 1
+        return "done"
+
+    first = engine.submit(run)
+    await asyncio.sleep(0.01)
+    second = engine.submit(run)
+    with pytest.raises(JobQueueFullError):
+        engine.submit(run)
+
+    release.set()
+    await wait_until_finished(engine, first)
+    await wait_until_finished(engine, second)
+
+    assert max_running == 1
+    await engine.aclose()
+
+
+@pytest.mark.anyio
+async def test_every_engine_pending_jobs_are_observed() -> None:
+    # names unique to the test, engines of other tests may still be alive; the
+    # engines are not started, so the submitted jobs stay pending
+    busy_engine: JobEngine[str] = JobEngine("observed_busy", JobConfig())
+    idle_engine: JobEngine[str] = JobEngine("observed_idle", JobConfig())
+
+    async def run() -> str:
+        return "done"
+
+    busy_engine.submit(run)
+    busy_engine.submit(run)
+    observations = _observe_pending(CallbackOptions())
+
+    pending = {
+        observation.attributes["engine"]: observation.value
+        for observation in observations
+        if observation.attributes is not None
+    }
+    assert pending["observed_busy"] == 2
+    assert pending["observed_idle"] == 0
+    assert idle_engine.pending == 0
+
+
+@pytest.mark.anyio
+async def test_every_engine_stored_jobs_are_observed() -> None:
+    # names unique to the test, engines of other tests may still be alive
+    busy_engine: JobEngine[str] = JobEngine("observed_stored_busy", JobConfig())
+    idle_engine: JobEngine[str] = JobEngine("observed_stored_idle", JobConfig())
+
+    async def run() -> str:
+        return "done"
+
+    busy_engine.submit(run)
+    observations = _observe_stored(CallbackOptions())
+
+    stored = {
+        observation.attributes["engine"]: observation.value
+        for observation in observations
+        if observation.attributes is not None
+    }
+    assert stored["observed_stored_busy"] == 1
+    assert stored["observed_stored_idle"] == 0
+    assert idle_engine.stored == 0
+
+
+@pytest.mark.anyio
+async def test_engine_evicts_expired_jobs() -> None:
+    engine: JobEngine[str] = JobEngine("test", JobConfig(ttl=0))
+    await engine.start()
+
+    async def run() -> str:
+        return "done"
+
+    token = engine.submit(run)
+    await wait_until_finished(engine, token)
+
+    assert await engine.get(token) is None
+    assert await engine.get("unknown") is None
+    await engine.aclose()
+
+
+@pytest.mark.anyio
+async def test_engine_keeps_at_most_max_finished_jobs() -> None:
+    engine: JobEngine[str] = JobEngine("test", JobConfig(max_workers=1, max_finished=1))
+    await engine.start()
+
+    async def run() -> str:
+        return "done"
+
+    first = engine.submit(run)
+    await wait_until_finished(engine, first)
+    second = engine.submit(run)
+    await wait_until_finished(engine, second)
+
+    assert await engine.get(first) is None
+    assert await engine.get(second) is not None
+    await engine.aclose()
+
+
+def test_job_config_from_env(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("PROVISIONING_JOBS_ENABLED", "true")
+    monkeypatch.setenv("PROVISIONING_JOBS_MAX_WORKERS", "4")
+    monkeypatch.setenv("PROVISIONING_JOBS_MAX_PENDING", "10")
+    monkeypatch.setenv("PROVISIONING_JOBS_TTL", "60")
+    monkeypatch.setenv("PROVISIONING_JOBS_MAX_FINISHED", "100")
+    monkeypatch.setenv("PROVISIONING_JOBS_STORE", "sqlite")
+    monkeypatch.setenv("PROVISIONING_JOBS_SQLITE_PATH", "/data/jobs.db")
+
+    assert get_job_config_from_env("PROVISIONING_JOBS") == JobConfig(
+        enabled=True,
+        max_workers=4,
+        max_pending=10,
+        ttl=60,
+        max_finished=100,
+        store="sqlite",
+        sqlite_path="/data/jobs.db",
+    )
+    assert get_job_config_from_env("OTHER_JOBS") == JobConfig()
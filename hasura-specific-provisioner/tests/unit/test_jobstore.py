@@ -0,0 +1,154 @@
+import asyncio
+import time
+from pathlib import Path
+
+import pytest
+
+from src.common.model.config import JobConfig
+from src.common.model.jobs import Job, JobStatus
+from src.models import ValidationResult
+from src.services.jobs import JobEngine
+from src.services.jobstore import InMemoryJobStore, SqliteJobStore
+from tests.unit.test_jobs import wait_until_finished
+
+
+def make_sqlite_store(
+    path: Path, config: JobConfig = JobConfig(), **kwargs
+) -> SqliteJobStore[ValidationResult]:
+    return SqliteJobStore(
+        name="validation",
+        path=str(path / "jobs.db"),
+        config=config,
+        encode_result=lambda result: result.dict(),
+        decode_result=ValidationResult.parse_obj,
+        **kwargs,
+    )
+
+
+def make_finished_job(
+    token: str, component_id: str, finished_at: float
+) -> Job[ValidationResult]:
+    job: Job[ValidationResult] = Job(token, component_id=component_id)
+    job.status = JobStatus.COMPLETED
+    job.result = ValidationResult(valid=True)
+    job.finished_at = finished_at
+    return job
+
+
+@pytest.mark.anyio
+async def test_in_memory_store_indexes_jobs_by_component() -> None:
+    store: InMemoryJobStore[ValidationResult] = InMemoryJobStore(
+        JobConfig(max_finished=1)
+    )
+    running: Job[ValidationResult] = Job("running", component_id="op")
+    store.save(running)
+    store.save(make_finished_job("old", "op", time.time() - 1))
+    store.save(make_finished_job("new", "op", time.time()))
+
+    # the oldest finished job is evicted beyond max_finished
+    assert {job.token for job in await store.find_by_component("op")} == {
+        "running",
+        "new",
+    }
+    assert await store.find_running() == [running]
+    assert await store.get("old") is None
+
+
+@pytest.mark.anyio
+async def test_sqlite_store_persists_jobs(tmp_path: Path) -> None:
+    store = make_sqlite_store(tmp_path)
+    await store.start()
+    running: Job[ValidationResult] = Job(
+        "running", component_id="op", request={"descriptor": "yaml"}
+    )
+    store.save(running)
+    store.save(make_finished_job("finished", "op", time.time()))
+    # visible before being written
+    assert await store.get("running") is running
+    await store.aclose()
+
+    reopened = make_sqlite_store(tmp_path)
+    await reopened.start()
+    finished = await reopened.get("finished")
+
+    assert finished is not None
+    assert finished.status == JobStatus.COMPLETED
+    assert finished.result == ValidationResult(valid=True)
+    assert [job.token for job in await reopened.find_running()] == ["running"]
+    assert (await reopened.find_running())[0].request == {"descriptor": "yaml"}
+    assert {job.token for job in await reopened.find_by_component("op")} == {
+        "running",
+        "finished",
+    }
+    assert await reopened.get("unknown") is None
+    await reopened.aclose()
+
+
+@pytest.mark.anyio
+async def test_sqlite_store_writes_in_batches(tmp_path: Path) -> None:
+    store = make_sqlite_store(tmp_path, flush_interval=60, max_batch_size=2)
+    await store.start()
+    reader = make_sqlite_store(tmp_path)
+    await reader.start()
+
+    store.save(Job("first"))
+    await asyncio.sleep(0.01)
+    assert await reader.get("first") is None
+
+    store.save(Job("second"))
+    for _ in range(100):
+        if await reader.get("second") is not None:
+            break
+        await asyncio.sleep(0.01)
+
+    assert await reader.get("first") is not None
+    assert await reader.get("second") is not None
+    await store.aclose()
+    await reader.aclose()
+
+
+@pytest.mark.anyio
+async def test_sqlite_store_evicts_expired_jobs(tmp_path: Path) -> None:
+    store = make_sqlite_store(tmp_path, config=JobConfig(ttl=60), max_cached=1)
+    await store.start()
+    store.save(make_finished_job("expired", "op", time.time() - 120))
+    store.save(make_finished_job("fresh", "op", time.time()))
+    await store.aclose()
+
+    reopened = make_sqlite_store(tmp_path, config=JobConfig(ttl=60))
+    await reopened.start()
+
+    assert await reopened.get("expired") is None
+    assert await reopened.get("fresh") is not None
+    await reopened.aclose()
+
+
+@pytest.mark.anyio
+async def test_engine_replays_running_jobs(tmp_path: Path) -> None:
+    config = JobConfig(max_workers=1)
+    store = make_sqlite_store(tmp_path, config=config)
+    await store.start()
+    store.save(Job("replayable", request={"valid": True}))
+    store.save(Job("not_replayable"))
+    await store.aclose()
+
+    def replay(request: dict):
+        async def run() -> ValidationResult:
+            return ValidationResult(valid=request["valid"])
+
+        return run
+
+    engine: JobEngine[ValidationResult] = JobEngine(
+        "validation", config, store=make_sqlite_store(tmp_path), replay=replay
+    )
+    await engine.start()
+    await wait_until_finished(engine, "replayable")
+    replayed = await engine.get("replayable")
+    not_replayed = await engine.get("not_replayable")
+
+    assert replayed is not None
+    assert replayed.status == JobStatus.COMPLETED
+    assert replayed.result == ValidationResult(valid=True)
+    assert not_replayed is not None
+    assert not_replayed.status == JobStatus.FAILED
+    await engine.aclose()
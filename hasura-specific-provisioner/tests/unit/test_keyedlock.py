@@ -0,0 +1,79 @@
+import asyncio
+from typing import List
+
+import pytest
+
+from src.services.keyedlock import KeyedLockScheduler, role_key, source_key
+
+
+async def hold_for(
+    scheduler: KeyedLockScheduler, name: str, events: List[str], *keys: str
+) -> None:
+    async with scheduler.hold(*keys):
+        events.append(f"{name} start")
+        await asyncio.sleep(0.01)
+        events.append(f"{name} end")
+
+
+@pytest.mark.anyio
+async def test_operations_on_the_same_key_are_serialized() -> None:
+    scheduler = KeyedLockScheduler()
+    events: List[str] = []
+
+    await asyncio.gather(
+        hold_for(scheduler, "first", events, source_key("domain_dp_0")),
+        hold_for(scheduler, "second", events, source_key("domain_dp_0")),
+    )
+
+    assert events == ["first start", "first end", "second start", "second end"]
+
+
+@pytest.mark.anyio
+async def test_operations_on_different_keys_run_in_parallel() -> None:
+    scheduler = KeyedLockScheduler()
+    events: List[str] = []
+
+    await asyncio.gather(
+        hold_for(scheduler, "first", events, source_key("domain_dp_0")),
+        hold_for(scheduler, "second", events, source_key("domain_dp_1")),
+    )
+
+    assert events[:2] == ["first start", "second start"]
+
+
+@pytest.mark.anyio
+async def test_waiting_operations_are_granted_the_key_in_arrival_order() -> None:
+    scheduler = KeyedLockScheduler()
+    events: List[str] = []
+
+    # the large data product queues all its steps first, the other request
+    # still gets the key before the data product takes it again
+    async def large_data_product() -> None:
+        for step in range(3):
+            await hold_for(scheduler, f"large{step}", events, source_key("shared"))
+
+    async def other_request() -> None:
+        await asyncio.sleep(0.005)
+        await hold_for(scheduler, "other", events, source_key("shared"))
+
+    await asyncio.gather(large_data_product(), other_request())
+
+    starts = [event for event in events if event.endswith("start")]
+    assert starts.index("other start") < starts.index("large2 start")
+
+
+@pytest.mark.anyio
+async def test_several_keys_never_deadlock_and_locks_are_released() -> None:
+    scheduler = KeyedLockScheduler()
+    events: List[str] = []
+
+    await asyncio.wait_for(
+        asyncio.gather(
+            hold_for(scheduler, "first", events, source_key("a"), role_key("b")),
+            hold_for(scheduler, "second", events, role_key("b"), source_key("a")),
+        ),
+        timeout=1,
+    )
+
+    assert len(events) == 4
+    assert scheduler._locks == {}
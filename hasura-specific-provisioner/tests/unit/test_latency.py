@@ -0,0 +1,25 @@
+import pytest
+
+from src.services.latency import LatencyTracker
+
+
+def test_estimate_is_the_median_of_the_recent_calls() -> None:
+    latency_tracker = LatencyTracker(window=3)
+    for duration in (10.0, 1.0, 2.0, 3.0):
+        latency_tracker.record("track_table", duration)
+
+    assert latency_tracker.estimate("track_table") == 2.0
+    assert latency_tracker.estimate("untrack_table") is None
+
+
+@pytest.mark.anyio
+async def test_failed_calls_are_measured() -> None:
+    latency_tracker = LatencyTracker()
+
+    async def fail() -> None:
+        raise ValueError()
+
+    with pytest.raises(ValueError):
+        await latency_tracker.measure("create_role", fail())
+
+    assert latency_tracker.estimate("create_role") is not None
@@ -0,0 +1,87 @@
+import io
+import logging
+
+from src.common.log import (
+    BackgroundStreamHandler,
+    LazyBody,
+    RedactingFormatter,
+    redact,
+)
+from tests.unit.test_hasura_client import data_source_config
+
+
+def make_record(msg: str, *args: object) -> logging.LogRecord:
+    return logging.LogRecord("test", logging.DEBUG, __file__, 1, msg, args, None)
+
+
+class ExplodingBody:
+    def __str__(self) -> str:
+        raise AssertionError("the body should not be rendered")
+
+
+def test_redact_masks_secrets() -> None:
+    assert redact("jdbc:snowflake://host/?user=user&password=p%40ss&role=role") == (
+        "jdbc:snowflake://host/?user=user&password=***&role=role"
+    )
+    assert redact('{"x-hasura-admin-secret": "secret"}') == (
+        '{"x-hasura-admin-secret": "***"}'
+    )
+    assert redact("hasura_admin_secret='secret' timeout=30") == (
+        "hasura_admin_secret='***' timeout=30"
+    )
+
+
+def test_formatter_redacts_configs_and_bodies() -> None:
+    formatter = RedactingFormatter(fmt="%(message)s")
+    jdbc_url = "jdbc:snowflake://host/?user=user&password=pass&role=role"
+    config = data_source_config.copy(update={"config": {"jdbc_url": jdbc_url}})
+
+    formatted = formatter.format(
+        make_record("config: %s, body: %s", config, LazyBody({"jdbc_url": jdbc_url}))
+    )
+
+    assert "pass&" not in formatted
+    assert formatted.count("password=***&") == 2
+
+
+def test_formatter_truncates_large_bodies() -> None:
+    formatter = RedactingFormatter(fmt="%(message)s", max_body_size=10)
+    record = make_record("body: %s", LazyBody({"key": "a" * 100}))
+
+    formatted = formatter.format(record)
+
+    assert formatted == 'body: {"key":"aa... (100 chars truncated)'
+    # the record itself is left untouched for the other handlers
+    assert isinstance(record.args[0], LazyBody)  # type: ignore[index]
+
+
+def test_formatter_samples_bodies() -> None:
+    formatter = RedactingFormatter(fmt="%(message)s", body_sample_rate=0)
+
+    assert formatter.format(make_record("body: %s", LazyBody(ExplodingBody()))) == (
+        "body: <body not sampled>"
+    )
+
+
+def test_filtered_records_are_never_formatted() -> None:
+    logger = logging.getLogger("tests.unit.test_log.filtered")
+    logger.setLevel(logging.INFO)
+
+    logger.debug("body: %s", LazyBody(ExplodingBody()))
+
+
+def test_background_handler_writes_formatted_records() -> None:
+    stream = io.StringIO()
+    handler = BackgroundStreamHandler(stream)
+    handler.setFormatter(RedactingFormatter(fmt="%(levelname)s %(message)s"))
+    logger = logging.getLogger("tests.unit.test_log.background")
+    logger.propagate = False
+    logger.addHandler(handler)
+
+    try:
+        logger.warning("body: %s", LazyBody(b"password=secret"))
+    finally:
+        logger.removeHandler(handler)
+        handler.close()
+
+    assert stream.getvalue() == "WARNING body: password=***\n"
@@ -1,13 +1,37 @@
-from unittest.mock import Mock
+import asyncio
+from unittest.mock import AsyncMock, Mock
 
+import orjson
+import pytest
 from fastapi.testclient import TestClient
 
-from src.dependencies import get_provisioner
-from src.main import app
+from src.common.model.config import (
+    CircuitBreakerConfig,
+    Lane,
+    ResultCacheConfig,
+    SchedulerConfig,
+)
+from src.common.model.jobs import Job, JobStatus
+from src.common.model.reconciliation import ExecutionPlan, PlannedCall, Service
+from src.common.parsing.descriptor import (
+    parse_yaml_component_descriptor,
+    parse_yaml_dataproduct_descriptor,
+)
+from src.dependencies import (
+    get_provisioner,
+    get_provisioning_job_engine,
+    get_result_cache,
+    get_validation_job_engine,
+)
+from src.main import _make_provisioning_job_request, _replay_provisioning, app
 from src.models import ProvisioningStatus, Status1, ValidationError, ValidationResult
+from src.services.circuitbreaker import CircuitBreaker
+from src.services.resultcache import ResultCache
+from src.services.scheduler import LaneScheduler
 
 from .test_requests import (
     bad_provision_request,
+    dataproduct_provision_request,
     provision_request,
     update_acl_request,
     validation_request,
@@ -18,7 +42,7 @@ client = TestClient(app)
 
 def test_main_provision_success() -> None:
     def mock_provisioner():
-        m = Mock()
+        m = AsyncMock()
         m.provision.return_value = ProvisioningStatus(
             status=Status1.COMPLETED, result=""
         )
@@ -32,9 +56,79 @@ def test_main_provision_success() -> None:
     app.dependency_overrides = {}
 
 
+def test_main_provision_identical_request_is_cached() -> None:
+    provisioner = AsyncMock()
+    provisioner.provision.return_value = ProvisioningStatus(
+        status=Status1.COMPLETED, result=""
+    )
+    resource_version = AsyncMock(return_value=1)
+    result_cache: ResultCache = ResultCache(
+        ResultCacheConfig(ttl=60),
+        get_resource_version=resource_version,
+        is_cacheable=lambda result: True,
+    )
+
+    app.dependency_overrides[get_provisioner] = lambda: provisioner
+    app.dependency_overrides[get_result_cache] = lambda: result_cache
+    responses = [client.post("/v1/provision", json=provision_request) for _ in range(2)]
+
+    assert [response.status_code for response in responses] == [200, 200]
+    assert responses[1].json() == responses[0].json()
+    provisioner.provision.assert_awaited_once()
+    app.dependency_overrides = {}
+
+
+def test_main_update_acl_identical_request_is_not_cached() -> None:
+    provisioner = AsyncMock()
+    provisioner.update_acl.return_value = ProvisioningStatus(
+        status=Status1.COMPLETED, result=""
+    )
+    result_cache: ResultCache = ResultCache(
+        ResultCacheConfig(ttl=60),
+        get_resource_version=AsyncMock(return_value=1),
+        is_cacheable=lambda result: True,
+    )
+
+    app.dependency_overrides[get_provisioner] = lambda: provisioner
+    app.dependency_overrides[get_result_cache] = lambda: result_cache
+    responses = [
+        client.post("/v1/updateacl", json=update_acl_request) for _ in range(2)
+    ]
+
+    assert [response.status_code for response in responses] == [200, 200]
+    # the mappings may have been changed in the Role Mapper in the meantime
+    assert provisioner.update_acl.await_count == 2
+    app.dependency_overrides = {}
+
+
+def test_main_provision_plan_does_not_provision() -> None:
+    provisioner = AsyncMock()
+    provisioner.plan_provision.return_value = ExecutionPlan(
+        calls=[
+            PlannedCall(
+                service=Service.HASURA,
+                operations=["track_table"],
+                schema_reloads=1,
+                estimated_latency=0.5,
+            )
+        ],
+        schema_reloads=1,
+        estimated_latency=0.5,
+    )
+
+    app.dependency_overrides[get_provisioner] = lambda: provisioner
+    response = client.post("/v1/provision?plan=true", json=provision_request)
+
+    assert response.status_code == 200
+    assert response.json()["schema_reloads"] == 1
+    assert response.json()["calls"][0]["operations"] == ["track_table"]
+    provisioner.provision.assert_not_called()
+    app.dependency_overrides = {}
+
+
 def test_main_provision_failure_validation_error() -> None:
     def mock_provisioner():
-        m = Mock()
+        m = AsyncMock()
         m.provision.return_value = ValidationError(errors=["error"])
         return m
 
@@ -57,24 +151,146 @@ def test_main_provision_failure_validation_error_unpack() -> None:
     assert response.status_code == 400
     assert response.json() == {
         "errors": [
-            "Expecting a COMPONENT_DESCRIPTOR but got a "
-            + "DescriptorKind.DATAPRODUCT_DESCRIPTOR instead; please check with "
-            + "the platform team."
+            "Expecting a COMPONENT_DESCRIPTOR or a DATAPRODUCT_DESCRIPTOR but got "
+            + "a DescriptorKind.DATAPRODUCT_DESCRIPTOR_WITH_RESULTS instead; please "
+            + "check with the platform team."
         ]
     }
     app.dependency_overrides = {}
 
 
-def test_main_provision_status_not_implemented() -> None:
+def test_main_provision_data_product() -> None:
+    provisioner = AsyncMock()
+    provisioner.provision_data_product.return_value = ProvisioningStatus(
+        status=Status1.COMPLETED, result=""
+    )
+
+    app.dependency_overrides[get_provisioner] = lambda: provisioner
+    response = client.post("/v1/provision", json=dataproduct_provision_request)
+
+    assert response.status_code == 200
+    assert response.json() == {"info": None, "result": "", "status": "COMPLETED"}
+    (hasura_data_product,) = provisioner.provision_data_product.await_args.args
+    assert len(hasura_data_product.output_ports) == 2
+    provisioner.provision.assert_not_awaited()
+    app.dependency_overrides = {}
+
+
+def test_main_provision_async() -> None:
+    def mock_provisioner():
+        m = AsyncMock()
+        m.provision.return_value = ProvisioningStatus(
+            status=Status1.COMPLETED, result=""
+        )
+        return m
+
+    job_engine = Mock()
+    job_engine.submit.return_value = "token"
+    app.dependency_overrides[get_provisioner] = mock_provisioner
+    app.dependency_overrides[get_provisioning_job_engine] = lambda: job_engine
+    response = client.post("/v1/provision", json=provision_request)
+
+    assert response.status_code == 202
+    assert response.json() == "token"
+    job_engine.submit.assert_called_once()
+    app.dependency_overrides = {}
+
+
+@pytest.mark.anyio
+async def test_main_provisioning_jobs_can_be_replayed() -> None:
+    data_product, hasura_op, snowflake_op = parse_yaml_component_descriptor(
+        provision_request["descriptor"]
+    )
+    provisioner = AsyncMock()
+    provisioner.unprovision.return_value = ProvisioningStatus(
+        status=Status1.COMPLETED, result=""
+    )
+
+    request = _make_provisioning_job_request(
+        "unprovision", (data_product, hasura_op, snowflake_op)
+    )
+    run = _replay_provisioning(orjson.loads(orjson.dumps(request)), provisioner)
+    await run()
+
+    # the raw components of the data product hold dates as strings after a replay
+    (
+        replayed_data_product,
+        replayed_hasura_op,
+        replayed_snowflake_op,
+    ) = provisioner.unprovision.await_args.args
+    assert replayed_data_product.id == data_product.id
+    assert replayed_hasura_op == hasura_op
+    assert replayed_snowflake_op == snowflake_op
+
+
+@pytest.mark.anyio
+async def test_main_data_product_provisioning_jobs_can_be_replayed() -> None:
+    hasura_data_product = parse_yaml_dataproduct_descriptor(
+        dataproduct_provision_request["descriptor"]
+    )
+    provisioner = AsyncMock()
+    provisioner.provision_data_product.return_value = ProvisioningStatus(
+        status=Status1.COMPLETED, result=""
+    )
+
+    request = _make_provisioning_job_request("provision", hasura_data_product)
+    run = _replay_provisioning(orjson.loads(orjson.dumps(request)), provisioner)
+    await run()
+
+    (replayed,) = provisioner.provision_data_product.await_args.args
+    assert replayed.data_product.id == hasura_data_product.data_product.id
+    assert replayed.output_ports == hasura_data_product.output_ports
+
+
+def test_main_provision_status() -> None:
+    running: Job = Job("running")
+    completed: Job = Job("completed")
+    completed.status = JobStatus.COMPLETED
+    completed.result = ProvisioningStatus(status=Status1.COMPLETED, result="ok")
+    invalid: Job = Job("invalid")
+    invalid.status = JobStatus.COMPLETED
+    invalid.result = ValidationError(errors=["error"])
+    failed: Job = Job("failed")
+    failed.status = JobStatus.FAILED
+    failed.error = "boom"
+    jobs = {job.token: job for job in (running, completed, invalid, failed)}
+
+    job_engine = Mock()
+    job_engine.get = AsyncMock(side_effect=jobs.get)
+    app.dependency_overrides[get_provisioning_job_engine] = lambda: job_engine
+
+    def get_status(token: str) -> dict:
+        response = client.get(f"/v1/provision/{token}/status")
+        assert response.status_code == 200
+        return response.json()
+
+    assert get_status("running") == {"info": None, "result": "", "status": "RUNNING"}
+    assert get_status("completed") == {
+        "info": None,
+        "result": "ok",
+        "status": "COMPLETED",
+    }
+    assert get_status("invalid") == {
+        "info": None,
+        "result": "error",
+        "status": "FAILED",
+    }
+    assert get_status("failed") == {"info": None, "result": "boom", "status": "FAILED"}
+    app.dependency_overrides = {}
+
+
+def test_main_provision_status_unknown_token() -> None:
     response = client.get("/v1/provision/token/status")
 
-    assert response.status_code == 500
-    assert response.json() == {"error": "Not implemented"}
+    assert response.status_code == 400
+    assert response.json() == {
+        "errors": ["Unknown or expired provisioning token token"]
+    }
 
 
 def test_main_unprovision_success() -> None:
     def mock_provisioner():
-        m = Mock()
+        m = AsyncMock()
         m.unprovision.return_value = ProvisioningStatus(
             status=Status1.COMPLETED, result=""
         )
@@ -90,7 +306,7 @@ def test_main_unprovision_success() -> None:
 
 def test_main_unprovision_failure_validation_error() -> None:
     def mock_provisioner():
-        m = Mock()
+        m = AsyncMock()
         m.unprovision.return_value = ValidationError(errors=["error"])
         return m
 
@@ -112,9 +328,9 @@ def test_main_unprovision_failure_validation_error_unpack() -> None:
     assert response.status_code == 400
     assert response.json() == {
         "errors": [
-            "Expecting a COMPONENT_DESCRIPTOR but got a "
-            + "DescriptorKind.DATAPRODUCT_DESCRIPTOR instead; please check with "
-            + "the platform team."
+            "Expecting a COMPONENT_DESCRIPTOR or a DATAPRODUCT_DESCRIPTOR but got "
+            + "a DescriptorKind.DATAPRODUCT_DESCRIPTOR_WITH_RESULTS instead; please "
+            + "check with the platform team."
         ]
     }
     app.dependency_overrides = {}
@@ -122,7 +338,7 @@ def test_main_unprovision_failure_validation_error_unpack() -> None:
 
 def test_main_update_acl_success() -> None:
     def mock_provisioner():
-        m = Mock()
+        m = AsyncMock()
         m.update_acl.return_value = ProvisioningStatus(
             status=Status1.COMPLETED, result=""
         )
@@ -138,7 +354,7 @@ def test_main_update_acl_success() -> None:
 
 def test_main_update_acl_failure_validation_error() -> None:
     def mock_provisioner():
-        m = Mock()
+        m = AsyncMock()
         m.update_acl.return_value = ValidationError(errors=["error"])
         return m
 
@@ -191,9 +407,9 @@ def test_main_validate_failure_validation_error_unpack() -> None:
     assert response.json() == {
         "error": {
             "errors": [
-                "Expecting a COMPONENT_DESCRIPTOR but got a "
-                + "DescriptorKind.DATAPRODUCT_DESCRIPTOR instead; please "
-                + "check with the platform team."
+                "Expecting a COMPONENT_DESCRIPTOR or a DATAPRODUCT_DESCRIPTOR but "
+                + "got a DescriptorKind.DATAPRODUCT_DESCRIPTOR_WITH_RESULTS instead; "
+                + "please check with the platform team."
             ]
         },
         "valid": False,
@@ -201,23 +417,109 @@ def test_main_validate_failure_validation_error_unpack() -> None:
     app.dependency_overrides = {}
 
 
-def test_main_v2_validate_not_implemented() -> None:
+def test_main_v2_validate() -> None:
+    def mock_provisioner():
+        m = Mock()
+        m.validate.return_value = ValidationResult(valid=True)
+        m.check_preflight = AsyncMock(return_value=ValidationResult(valid=True))
+        return m
+
+    job_engine = Mock()
+    job_engine.submit.return_value = "token"
+    app.dependency_overrides[get_provisioner] = mock_provisioner
+    app.dependency_overrides[get_validation_job_engine] = lambda: job_engine
+    response = client.post(
+        "/v2/validate", json={"descriptor": provision_request["descriptor"]}
+    )
+
+    assert response.status_code == 202
+    assert response.json() == "token"
+    run = job_engine.submit.call_args.args[0]
+    assert asyncio.run(run()) == ValidationResult(valid=True)
+    app.dependency_overrides = {}
+
+
+def test_main_v2_validate_data_product() -> None:
+    provisioner = Mock()
+    provisioner.validate_data_product.return_value = ValidationResult(valid=True)
+    provisioner.check_preflight_data_product = AsyncMock(
+        return_value=ValidationResult(valid=True)
+    )
+    job_engine = Mock()
+    job_engine.submit.return_value = "token"
+    app.dependency_overrides[get_provisioner] = lambda: provisioner
+    app.dependency_overrides[get_validation_job_engine] = lambda: job_engine
+    response = client.post(
+        "/v2/validate", json={"descriptor": dataproduct_provision_request["descriptor"]}
+    )
+
+    assert response.status_code == 202
+    run = job_engine.submit.call_args.args[0]
+    assert asyncio.run(run()) == ValidationResult(valid=True)
+    (hasura_data_product,) = provisioner.validate_data_product.call_args.args
+    provisioner.check_preflight_data_product.assert_awaited_once_with(
+        hasura_data_product
+    )
+    provisioner.validate.assert_not_called()
+    app.dependency_overrides = {}
+
+
+def test_main_v2_validate_unparsable_descriptor() -> None:
+    job_engine = Mock()
+    job_engine.submit.return_value = "token"
+    app.dependency_overrides[get_provisioner] = lambda: Mock()
+    app.dependency_overrides[get_validation_job_engine] = lambda: job_engine
     response = client.post("/v2/validate", json=validation_request)
 
-    assert response.status_code == 500
-    assert response.json() == {"error": "Not implemented"}
+    assert response.status_code == 202
+    run = job_engine.submit.call_args.args[0]
+    validation_result = asyncio.run(run())
+    assert validation_result.valid is False
+    assert validation_result.error.errors[0] == "Unable to parse the descriptor."
+    app.dependency_overrides = {}
 
 
-def test_main_v2_validate_status_not_implemented() -> None:
+def test_main_v2_validate_status() -> None:
+    running: Job = Job("running")
+    completed: Job = Job("completed")
+    completed.status = JobStatus.COMPLETED
+    completed.result = ValidationResult(valid=True)
+    failed: Job = Job("failed")
+    failed.status = JobStatus.FAILED
+    failed.error = "boom"
+    jobs = {job.token: job for job in (running, completed, failed)}
+
+    job_engine = Mock()
+    job_engine.get = AsyncMock(side_effect=jobs.get)
+    app.dependency_overrides[get_validation_job_engine] = lambda: job_engine
+
+    def get_status(token: str) -> dict:
+        response = client.get(f"/v2/validate/{token}/status")
+        assert response.status_code == 200
+        return response.json()
+
+    assert get_status("running") == {"status": "RUNNING", "result": None}
+    assert get_status("completed") == {
+        "status": "COMPLETED",
+        "result": {"valid": True, "error": None},
+    }
+    assert get_status("failed") == {
+        "status": "FAILED",
+        "result": {"valid": False, "error": {"errors": ["boom"]}},
+    }
+    app.dependency_overrides = {}
+
+
+def test_main_v2_validate_status_unknown_token() -> None:
     response = client.get("/v2/validate/token/status")
 
-    assert response.status_code == 500
-    assert response.json() == {"error": "Not implemented"}
+    assert response.status_code == 400
+    assert response.json() == {"errors": ["Unknown or expired validation token token"]}
 
 
 def test_main_provision_exception() -> None:
     def mock_provisioner():
-        m = Mock()
+        m = AsyncMock()
         m.provision.side_effect = ValueError("value error")
         return m
 
@@ -231,7 +533,7 @@ def test_main_provision_exception() -> None:
 
 def test_main_unprovision_exception() -> None:
     def mock_provisioner():
-        m = Mock()
+        m = AsyncMock()
         m.unprovision.side_effect = ValueError("value error")
         return m
 
@@ -259,7 +561,7 @@ def test_main_validate_exception() -> None:
 
 def test_main_update_acl_exception() -> None:
     def mock_provisioner():
-        m = Mock()
+        m = AsyncMock()
         m.update_acl.side_effect = ValueError("value error")
         return m
 
@@ -269,3 +571,47 @@ def test_main_update_acl_exception() -> None:
     assert response.status_code == 500
     assert response.json() == {"error": "value error"}
     app.dependency_overrides = {}
+
+
+def test_main_validate_holds_a_slot_of_its_lane() -> None:
+    lane_scheduler = LaneScheduler(SchedulerConfig())
+    held = []
+
+    def validate(*args) -> ValidationResult:
+        held.append(lane_scheduler._lanes[Lane.VALIDATE].running)
+        return ValidationResult(valid=True)
+
+    def mock_provisioner():
+        m = Mock()
+        m.validate.side_effect = validate
+        return m
+
+    app.state.lane_scheduler = lane_scheduler
+    app.dependency_overrides[get_provisioner] = mock_provisioner
+    response = client.post("/v1/validate", json=provision_request)
+
+    assert response.status_code == 200
+    assert held == [1]
+    assert lane_scheduler._lanes[Lane.VALIDATE].running == 0
+    app.dependency_overrides = {}
+    del app.state.lane_scheduler
+
+
+def test_main_health_reports_circuit_breakers() -> None:
+    hasura_circuit_breaker = CircuitBreaker("hasura", CircuitBreakerConfig())
+    role_mapper_circuit_breaker = CircuitBreaker(
+        "rolemapper", CircuitBreakerConfig(failure_threshold=1)
+    )
+    role_mapper_circuit_breaker.record_failure()
+    app.state.hasura_circuit_breaker = hasura_circuit_breaker
+    app.state.role_mapper_circuit_breaker = role_mapper_circuit_breaker
+
+    response = client.get("/v1/health")
+
+    assert response.status_code == 200
+    assert response.json() == {
+        "status": "degraded",
+        "circuit_breakers": {"hasura": "closed", "rolemapper": "open"},
+    }
+    del app.state.hasura_circuit_breaker
+    del app.state.role_mapper_circuit_breaker
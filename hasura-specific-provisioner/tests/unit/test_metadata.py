@@ -0,0 +1,199 @@
+import json
+from typing import List, Tuple
+
+import pytest
+from httpx import AsyncClient, MockTransport, Request, Response
+
+from src.common.model.hasura import (
+    AddSourceResult,
+    CreateSelectPermissionResult,
+    TrackTableResult,
+)
+from src.services.hasura.client import HasuraAdminClient
+from src.services.hasura.metadata import HasuraMetadataCache, MetadataSnapshot
+from tests.unit.test_hasura_client import data_source_config, table_config
+
+role_id = "domain_dp_0_op_role"
+
+exported_metadata: dict = {
+    "version": 3,
+    "sources": [
+        {
+            "name": "domain_dp_0",
+            "kind": "snowflake",
+            "configuration": data_source_config.config,
+            "tables": [
+                {
+                    "table": ["TABLE"],
+                    "configuration": {
+                        "custom_name": "domain_dp_0_op_table",
+                        "custom_root_fields": {
+                            "select": "domain_dp_0_op_select",
+                            "select_by_pk": "domain_dp_0_op_select_by_pk",
+                            "select_aggregate": {"name": "domain_dp_0_op_aggregate"},
+                        },
+                        "comment": "Access to the TABLE table in schema SCHEMA",
+                    },
+                    "select_permissions": [
+                        {"role": role_id, "permission": {"columns": "*", "filter": {}}}
+                    ],
+                }
+            ],
+        }
+    ],
+}
+
+
+class FakeExporter:
+    def __init__(self, resource_version: int = 1, metadata: dict = exported_metadata):
+        self.calls = 0
+        self.resource_version = resource_version
+        self.metadata = metadata
+
+    async def __call__(self) -> Tuple[int, dict]:
+        self.calls += 1
+        return self.resource_version, self.metadata
+
+
+def test_snapshot_finds_identical_resources() -> None:
+    snapshot = MetadataSnapshot(1, exported_metadata)
+    client = HasuraAdminClient(hasura_url="http://hasura", hasura_admin_secret="")
+
+    assert snapshot.has_source(
+        "snowflake",
+        "domain_dp_0",
+        client._make_add_source_request(data_source_config)["args"]["configuration"],
+    )
+    assert snapshot.has_table(
+        "domain_dp_0",
+        ["TABLE"],
+        client._make_track_table_request(table_config)["args"]["configuration"],
+    )
+    assert snapshot.has_select_permission(
+        "domain_dp_0",
+        ["TABLE"],
+        role_id,
+        client._make_create_select_permission_request(table_config, role_id)["args"][
+            "permission"
+        ],
+    )
+
+
+def test_snapshot_detects_differences() -> None:
+    snapshot = MetadataSnapshot(1, exported_metadata)
+
+    assert not snapshot.has_source("snowflake", "domain_dp_0", {"jdbc_url": "other"})
+    assert not snapshot.has_source("pg", "domain_dp_0", data_source_config.config)
+    assert not snapshot.has_source("snowflake", "other", data_source_config.config)
+    assert not snapshot.has_table("domain_dp_0", ["TABLE"], {"custom_name": "other"})
+    assert not snapshot.has_table("domain_dp_0", ["OTHER"], {})
+    assert not snapshot.has_select_permission(
+        "domain_dp_0", ["TABLE"], "other_role", {"columns": "*"}
+    )
+    assert not snapshot.has_select_permission(
+        "domain_dp_0", ["TABLE"], role_id, {"columns": ["col1"]}
+    )
+
+
+def test_snapshot_finds_graphql_name_conflicts() -> None:
+    snapshot = MetadataSnapshot(1, exported_metadata)
+    names = ["domain_dp_0_op_table", "domain_dp_0_op_aggregate", "unused"]
+
+    # the table itself does not conflict with its own names
+    assert snapshot.find_graphql_name_conflicts("domain_dp_0", ["TABLE"], names) == {}
+    assert snapshot.find_graphql_name_conflicts("domain_dp_0", ["OTHER"], names) == {
+        "domain_dp_0_op_table": ("domain_dp_0", ["TABLE"]),
+        "domain_dp_0_op_aggregate": ("domain_dp_0", ["TABLE"]),
+    }
+
+
+@pytest.mark.anyio
+async def test_cache_reuses_fresh_snapshot() -> None:
+    exporter = FakeExporter()
+    cache = HasuraMetadataCache(export_metadata=exporter, max_staleness=60)
+
+    await cache.get()
+    await cache.get()
+
+    assert exporter.calls == 1
+
+
+@pytest.mark.anyio
+async def test_cache_reloads_stale_snapshot() -> None:
+    exporter = FakeExporter()
+    cache = HasuraMetadataCache(export_metadata=exporter, max_staleness=0)
+
+    first = await cache.get()
+    second = await cache.get()
+
+    assert exporter.calls == 2
+    # same resource version, the indexed snapshot is kept
+    assert first is second
+
+
+@pytest.mark.anyio
+async def test_cache_reloads_after_invalidation() -> None:
+    exporter = FakeExporter()
+    cache = HasuraMetadataCache(export_metadata=exporter, max_staleness=60)
+
+    first = await cache.get()
+    cache.invalidate()
+    exporter.resource_version = 2
+    second = await cache.get()
+
+    assert exporter.calls == 2
+    assert first.resource_version == 1
+    assert second.resource_version == 2
+
+
+@pytest.mark.anyio
+async def test_client_skips_writes_already_in_metadata() -> None:
+    requests: List[dict] = []
+
+    def handler(request: Request) -> Response:
+        requests.append(json.loads(request.content))
+        return Response(200, json={"message": "success"})
+
+    cache = HasuraMetadataCache(export_metadata=FakeExporter(), max_staleness=60)
+    client = HasuraAdminClient(
+        hasura_url="http://hasura",
+        hasura_admin_secret="",
+        client=AsyncClient(transport=MockTransport(handler)),
+        metadata_cache=cache,
+    )
+
+    assert await client.add_source(data_source_config) == AddSourceResult.ALREADY_EXISTS
+    assert await client.track_table(table_config) == TrackTableResult.ALREADY_TRACKED
+    assert (
+        await client.create_select_permission(table_config, role_id)
+        == CreateSelectPermissionResult.ALREADY_EXISTS
+    )
+    assert requests == []
+
+
+@pytest.mark.anyio
+async def test_client_writes_missing_resources_and_invalidates_cache() -> None:
+    requests: List[dict] = []
+
+    def handler(request: Request) -> Response:
+        requests.append(json.loads(request.content))
+        return Response(200, json={"message": "success"})
+
+    exporter = FakeExporter()
+    cache = HasuraMetadataCache(export_metadata=exporter, max_staleness=60)
+    client = HasuraAdminClient(
+        hasura_url="http://hasura",
+        hasura_admin_secret="",
+        client=AsyncClient(transport=MockTransport(handler)),
+        metadata_cache=cache,
+    )
+
+    result = await client.create_select_permission(table_config, "another_role")
+
+    assert result == CreateSelectPermissionResult.SUCCESS
+    assert [request["type"] for request in requests] == [
+        "snowflake_create_select_permission"
+    ]
+
+    await cache.get()
+    assert exporter.calls == 2
@@ -1,8 +1,14 @@
-from src.common.parsing.descriptor import parse_yaml_component_descriptor
+from src.common.model.descriptor import HasuraDataProduct
+from src.common.parsing.descriptor import (
+    parse_yaml_component_descriptor,
+    parse_yaml_dataproduct_descriptor,
+    parse_yaml_descriptor,
+)
 from tests.unit.test_descriptors import (
     data_product_ok,
     descriptor_yaml_ok,
     hasura_op_ok,
+    make_dataproduct_descriptor_yaml,
     snowflake_op_ok,
 )
 
@@ -15,3 +21,42 @@ def test_parse_yaml_descriptor() -> None:
     assert data_product == data_product_ok
     assert hasura_op == hasura_op_ok
     assert snowflake_op == snowflake_op_ok
+
+
+def test_parse_yaml_dataproduct_descriptor() -> None:
+    data_product, output_ports = parse_yaml_dataproduct_descriptor(
+        make_dataproduct_descriptor_yaml(["first", "second"])
+    )
+
+    assert data_product.id == data_product_ok.id
+    assert [hasura_op.name for hasura_op, _ in output_ports] == ["first", "second"]
+    assert all(source_op == snowflake_op_ok for _, source_op in output_ports)
+
+
+def test_parse_yaml_dataproduct_descriptor_under_data_product_key() -> None:
+    # a component descriptor also holds the whole data product
+    data_product, output_ports = parse_yaml_dataproduct_descriptor(descriptor_yaml_ok)
+
+    assert data_product == data_product_ok
+    assert output_ports == [(hasura_op_ok, snowflake_op_ok)]
+
+
+def test_parse_yaml_dataproduct_descriptor_without_hasura_output_ports() -> None:
+    _, output_ports = parse_yaml_dataproduct_descriptor(
+        make_dataproduct_descriptor_yaml([])
+    )
+
+    assert output_ports == []
+
+
+def test_parse_yaml_descriptor_of_either_kind() -> None:
+    assert parse_yaml_descriptor(descriptor_yaml_ok) == (
+        data_product_ok,
+        hasura_op_ok,
+        snowflake_op_ok,
+    )
+    hasura_data_product = parse_yaml_descriptor(
+        make_dataproduct_descriptor_yaml(["first"])
+    )
+    assert isinstance(hasura_data_product, HasuraDataProduct)
+    assert [op.name for op, _ in hasura_data_product.output_ports] == ["first"]
@@ -1,12 +1,13 @@
-from unittest.mock import Mock
+import asyncio
+from typing import Any, Callable, Iterable, List, Optional
+from unittest.mock import AsyncMock, Mock
+
+import pytest
 
 from src.common.model.config import ProvisionerConfig, SnowflakeConfig
-from src.common.model.hasura import (
-    AddSourceResult,
-    CreateSelectPermissionResult,
-    TrackTableResult,
-    UntrackTableResult,
-)
+from src.common.model.descriptor import HasuraDataProduct
+from src.common.model.hasura import ClearSourceResult, ResourceState
+from src.common.model.reconciliation import ExecutionPlan, OperationType
 from src.common.model.rolemapping import (
     GroupRoleMappings,
     Role,
@@ -15,12 +16,18 @@ from src.common.model.rolemapping import (
 from src.common.model.rolemapping import (
     ValidationError as RoleMappingValidationError,
 )
-from src.common.parsing.descriptor import parse_yaml_component_descriptor
+from src.common.parsing.descriptor import (
+    parse_yaml_component_descriptor,
+    parse_yaml_dataproduct_descriptor,
+)
 from src.models import ProvisioningStatus, Status1, ValidationError
-from src.services.hasura.provisioner import HasuraProvisioner
+from src.services.hasura.provisioner import HasuraProvisioner, _make_role_id
+from src.services.hasura.reconciler import call_name
+from src.services.latency import LatencyTracker
 from tests.unit.test_descriptors import (
     descriptor_yaml_ok,
     descriptor_yaml_validation_ko,
+    make_dataproduct_descriptor_yaml,
 )
 
 provisioner_config = ProvisionerConfig(
@@ -29,6 +36,49 @@ provisioner_config = ProvisionerConfig(
     )
 )
 
+bulk_provisioner_config = ProvisionerConfig(
+    snowflake_config=provisioner_config.snowflake_config, bulk_metadata=True
+)
+
+
+def make_hasura_admin_client(
+    source_state: ResourceState = ResourceState.MISSING,
+    table_state: ResourceState = ResourceState.MISSING,
+    permission_state: ResourceState = ResourceState.MISSING,
+    failing_operations: Iterable[OperationType] = (),
+) -> Mock:
+    hasura_admin_client = Mock()
+    hasura_admin_client.has_batcher = False
+    hasura_admin_client.get_metadata_snapshot = AsyncMock()
+    hasura_admin_client.get_source_state.return_value = source_state
+    hasura_admin_client.get_table_state.return_value = table_state
+    hasura_admin_client.get_select_permission_state.return_value = permission_state
+
+    async def run_metadata_operations(
+        operations: List[OperationType], *args
+    ) -> List[bool]:
+        return [operation not in failing_operations for operation in operations]
+
+    hasura_admin_client.run_metadata_operations = AsyncMock(
+        side_effect=run_metadata_operations
+    )
+    return hasura_admin_client
+
+
+def make_role_mapper_client(existing_role: Optional[Role] = None) -> AsyncMock:
+    role_mapper_client = AsyncMock()
+    role_mapper_client.get_role.return_value = existing_role
+    role_mapper_client.create_role.return_value = Role(
+        role_id="", component_id="", graphql_root_field_names=[""]
+    )
+    return role_mapper_client
+
+
+def ran_operations(hasura_admin_client: Mock) -> List[List[OperationType]]:
+    return [
+        call.args[0] for call in hasura_admin_client.run_metadata_operations.mock_calls
+    ]
+
 
 def test_provisioner_validate_success() -> None:
     data_product, hasura_op, snowflake_op = parse_yaml_component_descriptor(
@@ -58,42 +108,131 @@ def test_provisioner_validate_fail() -> None:
     assert len(validation_result.error.errors) == 6
 
 
-def test_provisioner_provision_success() -> None:
+@pytest.mark.anyio
+async def test_provisioner_check_preflight_success() -> None:
     data_product, hasura_op, snowflake_op = parse_yaml_component_descriptor(
         descriptor_yaml_ok
     )
-    hasura_admin_client = Mock()
-    hasura_admin_client.add_source.return_value = AddSourceResult.SUCCESS
-    hasura_admin_client.track_table.return_value = TrackTableResult.SUCCESS
-    hasura_admin_client.create_select_permission.return_value = (
-        CreateSelectPermissionResult.SUCCESS
+    hasura_admin_client = make_hasura_admin_client()
+    hasura_admin_client.get_graphql_name_conflicts.return_value = {}
+    provisioner = HasuraProvisioner(
+        hasura_admin_client=hasura_admin_client,
+        provisioner_config=provisioner_config,
+        role_mapper_client=make_role_mapper_client(),
     )
-    role_mapper_client = Mock()
-    role_mapper_client.create_role.return_value = Role(
-        role_id="", component_id="", graphql_root_field_names=[""]
+
+    validation_result = await provisioner.check_preflight(
+        data_product, hasura_op, snowflake_op
+    )
+
+    assert validation_result.valid
+
+
+@pytest.mark.anyio
+async def test_provisioner_check_preflight_name_conflict() -> None:
+    data_product, hasura_op, snowflake_op = parse_yaml_component_descriptor(
+        descriptor_yaml_ok
     )
+    hasura_admin_client = make_hasura_admin_client()
+    hasura_admin_client.get_graphql_name_conflicts.return_value = {
+        hasura_op.specific.select: ("other_source", ["OTHER"])
+    }
+    provisioner = HasuraProvisioner(
+        hasura_admin_client=hasura_admin_client,
+        provisioner_config=provisioner_config,
+        role_mapper_client=make_role_mapper_client(),
+    )
+
+    validation_result = await provisioner.check_preflight(
+        data_product, hasura_op, snowflake_op
+    )
+
+    assert validation_result.valid is False
+    assert isinstance(validation_result.error, ValidationError)
+    assert validation_result.error.errors == [
+        f"The name {hasura_op.specific.select} is already used by table ['OTHER'] "
+        "of source other_source; please choose another one."
+    ]
+
+
+@pytest.mark.anyio
+async def test_provisioner_check_preflight_data_product() -> None:
+    hasura_data_product = parse_yaml_dataproduct_descriptor(
+        make_dataproduct_descriptor_yaml(["first", "second"])
+    )
+    _, [(first_op, _), _] = hasura_data_product
+    hasura_admin_client = make_hasura_admin_client()
+    hasura_admin_client.get_graphql_name_conflicts.side_effect = [
+        {first_op.specific.select: ("other_source", ["OTHER"])},
+        {},
+    ]
+    provisioner = HasuraProvisioner(
+        hasura_admin_client=hasura_admin_client,
+        provisioner_config=provisioner_config,
+        role_mapper_client=make_role_mapper_client(),
+    )
+
+    validation_result = await provisioner.check_preflight_data_product(
+        hasura_data_product
+    )
+
+    # the output ports are checked against a single snapshot of the metadata
+    hasura_admin_client.get_metadata_snapshot.assert_awaited_once()
+    assert validation_result.valid is False
+    assert isinstance(validation_result.error, ValidationError)
+    assert validation_result.error.errors == [
+        f"{first_op.id}: The name {first_op.specific.select} is already used by "
+        "table ['OTHER'] of source other_source; please choose another one."
+    ]
+
+
+@pytest.mark.anyio
+async def test_provisioner_provision_success() -> None:
+    data_product, hasura_op, snowflake_op = parse_yaml_component_descriptor(
+        descriptor_yaml_ok
+    )
+    hasura_admin_client = make_hasura_admin_client()
+    role_mapper_client = make_role_mapper_client()
     provisioner = HasuraProvisioner(
         hasura_admin_client=hasura_admin_client,
         provisioner_config=provisioner_config,
         role_mapper_client=role_mapper_client,
     )
 
-    provisioning_status = provisioner.provision(data_product, hasura_op, snowflake_op)
+    provisioning_status = await provisioner.provision(
+        data_product, hasura_op, snowflake_op
+    )
 
     assert isinstance(provisioning_status, ProvisioningStatus)
     assert provisioning_status.status == Status1.COMPLETED
+    assert ran_operations(hasura_admin_client) == [
+        [OperationType.ADD_SOURCE],
+        [OperationType.TRACK_TABLE],
+        [OperationType.CREATE_SELECT_PERMISSION],
+    ]
+    role_mapper_client.create_role.assert_awaited_once()
 
 
-def test_provisioner_provision_failure_add_source() -> None:
+@pytest.mark.anyio
+async def test_provisioner_provision_up_to_date_makes_no_writes() -> None:
     data_product, hasura_op, snowflake_op = parse_yaml_component_descriptor(
         descriptor_yaml_ok
     )
-    hasura_admin_client = Mock()
-    hasura_admin_client.add_source.return_value = AddSourceResult.FAILURE
-    role_mapper_client = Mock()
-    provisioner_config = ProvisionerConfig(
-        snowflake_config=SnowflakeConfig(
-            host="", user="", password="", role="", warehouse=""
+    hasura_admin_client = make_hasura_admin_client(
+        source_state=ResourceState.UP_TO_DATE,
+        table_state=ResourceState.UP_TO_DATE,
+        permission_state=ResourceState.UP_TO_DATE,
+    )
+    role_mapper_client = make_role_mapper_client(
+        existing_role=Role(
+            role_id=_make_role_id(data_product, hasura_op),
+            component_id=hasura_op.id,
+            graphql_root_field_names=[
+                hasura_op.specific.select,
+                hasura_op.specific.selectByPk,
+                hasura_op.specific.selectAggregate,
+                hasura_op.specific.selectStream,
+            ],
         )
     )
     provisioner = HasuraProvisioner(
@@ -102,40 +241,107 @@ def test_provisioner_provision_failure_add_source() -> None:
         role_mapper_client=role_mapper_client,
     )
 
-    provisioning_status = provisioner.provision(data_product, hasura_op, snowflake_op)
+    provisioning_status = await provisioner.provision(
+        data_product, hasura_op, snowflake_op
+    )
+
+    assert isinstance(provisioning_status, ProvisioningStatus)
+    assert provisioning_status.status == Status1.COMPLETED
+    hasura_admin_client.run_metadata_operations.assert_not_awaited()
+    role_mapper_client.create_role.assert_not_awaited()
+
+
+@pytest.mark.anyio
+async def test_provisioner_provision_updates_outdated_resources() -> None:
+    data_product, hasura_op, snowflake_op = parse_yaml_component_descriptor(
+        descriptor_yaml_ok
+    )
+    hasura_admin_client = make_hasura_admin_client(
+        source_state=ResourceState.OUTDATED,
+        table_state=ResourceState.OUTDATED,
+        permission_state=ResourceState.OUTDATED,
+    )
+    role_mapper_client = make_role_mapper_client()
+    provisioner = HasuraProvisioner(
+        hasura_admin_client=hasura_admin_client,
+        provisioner_config=provisioner_config,
+        role_mapper_client=role_mapper_client,
+    )
+
+    provisioning_status = await provisioner.provision(
+        data_product, hasura_op, snowflake_op
+    )
+
+    assert isinstance(provisioning_status, ProvisioningStatus)
+    assert provisioning_status.status == Status1.COMPLETED
+    assert ran_operations(hasura_admin_client) == [
+        [OperationType.UPDATE_SOURCE],
+        [OperationType.UPDATE_TABLE],
+        [OperationType.DROP_SELECT_PERMISSION],
+        [OperationType.CREATE_SELECT_PERMISSION],
+    ]
+
+
+@pytest.mark.anyio
+async def test_provisioner_provision_failure_add_source() -> None:
+    data_product, hasura_op, snowflake_op = parse_yaml_component_descriptor(
+        descriptor_yaml_ok
+    )
+    hasura_admin_client = make_hasura_admin_client(
+        failing_operations=[OperationType.ADD_SOURCE]
+    )
+    role_mapper_client = make_role_mapper_client()
+    provisioner = HasuraProvisioner(
+        hasura_admin_client=hasura_admin_client,
+        provisioner_config=provisioner_config,
+        role_mapper_client=role_mapper_client,
+    )
+
+    provisioning_status = await provisioner.provision(
+        data_product, hasura_op, snowflake_op
+    )
 
     assert isinstance(provisioning_status, ProvisioningStatus)
     assert provisioning_status.status == Status1.FAILED
+    assert "add data source" in provisioning_status.result
+    assert ran_operations(hasura_admin_client) == [[OperationType.ADD_SOURCE]]
 
 
-def test_provisioner_provision_failure_track_table() -> None:
+@pytest.mark.anyio
+async def test_provisioner_provision_failure_track_table() -> None:
     data_product, hasura_op, snowflake_op = parse_yaml_component_descriptor(
         descriptor_yaml_ok
     )
-    hasura_admin_client = Mock()
-    hasura_admin_client.add_source.return_value = AddSourceResult.SUCCESS
-    hasura_admin_client.track_table.return_value = TrackTableResult.FAILURE
-    role_mapper_client = Mock()
+    hasura_admin_client = make_hasura_admin_client(
+        source_state=ResourceState.UP_TO_DATE,
+        failing_operations=[OperationType.TRACK_TABLE],
+    )
+    role_mapper_client = make_role_mapper_client()
     provisioner = HasuraProvisioner(
         hasura_admin_client=hasura_admin_client,
         provisioner_config=provisioner_config,
         role_mapper_client=role_mapper_client,
     )
 
-    provisioning_status = provisioner.provision(data_product, hasura_op, snowflake_op)
+    provisioning_status = await provisioner.provision(
+        data_product, hasura_op, snowflake_op
+    )
 
     assert isinstance(provisioning_status, ProvisioningStatus)
     assert provisioning_status.status == Status1.FAILED
+    assert "track table" in provisioning_status.result
+    # the role does not depend on the table and is created concurrently
+    role_mapper_client.create_role.assert_awaited_once()
+    assert ran_operations(hasura_admin_client) == [[OperationType.TRACK_TABLE]]
 
 
-def test_provisioner_provision_failure_create_role() -> None:
+@pytest.mark.anyio
+async def test_provisioner_provision_failure_create_role() -> None:
     data_product, hasura_op, snowflake_op = parse_yaml_component_descriptor(
         descriptor_yaml_ok
     )
-    hasura_admin_client = Mock()
-    hasura_admin_client.add_source.return_value = AddSourceResult.SUCCESS
-    hasura_admin_client.track_table.return_value = TrackTableResult.SUCCESS
-    role_mapper_client = Mock()
+    hasura_admin_client = make_hasura_admin_client()
+    role_mapper_client = make_role_mapper_client()
     role_mapper_client.create_role.return_value = RoleMappingValidationError(
         errors=[""]
     )
@@ -145,82 +351,117 @@ def test_provisioner_provision_failure_create_role() -> None:
         role_mapper_client=role_mapper_client,
     )
 
-    provisioning_status = provisioner.provision(data_product, hasura_op, snowflake_op)
+    provisioning_status = await provisioner.provision(
+        data_product, hasura_op, snowflake_op
+    )
 
     assert isinstance(provisioning_status, ProvisioningStatus)
     assert provisioning_status.status == Status1.FAILED
+    assert "create role" in provisioning_status.result
+    assert [OperationType.CREATE_SELECT_PERMISSION] not in ran_operations(
+        hasura_admin_client
+    )
 
 
-def test_provisioner_provision_failure_select_permission() -> None:
+@pytest.mark.anyio
+async def test_provisioner_provision_failure_select_permission() -> None:
     data_product, hasura_op, snowflake_op = parse_yaml_component_descriptor(
         descriptor_yaml_ok
     )
-    hasura_admin_client = Mock()
-    hasura_admin_client.add_source.return_value = AddSourceResult.SUCCESS
-    hasura_admin_client.track_table.return_value = TrackTableResult.SUCCESS
-    hasura_admin_client.create_select_permission.return_value = (
-        CreateSelectPermissionResult.FAILURE
-    )
-    role_mapper_client = Mock()
-    role_mapper_client.create_role.return_value = Role(
-        role_id="", component_id="", graphql_root_field_names=[""]
+    hasura_admin_client = make_hasura_admin_client(
+        failing_operations=[OperationType.CREATE_SELECT_PERMISSION]
     )
+    role_mapper_client = make_role_mapper_client()
     provisioner = HasuraProvisioner(
         hasura_admin_client=hasura_admin_client,
         provisioner_config=provisioner_config,
         role_mapper_client=role_mapper_client,
     )
 
-    provisioning_status = provisioner.provision(data_product, hasura_op, snowflake_op)
+    provisioning_status = await provisioner.provision(
+        data_product, hasura_op, snowflake_op
+    )
 
     assert isinstance(provisioning_status, ProvisioningStatus)
     assert provisioning_status.status == Status1.FAILED
+    assert "create permissions" in provisioning_status.result
 
 
-def test_provisioner_unprovision_success() -> None:
+@pytest.mark.anyio
+async def test_provisioner_unprovision_success() -> None:
     data_product, hasura_op, snowflake_op = parse_yaml_component_descriptor(
         descriptor_yaml_ok
     )
-    hasura_admin_client = Mock()
-    hasura_admin_client.untrack_table.return_value = UntrackTableResult.SUCCESS
-    role_mapper_client = Mock()
+    hasura_admin_client = make_hasura_admin_client(table_state=ResourceState.UP_TO_DATE)
+    role_mapper_client = make_role_mapper_client()
     provisioner = HasuraProvisioner(
         hasura_admin_client=hasura_admin_client,
         provisioner_config=provisioner_config,
         role_mapper_client=role_mapper_client,
     )
 
-    provisioning_status = provisioner.unprovision(data_product, hasura_op, snowflake_op)
+    provisioning_status = await provisioner.unprovision(
+        data_product, hasura_op, snowflake_op
+    )
 
     assert isinstance(provisioning_status, ProvisioningStatus)
     assert provisioning_status.status == Status1.COMPLETED
+    assert ran_operations(hasura_admin_client) == [[OperationType.UNTRACK_TABLE]]
 
 
-def test_provisioner_unprovision_failure_untrack_table() -> None:
+@pytest.mark.anyio
+async def test_provisioner_unprovision_untracked_table_makes_no_writes() -> None:
     data_product, hasura_op, snowflake_op = parse_yaml_component_descriptor(
         descriptor_yaml_ok
     )
-    hasura_admin_client = Mock()
-    hasura_admin_client.untrack_table.return_value = UntrackTableResult.FAILURE
-    role_mapper_client = Mock()
+    hasura_admin_client = make_hasura_admin_client(table_state=ResourceState.MISSING)
+    role_mapper_client = make_role_mapper_client()
     provisioner = HasuraProvisioner(
         hasura_admin_client=hasura_admin_client,
         provisioner_config=provisioner_config,
         role_mapper_client=role_mapper_client,
     )
 
-    provisioning_status = provisioner.unprovision(data_product, hasura_op, snowflake_op)
+    provisioning_status = await provisioner.unprovision(
+        data_product, hasura_op, snowflake_op
+    )
+
+    assert isinstance(provisioning_status, ProvisioningStatus)
+    assert provisioning_status.status == Status1.COMPLETED
+    hasura_admin_client.run_metadata_operations.assert_not_awaited()
+
+
+@pytest.mark.anyio
+async def test_provisioner_unprovision_failure_untrack_table() -> None:
+    data_product, hasura_op, snowflake_op = parse_yaml_component_descriptor(
+        descriptor_yaml_ok
+    )
+    hasura_admin_client = make_hasura_admin_client(
+        table_state=ResourceState.UP_TO_DATE,
+        failing_operations=[OperationType.UNTRACK_TABLE],
+    )
+    role_mapper_client = make_role_mapper_client()
+    provisioner = HasuraProvisioner(
+        hasura_admin_client=hasura_admin_client,
+        provisioner_config=provisioner_config,
+        role_mapper_client=role_mapper_client,
+    )
+
+    provisioning_status = await provisioner.unprovision(
+        data_product, hasura_op, snowflake_op
+    )
 
     assert isinstance(provisioning_status, ProvisioningStatus)
     assert provisioning_status.status == Status1.FAILED
 
 
-def test_provisioner_update_acl_success() -> None:
+@pytest.mark.anyio
+async def test_provisioner_update_acl_success() -> None:
     data_product, hasura_op, snowflake_op = parse_yaml_component_descriptor(
         descriptor_yaml_ok
     )
-    hasura_admin_client = Mock()
-    role_mapper_client = Mock()
+    hasura_admin_client = AsyncMock()
+    role_mapper_client = AsyncMock()
     role_mapper_client.update_user_role_mappings.return_value = UserRoleMappings(
         role_id="", users=[""]
     )
@@ -233,7 +474,7 @@ def test_provisioner_update_acl_success() -> None:
         role_mapper_client=role_mapper_client,
     )
 
-    provisioning_status = provisioner.update_acl(
+    provisioning_status = await provisioner.update_acl(
         data_product, hasura_op, snowflake_op, ["user"]
     )
 
@@ -241,12 +482,13 @@ def test_provisioner_update_acl_success() -> None:
     assert provisioning_status.status == Status1.COMPLETED
 
 
-def test_provisioner_update_acl_failure_update_user_role_mappings() -> None:
+@pytest.mark.anyio
+async def test_provisioner_update_acl_failure_update_user_role_mappings() -> None:
     data_product, hasura_op, snowflake_op = parse_yaml_component_descriptor(
         descriptor_yaml_ok
     )
-    hasura_admin_client = Mock()
-    role_mapper_client = Mock()
+    hasura_admin_client = AsyncMock()
+    role_mapper_client = AsyncMock()
     role_mapper_client.update_user_role_mappings.return_value = (
         RoleMappingValidationError(errors=[""])
     )
@@ -256,20 +498,23 @@ def test_provisioner_update_acl_failure_update_user_role_mappings() -> None:
         role_mapper_client=role_mapper_client,
     )
 
-    provisioning_status = provisioner.update_acl(
+    provisioning_status = await provisioner.update_acl(
         data_product, hasura_op, snowflake_op, ["user"]
     )
 
     assert isinstance(provisioning_status, ProvisioningStatus)
     assert provisioning_status.status == Status1.FAILED
+    # the group mappings are updated concurrently with the user ones
+    role_mapper_client.update_group_role_mappings.assert_awaited_once()
 
 
-def test_provisioner_update_acl_failure_update_group_role_mappings() -> None:
+@pytest.mark.anyio
+async def test_provisioner_update_acl_failure_update_group_role_mappings() -> None:
     data_product, hasura_op, snowflake_op = parse_yaml_component_descriptor(
         descriptor_yaml_ok
     )
-    hasura_admin_client = Mock()
-    role_mapper_client = Mock()
+    hasura_admin_client = AsyncMock()
+    role_mapper_client = AsyncMock()
     role_mapper_client.update_user_role_mappings.return_value = UserRoleMappings(
         role_id="", users=[""]
     )
@@ -282,9 +527,394 @@ def test_provisioner_update_acl_failure_update_group_role_mappings() -> None:
         role_mapper_client=role_mapper_client,
     )
 
-    provisioning_status = provisioner.update_acl(
+    provisioning_status = await provisioner.update_acl(
         data_product, hasura_op, snowflake_op, ["user"]
     )
 
     assert isinstance(provisioning_status, ProvisioningStatus)
     assert provisioning_status.status == Status1.FAILED
+
+
+@pytest.mark.anyio
+async def test_provisioner_provision_bulk_success() -> None:
+    data_product, hasura_op, snowflake_op = parse_yaml_component_descriptor(
+        descriptor_yaml_ok
+    )
+    hasura_admin_client = make_hasura_admin_client(
+        source_state=ResourceState.UP_TO_DATE
+    )
+    role_mapper_client = make_role_mapper_client()
+    provisioner = HasuraProvisioner(
+        hasura_admin_client=hasura_admin_client,
+        provisioner_config=bulk_provisioner_config,
+        role_mapper_client=role_mapper_client,
+    )
+
+    provisioning_status = await provisioner.provision(
+        data_product, hasura_op, snowflake_op
+    )
+
+    assert isinstance(provisioning_status, ProvisioningStatus)
+    assert provisioning_status.status == Status1.COMPLETED
+    role_mapper_client.create_role.assert_awaited_once()
+    # the role is created first, so that the metadata is written with one request
+    assert ran_operations(hasura_admin_client) == [
+        [OperationType.TRACK_TABLE, OperationType.CREATE_SELECT_PERMISSION]
+    ]
+
+
+@pytest.mark.anyio
+async def test_provisioner_provision_bulk_failure_track_table() -> None:
+    data_product, hasura_op, snowflake_op = parse_yaml_component_descriptor(
+        descriptor_yaml_ok
+    )
+    hasura_admin_client = make_hasura_admin_client(
+        failing_operations=[
+            OperationType.TRACK_TABLE,
+            OperationType.CREATE_SELECT_PERMISSION,
+        ]
+    )
+    role_mapper_client = make_role_mapper_client()
+    provisioner = HasuraProvisioner(
+        hasura_admin_client=hasura_admin_client,
+        provisioner_config=bulk_provisioner_config,
+        role_mapper_client=role_mapper_client,
+    )
+
+    provisioning_status = await provisioner.provision(
+        data_product, hasura_op, snowflake_op
+    )
+
+    assert isinstance(provisioning_status, ProvisioningStatus)
+    assert provisioning_status.status == Status1.FAILED
+    assert "track table" in provisioning_status.result
+
+
+@pytest.mark.anyio
+async def test_provisioner_provision_bulk_failure_create_role() -> None:
+    data_product, hasura_op, snowflake_op = parse_yaml_component_descriptor(
+        descriptor_yaml_ok
+    )
+    hasura_admin_client = make_hasura_admin_client()
+    role_mapper_client = make_role_mapper_client()
+    role_mapper_client.create_role.return_value = RoleMappingValidationError(
+        errors=[""]
+    )
+    provisioner = HasuraProvisioner(
+        hasura_admin_client=hasura_admin_client,
+        provisioner_config=bulk_provisioner_config,
+        role_mapper_client=role_mapper_client,
+    )
+
+    provisioning_status = await provisioner.provision(
+        data_product, hasura_op, snowflake_op
+    )
+
+    assert isinstance(provisioning_status, ProvisioningStatus)
+    assert provisioning_status.status == Status1.FAILED
+    hasura_admin_client.run_metadata_operations.assert_not_awaited()
+
+
+@pytest.mark.anyio
+async def test_provisioner_provision_data_product_success() -> None:
+    hasura_data_product = parse_yaml_dataproduct_descriptor(
+        make_dataproduct_descriptor_yaml(["first", "second", "third"])
+    )
+    hasura_admin_client = make_hasura_admin_client()
+    role_mapper_client = make_role_mapper_client()
+    running = {"metadata": 0, "role": 0}
+    max_running = {"metadata": 0, "role": 0}
+
+    def track_running(kind: str, result: Callable[[], Any]):
+        async def run(*args) -> Any:
+            running[kind] += 1
+            max_running[kind] = max(max_running[kind], running[kind])
+            await asyncio.sleep(0.01)
+            running[kind] -= 1
+            return result()
+
+        return run
+
+    hasura_admin_client.run_metadata_operations.side_effect = track_running(
+        "metadata", lambda: [True]
+    )
+    role_mapper_client.create_role.side_effect = track_running(
+        "role", lambda: role_mapper_client.create_role.return_value
+    )
+    provisioner = HasuraProvisioner(
+        hasura_admin_client=hasura_admin_client,
+        provisioner_config=provisioner_config.copy(
+            update={"data_product_max_concurrency": 2}
+        ),
+        role_mapper_client=role_mapper_client,
+    )
+
+    provisioning_status = await provisioner.provision_data_product(hasura_data_product)
+
+    assert isinstance(provisioning_status, ProvisioningStatus)
+    assert provisioning_status.status == Status1.COMPLETED
+    assert provisioning_status.result == "Provisioning completed for 3 output ports"
+    assert provisioning_status.info is not None
+    assert list(provisioning_status.info.privateInfo["components"]) == [
+        hasura_op.id for hasura_op, _ in hasura_data_product.output_ports
+    ]
+    # the shared source is added once, before the output ports
+    operations = ran_operations(hasura_admin_client)
+    assert operations[0] == [OperationType.ADD_SOURCE]
+    assert sorted(operations[1:]) == sorted(
+        [[OperationType.TRACK_TABLE], [OperationType.CREATE_SELECT_PERMISSION]] * 3
+    )
+    # the roles are created concurrently, the writes to the shared source are not
+    assert max_running == {"metadata": 1, "role": 2}
+
+
+@pytest.mark.anyio
+async def test_provisioner_provision_data_product_partial_failure() -> None:
+    hasura_data_product = parse_yaml_dataproduct_descriptor(
+        make_dataproduct_descriptor_yaml(["first", "second"])
+    )
+    failing_id = hasura_data_product.output_ports[1][0].id
+    role_mapper_client = make_role_mapper_client()
+
+    async def create_role(role: Role) -> object:
+        if role.component_id == failing_id:
+            return RoleMappingValidationError(errors=[""])
+        return role
+
+    role_mapper_client.create_role.side_effect = create_role
+    provisioner = HasuraProvisioner(
+        hasura_admin_client=make_hasura_admin_client(
+            source_state=ResourceState.UP_TO_DATE
+        ),
+        provisioner_config=provisioner_config,
+        role_mapper_client=role_mapper_client,
+    )
+
+    provisioning_status = await provisioner.provision_data_product(hasura_data_product)
+
+    assert isinstance(provisioning_status, ProvisioningStatus)
+    assert provisioning_status.status == Status1.FAILED
+    assert provisioning_status.result.startswith(
+        f"Provisioning failed for 1 of 2 output ports: {failing_id}: "
+        "Unable to create role"
+    )
+    assert provisioning_status.info is not None
+    components = provisioning_status.info.privateInfo["components"]
+    assert components[hasura_data_product.output_ports[0][0].id]["status"] == (
+        "COMPLETED"
+    )
+    assert components[failing_id]["status"] == "FAILED"
+
+
+@pytest.mark.anyio
+async def test_provisioner_provision_data_product_validation_error() -> None:
+    hasura_data_product = parse_yaml_dataproduct_descriptor(
+        descriptor_yaml_validation_ko
+    )
+    hasura_admin_client = make_hasura_admin_client()
+    provisioner = HasuraProvisioner(
+        hasura_admin_client=hasura_admin_client,
+        provisioner_config=provisioner_config,
+        role_mapper_client=make_role_mapper_client(),
+    )
+
+    provisioning_status = await provisioner.provision_data_product(hasura_data_product)
+
+    assert isinstance(provisioning_status, ValidationError)
+    hasura_op_id = hasura_data_product.output_ports[0][0].id
+    assert all(
+        error.startswith(f"{hasura_op_id}: ") for error in provisioning_status.errors
+    )
+    hasura_admin_client.run_metadata_operations.assert_not_awaited()
+
+
+@pytest.mark.anyio
+async def test_provisioner_provision_data_product_rejects_different_schemas() -> None:
+    data_product, output_ports = parse_yaml_dataproduct_descriptor(
+        make_dataproduct_descriptor_yaml(["first", "second"])
+    )
+    hasura_op, source_op = output_ports[1]
+    other_source_op = source_op.copy(
+        update={"specific": {**source_op.specific, "schema": "OTHER_SCHEMA"}}
+    )
+    hasura_admin_client = make_hasura_admin_client()
+    provisioner = HasuraProvisioner(
+        hasura_admin_client=hasura_admin_client,
+        provisioner_config=provisioner_config,
+        role_mapper_client=make_role_mapper_client(),
+    )
+
+    provisioning_status = await provisioner.provision_data_product(
+        HasuraDataProduct(data_product, [output_ports[0], (hasura_op, other_source_op)])
+    )
+
+    assert isinstance(provisioning_status, ValidationError)
+    assert len(provisioning_status.errors) == 1
+    assert "same database and schema" in provisioning_status.errors[0]
+    hasura_admin_client.run_metadata_operations.assert_not_awaited()
+
+
+@pytest.mark.anyio
+async def test_provisioner_unprovision_data_product_success() -> None:
+    hasura_data_product = parse_yaml_dataproduct_descriptor(
+        make_dataproduct_descriptor_yaml(["first", "second"])
+    )
+    hasura_admin_client = make_hasura_admin_client()
+    hasura_admin_client.clear_source = AsyncMock(
+        return_value=(ClearSourceResult.SUCCESS, 3)
+    )
+    provisioner = HasuraProvisioner(
+        hasura_admin_client=hasura_admin_client,
+        provisioner_config=provisioner_config.copy(
+            update={"drop_source_on_unprovision": True}
+        ),
+        role_mapper_client=make_role_mapper_client(),
+    )
+
+    provisioning_status = await provisioner.unprovision_data_product(
+        hasura_data_product
+    )
+
+    assert isinstance(provisioning_status, ProvisioningStatus)
+    assert provisioning_status.status == Status1.COMPLETED
+    assert provisioning_status.result == "Unprovisioning completed, 3 tables untracked"
+    clear_source_call = hasura_admin_client.clear_source.await_args
+    assert clear_source_call is not None
+    (data_source_config,) = clear_source_call.args
+    assert data_source_config.data_source_name == "healthcare_vaccinations_0"
+    assert clear_source_call.kwargs == {"drop_source": True}
+    # no table by table writes
+    hasura_admin_client.run_metadata_operations.assert_not_awaited()
+
+
+@pytest.mark.anyio
+async def test_provisioner_unprovision_data_product_failure() -> None:
+    hasura_data_product = parse_yaml_dataproduct_descriptor(
+        make_dataproduct_descriptor_yaml([])
+    )
+    hasura_admin_client = make_hasura_admin_client()
+    hasura_admin_client.clear_source = AsyncMock(
+        return_value=(ClearSourceResult.FAILURE, 0)
+    )
+    provisioner = HasuraProvisioner(
+        hasura_admin_client=hasura_admin_client,
+        provisioner_config=provisioner_config,
+        role_mapper_client=make_role_mapper_client(),
+    )
+
+    provisioning_status = await provisioner.unprovision_data_product(
+        hasura_data_product
+    )
+
+    assert isinstance(provisioning_status, ProvisioningStatus)
+    assert provisioning_status.status == Status1.FAILED
+
+
+@pytest.mark.anyio
+async def test_provisioner_plan_provision_skips_up_to_date_resources() -> None:
+    data_product, hasura_op, snowflake_op = parse_yaml_component_descriptor(
+        descriptor_yaml_ok
+    )
+    hasura_admin_client = make_hasura_admin_client(
+        source_state=ResourceState.UP_TO_DATE, table_state=ResourceState.UP_TO_DATE
+    )
+    role_mapper_client = make_role_mapper_client()
+    provisioner = HasuraProvisioner(
+        hasura_admin_client=hasura_admin_client,
+        provisioner_config=provisioner_config,
+        role_mapper_client=role_mapper_client,
+    )
+
+    plan = await provisioner.plan_provision(data_product, hasura_op, snowflake_op)
+
+    assert isinstance(plan, ExecutionPlan)
+    assert [(call.operations, call.skipped) for call in plan.calls] == [
+        (["get_role"], False),
+        ([OperationType.CREATE_ROLE], False),
+        ([OperationType.CREATE_SELECT_PERMISSION], False),
+        ([OperationType.ADD_SOURCE], True),
+        ([OperationType.TRACK_TABLE], True),
+    ]
+    assert plan.schema_reloads == 1
+    hasura_admin_client.run_metadata_operations.assert_not_called()
+    role_mapper_client.create_role.assert_not_called()
+
+
+@pytest.mark.anyio
+async def test_provisioner_plan_provision_bulk_reloads_once_per_request() -> None:
+    data_product, hasura_op, snowflake_op = parse_yaml_component_descriptor(
+        descriptor_yaml_ok
+    )
+    provisioner = HasuraProvisioner(
+        hasura_admin_client=make_hasura_admin_client(),
+        provisioner_config=bulk_provisioner_config,
+        role_mapper_client=make_role_mapper_client(),
+    )
+
+    plan = await provisioner.plan_provision(data_product, hasura_op, snowflake_op)
+
+    assert isinstance(plan, ExecutionPlan)
+    assert [
+        OperationType.ADD_SOURCE,
+        OperationType.TRACK_TABLE,
+        OperationType.CREATE_SELECT_PERMISSION,
+    ] in [call.operations for call in plan.calls]
+    assert plan.schema_reloads == 1
+
+
+@pytest.mark.anyio
+async def test_provisioner_plan_estimates_latency_from_previous_calls() -> None:
+    data_product, hasura_op, snowflake_op = parse_yaml_component_descriptor(
+        descriptor_yaml_ok
+    )
+    latency_tracker = LatencyTracker()
+    latency_tracker.record(OperationType.TRACK_TABLE, 0.5)
+    latency_tracker.record(OperationType.CREATE_SELECT_PERMISSION, 0.25)
+    provisioner = HasuraProvisioner(
+        hasura_admin_client=make_hasura_admin_client(
+            source_state=ResourceState.UP_TO_DATE
+        ),
+        provisioner_config=provisioner_config,
+        role_mapper_client=make_role_mapper_client(),
+        latency_tracker=latency_tracker,
+    )
+
+    plan = await provisioner.plan_provision(data_product, hasura_op, snowflake_op)
+
+    assert isinstance(plan, ExecutionPlan)
+    estimates = {
+        call_name(call.operations): call.estimated_latency for call in plan.calls
+    }
+    assert estimates[OperationType.TRACK_TABLE] == 0.5
+    # the role was never created yet, so its duration is unknown
+    assert estimates[OperationType.CREATE_ROLE] is None
+    # the role read by the plan itself is measured as well
+    assert plan.estimated_latency == pytest.approx(0.75, abs=0.1)
+
+
+@pytest.mark.anyio
+async def test_provisioner_provision_records_call_latencies() -> None:
+    data_product, hasura_op, snowflake_op = parse_yaml_component_descriptor(
+        descriptor_yaml_ok
+    )
+    latency_tracker = LatencyTracker()
+    provisioner = HasuraProvisioner(
+        hasura_admin_client=make_hasura_admin_client(),
+        provisioner_config=provisioner_config,
+        role_mapper_client=make_role_mapper_client(),
+        latency_tracker=latency_tracker,
+    )
+
+    await provisioner.provision(data_product, hasura_op, snowflake_op)
+
+    for operation in ("get_role", *OperationType.__members__.values()):
+        if operation in (
+            OperationType.UPDATE_SOURCE,
+            OperationType.UPDATE_TABLE,
+            OperationType.DROP_SELECT_PERMISSION,
+            OperationType.UNTRACK_TABLE,
+            OperationType.DROP_SOURCE,
+        ):
+            assert latency_tracker.estimate(operation) is None
+        else:
+            assert latency_tracker.estimate(operation) is not None
@@ -0,0 +1,382 @@
+import asyncio
+import copy
+import json
+from typing import Callable, List, Optional
+
+import pytest
+from httpx import AsyncClient, MockTransport, Request, Response
+
+from src.common.model.reconciliation import DesiredState, OperationType
+from src.common.model.rolemapping import Role
+from src.services.hasura.batcher import MetadataBatcher
+from src.services.hasura.client import HasuraAdminClient
+from src.services.hasura.metadata import MetadataSnapshot
+from src.services.hasura.reconciler import HasuraReconciler
+from src.services.hasura.registry import SourceRegistry
+from src.services.keyedlock import KeyedLockScheduler
+from src.services.rolemapper import RoleMapperClient
+from tests.unit.test_hasura_client import data_source_config, make_client, table_config
+from tests.unit.test_metadata import exported_metadata, role_id
+
+role = Role(
+    role_id=role_id,
+    component_id="urn:dmb:cmp:domain:dp:0:op",
+    graphql_root_field_names=[
+        table_config.select_root_field_name,
+        table_config.select_by_pk_root_field_name,
+        table_config.select_aggregate_root_field_name,
+        table_config.select_stream_root_field_name,
+    ],
+)
+
+desired_state = DesiredState(
+    data_source_config=data_source_config, table_config=table_config, role=role
+)
+
+
+class FakeHasura:
+    def __init__(self, metadata: dict):
+        self.metadata = metadata
+        self.writes: List[str] = []
+        self.exports = 0
+
+    def __call__(self, request: Request) -> Response:
+        body = json.loads(request.content)
+        if body["type"] == "export_metadata":
+            self.exports += 1
+            return Response(
+                200, json={"resource_version": 1, "metadata": self.metadata}
+            )
+        if body["type"] == "bulk_keep_going":
+            self.writes.extend(arg["type"] for arg in body["args"])
+            return Response(200, json=[{"message": "success"}] * len(body["args"]))
+        self.writes.append(body["type"])
+        return Response(200, json={"message": "success"})
+
+
+class FakeRoleMapper:
+    def __init__(self, existing_role: Optional[Role]):
+        self.existing_role = existing_role
+        self.upserted: List[dict] = []
+        self.reads = 0
+
+    def __call__(self, request: Request) -> Response:
+        if request.method == "GET":
+            self.reads += 1
+            if self.existing_role is None:
+                return Response(404)
+            return Response(200, json=self.existing_role.dict())
+        self.upserted.append(json.loads(request.content))
+        return Response(200, json=json.loads(request.content))
+
+
+def make_reconciler(
+    hasura: Callable[[Request], Response],
+    role_mapper: FakeRoleMapper,
+    bulk_metadata: bool = False,
+    source_registry: Optional[SourceRegistry] = None,
+    inspect_state: bool = True,
+) -> HasuraReconciler:
+    return HasuraReconciler(
+        hasura_admin_client=HasuraAdminClient(
+            hasura_url="http://hasura",
+            hasura_admin_secret="secret",
+            client=AsyncClient(transport=MockTransport(hasura)),
+            source_registry=source_registry,
+        ),
+        role_mapper_client=RoleMapperClient(
+            role_mapper_url="http://rolemapper",
+            client=AsyncClient(transport=MockTransport(role_mapper)),
+        ),
+        bulk_metadata=bulk_metadata,
+        drop_unused_sources=source_registry is not None,
+        inspect_state=inspect_state,
+    )
+
+
+@pytest.mark.anyio
+async def test_reconciler_makes_no_writes_when_up_to_date() -> None:
+    hasura = FakeHasura(exported_metadata)
+    role_mapper = FakeRoleMapper(role)
+    reconciler = make_reconciler(hasura, role_mapper)
+
+    operations = await reconciler.plan_provision(desired_state)
+    failed_operation = await reconciler.apply(desired_state, operations)
+
+    assert operations == []
+    assert failed_operation is None
+    assert hasura.writes == []
+    assert role_mapper.upserted == []
+
+
+@pytest.mark.anyio
+async def test_reconciler_provisions_everything_in_dependency_order() -> None:
+    hasura = FakeHasura({"version": 3, "sources": []})
+    role_mapper = FakeRoleMapper(None)
+    reconciler = make_reconciler(hasura, role_mapper)
+
+    operations = await reconciler.plan_provision(desired_state)
+    failed_operation = await reconciler.apply(desired_state, operations)
+
+    assert operations == [
+        OperationType.ADD_SOURCE,
+        OperationType.TRACK_TABLE,
+        OperationType.CREATE_ROLE,
+        OperationType.CREATE_SELECT_PERMISSION,
+    ]
+    assert failed_operation is None
+    assert hasura.writes == [
+        "snowflake_add_source",
+        "snowflake_track_table",
+        "snowflake_create_select_permission",
+    ]
+    assert len(role_mapper.upserted) == 1
+
+
+@pytest.mark.anyio
+async def test_reconciler_writes_directly_without_inspecting_the_state() -> None:
+    hasura = FakeHasura(exported_metadata)
+    role_mapper = FakeRoleMapper(role)
+    reconciler = make_reconciler(hasura, role_mapper, inspect_state=False)
+
+    operations = await reconciler.plan_provision(desired_state)
+    failed_operation = await reconciler.apply(desired_state, operations)
+
+    assert operations == [
+        OperationType.ADD_SOURCE,
+        OperationType.TRACK_TABLE,
+        OperationType.CREATE_ROLE,
+        OperationType.CREATE_SELECT_PERMISSION,
+    ]
+    assert failed_operation is None
+    assert hasura.exports == 0
+    assert role_mapper.reads == 0
+    assert len(hasura.writes) == 3
+
+
+@pytest.mark.anyio
+async def test_reconciler_without_inspecting_accepts_existing_resources() -> None:
+    def hasura(request: Request) -> Response:
+        body = json.loads(request.content)
+        if body["type"] == "snowflake_track_table":
+            return Response(400, json={"code": "already-tracked", "error": ""})
+        return Response(400, json={"code": "already-exists", "error": ""})
+
+    reconciler = make_reconciler(hasura, FakeRoleMapper(role), inspect_state=False)
+
+    operations = await reconciler.plan_provision(desired_state)
+
+    assert await reconciler.apply(desired_state, operations) is None
+
+
+@pytest.mark.anyio
+async def test_reconciler_unprovisions_without_inspecting_the_state() -> None:
+    hasura = FakeHasura(exported_metadata)
+    registry = SourceRegistry()
+    registry.sync(MetadataSnapshot(1, exported_metadata))
+    reconciler = make_reconciler(
+        hasura, FakeRoleMapper(role), source_registry=registry, inspect_state=False
+    )
+
+    operations = await reconciler.plan_unprovision(desired_state)
+    failed_operation = await reconciler.apply(desired_state, operations)
+
+    assert operations == [OperationType.UNTRACK_TABLE, OperationType.DROP_SOURCE]
+    assert failed_operation is None
+    assert hasura.exports == 0
+    assert hasura.writes == ["snowflake_untrack_table", "snowflake_drop_source"]
+
+
+@pytest.mark.anyio
+async def test_reconciler_batches_concurrent_writes_to_the_same_source() -> None:
+    hasura = FakeHasura(exported_metadata)
+    bulk_requests = 0
+
+    def counting_hasura(request: Request) -> Response:
+        nonlocal bulk_requests
+        if json.loads(request.content)["type"] == "bulk_keep_going":
+            bulk_requests += 1
+        return hasura(request)
+
+    # the batcher sends the writes with a client of its own, as in production
+    batcher = MetadataBatcher(
+        send_bulk=make_client(counting_hasura).bulk_keep_going,
+        window=0.05,
+        max_batch_size=100,
+    )
+    reconciler = HasuraReconciler(
+        hasura_admin_client=HasuraAdminClient(
+            hasura_url="http://hasura",
+            hasura_admin_secret="secret",
+            client=AsyncClient(transport=MockTransport(counting_hasura)),
+            batcher=batcher,
+        ),
+        role_mapper_client=RoleMapperClient(
+            role_mapper_url="http://rolemapper",
+            client=AsyncClient(transport=MockTransport(FakeRoleMapper(role))),
+        ),
+        lock_scheduler=KeyedLockScheduler(),
+    )
+    desired_states = [
+        desired_state.copy(
+            update={
+                "table_config": table_config.copy(
+                    update={"custom_table_name": f"table_{i}"}
+                )
+            }
+        )
+        for i in range(10)
+    ]
+
+    failed_operations = await asyncio.gather(
+        *[
+            reconciler.apply(state, [OperationType.TRACK_TABLE])
+            for state in desired_states
+        ]
+    )
+
+    assert failed_operations == [None] * 10
+    assert hasura.writes == ["snowflake_track_table"] * 10
+    assert bulk_requests == 1
+
+
+@pytest.mark.anyio
+async def test_reconciler_only_redoes_missing_steps() -> None:
+    # a previous run stopped after tracking the table
+    metadata = copy.deepcopy(exported_metadata)
+    del metadata["sources"][0]["tables"][0]["select_permissions"]
+    hasura = FakeHasura(metadata)
+    role_mapper = FakeRoleMapper(None)
+    reconciler = make_reconciler(hasura, role_mapper, bulk_metadata=True)
+
+    operations = await reconciler.plan_provision(desired_state)
+    failed_operation = await reconciler.apply(desired_state, operations)
+
+    assert operations == [
+        OperationType.CREATE_ROLE,
+        OperationType.CREATE_SELECT_PERMISSION,
+    ]
+    assert failed_operation is None
+    assert hasura.writes == ["snowflake_create_select_permission"]
+
+
+@pytest.mark.anyio
+async def test_reconciler_updates_changed_custom_root_fields() -> None:
+    hasura = FakeHasura(exported_metadata)
+    changed_table_config = table_config.copy(
+        update={"select_root_field_name": "domain_dp_0_op_select_v2"}
+    )
+    changed_role = role.copy(
+        update={
+            "graphql_root_field_names": [
+                "domain_dp_0_op_select_v2",
+                *role.graphql_root_field_names[1:],
+            ]
+        }
+    )
+    role_mapper = FakeRoleMapper(role)
+    reconciler = make_reconciler(hasura, role_mapper)
+    changed_state = DesiredState(
+        data_source_config=data_source_config,
+        table_config=changed_table_config,
+        role=changed_role,
+    )
+
+    operations = await reconciler.plan_provision(changed_state)
+    failed_operation = await reconciler.apply(changed_state, operations)
+
+    assert operations == [OperationType.UPDATE_TABLE, OperationType.CREATE_ROLE]
+    assert failed_operation is None
+    assert hasura.writes == ["snowflake_set_table_customization"]
+    assert role_mapper.upserted[0]["graphql_root_field_names"][0] == (
+        "domain_dp_0_op_select_v2"
+    )
+
+
+@pytest.mark.anyio
+async def test_reconciler_skips_operations_depending_on_a_failure() -> None:
+    writes: List[str] = []
+
+    def failing_hasura(request: Request) -> Response:
+        body = json.loads(request.content)
+        if body["type"] == "export_metadata":
+            return Response(
+                200,
+                json={"resource_version": 1, "metadata": {"version": 3, "sources": []}},
+            )
+        writes.append(body["type"])
+        return Response(500, json={"error": "boom"})
+
+    role_mapper = FakeRoleMapper(None)
+    reconciler = HasuraReconciler(
+        hasura_admin_client=make_client(failing_hasura),
+        role_mapper_client=RoleMapperClient(
+            role_mapper_url="http://rolemapper",
+            client=AsyncClient(transport=MockTransport(role_mapper)),
+        ),
+    )
+
+    operations = await reconciler.plan_provision(desired_state)
+    failed_operation = await reconciler.apply(desired_state, operations)
+
+    assert failed_operation == OperationType.ADD_SOURCE
+    # the role does not depend on the source and is created anyway
+    assert len(role_mapper.upserted) == 1
+    # nothing depending on the source is attempted
+    assert writes == ["snowflake_add_source"]
+
+
+@pytest.mark.anyio
+async def test_reconciler_drops_the_source_of_its_last_table() -> None:
+    hasura = FakeHasura(exported_metadata)
+    registry = SourceRegistry()
+    reconciler = make_reconciler(
+        hasura, FakeRoleMapper(role), bulk_metadata=True, source_registry=registry
+    )
+
+    operations = await reconciler.plan_unprovision(desired_state)
+    failed_operation = await reconciler.apply(desired_state, operations)
+
+    assert operations == [OperationType.UNTRACK_TABLE, OperationType.DROP_SOURCE]
+    assert failed_operation is None
+    assert hasura.writes == ["snowflake_untrack_table", "snowflake_drop_source"]
+    assert not registry.has_source(data_source_config.data_source_name)
+
+
+@pytest.mark.anyio
+async def test_reconciler_keeps_a_source_still_in_use() -> None:
+    metadata = copy.deepcopy(exported_metadata)
+    metadata["sources"][0]["tables"].append({"table": ["OTHER"]})
+    hasura = FakeHasura(metadata)
+    registry = SourceRegistry()
+    reconciler = make_reconciler(hasura, FakeRoleMapper(role), source_registry=registry)
+
+    operations = await reconciler.plan_unprovision(desired_state)
+    failed_operation = await reconciler.apply(desired_state, operations)
+
+    assert operations == [OperationType.UNTRACK_TABLE]
+    assert failed_operation is None
+    assert registry.count(data_source_config.data_source_name) == 1
+
+
+@pytest.mark.anyio
+async def test_reconciler_keeps_the_source_when_the_metadata_changed() -> None:
+    hasura = FakeHasura(exported_metadata)
+
+    def conflicting_hasura(request: Request) -> Response:
+        if json.loads(request.content)["type"] == "snowflake_drop_source":
+            # another writer tracked a table in the meantime
+            return Response(409, json={"code": "conflict", "error": "conflict"})
+        return hasura(request)
+
+    registry = SourceRegistry()
+    reconciler = make_reconciler(
+        conflicting_hasura, FakeRoleMapper(role), source_registry=registry
+    )
+
+    operations = await reconciler.plan_unprovision(desired_state)
+    failed_operation = await reconciler.apply(desired_state, operations)
+
+    assert operations == [OperationType.UNTRACK_TABLE, OperationType.DROP_SOURCE]
+    assert failed_operation is None
+    assert registry.has_source(data_source_config.data_source_name)
@@ -0,0 +1,50 @@
+import copy
+
+from src.services.hasura.metadata import MetadataSnapshot
+from src.services.hasura.registry import SourceRegistry
+from tests.unit.test_metadata import exported_metadata, role_id
+
+
+def test_registry_is_built_from_the_snapshot() -> None:
+    registry = SourceRegistry()
+    assert not registry.is_loaded()
+
+    registry.sync(MetadataSnapshot(1, exported_metadata))
+
+    assert registry.is_loaded()
+    assert registry.count("domain_dp_0") == 1
+    assert registry.get_roles("domain_dp_0") == {role_id}
+    assert registry.count("unknown") == 0
+
+
+def test_registry_tracks_own_writes() -> None:
+    registry = SourceRegistry()
+    registry.sync(MetadataSnapshot(1, exported_metadata))
+
+    registry.track("domain_dp_0", ["OTHER"])
+    registry.grant("domain_dp_0", ["OTHER"], "other_role")
+    assert registry.count("domain_dp_0") == 2
+    assert registry.get_roles("domain_dp_0") == {role_id, "other_role"}
+
+    registry.untrack("domain_dp_0", ["OTHER"])
+    registry.revoke("domain_dp_0", ["TABLE"], role_id)
+    assert registry.count("domain_dp_0") == 1
+    assert registry.get_roles("domain_dp_0") == set()
+
+    registry.drop_source("domain_dp_0")
+    assert not registry.has_source("domain_dp_0")
+
+
+def test_registry_ignores_older_snapshots() -> None:
+    registry = SourceRegistry()
+    registry.sync(MetadataSnapshot(2, exported_metadata))
+    registry.untrack("domain_dp_0", ["TABLE"])
+
+    registry.sync(MetadataSnapshot(2, exported_metadata))
+    assert registry.count("domain_dp_0") == 0
+
+    # a newer snapshot is authoritative
+    metadata = copy.deepcopy(exported_metadata)
+    metadata["sources"][0]["tables"].append({"table": ["OTHER"]})
+    registry.sync(MetadataSnapshot(3, metadata))
+    assert registry.count("domain_dp_0") == 2
@@ -1,4 +1,4 @@
-from .test_descriptors import descriptor_yaml_ok
+from .test_descriptors import descriptor_yaml_ok, make_dataproduct_descriptor_yaml
 
 provision_request: dict = {
     "descriptorKind": "COMPONENT_DESCRIPTOR",
@@ -6,8 +6,14 @@ provision_request: dict = {
 }
 
 
-bad_provision_request: dict = {
+dataproduct_provision_request: dict = {
     "descriptorKind": "DATAPRODUCT_DESCRIPTOR",
+    "descriptor": make_dataproduct_descriptor_yaml(["first", "second"]),
+}
+
+
+bad_provision_request: dict = {
+    "descriptorKind": "DATAPRODUCT_DESCRIPTOR_WITH_RESULTS",
     "descriptor": descriptor_yaml_ok,
 }
 
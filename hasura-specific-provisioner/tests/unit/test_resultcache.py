@@ -0,0 +1,126 @@
+import asyncio
+from typing import List
+from unittest.mock import Mock
+
+import pytest
+
+from src.common.model.config import HasuraConfig, ResultCacheConfig
+from src.dependencies import create_result_cache
+from src.services.resultcache import ResultCache, make_result_key
+
+
+class FakeOperation:
+    def __init__(self, result: str = "COMPLETED"):
+        self.result = result
+        self.calls = 0
+
+    async def __call__(self) -> str:
+        self.calls += 1
+        return self.result
+
+
+def make_cache(
+    resource_versions: List[int], ttl: float = 60, max_entries: int = 10
+) -> ResultCache[str]:
+    async def get_resource_version() -> int:
+        return resource_versions[0]
+
+    return ResultCache(
+        config=ResultCacheConfig(ttl=ttl, max_entries=max_entries),
+        get_resource_version=get_resource_version,
+        is_cacheable=lambda result: result == "COMPLETED",
+    )
+
+
+def test_result_key_depends_on_operation_and_request() -> None:
+    key = make_result_key("provision", "descriptor")
+
+    assert key == make_result_key("provision", "descriptor")
+    assert key != make_result_key("unprovision", "descriptor")
+    assert key != make_result_key("provision", "other descriptor")
+    assert make_result_key("updateacl", "a", "b") != make_result_key("updateacl", "ab")
+
+
+@pytest.mark.anyio
+async def test_identical_request_is_answered_from_the_cache() -> None:
+    resource_versions = [1]
+    cache = make_cache(resource_versions)
+    operation = FakeOperation()
+    run = cache.wrap("provision", "key", "component", operation)
+
+    assert await run() == "COMPLETED"
+    assert await run() == "COMPLETED"
+    assert operation.calls == 1
+
+    # the metadata changed in between
+    resource_versions[0] = 2
+    assert await run() == "COMPLETED"
+    assert operation.calls == 2
+
+
+@pytest.mark.anyio
+async def test_failures_are_not_cached() -> None:
+    cache = make_cache([1])
+    operation = FakeOperation("FAILED")
+    run = cache.wrap("provision", "key", "component", operation)
+
+    await run()
+    await run()
+
+    assert operation.calls == 2
+
+
+@pytest.mark.anyio
+async def test_results_expire() -> None:
+    cache = make_cache([1], ttl=0.01)
+    operation = FakeOperation()
+    run = cache.wrap("provision", "key", "component", operation)
+
+    await run()
+    await asyncio.sleep(0.02)
+    await run()
+
+    assert operation.calls == 2
+
+
+@pytest.mark.anyio
+async def test_another_operation_on_the_component_evicts_its_results() -> None:
+    cache = make_cache([1])
+    provision = FakeOperation()
+    unprovision = FakeOperation()
+
+    await cache.wrap("provision", "provision", "component", provision)()
+    await cache.wrap("unprovision", "unprovision", "component", unprovision)()
+    await cache.wrap("provision", "provision", "component", provision)()
+
+    assert provision.calls == 2
+
+
+@pytest.mark.anyio
+async def test_least_recently_used_results_are_evicted() -> None:
+    cache = make_cache([1], max_entries=1)
+    first = FakeOperation()
+    second = FakeOperation()
+
+    await cache.wrap("provision", "first", "first", first)()
+    await cache.wrap("provision", "second", "second", second)()
+    await cache.wrap("provision", "first", "first", first)()
+
+    assert first.calls == 2
+
+
+def test_result_cache_requires_the_metadata_cache() -> None:
+    result_cache_config = ResultCacheConfig(ttl=60)
+    hasura_config = HasuraConfig(url="http://hasura", admin_secret="", timeout=30)
+
+    # checking each result against a full metadata export would cost more than it
+    # saves
+    assert create_result_cache(result_cache_config, hasura_config, Mock()) is None
+    assert (
+        create_result_cache(
+            result_cache_config,
+            hasura_config.copy(update={"metadata_cache_max_staleness": 1.0}),
+            Mock(),
+        )
+        is not None
+    )
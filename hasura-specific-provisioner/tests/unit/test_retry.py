@@ -0,0 +1,166 @@
+from typing import List
+
+import pytest
+from httpx import AsyncClient, ConnectError, MockTransport, Request, Response
+
+from src.common.model.config import RetryConfig
+from src.common.model.hasura import TrackTableResult
+from src.common.model.rolemapping import Role
+from src.dependencies import get_retry_config_from_env
+from src.services.hasura.client import HasuraAdminClient
+from src.services.retry import Retrier
+from src.services.rolemapper import RoleMapperClient
+from tests.unit.test_hasura_client import table_config
+
+fast_retry_config = RetryConfig(
+    max_attempts=3, initial_backoff=0.001, max_backoff=0.01, deadline=5
+)
+
+
+class FlakyEndpoint:
+    def __init__(self, failures: List[object], response: Response):
+        self.failures = failures
+        self.response = response
+        self.calls = 0
+
+    async def __call__(self) -> Response:
+        self.calls += 1
+        if self.failures:
+            failure = self.failures.pop(0)
+            if isinstance(failure, Exception):
+                raise failure
+            return failure  # type: ignore[return-value]
+        return self.response
+
+
+@pytest.mark.anyio
+async def test_retrier_retries_transient_failures() -> None:
+    retrier = Retrier("hasura", fast_retry_config, {"track_table"})
+    endpoint = FlakyEndpoint(
+        [Response(503), ConnectError("connection reset")], Response(200)
+    )
+
+    response = await retrier.call("track_table", endpoint)
+
+    assert response.status_code == 200
+    assert endpoint.calls == 3
+
+
+@pytest.mark.anyio
+async def test_retrier_returns_non_retryable_response_immediately() -> None:
+    retrier = Retrier("hasura", fast_retry_config, {"track_table"})
+    endpoint = FlakyEndpoint([Response(400)], Response(200))
+
+    response = await retrier.call("track_table", endpoint)
+
+    assert response.status_code == 400
+    assert endpoint.calls == 1
+
+
+@pytest.mark.anyio
+async def test_retrier_does_not_retry_non_idempotent_operations() -> None:
+    retrier = Retrier("hasura", fast_retry_config, {"track_table"})
+    endpoint = FlakyEndpoint([Response(503)], Response(200))
+
+    response = await retrier.call("run_sql", endpoint)
+
+    assert response.status_code == 503
+    assert endpoint.calls == 1
+
+
+@pytest.mark.anyio
+async def test_retrier_applies_operation_overrides() -> None:
+    config = fast_retry_config.copy(
+        update={"operation_max_attempts": {"track_table": 1, "run_sql": 2}}
+    )
+    retrier = Retrier("hasura", config, {"track_table"})
+
+    track_table_endpoint = FlakyEndpoint([Response(503)], Response(200))
+    run_sql_endpoint = FlakyEndpoint([Response(503)], Response(200))
+
+    assert (await retrier.call("track_table", track_table_endpoint)).status_code == 503
+    assert (await retrier.call("run_sql", run_sql_endpoint)).status_code == 200
+
+
+@pytest.mark.anyio
+async def test_retrier_raises_last_error_when_attempts_are_exhausted() -> None:
+    retrier = Retrier("hasura", fast_retry_config, {"track_table"})
+    endpoint = FlakyEndpoint([ConnectError("down")] * 3, Response(200))
+
+    with pytest.raises(ConnectError):
+        await retrier.call("track_table", endpoint)
+    assert endpoint.calls == 3
+
+
+@pytest.mark.anyio
+async def test_retrier_stops_at_deadline() -> None:
+    config = RetryConfig(max_attempts=10, initial_backoff=1, max_backoff=1, deadline=0)
+    retrier = Retrier("hasura", config, {"track_table"})
+    endpoint = FlakyEndpoint([Response(503)] * 10, Response(200))
+
+    response = await retrier.call("track_table", endpoint)
+
+    assert response.status_code == 503
+    assert endpoint.calls == 1
+
+
+@pytest.mark.anyio
+async def test_clients_retry_idempotent_operations() -> None:
+    hasura_calls = 0
+
+    def hasura_handler(request: Request) -> Response:
+        nonlocal hasura_calls
+        hasura_calls += 1
+        if hasura_calls == 1:
+            return Response(502)
+        return Response(200, json={"message": "success"})
+
+    role_mapper_calls = 0
+
+    def role_mapper_handler(request: Request) -> Response:
+        nonlocal role_mapper_calls
+        role_mapper_calls += 1
+        if role_mapper_calls == 1:
+            raise ConnectError("connection reset")
+        return Response(200, content=request.content)
+
+    hasura_admin_client = HasuraAdminClient(
+        hasura_url="http://hasura",
+        hasura_admin_secret="",
+        client=AsyncClient(transport=MockTransport(hasura_handler)),
+        retry_config=fast_retry_config,
+    )
+    role_mapper_client = RoleMapperClient(
+        role_mapper_url="http://rolemapper",
+        client=AsyncClient(transport=MockTransport(role_mapper_handler)),
+        retry_config=fast_retry_config,
+    )
+    role = Role(role_id="role", component_id="op", graphql_root_field_names=["f"])
+
+    assert await hasura_admin_client.track_table(table_config) == (
+        TrackTableResult.SUCCESS
+    )
+    assert await role_mapper_client.create_role(role) == role
+    assert hasura_calls == 2
+    assert role_mapper_calls == 2
+
+
+def test_retry_config_from_env(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("HASURA_RETRY_MAX_ATTEMPTS", "5")
+    monkeypatch.setenv("HASURA_RETRY_INITIAL_BACKOFF", "0.5")
+    monkeypatch.setenv("HASURA_RETRY_MAX_BACKOFF", "4")
+    monkeypatch.setenv("HASURA_RETRY_DEADLINE", "20")
+    monkeypatch.setenv(
+        "HASURA_RETRY_OPERATION_MAX_ATTEMPTS", "track_table=2, run_sql=3"
+    )
+
+    retry_config = get_retry_config_from_env("HASURA")
+
+    assert retry_config == RetryConfig(
+        max_attempts=5,
+        initial_backoff=0.5,
+        max_backoff=4,
+        deadline=20,
+        operation_max_attempts={"track_table": 2, "run_sql": 3},
+    )
+    assert get_retry_config_from_env("ROLE_MAPPER") == RetryConfig()
@@ -0,0 +1,88 @@
+import asyncio
+from typing import List
+
+import pytest
+
+from src.common.model.config import Lane, LaneConfig, SchedulerConfig
+from src.services.scheduler import LaneScheduler
+
+
+def make_scheduler(max_concurrency: int, provision_concurrency: int = 8):
+    return LaneScheduler(
+        SchedulerConfig(
+            max_concurrency=max_concurrency,
+            provision_lane=LaneConfig(concurrency=provision_concurrency, priority=1),
+        )
+    )
+
+
+async def hold_for(
+    scheduler: LaneScheduler, lane: Lane, name: str, events: List[str]
+) -> None:
+    async with scheduler.hold(lane):
+        events.append(f"{name} start")
+        await asyncio.sleep(0.01)
+        events.append(f"{name} end")
+
+
+@pytest.mark.anyio
+async def test_lane_concurrency_is_bounded() -> None:
+    scheduler = make_scheduler(max_concurrency=0, provision_concurrency=1)
+    events: List[str] = []
+
+    await asyncio.gather(
+        hold_for(scheduler, Lane.PROVISION, "first", events),
+        hold_for(scheduler, Lane.PROVISION, "second", events),
+        hold_for(scheduler, Lane.VALIDATE, "validate", events),
+    )
+
+    assert events.index("first end") < events.index("second start")
+    # other lanes are not affected by a full lane
+    assert events.index("validate start") < events.index("first end")
+
+
+@pytest.mark.anyio
+async def test_higher_priority_lanes_are_granted_first() -> None:
+    scheduler = make_scheduler(max_concurrency=1)
+    events: List[str] = []
+
+    running = asyncio.create_task(
+        hold_for(scheduler, Lane.PROVISION, "running", events)
+    )
+    await asyncio.sleep(0)
+    await asyncio.gather(
+        running,
+        hold_for(scheduler, Lane.PROVISION, "provision", events),
+        hold_for(scheduler, Lane.UPDATE_ACL, "acl", events),
+        hold_for(scheduler, Lane.VALIDATE, "validate", events),
+    )
+
+    assert [event for event in events if event.endswith("start")] == [
+        "running start",
+        "validate start",
+        "acl start",
+        "provision start",
+    ]
+
+
+@pytest.mark.anyio
+async def test_cancelled_waiters_release_their_place() -> None:
+    scheduler = make_scheduler(max_concurrency=1)
+    events: List[str] = []
+
+    running = asyncio.create_task(
+        hold_for(scheduler, Lane.PROVISION, "running", events)
+    )
+    await asyncio.sleep(0)
+    cancelled = asyncio.create_task(
+        hold_for(scheduler, Lane.VALIDATE, "cancelled", events)
+    )
+    await asyncio.sleep(0)
+    cancelled.cancel()
+    await asyncio.gather(
+        running,
+        hold_for(scheduler, Lane.PROVISION, "next", events),
+    )
+
+    assert "cancelled start" not in events
+    assert events[-2:] == ["next start", "next end"]
@@ -0,0 +1,88 @@
+import asyncio
+from typing import Union
+
+import pytest
+
+from src.services.singleflight import Runner, SingleFlight
+
+
+class SlowOperation:
+    def __init__(self, result: Union[str, Exception] = "COMPLETED"):
+        self.result = result
+        self.calls = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self) -> str:
+        self.calls += 1
+        await self.release.wait()
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+
+def start(run: Runner[str]) -> "asyncio.Task[str]":
+    async def call() -> str:
+        return await run()
+
+    return asyncio.create_task(call())
+
+
+@pytest.mark.anyio
+async def test_identical_operations_in_flight_run_once() -> None:
+    single_flight: SingleFlight[str] = SingleFlight("test")
+    operation = SlowOperation()
+
+    calls = [start(single_flight.wrap("key", operation)) for _ in range(3)]
+    await asyncio.sleep(0)
+    operation.release.set()
+
+    assert await asyncio.gather(*calls) == ["COMPLETED"] * 3
+    assert operation.calls == 1
+
+    # once completed, the operation runs again
+    assert await single_flight.wrap("key", operation)() == "COMPLETED"
+    assert operation.calls == 2
+
+
+@pytest.mark.anyio
+async def test_different_operations_run_separately() -> None:
+    single_flight: SingleFlight[str] = SingleFlight("test")
+    operation = SlowOperation()
+    operation.release.set()
+
+    await asyncio.gather(
+        single_flight.wrap("provision", operation)(),
+        single_flight.wrap("unprovision", operation)(),
+    )
+
+    assert operation.calls == 2
+
+
+@pytest.mark.anyio
+async def test_attached_callers_get_the_same_exception() -> None:
+    single_flight: SingleFlight[str] = SingleFlight("test")
+    operation = SlowOperation(ValueError("boom"))
+
+    calls = [start(single_flight.wrap("key", operation)) for _ in range(2)]
+    await asyncio.sleep(0)
+    operation.release.set()
+    results = await asyncio.gather(*calls, return_exceptions=True)
+
+    assert [str(result) for result in results] == ["boom", "boom"]
+    assert operation.calls == 1
+
+
+@pytest.mark.anyio
+async def test_cancelling_the_first_caller_does_not_cancel_the_operation() -> None:
+    single_flight: SingleFlight[str] = SingleFlight("test")
+    operation = SlowOperation()
+
+    first = start(single_flight.wrap("key", operation))
+    await asyncio.sleep(0)
+    second = start(single_flight.wrap("key", operation))
+    await asyncio.sleep(0)
+    first.cancel()
+    operation.release.set()
+
+    assert await second == "COMPLETED"
+    assert operation.calls == 1